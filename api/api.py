@@ -1,14 +1,90 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from typing import Optional, List, Dict
 # Change relative imports to absolute imports
-from functions.winget import search_winget_packages
+from functions.winget import iter_winget_search, search_winget_packages_async
 from pydantic import BaseModel
-from functions.intune_win32_uploader import upload_intunewin
+from functions.intune_win32_uploader import upload_intunewin, upload_intunewin_batch, upload_intunewin_to_tenants
+from functions.tenants import UnknownTenantError, client_for, get_tenant_registry
+from functions.assignments import AssignmentError, assigner_for
+from functions.inventory import INVENTORY_FULL_SYNC_SECONDS, INVENTORY_SYNC_SECONDS, get_app_inventory
+from functions.manifest import ManifestError, apply_manifest, parse_manifest, plan_manifest
+from functions.jobs import JobManager
+from functions.polling import poll_stats
+from functions.graph_batch import batch_stats
+from functions.winget_catalog import WingetCatalog
+from functions.detection import catalog_overrides
+from functions.updates import UpdatePipeline
+from functions.cache import AsyncTTLCache
+from functions import metrics
 # Add this import for CORS
 from fastapi.middleware.cors import CORSMiddleware
+from starlette.concurrency import run_in_threadpool
+import asyncio
+import json
 import os
+import subprocess
+import time
+from contextlib import asynccontextmanager
 
-app = FastAPI(title="Intune Deployment API")
+# Background jobs for uploads that should not hold the request open
+jobs = JobManager()
+
+# Local winget catalog index; /search falls back to the winget CLI until it has loaded
+catalog_enabled = os.environ.get("WINGET_CATALOG", "true").lower() == "true"
+catalog = WingetCatalog()
+
+# Local mirror of the Win32 apps in Intune, synced in the background
+inventory_enabled = os.environ.get("INVENTORY_SYNC", "true").lower() == "true"
+
+# Scheduled updates of deployed winget packages to the catalog's latest version
+updates_enabled = os.environ.get("AUTO_UPDATE", "false").lower() == "true"
+updates = UpdatePipeline(catalog)
+
+# winget CLI results, keyed by normalised search term
+search_cache = AsyncTTLCache(
+    maxsize=int(os.environ.get("SEARCH_CACHE_SIZE", "256")),
+    ttl=float(os.environ.get("SEARCH_CACHE_TTL", "300")),
+)
+
+search_latency = metrics.histogram("winget_search_duration_seconds", "Time to answer /search, by backend",
+                                   ("backend",))
+
+
+def _collect_stats():
+    # counters other modules already keep, read at scrape time
+    cache = search_cache.stats()
+    batches = batch_stats()
+    yield ("search_cache_requests_total", "counter", "/search lookups through the winget CLI cache, by result",
+           [({"result": result}, cache[key]) for result, key in
+            (("hit", "hits"), ("miss", "misses"), ("coalesced", "coalesced"))])
+    yield ("search_cache_entries", "gauge", "Searches held in the winget CLI cache", [({}, cache["size"])])
+    yield ("graph_batch_calls_total", "counter", "$batch calls sent by the shared batchers",
+           [({}, batches["batches"])])
+    yield ("winget_catalog_packages", "gauge", "Packages in the local winget catalog index",
+           [({}, len(catalog.index) if catalog.loaded else 0)])
+
+
+metrics.register_collector(_collect_stats)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if catalog_enabled:
+        catalog.start()
+    if inventory_enabled:
+        get_app_inventory().start()
+    if updates_enabled:
+        updates.start()
+    yield
+    catalog.stop()
+    if inventory_enabled:
+        get_app_inventory().stop()
+    updates.stop()
+    jobs.shutdown(wait=False)
+
+
+app = FastAPI(title="Intune Deployment API", lifespan=lifespan)
 
 # Get environment variables or set defaults
 debug_mode = os.environ.get("DEBUG", "true").lower() == "true"
@@ -41,21 +117,175 @@ app.add_middleware(
 async def root():
     return {"message": "Welcome to the Intune Deployment API"}
 
+@app.get("/stats", response_model=dict)
+async def get_stats():
+    """
+    Operational counters, e.g. how long uploads spent waiting on each
+    Intune processing stage (storage_uri, file_commit, publish), and how
+    many Graph requests went out in shared $batch calls.
+    """
+    return {"polling": poll_stats(), "graph_batch": batch_stats(), "search_cache": search_cache.stats()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def get_metrics():
+    """
+    Metrics in the Prometheus text format: Graph requests by route and
+    status with latency and retries, time per upload stage, blob upload
+    throughput, and winget search latency and cache hits (see
+    `functions/metrics.py`).
+    """
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+async def _cancel_on_disconnect(request: Request, awaitable, poll_interval: float = 0.25):
+    """
+    Await *awaitable*, cancelling it if the client goes away first.  Starlette
+    does not cancel handlers on disconnect, so a slow winget search would
+    otherwise keep running for nobody.
+    """
+    task = asyncio.ensure_future(awaitable)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                # 499: client closed request (nobody will read this response)
+                raise HTTPException(status_code=499, detail="Client disconnected")
+    except asyncio.CancelledError:
+        task.cancel()
+        raise
+
+def _search_error(exc: Exception) -> HTTPException:
+    """The error response for a failed winget search."""
+    if isinstance(exc, asyncio.TimeoutError):
+        return HTTPException(status_code=504, detail="winget search timed out")
+    if isinstance(exc, subprocess.CalledProcessError):
+        return HTTPException(status_code=502, detail=f"winget search failed: {(exc.stderr or '').strip() or exc}")
+    return HTTPException(status_code=500, detail=str(exc))
+
 @app.get("/search", response_model=List[Dict[str, str]])
-async def search_applications_json(search_term: str):
+async def search_applications_json(search_term: str, request: Request, limit: int = Query(100, ge=1, le=1000)):
     """
     Search for applications using winget and return structured JSON data.
     Pass the search term as a query parameter, e.g., /search?search_term=vscode
     
-    Returns a list of applications with Name, Id, Version, and Source fields.
+    Returns at most `limit` applications (default 100) with Name, Id,
+    Version, and Source fields. Served from the local catalog index when it
+    is loaded, otherwise from the winget CLI through a short-lived cache
+    that also merges identical concurrent searches into one winget run.
     """
     try:
-        apps = search_winget_packages(search_term)
+        started = time.perf_counter()
+        if catalog.loaded:
+            apps = catalog.search(search_term, limit)
+            backend = "catalog"
+        else:
+            key = " ".join(search_term.lower().split())
+            apps = await _cancel_on_disconnect(
+                request,
+                search_cache.get_or_load(key, lambda: search_winget_packages_async(search_term)),
+            )
+            apps = apps[:limit]
+            backend = "cli"
+        search_latency.observe(time.perf_counter() - started, backend)
         if not apps:
             raise HTTPException(status_code=404, detail="No applications found matching the search term")
         return apps
+    except HTTPException:
+        raise
     except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        # not cached: the next search runs winget again
+        raise _search_error(e)
+
+
+@app.get("/search/stream")
+async def search_applications_stream(search_term: str, request: Request, limit: int = Query(100, ge=1, le=1000)):
+    """
+    Streaming variant of /search: newline-delimited JSON, one application
+    per line, written as soon as each result is known so the UI can render
+    the first hits before winget finishes. Stops after `limit` applications.
+
+    A winget search that fails before its first result gets the error status
+    of /search (502, or 504 on timeout); one that fails later ends the stream
+    with an `{"error": ...}` line.
+    """
+    if catalog.loaded:
+        apps = catalog.search(search_term, limit)
+
+        async def catalog_results():
+            for app_info in apps:
+                yield json.dumps(app_info) + "\n"
+
+        return StreamingResponse(catalog_results(), media_type="application/x-ndjson")
+
+    # wait for the first result before sending the status line
+    search = iter_winget_search(search_term)
+    try:
+        first = await _cancel_on_disconnect(request, search.__anext__())
+    except StopAsyncIteration:
+        first = None
+    except HTTPException:
+        raise
+    except Exception as exc:
+        raise _search_error(exc)
+
+    async def results():
+        # the winget process is killed if the client disconnects mid-stream
+        # or once enough results have been sent
+        try:
+            if first is None:
+                return
+            yield json.dumps(first) + "\n"
+            sent = 1
+            if sent < limit:
+                async for app_info in search:
+                    yield json.dumps(app_info) + "\n"
+                    sent += 1
+                    if sent >= limit:
+                        break
+        except Exception as exc:
+            # the 200 has been sent already: report the failure in the stream
+            yield json.dumps({"error": _search_error(exc).detail}) + "\n"
+        finally:
+            await search.aclose()
+
+    return StreamingResponse(results(), media_type="application/x-ndjson")
+
+
+@app.get("/catalog", response_model=dict)
+async def get_catalog_status():
+    """State of the local winget catalog index (loaded, package count, last refresh)."""
+    return {"enabled": catalog_enabled, **catalog.status()}
+
+
+@app.post("/catalog/refresh", response_model=dict)
+async def refresh_catalog():
+    """Rebuild the local winget catalog index now."""
+    try:
+        updated = await run_in_threadpool(catalog.refresh)
+    except Exception as exc:
+        raise HTTPException(status_code=502, detail=f"Catalog refresh failed: {exc}")
+    return {"updated": updated, **catalog.status()}
+
+
+# Who an app is assigned to (see functions/assignments.py)
+class AssignmentSpec(BaseModel):
+    group_id: Optional[str] = None
+    group: Optional[str] = None
+    all_users: bool = False
+    all_devices: bool = False
+    exclude: bool = False
+    intent: str = "required"
+    filter_id: Optional[str] = None
+    filter: Optional[str] = None
+    filter_mode: str = "include"
+    notifications: str = "showAll"
+
+
+def _assignment_specs(specs: Optional[List[AssignmentSpec]]) -> Optional[List[Dict]]:
+    # unset fields take the engine's defaults
+    return [spec.model_dump(exclude_defaults=True) for spec in specs] if specs else None
 
 
 # Request model for /apps endpoint
@@ -65,6 +295,9 @@ class UploadRequest(BaseModel):
     package_id: str
     publisher: Optional[str] = None
     description: Optional[str] = None
+    tenant_id: Optional[str] = None
+    force: bool = False
+    assignments: Optional[List[AssignmentSpec]] = None
 
 
 # Endpoint to upload Win32 .intunewin package to Intune
@@ -85,18 +318,460 @@ async def upload_win32_app(body: UploadRequest):
         Publisher name; defaults to empty if omitted.
     description : str, optional
         Descriptive text shown in Intune. Defaults to display_name if omitted.
+    tenant_id : str, optional
+        Registered tenant to deploy to (see `/tenants`). Defaults to the
+        tenant configured through GRAPH_TENANT_ID.
+    force : bool, optional
+        Upload again even if this exact package is already deployed under
+        package_id; otherwise the existing app is returned with
+        `already_deployed` set.
+    assignments : list, optional
+        Groups to assign the app to once it is published, each with
+        `group_id` (or `group` by name, or `all_users`/`all_devices`),
+        `intent` (required, available, uninstall) and optionally `exclude`,
+        `filter_id`/`filter` with `filter_mode`, and `notifications`.
+
+    Once the winget catalog has loaded, the app records the package's
+    latest catalog version (the one winget installs) as its displayVersion
+    and detects that version, so `/updates` can tell when it is outdated.
+    """
+    stages = []
+    try:
+        # upload_intunewin is synchronous and takes minutes; keep it off the event loop
+        app_id = await run_in_threadpool(
+            upload_intunewin,
+            path=body.path,
+            display_name=body.display_name,
+            package_id=body.package_id,
+            description=body.description,
+            publisher=body.publisher or "",
+            tenant_id=body.tenant_id,
+            reuse=not body.force,
+            progress=lambda stage, **info: stages.append(stage),
+            overrides=catalog_overrides(catalog, body.package_id),
+            assignments=_assignment_specs(body.assignments),
+        )
+        return {"app_id": app_id, "already_deployed": "already_deployed" in stages}
+    except UnknownTenantError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    except AssignmentError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+
+
+# Request model for /apps/batch endpoint
+class BatchUploadRequest(BaseModel):
+    items: List[UploadRequest]
+    max_concurrency: Optional[int] = None
+
+
+# Endpoint to upload many Win32 packages in one call
+@app.post("/apps/batch", response_model=dict)
+async def upload_win32_apps_batch(body: BatchUploadRequest):
+    """
+    Upload several Win32 `.intunewin` packages concurrently.
+
+    Body parameters
+    ---------------
+    items : list
+        Upload requests, each with the same fields as `POST /apps` (so each
+        item may target its own tenant).
+    max_concurrency : int, optional
+        Number of uploads to run at once. Capped by the BATCH_MAX_CONCURRENCY
+        environment variable.
+
+    Returns per-item status in the order the items were submitted.
+    """
+    if not body.items:
+        raise HTTPException(status_code=400, detail="No items to upload")
+    try:
+        results = await run_in_threadpool(
+            upload_intunewin_batch,
+            [
+                {
+                    "path": item.path,
+                    "display_name": item.display_name,
+                    "package_id": item.package_id,
+                    "description": item.description,
+                    "publisher": item.publisher or "",
+                    "tenant_id": item.tenant_id,
+                    "reuse": not item.force,
+                    "overrides": catalog_overrides(catalog, item.package_id),
+                    "assignments": _assignment_specs(item.assignments),
+                }
+                for item in body.items
+            ],
+            body.max_concurrency,
+        )
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=str(exc))
+    return {
+        "results": results,
+        "succeeded": sum(r["status"] == "succeeded" for r in results),
+        "failed": sum(r["status"] == "failed" for r in results),
+    }
+
+
+# Request model for /apps/tenants endpoint
+class MultiTenantUploadRequest(BaseModel):
+    path: str
+    display_name: str
+    package_id: str
+    tenant_ids: List[str]
+    publisher: Optional[str] = None
+    description: Optional[str] = None
+    force: bool = False
+
+
+# Endpoint to deploy one package to several tenants
+@app.post("/apps/tenants", response_model=dict)
+async def upload_win32_app_to_tenants(body: MultiTenantUploadRequest):
+    """
+    Deploy one Win32 `.intunewin` package to several tenants in parallel.
+
+    Takes the fields of `POST /apps` with a list of `tenant_ids` instead of a
+    single tenant. The encrypted payload is read once and uploaded to every
+    tenant's storage together. Returns per-tenant status in input order.
     """
+    if not body.tenant_ids:
+        raise HTTPException(status_code=400, detail="No tenants to deploy to")
     try:
-        app_id = upload_intunewin(
+        results = await run_in_threadpool(
+            upload_intunewin_to_tenants,
             path=body.path,
             display_name=body.display_name,
             package_id=body.package_id,
+            tenant_ids=body.tenant_ids,
             description=body.description,
-            publisher=body.publisher or ""
+            publisher=body.publisher or "",
+            reuse=not body.force,
+            overrides=catalog_overrides(catalog, body.package_id),
         )
-        return {"app_id": app_id}
     except Exception as exc:
         raise HTTPException(status_code=500, detail=str(exc))
+    return {
+        "results": results,
+        "succeeded": sum(r["status"] == "succeeded" for r in results),
+        "failed": sum(r["status"] == "failed" for r in results),
+    }
+
+
+# Request model for /tenants endpoint
+class TenantRequest(BaseModel):
+    tenant_id: str
+    client_id: str
+    client_secret: str
+    name: Optional[str] = None
+
+
+@app.get("/tenants", response_model=List[dict])
+async def list_tenants():
+    """Registered tenants (client secrets are never returned)."""
+    return await run_in_threadpool(get_tenant_registry().list)
+
+
+@app.post("/tenants", response_model=dict, status_code=201)
+async def register_tenant(body: TenantRequest):
+    """Register a tenant's app registration, or replace its credentials."""
+    # replacing credentials closes the tenant's client, which waits for its in-flight requests
+    return await run_in_threadpool(get_tenant_registry().add, body.tenant_id, body.client_id, body.client_secret,
+                                   name=body.name)
+
+
+@app.delete("/tenants/{tenant_id}", status_code=204)
+async def remove_tenant(tenant_id: str):
+    """Forget a registered tenant."""
+    if not await run_in_threadpool(get_tenant_registry().remove, tenant_id):
+        raise HTTPException(status_code=404, detail="Tenant not found")
+
+
+@app.get("/apps", response_model=dict)
+async def list_apps(
+    tenant_id: Optional[str] = None,
+    search: Optional[str] = None,
+    publisher: Optional[str] = None,
+    package_id: Optional[str] = None,
+    publishing_state: Optional[str] = None,
+    assigned: Optional[bool] = None,
+    group_id: Optional[str] = None,
+    order: str = "name",
+    offset: int = Query(0, ge=0),
+    limit: int = Query(50, ge=1, le=1000),
+):
+    """
+    Win32 apps in Intune, served from the local inventory mirror.
+
+    Query parameters
+    ----------------
+    tenant_id : str, optional
+        Tenant to list; the GRAPH_TENANT_ID tenant if omitted.
+    search : str, optional
+        Case-insensitive substring of the display name, publisher or winget
+        package id.
+    publisher, package_id, publishing_state, group_id : str, optional
+        Exact matches; `group_id` selects apps assigned to that group.
+    assigned : bool, optional
+        Only apps that are (or are not) assigned.
+    order : str
+        "name" (default) or "modified" for the most recently changed first.
+    offset, limit : int
+        Page to return; `total` in the response counts all matches.
+
+    The mirror is refreshed every INVENTORY_SYNC_SECONDS; `POST /apps/sync`
+    refreshes it now.
+    """
+    try:
+        return await run_in_threadpool(
+            get_app_inventory().list,
+            tenant_id=tenant_id, search=search, publisher=publisher, package_id=package_id,
+            publishing_state=publishing_state, assigned=assigned, group_id=group_id,
+            order=order, offset=offset, limit=limit,
+        )
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+
+
+@app.post("/apps/sync", response_model=dict)
+async def sync_apps(tenant_id: Optional[str] = None, full: bool = False):
+    """
+    Refresh the inventory mirror of a tenant (the GRAPH_TENANT_ID tenant if
+    omitted) from Intune now. Incremental unless `full` is set or the last
+    full sync is older than INVENTORY_FULL_SYNC_SECONDS; an incremental sync
+    does not see assignment changes of apps that did not otherwise change.
+    """
+    try:
+        return await run_in_threadpool(get_app_inventory().sync, tenant_id, full=full)
+    except UnknownTenantError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    except Exception as exc:
+        raise HTTPException(status_code=502, detail=f"Inventory sync failed: {exc}")
+
+
+# Request model for /apps/assignments endpoint
+class BulkAssignmentRequest(BaseModel):
+    app_ids: List[str]
+    assignments: List[AssignmentSpec]
+    tenant_id: Optional[str] = None
+    replace: bool = False
+
+
+@app.post("/apps/assignments", response_model=dict)
+async def assign_apps(body: BulkAssignmentRequest):
+    """
+    Assign existing apps to groups in bulk.
+
+    Body parameters
+    ---------------
+    app_ids : list
+        Intune app ids.
+    assignments : list
+        Assignment specs, as for `POST /apps`, applied to every app.
+    tenant_id : str, optional
+        Tenant of the apps; the GRAPH_TENANT_ID tenant if omitted.
+    replace : bool, optional
+        Drop the apps' other assignments instead of keeping them.
+
+    Lookups and assignments go out in shared `$batch` calls. Returns
+    per-app status in input order.
+    """
+    if not body.app_ids or not body.assignments:
+        raise HTTPException(status_code=400, detail="No apps or assignments given")
+    specs = _assignment_specs(body.assignments)
+    try:
+        assigner = assigner_for(client_for(body.tenant_id))
+        outcome = await run_in_threadpool(assigner.assign, dict.fromkeys(body.app_ids, specs), body.replace)
+    except UnknownTenantError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    except AssignmentError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except Exception as exc:
+        raise HTTPException(status_code=502, detail=f"Assigning apps failed: {exc}")
+    results = [{"app_id": app_id, **outcome[app_id]} for app_id in dict.fromkeys(body.app_ids)]
+    return {
+        "results": results,
+        "succeeded": sum(r["status"] == "succeeded" for r in results),
+        "failed": sum(r["status"] == "failed" for r in results),
+    }
+
+
+@app.get("/apps/{app_id}", response_model=dict)
+async def get_app(app_id: str, tenant_id: Optional[str] = None):
+    """A Win32 app from the inventory mirror, with its assignments."""
+    app_info = await run_in_threadpool(get_app_inventory().get, app_id, tenant_id)
+    if app_info is None:
+        raise HTTPException(status_code=404, detail="App not found in inventory")
+    return app_info
+
+
+@app.get("/inventory", response_model=dict)
+async def get_inventory_status():
+    """Sync state of the inventory mirror per tenant (last sync, app count, last error)."""
+    return {
+        "enabled": inventory_enabled,
+        "interval": INVENTORY_SYNC_SECONDS,
+        "full_interval": INVENTORY_FULL_SYNC_SECONDS,
+        "tenants": await run_in_threadpool(get_app_inventory().status),
+    }
+
+
+@app.post("/jobs/apps", response_model=dict, status_code=202)
+async def submit_win32_app_job(body: UploadRequest):
+    """
+    Queue a Win32 `.intunewin` upload and return its job id immediately.
+
+    Takes the same body as `POST /apps`. Follow the job with `GET /jobs/{job_id}`
+    or stream its progress from `GET /jobs/{job_id}/events`.
+    """
+    params = {
+        "path": body.path,
+        "display_name": body.display_name,
+        "package_id": body.package_id,
+        "description": body.description,
+        "publisher": body.publisher or "",
+        "tenant_id": body.tenant_id,
+        "reuse": not body.force,
+        "assignments": _assignment_specs(body.assignments),
+    }
+    job = jobs.submit("upload", upload_intunewin, params=params,
+                      overrides=catalog_overrides(catalog, body.package_id), **params)
+    return {"job_id": job.id, "status": job.status}
+
+
+# Request model for the manifest endpoints
+class ManifestRequest(BaseModel):
+    manifest: dict
+    tenant_id: Optional[str] = None
+    max_workers: Optional[int] = None
+
+
+@app.post("/manifest/plan", response_model=dict)
+async def plan_deployment_manifest(body: ManifestRequest):
+    """
+    Diff a deployment manifest against the Win32 apps in Intune.
+
+    Body parameters
+    ---------------
+    manifest : dict
+        The manifest (see `functions/manifest.py`): optional `tenant_id`
+        and `defaults`, and the `apps` list. Relative package paths are
+        resolved against the API's working directory.
+    tenant_id : str, optional
+        Tenant to compare with instead of the manifest's.
+
+    Returns the create/update/skip action of every app and their counts.
+    """
+    try:
+        manifest = parse_manifest(body.manifest)
+        return await run_in_threadpool(plan_manifest, manifest, tenant_id=body.tenant_id)
+    except ManifestError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    except UnknownTenantError as exc:
+        raise HTTPException(status_code=404, detail=str(exc))
+    except Exception as exc:
+        raise HTTPException(status_code=502, detail=f"Reading Intune apps failed: {exc}")
+
+
+@app.post("/jobs/manifest", response_model=dict, status_code=202)
+async def submit_manifest_job(body: ManifestRequest):
+    """
+    Queue applying a deployment manifest: plan it, then create and update
+    apps in parallel (`max_workers` uploads at once). Takes the body of
+    `POST /manifest/plan`; follow the job like an upload job.
+    """
+    try:
+        manifest = parse_manifest(body.manifest)
+    except ManifestError as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    params = {"apps": len(manifest["apps"]), "tenant_id": body.tenant_id or manifest["tenant_id"]}
+    job = jobs.submit("manifest", apply_manifest, manifest, params=params, tenant_id=body.tenant_id,
+                      max_workers=body.max_workers, catalog=catalog)
+    return {"job_id": job.id, "status": job.status}
+
+
+@app.get("/updates", response_model=dict)
+async def get_updates(tenant_id: Optional[str] = None, include_unversioned: bool = False):
+    """
+    Deployed winget packages with a newer version in the catalog, compared
+    from the inventory mirror (sync it first with `POST /apps/sync` for the
+    latest state). Also lists packages that are current, have no recorded
+    version (`unversioned`) or are not in the catalog, and the state of the
+    scheduled update runs.
+    """
+    if not catalog.loaded:
+        raise HTTPException(status_code=503, detail="The winget catalog is not loaded yet")
+    plan = await run_in_threadpool(updates.plan, tenant_id, include_unversioned=include_unversioned)
+    return {"enabled": updates_enabled, **updates.status(), **plan}
+
+
+# Request model for /jobs/updates endpoint
+class UpdateRunRequest(BaseModel):
+    tenant_id: Optional[str] = None
+    include_unversioned: bool = False
+    sync: bool = True
+
+
+@app.post("/jobs/updates", response_model=dict, status_code=202)
+async def submit_update_job(body: UpdateRunRequest):
+    """
+    Queue an update run: sync the inventory, then upload every outdated
+    package as a superseding app or a new content version (UPDATE_MODE) with
+    version-aware detection. Follow the job like an upload job.
+    """
+    if not catalog.loaded:
+        raise HTTPException(status_code=503, detail="The winget catalog is not loaded yet")
+    params = {"tenant_id": body.tenant_id, "mode": updates.mode}
+    job = jobs.submit("update", updates.run, params=params, tenant_id=body.tenant_id,
+                      include_unversioned=body.include_unversioned, sync=body.sync)
+    return {"job_id": job.id, "status": job.status}
+
+
+@app.get("/jobs", response_model=List[dict])
+async def list_jobs():
+    """List known jobs, newest first."""
+    return [job.to_dict() for job in jobs.list()]
+
+
+@app.get("/jobs/{job_id}", response_model=dict)
+async def get_job(job_id: str):
+    """
+    Current state of a job: status (queued, running, succeeded, failed), the
+    stage it is in (shell, content_version, file_placeholder, storage_uri,
+    upload, commit, publish, assign, done, or already_deployed when the
+    package was deployed before; plan and apply for manifest jobs; sync,
+    plan, apply and supersede for update jobs), stage
+    info such as bytes sent, and the result or error once finished.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job.to_dict()
+
+
+@app.get("/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """
+    Server-Sent Events stream of a job's progress. Each event carries the
+    job snapshot; the stream ends once the job has finished.
+    """
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        seq = int(request.headers.get("last-event-id") or 0)
+        while True:
+            # read finished before draining so the final event is never missed
+            finished = job.finished
+            for event in job.events_since(seq):
+                seq = event["seq"]
+                yield f"id: {seq}\nevent: progress\ndata: {json.dumps(event)}\n\n"
+            if finished or await request.is_disconnected():
+                break
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache"})
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,145 @@
+"""
+Disk/network overlap in the blob upload pipeline.
+
+The payload is read through a throttled reader (--disk-mbps) and sent to a
+local SAS endpoint stand-in with a per-request round trip (--latency).  With
+a single buffer the reader cannot run ahead of the PUTs, so reading and
+sending alternate; with a pool the reader fills buffers while earlier blocks
+are on the wire and the wall time approaches the slower of the two.  The
+"overlapped" column is the time the disk and the network were busy at once.
+Peak RSS shows that memory is bounded by the pool, not the payload size.
+
+Run from the repository root:
+    python -m api.benchmarks.bench_blob_pipeline --size-mb 128 --disk-mbps 200 --latency 0.05
+"""
+
+import argparse
+import base64
+import os
+import resource
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions.intune_win32_uploader import _FilePayload, _PayloadVerifier, _upload_to_blob
+from api.functions.intunewin import _EncryptingWriter
+from api.tests.stubs import BlobStubServer
+
+
+def _busy_time(intervals) -> float:
+    """Total time covered by at least one of *intervals*."""
+    total, end = 0.0, float("-inf")
+    for start, stop in sorted(intervals):
+        if stop > end:
+            total += stop - max(start, end)
+            end = stop
+    return total
+
+
+def _overlap_time(a, b) -> float:
+    return _busy_time(a) + _busy_time(b) - _busy_time(a + b)
+
+
+class _ThrottledReader:
+    """Reads at most *rate* bytes per second and records when it was reading."""
+
+    def __init__(self, fh, rate: float, intervals: list):
+        self._fh = fh
+        self._rate = rate
+        self._intervals = intervals
+
+    def readinto(self, view):
+        started = time.perf_counter()
+        n = self._fh.readinto(view)
+        time.sleep(n / self._rate)
+        self._intervals.append((started, time.perf_counter()))
+        return n
+
+    def seek(self, offset):
+        return self._fh.seek(offset)
+
+
+class _ThrottledPayload(_FilePayload):
+    def __init__(self, path, rate: float):
+        super().__init__(path)
+        self.rate = rate
+        self.reads = []
+
+    @contextmanager
+    def open(self):
+        with open(self.path, "rb") as fh:
+            yield _ThrottledReader(fh, self.rate, self.reads)
+
+
+CHUNK = 1024 * 1024
+
+
+def _write_payload(path: Path, size: int) -> dict:
+    """Write an encrypted payload of *size* content bytes without holding it in memory."""
+    key, mac_key, iv = os.urandom(32), os.urandom(32), os.urandom(16)
+    with open(path, "wb") as fh:
+        writer = _EncryptingWriter(fh, key, mac_key, iv)
+        for _ in range(size // CHUNK):
+            writer.write(os.urandom(CHUNK))
+        writer.write(os.urandom(size % CHUNK))
+        writer.finish()
+        fh.seek(0)
+        fh.write(writer.mac)
+    b64 = lambda raw: base64.b64encode(raw).decode()
+    return {"unencrypted_size": size, "encryption_key": b64(key), "iv": b64(iv), "mac": b64(writer.mac),
+            "mac_key": b64(mac_key), "file_digest": b64(writer.digest), "digest_algorithm": "SHA256"}
+
+
+def _peak_rss_mib() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the blob upload pipeline")
+    parser.add_argument("--size-mb", type=int, default=128)
+    parser.add_argument("--disk-mbps", type=float, default=200, help="simulated disk read speed in MiB/s")
+    parser.add_argument("--latency", type=float, default=0.05, help="simulated per-request round trip in seconds")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--buffers", type=int, nargs="+", default=[1, 2, 4, 8])
+    parser.add_argument("--verify", action="store_true", help="also check Mac/FileDigest on the way")
+    args = parser.parse_args()
+
+    fd, name = tempfile.mkstemp(suffix=".bin")
+    os.close(fd)
+    path = Path(name)
+    meta = _write_payload(path, args.size_mb * 1024 * 1024)
+
+    try:
+        print(f"payload {args.size_mb} MiB, disk {args.disk_mbps:.0f} MiB/s, round trip {args.latency * 1000:.0f} ms, "
+              f"{args.concurrency} PUTs in flight, baseline RSS {_peak_rss_mib():.0f} MiB")
+        for buffers in args.buffers:
+            payload = _ThrottledPayload(path, args.disk_mbps * 1024 * 1024)
+            verifier = _PayloadVerifier.for_package(meta, payload) if args.verify else None
+            with BlobStubServer(latency=args.latency, keep_data=False) as stub:
+                puts = []
+                handle = stub.RequestHandlerClass.do_PUT
+
+                def timed_put(handler, handle=handle):
+                    started = time.perf_counter()
+                    handle(handler)
+                    puts.append((started, time.perf_counter()))
+
+                stub.RequestHandlerClass = type("TimedHandler", (stub.RequestHandlerClass,), {"do_PUT": timed_put})
+                started = time.perf_counter()
+                _upload_to_blob(payload, stub.sas_uri, concurrency=args.concurrency, buffers=buffers,
+                                verifier=verifier)
+                elapsed = time.perf_counter() - started
+            print(f"buffers={buffers:<3} {elapsed:6.2f}s {args.size_mb / elapsed:8.1f} MiB/s  "
+                  f"disk {_busy_time(payload.reads):5.2f}s  network {_busy_time(puts):5.2f}s  "
+                  f"overlapped {_overlap_time(payload.reads, puts):5.2f}s  "
+                  f"in flight <= {stub.max_in_flight}  peak RSS {_peak_rss_mib():.0f} MiB")
+    finally:
+        path.unlink()
+
+
+if __name__ == "__main__":
+    main()
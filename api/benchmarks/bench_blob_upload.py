@@ -0,0 +1,63 @@
+"""
+Blob upload throughput against a local SAS endpoint stand-in.
+
+Each run is repeated with the streaming Mac/FileDigest check enabled to show
+what the verification costs relative to the upload itself.
+
+Run from the repository root:
+    python -m api.benchmarks.bench_blob_upload --size-mb 256 --latency 0.05
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions.intune_win32_uploader import _FilePayload, _PayloadVerifier, _upload_to_blob
+from api.tests.stubs import BlobStubServer, encrypt_payload
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark _upload_to_blob")
+    parser.add_argument("--size-mb", type=int, default=128)
+    parser.add_argument("--latency", type=float, default=0.05,
+                        help="Simulated per-request round trip in seconds")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 8, 16])
+    args = parser.parse_args()
+
+    meta, encrypted = encrypt_payload(os.urandom(args.size_mb * 1024 * 1024))
+    fd, name = tempfile.mkstemp(suffix=".bin")
+    with os.fdopen(fd, "wb") as fh:
+        fh.write(encrypted)
+    del encrypted
+    path = Path(name)
+    payload = _FilePayload(path)
+
+    try:
+        started = time.perf_counter()
+        verifier = _PayloadVerifier.for_package(meta, payload)
+        with payload.open() as fh:
+            for chunk in iter(lambda: fh.read(4 * 1024 * 1024), b""):
+                verifier.update(chunk)
+        verifier.finish()
+        elapsed = time.perf_counter() - started
+        print(f"verify only        {elapsed:7.2f}s  {args.size_mb / elapsed:8.1f} MiB/s")
+
+        for concurrency in args.concurrency:
+            for verify in (False, True):
+                with BlobStubServer(latency=args.latency) as stub:
+                    started = time.perf_counter()
+                    _upload_to_blob(payload, stub.sas_uri, concurrency=concurrency,
+                                    verifier=_PayloadVerifier.for_package(meta, payload) if verify else None)
+                    elapsed = time.perf_counter() - started
+                print(f"concurrency={concurrency:<3} verify={'on ' if verify else 'off'} {elapsed:7.2f}s  "
+                      f"{args.size_mb / elapsed:8.1f} MiB/s  connections={stub.connections}")
+    finally:
+        path.unlink()
+
+if __name__ == "__main__":
+    main()
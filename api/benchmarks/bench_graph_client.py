@@ -0,0 +1,57 @@
+"""
+Connection reuse of the pooled Graph client against a local mock Graph server.
+
+Compares the old per-call ``requests.request`` with the shared GraphClient and
+reports how many connections (handshakes) each needed.
+
+Run from the repository root:
+    python -m api.benchmarks.bench_graph_client --calls 200
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import requests
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions.graph_client import GraphClient
+from api.functions.throttle import TokenBucket
+from api.tests.stubs import GraphStubServer
+
+# keep the client-side rate limit out of the way
+UNLIMITED = TokenBucket(rate=1e9, capacity=10 ** 9)
+
+
+def _headers():
+    return {"Authorization": "Bearer bench", "Content-Type": "application/json"}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Graph connection pooling")
+    parser.add_argument("--calls", type=int, default=200)
+    args = parser.parse_args()
+
+    with GraphStubServer() as stub:
+        url = f"{stub.base_url}/deviceAppManagement/mobileApps/app/contentVersions/1/files/1"
+        started = time.perf_counter()
+        for _ in range(args.calls):
+            requests.request("GET", url, headers=_headers()).raise_for_status()
+        elapsed = time.perf_counter() - started
+        print(f"requests.request  {elapsed:6.2f}s  connections={stub.connections}")
+
+    with GraphStubServer() as stub:
+        url = f"{stub.base_url}/deviceAppManagement/mobileApps/app/contentVersions/1/files/1"
+        client = GraphClient(auth_headers=_headers, bucket=UNLIMITED)
+        started = time.perf_counter()
+        for _ in range(args.calls):
+            client.get(url)
+        elapsed = time.perf_counter() - started
+        client.close()
+        print(f"GraphClient       {elapsed:6.2f}s  connections={stub.connections}")
+
+
+if __name__ == "__main__":
+    main()
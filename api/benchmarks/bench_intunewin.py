@@ -0,0 +1,65 @@
+"""
+Packaging throughput and memory of the native .intunewin builder.
+
+Builds a package from a generated source folder (one large installer-like
+file plus a small script) and reports MiB/s and peak RSS, which should stay
+flat as --size-mb grows.  Random content named setup.exe is stored as-is in
+the inner zip (like real, already compressed installers); --name setup.bin
+makes it go through deflate.
+
+Run from the repository root:
+    python -m api.benchmarks.bench_intunewin --size-mb 1024
+"""
+
+import argparse
+import os
+import resource
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions.intunewin import build_intunewin
+
+
+def _peak_rss_mib() -> float:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark build_intunewin")
+    parser.add_argument("--size-mb", type=int, default=256)
+    parser.add_argument("--compressible", action="store_true",
+                        help="use repetitive content instead of random (incompressible) bytes")
+    parser.add_argument("--compresslevel", type=int, nargs="+", default=[1, 6],
+                        help="zlib levels to compare")
+    parser.add_argument("--name", default="setup.exe", help="file name of the generated installer")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source = Path(tmp) / "src"
+        source.mkdir()
+        (source / "Winget-InstallPackage.ps1").write_text("winget install --id $PackageID\n")
+        block = (b"installer " * 104858)[:1024 * 1024] if args.compressible else None
+        with open(source / args.name, "wb") as fh:
+            for _ in range(args.size_mb):
+                fh.write(block or os.urandom(1024 * 1024))
+
+        print(f"source: {args.name} {args.size_mb} MiB ({'compressible' if args.compressible else 'random'}), "
+              f"baseline RSS {_peak_rss_mib():.0f} MiB")
+        for level in args.compresslevel:
+            output = Path(tmp) / "App.intunewin"
+            started = time.perf_counter()
+            build_intunewin(source, "Winget-InstallPackage.ps1", output, compresslevel=level)
+            elapsed = time.perf_counter() - started
+            print(f"compresslevel={level}  {elapsed:7.2f}s  {args.size_mb / elapsed:8.1f} MiB/s  "
+                  f"package {output.stat().st_size / 1024 ** 2:8.1f} MiB  peak RSS {_peak_rss_mib():.0f} MiB")
+            output.unlink()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Memory and serialization cost of Win32LobApp models.
+
+Builds --apps models shaped like the uploader's app shells and reports the
+memory they hold, the cost of building the request dict, and the cost of
+the JSON body the first time and once cached.
+
+Run from the repository root:
+    python -m api.benchmarks.bench_win32app --apps 10000
+"""
+
+import argparse
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.classes.win32app import Win32LobApp
+
+
+def make(n):
+    install = f'powershell.exe -executionpolicy bypass -file Winget-InstallPackage.ps1 -mode install -PackageID "Vendor.App{n}"'
+    return Win32LobApp(f"App {n}", f"Description {n}", "Contoso", install,
+                       install.replace("-mode install", "-mode uninstall"), "setup.exe",
+                       file_name="setup.exe", minimum_supported_windows_release="1607",
+                       rules=[{"ruleType": "detection", "scriptContent": "ZXhpdCAw"}],
+                       return_codes=[{"returnCode": 0, "type": "success"}])
+
+
+def _per_call(apps, fn, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for app in apps:
+            fn(app)
+        best = min(best, time.perf_counter() - started)
+    return best / len(apps) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the Win32LobApp model")
+    parser.add_argument("--apps", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    tracemalloc.start()
+    apps = [make(n) for n in range(args.apps)]
+    held, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"memory:          {held / args.apps:7.0f} bytes/app")
+
+    print(f"to_dict:         {_per_call(apps, Win32LobApp.to_dict, args.repeat):7.2f} µs/app")
+    print(f"to_json (first): {_per_call(apps, lambda app: (app.invalidate(), app.to_json()), args.repeat):7.2f} µs/app")
+    print(f"to_json (cached):{_per_call(apps, Win32LobApp.to_json, args.repeat):7.2f} µs/app")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""
+Build time and query latency of the in-memory winget catalog index.
+
+Uses a synthetic catalog by default; point --source at a real index.db or
+source.msix to measure against the actual winget catalog.
+
+Run from the repository root:
+    python -m api.benchmarks.bench_winget_catalog --packages 10000
+"""
+
+import argparse
+import random
+import string
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions.winget_catalog import CatalogIndex, load_source
+
+QUERIES = ["code", "firefox", "microsoft", "vl", "7zip", "python", "studio", "git", "zz", "adobe reader"]
+
+
+def synthetic(n):
+    rng = random.Random(1)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(3, 9))) for _ in range(3000)]
+    entries = []
+    for i in range(n):
+        publisher, product = rng.choice(words).title(), rng.choice(words).title()
+        entries.append({"Id": f"{publisher}.{product}{i}", "Name": f"{publisher} {product}",
+                        "Moniker": product.lower(), "Version": f"{rng.randint(1, 30)}.{rng.randint(0, 99)}",
+                        "Source": "winget"})
+    return entries
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the winget catalog index")
+    parser.add_argument("--packages", type=int, default=10000)
+    parser.add_argument("--source", help="index.db or source.msix to load instead of synthetic data")
+    args = parser.parse_args()
+
+    entries = load_source(Path(args.source)) if args.source else synthetic(args.packages)
+    started = time.perf_counter()
+    index = CatalogIndex(entries)
+    print(f"indexed {len(index)} packages in {time.perf_counter() - started:.2f}s")
+
+    rng = random.Random(2)
+    sampled = [rng.choice(entries)["Name"].lower()[:rng.randint(3, 6)] for _ in range(5)]
+    for query in QUERIES + sampled:
+        runs = 50
+        started = time.perf_counter()
+        for _ in range(runs):
+            results = index.search(query)
+        per_query = (time.perf_counter() - started) / runs * 1000
+        print(f"{query!r:16} {len(results):5} hits  {per_query:7.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+"""
+Throughput of the winget table parser on a large recorded-style output.
+
+Generates a 5,000 row `winget search` table (mixing ASCII, accented and
+double-width names, Match columns and truncated Ids), or parses a real
+recording given with --input.
+
+Run from the repository root:
+    python -m api.benchmarks.bench_winget_parser --rows 5000
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions.winget import WingetTableParser, parse_winget_output
+
+NAMES = ["Visual Studio Code", "Notepad++", "Mozilla Firefox", "微信", "Très Bon Éditeur", "7-Zip", "日本語入力"]
+
+
+def _pad(text, width):
+    # pad by display cells the way winget does
+    cells = sum(2 if "　" <= ch <= "鿿" else 1 for ch in text)
+    return text + " " * max(1, width - cells)
+
+
+def recorded(rows):
+    rng = random.Random(1)
+    lines = ["   - \r   \\ \r" + _pad("Name", 30) + _pad("Id", 36) + _pad("Version", 14) + _pad("Match", 18) + "Source",
+             "-" * 104]
+    for i in range(rows):
+        name = f"{rng.choice(NAMES)} {i}"
+        pkg_id = f"Vendor{i}.Product{i}"
+        if i % 97 == 0:
+            pkg_id = pkg_id[:12] + "…"
+        match = rng.choice(["", "Tag: editor", "Moniker: x"])
+        lines.append(_pad(name, 30) + _pad(pkg_id, 36) + _pad(f"{i % 30}.{i % 7}.{i}", 14) + _pad(match, 18) + "winget")
+    return "\n".join(lines) + "\n"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the winget output parser")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--input", help="recorded winget search output to parse instead")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    text = Path(args.input).read_text(encoding="utf-8") if args.input else recorded(args.rows)
+    lines = text.split("\n")
+
+    best = float("inf")
+    for _ in range(args.repeat):
+        started = time.perf_counter()
+        apps = parse_winget_output(text)
+        best = min(best, time.perf_counter() - started)
+    print(f"buffered:  {len(apps)} apps from {len(lines)} lines in {best * 1000:7.1f} ms "
+          f"({len(lines) / best:,.0f} lines/s)")
+
+    started = time.perf_counter()
+    table = WingetTableParser()
+    first = None
+    for n, line in enumerate(lines):
+        if table.feed(line) and first is None:
+            first = time.perf_counter() - started
+    print(f"streaming: first result after {first * 1e6:7.1f} µs, {table.truncated} truncated Ids dropped")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Latency of winget searches under parallel load, using a fake `winget` on PATH.
+
+Compares the old pattern (blocking subprocess.run called on the event loop)
+with search_winget_packages_async, and reports how long the event loop was
+blocked while the searches ran.  POSIX only.
+
+Run from the repository root:
+    python -m api.benchmarks.bench_winget_search --parallel 16 --delay 0.3
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions import winget
+from api.tests.stubs import write_fake_winget
+
+
+async def _loop_lag(stop: asyncio.Event) -> float:
+    """Worst delay seen by a 10ms ticker while the searches run."""
+    worst = 0.0
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(0.01)
+        worst = max(worst, time.perf_counter() - started - 0.01)
+    return worst
+
+
+async def _run(label, search, parallel):
+    stop = asyncio.Event()
+    lag = asyncio.ensure_future(_loop_lag(stop))
+    latencies = []
+
+    async def one(i):
+        started = time.perf_counter()
+        await search(f"app{i}")
+        latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one(i) for i in range(parallel)))
+    total = time.perf_counter() - started
+    stop.set()
+    latencies.sort()
+    print(f"{label:<28} total {total:6.2f}s  p50 {latencies[len(latencies) // 2]:6.2f}s  "
+          f"max {latencies[-1]:6.2f}s  worst loop stall {await lag:6.3f}s")
+
+
+async def main_async(args):
+    async def blocking(term):
+        # what the endpoint used to do: subprocess.run on the event loop
+        winget.search_winget_packages(term)
+
+    await _run("blocking subprocess.run", blocking, args.parallel)
+    await _run("async (max %d processes)" % winget.WINGET_MAX_PROCESSES,
+               winget.search_winget_packages_async, args.parallel)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark winget search under parallel load")
+    parser.add_argument("--parallel", type=int, default=16)
+    parser.add_argument("--delay", type=float, default=0.3, help="Seconds each fake winget run takes")
+    parser.add_argument("--rows", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        write_fake_winget(tmp, delay=args.delay, rows=args.rows)
+        os.environ["PATH"] = tmp + os.pathsep + os.environ["PATH"]
+        asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
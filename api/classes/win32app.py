@@ -1,5 +1,64 @@
+import json
+
+ODATA_TYPE = "#microsoft.graph.win32LobApp"
+
+ARCHITECTURES = frozenset({"none", "x86", "x64", "arm", "neutral", "arm64"})
+
+# (attribute, Graph property, @odata.type to wrap a dict value in) in output
+# order.  Required properties are always sent, optional ones only when set.
+_REQUIRED = (
+    ("display_name", "displayName", None),
+    ("description", "description", None),
+    ("publisher", "publisher", None),
+    ("install_command_line", "installCommandLine", None),
+    ("uninstall_command_line", "uninstallCommandLine", None),
+    ("setup_file_path", "setupFilePath", None),
+)
+_OPTIONAL = (
+    ("id", "id", None),
+    ("large_icon", "largeIcon", None),
+    ("is_featured", "isFeatured", None),
+    ("privacy_information_url", "privacyInformationUrl", None),
+    ("information_url", "informationUrl", None),
+    ("owner", "owner", None),
+    ("developer", "developer", None),
+    ("notes", "notes", None),
+    ("display_version", "displayVersion", None),
+    ("publishing_state", "publishingState", None),
+    ("committed_content_version", "committedContentVersion", None),
+    ("file_name", "fileName", None),
+    ("size", "size", None),
+    ("applicable_architectures", "applicableArchitectures", None),
+    ("minimum_free_disk_space_in_mb", "minimumFreeDiskSpaceInMB", None),
+    ("minimum_memory_in_mb", "minimumMemoryInMB", None),
+    ("minimum_number_of_processors", "minimumNumberOfProcessors", None),
+    ("minimum_cpu_speed_in_mhz", "minimumCpuSpeedInMHz", None),
+    ("rules", "rules", None),
+    ("install_experience", "installExperience", "#microsoft.graph.win32LobAppInstallExperience"),
+    ("return_codes", "returnCodes", None),
+    ("msi_information", "msiInformation", "#microsoft.graph.win32LobAppMsiInformation"),
+    ("minimum_supported_windows_release", "minimumSupportedWindowsRelease", None),
+)
+
+# attribute -> Graph property
+GRAPH_PROPERTIES = {attr: key for attr, key, _ in _REQUIRED + _OPTIONAL}
+
+
 class Win32LobApp:
-    def __init__(self, 
+    """
+    A Win32 LOB app as sent to Graph's mobileApps endpoint.
+
+    Instances use ``__slots__`` (no per-object ``__dict__``) since thousands
+    may be held at once, and are validated when created.  ``to_json`` caches
+    the serialized body; assigning any attribute, or the ``add_*``/``set_*``
+    helpers, invalidates it.  Call ``invalidate()`` after mutating a list or
+    dict attribute in place.
+    """
+
+    __slots__ = (*(attr for attr, _, _ in _REQUIRED + _OPTIONAL),
+                 "created_date_time", "last_modified_date_time", "_json")
+
+    def __init__(self,
                  display_name,
                  description,
                  publisher,
@@ -14,7 +73,8 @@ class Win32LobApp:
                  owner=None,
                  developer=None,
                  notes=None,
-                 publishing_state="notPublished",
+                 display_version=None,
+                 publishing_state=None,
                  committed_content_version=None,
                  file_name=None,
                  size=None,
@@ -28,7 +88,7 @@ class Win32LobApp:
                  return_codes=None,
                  msi_information=None,
                  minimum_supported_windows_release=None):
-        
+
         # Required properties
         self.display_name = display_name
         self.description = description
@@ -36,8 +96,9 @@ class Win32LobApp:
         self.install_command_line = install_command_line
         self.uninstall_command_line = uninstall_command_line
         self.setup_file_path = setup_file_path
-        
-        # Optional properties with defaults
+
+        # Optional properties with defaults; publishingState and the content
+        # version are set by Intune and only present on apps read back from it
         self.id = id
         self.large_icon = large_icon
         self.is_featured = is_featured
@@ -46,6 +107,7 @@ class Win32LobApp:
         self.owner = owner
         self.developer = developer
         self.notes = notes
+        self.display_version = display_version
         self.publishing_state = publishing_state
         self.committed_content_version = committed_content_version
         self.file_name = file_name
@@ -60,85 +122,69 @@ class Win32LobApp:
         self.return_codes = return_codes if return_codes is not None else []
         self.msi_information = msi_information
         self.minimum_supported_windows_release = minimum_supported_windows_release
-        
+
         # Auto-populated properties
         self.created_date_time = None
         self.last_modified_date_time = None
 
+        self.validate()
+
+    def __setattr__(self, name, value):
+        object.__setattr__(self, name, value)
+        if name != "_json":
+            object.__setattr__(self, "_json", None)
+
+    def invalidate(self):
+        """Drop the cached JSON body (after changing a list or dict in place)"""
+        self._json = None
+
+    def validate(self):
+        """Raise ValueError if the app could not be created as it stands"""
+        for attr, key, _ in _REQUIRED:
+            value = getattr(self, attr)
+            # description may be empty, but must still be sent
+            if not isinstance(value, str) or (not value and key != "description"):
+                raise ValueError(f"{key} is required")
+        if self.applicable_architectures:
+            unknown = set(self.applicable_architectures.replace(" ", "").split(",")) - ARCHITECTURES
+            if unknown:
+                raise ValueError(f"Unknown applicableArchitectures: {', '.join(sorted(unknown))}")
+        for attr in ("rules", "return_codes"):
+            if not isinstance(getattr(self, attr), list):
+                raise ValueError(f"{attr} must be a list")
+        for attr in ("install_experience", "msi_information"):
+            value = getattr(self, attr)
+            if value is not None and not isinstance(value, dict):
+                raise ValueError(f"{attr} must be a dict")
+
     def add_rule(self, rule):
         """Add a detection or requirement rule to the app"""
         self.rules.append(rule)
-        
+        self._json = None
+
     def add_return_code(self, return_code):
         """Add a return code for post-installation behavior"""
         self.return_codes.append(return_code)
-    
+        self._json = None
+
     def set_msi_information(self, msi_info):
         """Set MSI-specific information for the app"""
         self.msi_information = msi_info
-    
-    def to_dict(self):
+
+    def to_dict(self) -> dict:
         """Convert the Win32LobApp object to a dictionary for API submission"""
-        app_dict = {
-            "@odata.type": "#microsoft.graph.win32LobApp",
-            "displayName": self.display_name,
-            "description": self.description,
-            "publisher": self.publisher,
-            "installCommandLine": self.install_command_line,
-            "uninstallCommandLine": self.uninstall_command_line,
-            "setupFilePath": self.setup_file_path
-        }
-        
+        app_dict = {"@odata.type": ODATA_TYPE}
+        for attr, key, _ in _REQUIRED:
+            app_dict[key] = getattr(self, attr)
         # Add optional properties if they exist
-        if self.id:
-            app_dict["id"] = self.id
-        if self.large_icon:
-            app_dict["largeIcon"] = self.large_icon
-        if self.is_featured:
-            app_dict["isFeatured"] = self.is_featured
-        if self.privacy_information_url:
-            app_dict["privacyInformationUrl"] = self.privacy_information_url
-        if self.information_url:
-            app_dict["informationUrl"] = self.information_url
-        if self.owner:
-            app_dict["owner"] = self.owner
-        if self.developer:
-            app_dict["developer"] = self.developer
-        if self.notes:
-            app_dict["notes"] = self.notes
-        if self.publishing_state:
-            app_dict["publishingState"] = self.publishing_state
-        if self.committed_content_version:
-            app_dict["committedContentVersion"] = self.committed_content_version
-        if self.file_name:
-            app_dict["fileName"] = self.file_name
-        if self.size:
-            app_dict["size"] = self.size
-        if self.applicable_architectures:
-            app_dict["applicableArchitectures"] = self.applicable_architectures
-        if self.minimum_free_disk_space_in_mb:
-            app_dict["minimumFreeDiskSpaceInMB"] = self.minimum_free_disk_space_in_mb
-        if self.minimum_memory_in_mb:
-            app_dict["minimumMemoryInMB"] = self.minimum_memory_in_mb
-        if self.minimum_number_of_processors:
-            app_dict["minimumNumberOfProcessors"] = self.minimum_number_of_processors
-        if self.minimum_cpu_speed_in_mhz:
-            app_dict["minimumCpuSpeedInMHz"] = self.minimum_cpu_speed_in_mhz
-        if self.rules:
-            app_dict["rules"] = self.rules
-        if self.install_experience:
-            app_dict["installExperience"] = {
-                "@odata.type": "microsoft.graph.win32LobAppInstallExperience",
-                **self.install_experience
-            }
-        if self.return_codes:
-            app_dict["returnCodes"] = self.return_codes
-        if self.msi_information:
-            app_dict["msiInformation"] = {
-                "@odata.type": "microsoft.graph.win32LobAppMsiInformation",
-                **self.msi_information
-            }
-        if self.minimum_supported_windows_release:
-            app_dict["minimumSupportedWindowsRelease"] = self.minimum_supported_windows_release
-            
+        for attr, key, wrap in _OPTIONAL:
+            value = getattr(self, attr)
+            if value:
+                app_dict[key] = {"@odata.type": wrap, **value} if wrap else value
         return app_dict
+
+    def to_json(self) -> bytes:
+        """The request body for creating the app, serialized once until the app changes"""
+        if self._json is None:
+            self._json = json.dumps(self.to_dict(), separators=(",", ":")).encode()
+        return self._json
@@ -0,0 +1,347 @@
+"""
+Assign apps to groups in bulk once they are published.
+
+An assignment spec says who gets an app and how:
+
+    {"group_id": "<id>", "intent": "required"}
+    {"group": "All Sales Laptops", "intent": "available",
+     "filter": "Windows 11 only", "filter_mode": "include"}
+    {"group_id": "<id>", "exclude": true}
+    {"all_devices": true, "intent": "required", "notifications": "hideAll"}
+
+Exactly one of ``group_id``, ``group`` (display name), ``all_users`` or
+``all_devices`` picks the target.  ``intent`` is required (the default),
+available, uninstall or availableWithoutEnrollment; ``exclude`` turns a
+group into an exclusion.  An assignment filter is given by ``filter_id``
+or ``filter`` (display name).
+
+``AppAssigner.assign`` applies specs to many apps at once through
+``mobileApps/{id}/assign``.  Everything goes out through the client's
+``$batch`` coalescer (see ``graph_batch``), so assigning 100 apps to 10
+groups takes a handful of round trips, and throttled items are retried
+after their ``Retry-After``:
+
+1. group names and ids and filter names are resolved; results are cached
+   per tenant for ASSIGNMENT_LOOKUP_TTL, so a batch deploy looks each group
+   up once;
+2. unless ``replace`` is set, each app's current assignments are read and
+   kept (``/assign`` replaces the whole set), with a spec for the same
+   target taking precedence;
+3. one ``/assign`` per app.
+
+``AppAssigner.copy`` gives apps the assignments of other apps the same way,
+e.g. a new app those of the app it supersedes (see ``updates``).
+
+Tunable through environment variables:
+
+- ASSIGNMENT_LOOKUP_TTL: seconds to cache group and filter lookups
+  (default 3600)
+"""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+from urllib.parse import quote
+
+import requests
+
+from .graph_batch import GRAPH_BATCH_WINDOW, GraphBatcher, batcher_for
+from .graph_client import GRAPH_BASE, GraphClient
+
+logger = logging.getLogger(__name__)
+
+ASSIGNMENT_LOOKUP_TTL = float(os.environ.get("ASSIGNMENT_LOOKUP_TTL", "3600"))
+
+INTENTS = ("required", "available", "uninstall", "availableWithoutEnrollment")
+NOTIFICATIONS = ("showAll", "showReboot", "hideAll")
+FILTER_MODES = ("include", "exclude")
+
+_TARGET_KEYS = ("group_id", "group", "all_users", "all_devices")
+_SPEC_KEYS = {*_TARGET_KEYS, "exclude", "intent", "filter_id", "filter", "filter_mode", "notifications"}
+_TARGET_TYPES = {
+    "group": "#microsoft.graph.groupAssignmentTarget",
+    "exclude": "#microsoft.graph.exclusionGroupAssignmentTarget",
+    "all_users": "#microsoft.graph.allLicensedUsersAssignmentTarget",
+    "all_devices": "#microsoft.graph.allDevicesAssignmentTarget",
+}
+
+
+class AssignmentError(ValueError):
+    """An assignment spec is invalid or names a group or filter that does not exist."""
+
+
+def parse_assignments(specs: Iterable[Dict]) -> List[Dict]:
+    """Validate assignment specs; returns them with defaults filled in.  Raises AssignmentError."""
+    parsed = []
+    for n, spec in enumerate(specs or []):
+        if not isinstance(spec, dict):
+            raise AssignmentError(f"Assignment {n} must be a mapping")
+        unknown = set(spec) - _SPEC_KEYS
+        if unknown:
+            raise AssignmentError(f"Assignment {n}: unknown keys {', '.join(sorted(unknown))}")
+        targets = [key for key in _TARGET_KEYS if spec.get(key)]
+        if len(targets) != 1:
+            raise AssignmentError(f"Assignment {n} needs exactly one of {', '.join(_TARGET_KEYS)}")
+        spec = {"intent": "required", "notifications": "showAll", "filter_mode": "include", "exclude": False, **spec}
+        if spec["intent"] not in INTENTS:
+            raise AssignmentError(f"Assignment {n}: intent must be one of {', '.join(INTENTS)}")
+        if spec["notifications"] not in NOTIFICATIONS:
+            raise AssignmentError(f"Assignment {n}: notifications must be one of {', '.join(NOTIFICATIONS)}")
+        if spec["filter_mode"] not in FILTER_MODES:
+            raise AssignmentError(f"Assignment {n}: filter_mode must be include or exclude")
+        if spec["exclude"] and targets[0] not in ("group_id", "group"):
+            raise AssignmentError(f"Assignment {n}: only groups can be excluded")
+        if spec["exclude"] and (spec.get("filter_id") or spec.get("filter")):
+            raise AssignmentError(f"Assignment {n}: exclusions cannot have a filter")
+        if spec.get("filter_id") and spec.get("filter"):
+            raise AssignmentError(f"Assignment {n}: give filter_id or filter, not both")
+        parsed.append(spec)
+    return parsed
+
+
+def _kept(assignment: Dict) -> Dict:
+    # an assignment read from Graph, as /assign takes it
+    kept = {k: v for k, v in assignment.items() if k in ("intent", "target", "settings")}
+    return {"@odata.type": "#microsoft.graph.mobileAppAssignment", **kept}
+
+
+def _target_key(target: Dict) -> Tuple[str, Optional[str]]:
+    # one assignment per target: an app cannot be assigned twice to a group
+    kind = (target.get("@odata.type") or "").lstrip("#")
+    return kind, target.get("groupId")
+
+
+class AppAssigner:
+    """Resolves assignment specs and assigns apps for one tenant's client, in bulk."""
+
+    def __init__(
+        self,
+        client: GraphClient,
+        graph_base: str = GRAPH_BASE,
+        batcher: Optional[GraphBatcher] = None,
+        lookup_ttl: float = ASSIGNMENT_LOOKUP_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.client = client
+        self.graph_base = graph_base.rstrip("/")
+        if batcher is None and GRAPH_BATCH_WINDOW > 0 and not client.closed:
+            batcher = batcher_for(client)
+        self.batcher = batcher
+        self.lookup_ttl = lookup_ttl
+        self._clock = clock
+        self._lookups: Dict[Tuple[str, str], Tuple[float, object]] = {}
+        self._lock = threading.Lock()
+
+    def _submit(self, method: str, url: str, json=None) -> Future:
+        if self.batcher is not None:
+            return self.batcher.submit(method, url, json=json)
+        future: Future = Future()
+        try:
+            future.set_result(self.client.request(method, url, json=json))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+    # ----------------------------------------------------------------------------------
+    # lookups
+    # ----------------------------------------------------------------------------------
+    def _cached(self, key: Tuple[str, str]):
+        with self._lock:
+            entry = self._lookups.get(key)
+            if entry and entry[0] > self._clock():
+                return entry[1]
+        return None
+
+    def _remember(self, key: Tuple[str, str], value) -> None:
+        with self._lock:
+            self._lookups[key] = (self._clock() + self.lookup_ttl, value)
+
+    def _lookup_all(self, keys: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], object]:
+        """Resolve ``("group_id", id)``, ``("group", name)`` and ``("filters", "")`` keys, from cache or Graph."""
+        found, pending = {}, {}
+        for key in dict.fromkeys(keys):
+            value = self._cached(key)
+            if value is not None:
+                found[key] = value
+                continue
+            kind, name = key
+            if kind == "group_id":
+                url = f"{self.graph_base}/groups/{quote(name)}?$select=id,displayName"
+            elif kind == "group":
+                odata_filter = "displayName eq '{}'".format(name.replace("'", "''"))
+                url = f"{self.graph_base}/groups?$filter={quote(odata_filter)}&$select=id,displayName"
+            else:
+                url = f"{self.graph_base}/deviceManagement/assignmentFilters?$select=id,displayName"
+            pending[key] = self._submit("GET", url)
+
+        for (kind, name), future in pending.items():
+            try:
+                data = future.result() or {}
+            except requests.HTTPError as exc:
+                if kind == "group_id" and exc.response is not None and exc.response.status_code == 404:
+                    raise AssignmentError(f"Group {name} does not exist") from None
+                raise
+            if kind == "group_id":
+                value = data["id"]
+            elif kind == "group":
+                matches = data.get("value", [])
+                if len(matches) != 1:
+                    raise AssignmentError(f"{len(matches) or 'No'} groups are named {name!r}")
+                value = matches[0]["id"]
+            else:
+                value = {item["displayName"].lower(): item["id"] for item in data.get("value", [])}
+            self._remember((kind, name), value)
+            found[(kind, name)] = value
+        return found
+
+    @staticmethod
+    def _keys(specs: List[Dict]) -> List[Tuple[str, str]]:
+        keys = []
+        for spec in specs:
+            if spec.get("group_id"):
+                keys.append(("group_id", spec["group_id"]))
+            elif spec.get("group"):
+                keys.append(("group", spec["group"]))
+            if spec.get("filter"):
+                keys.append(("filters", ""))
+        return keys
+
+    def resolve(self, specs: Iterable[Dict]) -> List[Dict]:
+        """
+        Validate *specs* and turn them into ``mobileAppAssignment`` bodies,
+        checking that their groups and filters exist.  Raises AssignmentError.
+        """
+        specs = parse_assignments(specs)
+        found = self._lookup_all(self._keys(specs))
+
+        assignments = []
+        for spec in specs:
+            if spec.get("group_id") or spec.get("group"):
+                group_id = found[("group_id", spec["group_id"])] if spec.get("group_id") else \
+                    found[("group", spec["group"])]
+                target = {"@odata.type": _TARGET_TYPES["exclude" if spec["exclude"] else "group"], "groupId": group_id}
+            else:
+                target = {"@odata.type": _TARGET_TYPES["all_users" if spec.get("all_users") else "all_devices"]}
+            filter_id = spec.get("filter_id")
+            if spec.get("filter"):
+                filter_id = found[("filters", "")].get(spec["filter"].lower())
+                if filter_id is None:
+                    raise AssignmentError(f"No assignment filter is named {spec['filter']!r}")
+            if filter_id:
+                target["deviceAndAppManagementAssignmentFilterId"] = filter_id
+                target["deviceAndAppManagementAssignmentFilterType"] = spec["filter_mode"]
+            assignments.append({
+                "@odata.type": "#microsoft.graph.mobileAppAssignment",
+                "intent": spec["intent"],
+                "target": target,
+                "settings": {"@odata.type": "#microsoft.graph.win32LobAppAssignmentSettings",
+                             "notifications": spec["notifications"]},
+            })
+        return assignments
+
+    # ----------------------------------------------------------------------------------
+    # assign
+    # ----------------------------------------------------------------------------------
+    def assign(self, apps: Dict[str, List[Dict]], replace: bool = False) -> Dict[str, Dict]:
+        """
+        Assign every app in *apps* (app id -> specs).  Specs are resolved
+        before anything is changed, so an unknown group fails the call with
+        AssignmentError.  Unless *replace* is set, assignments an app already
+        has for other targets are kept.
+
+        Returns ``{app_id: {"status": "succeeded", "assignments": n}}``, or
+        ``{"status": "failed", "error": ...}`` for apps that could not be
+        assigned; one failure does not stop the others.
+        """
+        parsed = {app_id: parse_assignments(specs) for app_id, specs in apps.items()}
+        # every app's groups in one round of lookups; resolve() then hits the cache
+        self._lookup_all(key for specs in parsed.values() for key in self._keys(specs))
+        resolved = {app_id: self.resolve(specs) for app_id, specs in parsed.items()}
+        base = f"{self.graph_base}/deviceAppManagement/mobileApps"
+        current = {} if replace else {app_id: self._submit("GET", f"{base}/{app_id}/assignments")
+                                      for app_id in resolved}
+
+        results: Dict[str, Dict] = {}
+        posted = {}
+        for app_id, wanted in resolved.items():
+            merged = {_target_key(a["target"]): a for a in wanted}
+            if not replace:
+                try:
+                    existing = current[app_id].result() or {}
+                except Exception as exc:
+                    results[app_id] = {"status": "failed", "error": str(exc)}
+                    continue
+                for assignment in existing.get("value", []):
+                    kept = _kept(assignment)
+                    merged.setdefault(_target_key(kept.get("target") or {}), kept)
+            body = {"mobileAppAssignments": list(merged.values())}
+            posted[app_id] = (len(merged), self._submit("POST", f"{base}/{app_id}/assign", json=body))
+
+        self._collect(posted, results)
+        logger.info("Assigned %s of %s apps", sum(r["status"] == "succeeded" for r in results.values()), len(apps))
+        return {app_id: results[app_id] for app_id in apps}
+
+    def copy(self, apps: Dict[str, str]) -> Dict[str, Dict]:
+        """
+        Give every app in *apps* (app id -> source app id) the assignments
+        the source app has, e.g. a new app those of the app it supersedes.
+        Existing assignments of the target apps are replaced.
+
+        Returns the same per-app results as ``assign``.
+        """
+        base = f"{self.graph_base}/deviceAppManagement/mobileApps"
+        sources = {source: self._submit("GET", f"{base}/{source}/assignments") for source in set(apps.values())}
+
+        results: Dict[str, Dict] = {}
+        posted = {}
+        for app_id, source in apps.items():
+            try:
+                existing = sources[source].result() or {}
+            except Exception as exc:
+                results[app_id] = {"status": "failed", "error": str(exc)}
+                continue
+            body = {"mobileAppAssignments": [_kept(a) for a in existing.get("value", [])]}
+            posted[app_id] = (len(body["mobileAppAssignments"]),
+                              self._submit("POST", f"{base}/{app_id}/assign", json=body))
+
+        self._collect(posted, results)
+        return {app_id: results[app_id] for app_id in apps}
+
+    @staticmethod
+    def _collect(posted: Dict[str, Tuple[int, Future]], results: Dict[str, Dict]) -> None:
+        for app_id, (count, future) in posted.items():
+            try:
+                future.result()
+            except Exception as exc:
+                logger.error("Assigning app %s failed: %s", app_id, exc)
+                results[app_id] = {"status": "failed", "error": str(exc)}
+            else:
+                results[app_id] = {"status": "succeeded", "assignments": count}
+
+
+_assigners: Dict[GraphClient, AppAssigner] = {}
+_assigners_lock = threading.Lock()
+
+
+def assigner_for(client: GraphClient) -> AppAssigner:
+    """
+    The shared AppAssigner (and lookup cache) for *client*, i.e. per
+    tenant; forgotten when the client is closed.  A closed client (still
+    held by work that started before its tenant changed) gets an unshared
+    assigner that sends its requests without a batcher.
+    """
+    with _assigners_lock:
+        if client.closed:
+            return AppAssigner(client)
+        if client not in _assigners:
+            client.on_close(lambda: _release_assigner(client))
+            _assigners[client] = AppAssigner(client)
+        return _assigners[client]
+
+
+def _release_assigner(client: GraphClient) -> None:
+    with _assigners_lock:
+        _assigners.pop(client, None)
@@ -35,6 +35,7 @@ Azure/Microsoft Entra Setup:
    - GRAPH_CLIENT_ID: The Application (client) ID from the Overview page
    - GRAPH_CLIENT_SECRET: The client secret value you created
    - GRAPH_TENANT_ID: Your directory (tenant) ID from the Overview page
+   - TOKEN_REFRESH_MARGIN (optional): seconds before expiry to renew tokens in the background (default 300)
 
 Usage in Application:
 -------------------
@@ -70,7 +71,8 @@ Security Considerations:
 import os
 import time
 import logging
-from typing import Dict, Optional
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
 import msal
 from dotenv import load_dotenv
 
@@ -81,11 +83,15 @@ load_dotenv()
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Cache to store the token in memory
-_token_cache = {
-    "access_token": None,
-    "expires_at": 0
-}
+DEFAULT_SCOPES = ["https://graph.microsoft.com/.default"]
+
+# Tokens are renewed in the background this many seconds before they expire.
+# MSAL only hands out a fresh token once the cached one has less than five
+# minutes left, so a smaller margin than 300 just returns the same token.
+TOKEN_REFRESH_MARGIN = float(os.environ.get("TOKEN_REFRESH_MARGIN", "300"))
+
+# A cached token is never handed out with less than this many seconds left
+TOKEN_MIN_VALIDITY = 60
 
 def get_auth_config() -> Dict[str, str]:
     """
@@ -113,6 +119,168 @@ def get_auth_config() -> Dict[str, str]:
     
     return config
 
+class TokenProvider:
+    """
+    Client-credentials tokens for one app registration.
+
+    Keeps a single MSAL application (and with it MSAL's own token cache) for
+    the lifetime of the provider, caches one token per set of scopes, and
+    lets only one thread per scope talk to the token endpoint at a time;
+    callers arriving during a refresh wait for it and reuse its result.
+
+    After each acquisition a background timer renews the token
+    TOKEN_REFRESH_MARGIN seconds before it expires, so requests normally find
+    a valid token in memory and never wait on Entra ID.
+    """
+
+    def __init__(
+        self,
+        client_id: str,
+        client_secret: str,
+        tenant_id: str,
+        refresh_margin: float = TOKEN_REFRESH_MARGIN,
+        retry_interval: float = TOKEN_MIN_VALIDITY / 2,
+        app_factory: Callable[..., "msal.ConfidentialClientApplication"] = msal.ConfidentialClientApplication,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.client_id = client_id
+        self.tenant_id = tenant_id
+        self.authority = f"https://login.microsoftonline.com/{tenant_id}"
+        self.refresh_margin = refresh_margin
+        self.retry_interval = retry_interval
+        self._client_secret = client_secret
+        self._app_factory = app_factory
+        self._clock = clock
+        self._app = None
+        self._tokens: Dict[Tuple[str, ...], Tuple[str, float]] = {}
+        self._scope_locks: Dict[Tuple[str, ...], threading.Lock] = {}
+        self._timers: Dict[Tuple[str, ...], threading.Timer] = {}
+        self._lock = threading.Lock()
+        self._closed = False
+        self.acquisitions = 0
+
+    def _get_app(self):
+        with self._lock:
+            if self._app is None:
+                self._app = self._app_factory(
+                    client_id=self.client_id,
+                    client_credential=self._client_secret,
+                    authority=self.authority,
+                )
+            return self._app
+
+    def _scope_lock(self, key: Tuple[str, ...]) -> threading.Lock:
+        with self._lock:
+            return self._scope_locks.setdefault(key, threading.Lock())
+
+    def _cached(self, key: Tuple[str, ...]) -> Optional[str]:
+        entry = self._tokens.get(key)
+        if entry and entry[1] > self._clock() + TOKEN_MIN_VALIDITY:
+            return entry[0]
+        return None
+
+    def get_token(self, scopes: Optional[List[str]] = None) -> Optional[str]:
+        """
+        Access token for *scopes* (default: Microsoft Graph), or None if it
+        could not be acquired.  Safe to call from any number of threads.
+        """
+        key = tuple(sorted(scopes or DEFAULT_SCOPES))
+        token = self._cached(key)
+        if token:
+            logger.debug("Using cached access token")
+            return token
+        with self._scope_lock(key):
+            # another thread may have refreshed it while we waited
+            token = self._cached(key)
+            if token:
+                return token
+            return self._acquire(key)
+
+    def auth_headers(self) -> Dict[str, str]:
+        """Graph request headers with a bearer token; empty if none is available."""
+        token = self.get_token()
+        if not token:
+            logger.error("No access token available for headers")
+            return {}
+        return {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json"
+        }
+
+    def _acquire(self, key: Tuple[str, ...]) -> Optional[str]:
+        """Fetch a token from MSAL; the caller holds the scope lock."""
+        try:
+            result = self._get_app().acquire_token_for_client(scopes=list(key))
+        except Exception as ex:
+            logger.error(f"Exception during token acquisition: {str(ex)}")
+            result = {}
+
+        if "access_token" not in result:
+            if result:
+                logger.error(
+                    f"Failed to acquire token. Error: {result.get('error')}, "
+                    f"Description: {result.get('error_description')}, "
+                    f"Correlation ID: {result.get('correlation_id')}"
+                )
+            if self._cached(key):
+                # a background refresh failed: try again while the current token lasts
+                self._schedule(key, self.retry_interval)
+            return None
+
+        self.acquisitions += 1
+        expires_at = self._clock() + result.get("expires_in", 3599)  # Default to 1 hour - 1 second
+        self._tokens[key] = (result["access_token"], expires_at)
+        if result.get("token_source") != "cache":
+            logger.info("Successfully acquired new access token")
+        self._schedule(key, max(expires_at - self.refresh_margin - self._clock(), self.retry_interval))
+        return result["access_token"]
+
+    def _schedule(self, key: Tuple[str, ...], delay: float) -> None:
+        with self._lock:
+            if self._closed:
+                return
+            previous = self._timers.get(key)
+            if previous is not None:
+                previous.cancel()
+            timer = threading.Timer(delay, self._refresh, args=(key,))
+            timer.daemon = True
+            self._timers[key] = timer
+            timer.start()
+
+    def _refresh(self, key: Tuple[str, ...]) -> None:
+        with self._scope_lock(key):
+            if not self._closed:
+                self._acquire(key)
+
+    def close(self) -> None:
+        """Stop background refreshes."""
+        with self._lock:
+            self._closed = True
+            timers, self._timers = list(self._timers.values()), {}
+        for timer in timers:
+            timer.cancel()
+
+
+_provider: Optional[TokenProvider] = None
+_provider_lock = threading.Lock()
+
+
+def get_token_provider() -> Optional[TokenProvider]:
+    """
+    The TokenProvider for the GRAPH_* environment configuration, created on
+    first use.  Returns None while the configuration is incomplete.
+    """
+    global _provider
+    with _provider_lock:
+        if _provider is None:
+            config = get_auth_config()
+            if not all([config.get("client_id"), config.get("client_secret"), config.get("tenant_id")]):
+                logger.error("Incomplete authentication configuration")
+                return None
+            _provider = TokenProvider(config["client_id"], config["client_secret"], config["tenant_id"])
+        return _provider
+
+
 def get_access_token(scopes: Optional[list] = None) -> Optional[str]:
     """
     Get an access token for Microsoft Graph API.
@@ -123,53 +291,10 @@ def get_access_token(scopes: Optional[list] = None) -> Optional[str]:
     Returns:
         Access token string or None if authentication fails
     """
-    global _token_cache
-    
-    # Default scopes for client credentials flow
-    if scopes is None:
-        scopes = ["https://graph.microsoft.com/.default"]
-    
-    # Check if we have a valid token in the cache
-    current_time = time.time()
-    if (_token_cache["access_token"] and 
-            _token_cache["expires_at"] > current_time + 60):  # 60 second buffer
-        logger.debug("Using cached access token")
-        return _token_cache["access_token"]
-    
-    # Get the configuration
-    config = get_auth_config()
-    if not all([config.get("client_id"), config.get("client_secret"), config.get("authority")]):
-        logger.error("Incomplete authentication configuration")
-        return None
-    
-    try:
-        # Create an MSAL app instance
-        app = msal.ConfidentialClientApplication(
-            client_id=config["client_id"],
-            client_credential=config["client_secret"],
-            authority=config["authority"]
-        )
-        
-        # Acquire token using client credentials flow (app-only)
-        result = app.acquire_token_for_client(scopes=scopes)
-        
-        if "access_token" in result:
-            # Cache the token with expiration time
-            _token_cache["access_token"] = result["access_token"]
-            _token_cache["expires_at"] = current_time + result.get("expires_in", 3599)  # Default to 1 hour - 1 second
-            logger.info("Successfully acquired new access token")
-            return result["access_token"]
-        else:
-            # Log error details
-            error = result.get("error")
-            error_description = result.get("error_description")
-            correlation_id = result.get("correlation_id")
-            logger.error(f"Failed to acquire token. Error: {error}, Description: {error_description}, Correlation ID: {correlation_id}")
-            return None
-            
-    except Exception as ex:
-        logger.error(f"Exception during token acquisition: {str(ex)}")
+    provider = get_token_provider()
+    if provider is None:
         return None
+    return provider.get_token(scopes)
 
 def get_auth_headers() -> Dict[str, str]:
     """
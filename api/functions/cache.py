@@ -0,0 +1,109 @@
+"""
+Bounded TTL + LRU cache for async lookups, with request coalescing.
+
+Used by ``/search`` so that the same query typed again seconds later is
+answered from memory, and so that simultaneous identical searches share one
+in-flight lookup (single-flight) instead of each starting its own winget
+process.
+
+The cache lives on the event loop and is not thread-safe; callers that need
+to run blocking work should do so inside the *loader* coroutine (e.g. with
+``run_in_threadpool``).
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable
+
+
+class AsyncTTLCache:
+    """LRU cache of at most *maxsize* entries, each valid for *ttl* seconds."""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 300, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._in_flight: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def _lookup(self, key: Hashable):
+        entry = self._entries.get(key)
+        if entry is None:
+            return False, None
+        expires_at, value = entry
+        if expires_at <= self._clock():
+            del self._entries[key]
+            return False, None
+        self._entries.move_to_end(key)
+        return True, value
+
+    def _store(self, key: Hashable, value: Any) -> None:
+        self._entries[key] = (self._clock() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_load(self, key: Hashable, loader: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Return the cached value for *key*, joining an in-flight load for the
+        same key or starting ``loader()`` otherwise.  Failed loads are not
+        cached; every waiter sees the exception.  The shared load is
+        cancelled only once every caller waiting on it has been cancelled.
+        """
+        found, value = self._lookup(key)
+        if found:
+            self.hits += 1
+            return value
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            self.misses += 1
+
+            async def _load():
+                try:
+                    result = await loader()
+                    self._store(key, result)
+                    return result
+                finally:
+                    # a cancelled load may already have been replaced by a newer one
+                    if self._in_flight.get(key) is asyncio.current_task():
+                        del self._in_flight[key]
+
+            task = asyncio.ensure_future(_load())
+            self._in_flight[key] = task
+        # shield: one caller going away must not cancel the shared lookup
+        self._waiters[key] = self._waiters.get(key, 0) + 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if self._waiters[key] == 1 and not task.done():
+                task.cancel()
+                # the next caller must start a fresh load, not join this one
+                self._in_flight.pop(key, None)
+            raise
+        finally:
+            self._waiters[key] -= 1
+            if not self._waiters[key]:
+                del self._waiters[key]
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+            "size": len(self._entries),
+            "in_flight": len(self._in_flight),
+        }
@@ -0,0 +1,103 @@
+"""
+Persistent index of what has already been deployed where.
+
+Every ``upload_intunewin`` used to create a new app and upload the payload
+again, even for a package identical to one deployed minutes earlier.  The
+index records, per (file digest, tenant, package id), the Intune app and the
+content version that was committed, so a re-deploy of an unchanged package
+can answer "already deployed" instead of repeating a multi-minute upload.
+
+The file digest is the ``FileDigest`` from the package's Detection.xml, so
+two packages with the same content and package id are the same deployment
+whatever their file name.
+
+Configuration through environment variables:
+
+- DEPLOYMENT_DB_PATH: SQLite file holding the index (default deployments.db
+  in the working directory)
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+DEPLOYMENT_DB_PATH = os.environ.get("DEPLOYMENT_DB_PATH", "deployments.db")
+
+_COLUMNS = ("file_digest", "tenant_id", "package_id", "app_id", "content_version_id", "display_name", "deployed_at")
+
+
+def tenant_key(tenant_id: Optional[str]) -> str:
+    """Index key for *tenant_id*; the environment tenant when it is None."""
+    return tenant_id or os.environ.get("GRAPH_TENANT_ID") or ""
+
+
+class DeploymentIndex:
+    """SQLite mapping of (file_digest, tenant_id, package_id) to a deployed app."""
+
+    def __init__(self, path: str = DEPLOYMENT_DB_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS deployments ("
+                " file_digest TEXT NOT NULL,"
+                " tenant_id TEXT NOT NULL,"
+                " package_id TEXT NOT NULL,"
+                " app_id TEXT NOT NULL,"
+                " content_version_id TEXT,"
+                " display_name TEXT,"
+                " deployed_at REAL NOT NULL,"
+                " PRIMARY KEY (file_digest, tenant_id, package_id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS deployments_app ON deployments (app_id)")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def lookup(self, file_digest: str, tenant_id: Optional[str], package_id: str) -> Optional[Dict]:
+        with self._connect() as conn:
+            row = conn.execute(
+                f"SELECT {', '.join(_COLUMNS)} FROM deployments "
+                "WHERE file_digest = ? AND tenant_id = ? AND package_id = ?",
+                (file_digest, tenant_key(tenant_id), package_id),
+            ).fetchone()
+        return dict(zip(_COLUMNS, row)) if row else None
+
+    def record(self, file_digest: str, tenant_id: Optional[str], package_id: str, app_id: str,
+               content_version_id: Optional[str] = None, display_name: Optional[str] = None) -> None:
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO deployments ({', '.join(_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (file_digest, tenant_key(tenant_id), package_id, app_id, content_version_id, display_name,
+                 time.time()),
+            )
+
+    def forget(self, app_id: str) -> int:
+        """Drop every entry pointing at *app_id* (e.g. after it was deleted in Intune)."""
+        with self._lock, self._connect() as conn:
+            return conn.execute("DELETE FROM deployments WHERE app_id = ?", (app_id,)).rowcount
+
+    def list(self, tenant_id: Optional[str] = None) -> List[Dict]:
+        query = f"SELECT {', '.join(_COLUMNS)} FROM deployments"
+        params = ()
+        if tenant_id is not None:
+            query += " WHERE tenant_id = ?"
+            params = (tenant_key(tenant_id),)
+        with self._connect() as conn:
+            rows = conn.execute(query + " ORDER BY deployed_at DESC", params).fetchall()
+        return [dict(zip(_COLUMNS, row)) for row in rows]
+
+
+_index: Optional[DeploymentIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_deployment_index() -> DeploymentIndex:
+    """Return the process-wide DeploymentIndex, creating it on first use."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = DeploymentIndex()
+        return _index
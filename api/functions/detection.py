@@ -0,0 +1,109 @@
+"""
+Version-aware detection rules for apps installed through winget.
+
+The app shells this API creates detect with a script that always succeeds
+(``exit 0``): useless once a package has a newer version, because Intune
+would consider every device up to date.  ``version_detection_rule`` builds a
+PowerShell detection rule that asks winget which version of the package is
+installed and reports the app as detected only if it is at least the
+deployed version.  ``catalog_overrides`` gives an app that rule, and the
+version as its ``displayVersion``, when it is first deployed: the version
+winget installs is the catalog's latest.
+
+Detection scripts run as SYSTEM, where ``winget`` is not on the PATH, so the
+script looks for winget.exe in the App Installer package under
+``Program Files\\WindowsApps`` first.  Versions are compared part by part,
+numerically where both parts are numbers, like ``winget_catalog.version_key``.
+"""
+
+import base64
+from typing import Dict, Optional
+
+_SCRIPT = r"""$ErrorActionPreference = 'SilentlyContinue'
+$PackageId = '{package_id}'
+$Wanted = '{version}'
+
+$winget = Get-ChildItem "$env:ProgramFiles\WindowsApps\Microsoft.DesktopAppInstaller_*_x64__8wekyb3d8bbwe\winget.exe" |
+    Sort-Object LastWriteTime | Select-Object -Last 1 -ExpandProperty FullName
+if (-not $winget) {{ $winget = (Get-Command winget.exe).Source }}
+if (-not $winget) {{ exit 1 }}
+
+function Compare-Version([string]$a, [string]$b) {{
+    $x = $a -split '[.\-+_]'
+    $y = $b -split '[.\-+_]'
+    for ($i = 0; $i -lt [Math]::Max($x.Count, $y.Count); $i++) {{
+        $p = if ($i -lt $x.Count) {{ $x[$i] }} else {{ '0' }}
+        $q = if ($i -lt $y.Count) {{ $y[$i] }} else {{ '0' }}
+        if ($p -match '^\d+$' -and $q -match '^\d+$') {{ $c = ([decimal]$p).CompareTo([decimal]$q) }}
+        else {{ $c = [string]::Compare($p, $q, $true) }}
+        if ($c -ne 0) {{ return $c }}
+    }}
+    return 0
+}}
+
+[Console]::OutputEncoding = [Text.Encoding]::UTF8
+$installed = $null
+foreach ($line in (& $winget list --id $PackageId --exact --accept-source-agreements --disable-interactivity)) {{
+    $tokens = @(-split $line)
+    $at = [Array]::FindIndex([string[]]$tokens, [Predicate[string]]{{ param($t) $t -ieq $PackageId }})
+    if ($at -lt 0) {{ continue }}
+    # the Version column follows the Id; winget prefixes ranges with < or >
+    $next = $at + 1
+    if ($next -lt $tokens.Count -and $tokens[$next] -in '<', '>') {{ $next++ }}
+    if ($next -lt $tokens.Count) {{ $installed = $tokens[$next]; break }}
+}}
+if (-not $installed -or $installed -eq 'Unknown') {{ exit 1 }}
+if ((Compare-Version $installed $Wanted) -ge 0) {{
+    Write-Output "$PackageId $installed is installed"
+    exit 0
+}}
+exit 1
+"""
+
+
+def _ps_literal(value: str) -> str:
+    # inside a single-quoted PowerShell string only the quote itself is special
+    return value.replace("'", "''")
+
+
+def version_detection_script(package_id: str, version: str) -> str:
+    """PowerShell detecting *package_id* at *version* or later through ``winget list``."""
+    if not package_id or not version:
+        raise ValueError("package_id and version are required")
+    return _SCRIPT.format(package_id=_ps_literal(package_id), version=_ps_literal(version))
+
+
+def version_detection_rule(package_id: str, version: str) -> Dict:
+    """``win32LobAppPowerShellScriptRule`` running ``version_detection_script``."""
+    script = version_detection_script(package_id, version)
+    return {
+        "@odata.type": "#microsoft.graph.win32LobAppPowerShellScriptRule",
+        "ruleType": "detection",
+        "enforceSignatureCheck": False,
+        "runAs32Bit": False,
+        "scriptContent": base64.b64encode(script.encode("utf-8")).decode(),
+        "operationType": "notConfigured",
+        "operator": "notConfigured",
+    }
+
+
+def version_overrides(package_id: str, version: str, overrides: Optional[Dict] = None) -> Dict:
+    """
+    Win32LobApp overrides (see ``build_app_shell``) recording *version* as
+    the ``displayVersion`` and detecting it; explicit *overrides* win.
+    """
+    return {"display_version": version, "rules": [version_detection_rule(package_id, version)], **(overrides or {})}
+
+
+def catalog_overrides(catalog, package_id: str, overrides: Optional[Dict] = None) -> Optional[Dict]:
+    """
+    ``version_overrides`` for the latest version of *package_id* in the
+    winget *catalog* (a ``WingetCatalog``).  Without a loaded catalog, or
+    for packages it does not know, *overrides* is returned unchanged and the
+    app is deployed unversioned.
+    """
+    entry = catalog.get(package_id) if catalog is not None and catalog.loaded else None
+    if not entry or not entry.get("Version"):
+        return overrides
+    # the catalog's spelling of the id is what winget list prints
+    return version_overrides(entry["Id"], entry["Version"], overrides)
@@ -0,0 +1,305 @@
+"""
+Coalesce small Graph requests into JSON ``$batch`` calls.
+
+Status polls for many in-flight uploads, assignment creation and metadata
+PATCHes are small, independent requests that each cost a full round trip.
+``GraphBatcher`` queues them and sends up to 20 at a time through Graph's
+``/$batch`` endpoint, then hands every caller its own response:
+
+- ``request``/``submit`` queue one request; callers arriving within the
+  batch window share a round trip.  Results and errors look exactly like
+  ``GraphClient.request`` (decoded JSON body, or ``requests.HTTPError`` with
+  the item's status, headers and body on ``.response``).
+- ``submit_many`` queues requests that must travel in the same batch, with
+  ``depends_on`` expressed as indexes into the list (Graph's ``dependsOn``).
+- Items answered with 429 (or a transient 5xx for idempotent methods) are
+  retried in a later batch after their ``Retry-After``, together with the
+  items that failed only because they depended on them (424).  The tenant's
+  token bucket is charged for every inner request and held on throttling,
+  as for direct calls.
+
+Use ``batcher_for(client)`` to share one batcher per ``GraphClient`` (i.e.
+per tenant).
+
+Tunable through environment variables:
+
+- GRAPH_BATCH_WINDOW: seconds to wait for more requests before sending a
+  batch; 0 makes callers such as the uploader's poll loops bypass batching
+  (default 0.05)
+- GRAPH_BATCH_CONCURRENCY: batches in flight at once per client (default 4)
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Deque, Dict, List, Optional
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+from . import metrics
+from .graph_client import GRAPH_BASE, GraphClient
+from .throttle import IDEMPOTENT_METHODS, RETRY_BASE_DELAY, RETRY_MAX_ATTEMPTS, RETRY_MAX_DELAY, RETRYABLE_STATUSES, \
+    _backoff
+
+logger = logging.getLogger(__name__)
+
+GRAPH_BATCH_MAX = 20  # Graph's limit per $batch call
+GRAPH_BATCH_WINDOW = float(os.environ.get("GRAPH_BATCH_WINDOW", "0.05"))
+GRAPH_BATCH_CONCURRENCY = int(os.environ.get("GRAPH_BATCH_CONCURRENCY", "4"))
+
+_ITEMS = metrics.counter("graph_batch_requests_total", "Graph requests sent inside $batch calls, by outcome",
+                         ("method", "route", "status"))
+
+
+class _Item:
+    __slots__ = ("method", "url", "body", "headers", "depends_on", "future", "attempts")
+
+    def __init__(self, method: str, url: str, body=None, headers=None, depends_on=()):
+        self.method = method.upper()
+        self.url = url
+        self.body = body
+        self.headers = headers
+        self.depends_on = list(depends_on)
+        self.future: Future = Future()
+        self.attempts = 0
+
+
+def _item_error(item: _Item, status: int, headers: Dict, body) -> requests.HTTPError:
+    """An HTTPError shaped like the one GraphClient.request raises."""
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers = CaseInsensitiveDict(headers or {})
+    resp._content = json.dumps(body).encode() if body is not None else b""
+    resp.url = item.url
+    return requests.HTTPError(f"{status} Error for {item.method} {item.url} (in $batch)\n{resp.text}", response=resp)
+
+
+class GraphBatcher:
+    """Queues Graph requests for one client and sends them as ``$batch`` calls."""
+
+    def __init__(
+        self,
+        client: GraphClient,
+        graph_base: str = GRAPH_BASE,
+        window: float = GRAPH_BATCH_WINDOW,
+        max_batch: int = GRAPH_BATCH_MAX,
+        concurrency: int = GRAPH_BATCH_CONCURRENCY,
+        max_attempts: int = RETRY_MAX_ATTEMPTS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.client = client
+        self.graph_base = graph_base.rstrip("/")
+        self.window = window
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self._clock = clock
+        # groups of items that must share a batch, with the time they may be sent
+        self._queue: Deque = deque()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._pool = ThreadPoolExecutor(max_workers=max(1, concurrency), thread_name_prefix="graph-batch")
+        self._thread: Optional[threading.Thread] = None
+        self.batches = 0
+        self.requests = 0
+
+    # ----------------------------------------------------------------------------------
+    # queueing
+    # ----------------------------------------------------------------------------------
+    def _relative(self, url: str) -> str:
+        if not url.startswith(self.graph_base + "/"):
+            raise ValueError(f"{url} is not under {self.graph_base}")
+        return url[len(self.graph_base):]
+
+    def _enqueue(self, group: List[_Item], not_before: float = 0.0, retry: bool = False) -> None:
+        with self._cond:
+            if self._closed and not retry:
+                raise RuntimeError("GraphBatcher is closed")
+            self._queue.append((not_before, group))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="graph-batcher", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def submit(self, method: str, url: str, json=None, headers: Optional[Dict] = None) -> Future:
+        """Queue one request; the future resolves to its decoded JSON body (or None)."""
+        self._relative(url)
+        item = _Item(method, url, json, headers)
+        self._enqueue([item])
+        return item.future
+
+    def submit_many(self, requests_: List[Dict]) -> List[Future]:
+        """
+        Queue requests that are sent in the same batch.  Each is a dict with
+        ``method``, ``url`` and optionally ``json``, ``headers`` and
+        ``depends_on`` (indexes of earlier requests in the list that must
+        succeed first).  At most ``max_batch`` requests.
+        """
+        if len(requests_) > self.max_batch:
+            raise ValueError(f"At most {self.max_batch} requests can share a batch")
+        items: List[_Item] = []
+        for n, spec in enumerate(requests_):
+            depends_on = spec.get("depends_on") or ()
+            if any(not 0 <= dep < n for dep in depends_on):
+                raise ValueError("depends_on must refer to earlier requests")
+            self._relative(spec["url"])
+            items.append(_Item(spec["method"], spec["url"], spec.get("json"), spec.get("headers"),
+                               [items[dep] for dep in depends_on]))
+        if items:
+            self._enqueue(items)
+        return [item.future for item in items]
+
+    def request(self, method: str, url: str, **kwargs):
+        """Like ``GraphClient.request``, but sent as part of a batch."""
+        return self.submit(method, url, **kwargs).result()
+
+    # ----------------------------------------------------------------------------------
+    # dispatch
+    # ----------------------------------------------------------------------------------
+    def _due(self, now: float) -> int:
+        return sum(len(group) for not_before, group in self._queue if not_before <= now)
+
+    def _take(self, now: float) -> List[List[_Item]]:
+        taken, size, keep = [], 0, deque()
+        for not_before, group in self._queue:
+            if not_before <= now and size + len(group) <= self.max_batch:
+                taken.append(group)
+                size += len(group)
+            else:
+                keep.append((not_before, group))
+        self._queue = keep
+        return taken
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    now = self._clock()
+                    if self._due(now) or (self._closed and not self._queue):
+                        break
+                    waits = [not_before - now for not_before, _ in self._queue]
+                    self._cond.wait(min(waits) if waits else None)
+                if self._closed and not self._queue:
+                    return
+                # linger briefly so callers arriving together share the round trip
+                deadline = self._clock() + self.window
+                while not self._closed and self._due(self._clock()) < self.max_batch:
+                    remaining = deadline - self._clock()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                batch = self._take(self._clock())
+            if batch:
+                self._pool.submit(self._send, batch)
+
+    def _send(self, batch: List[List[_Item]]) -> None:
+        items = [item for group in batch for item in group]
+        ids = {id(item): str(n) for n, item in enumerate(items, 1)}
+        payload = []
+        for item in items:
+            entry = {"id": ids[id(item)], "method": item.method, "url": self._relative(item.url)}
+            if item.body is not None:
+                entry["body"] = item.body
+                entry["headers"] = {"Content-Type": "application/json", **(item.headers or {})}
+            elif item.headers:
+                entry["headers"] = dict(item.headers)
+            # a dependency that already succeeded in an earlier batch is not resent
+            depends_on = [ids[id(dep)] for dep in item.depends_on if id(dep) in ids]
+            if depends_on:
+                entry["dependsOn"] = depends_on
+            payload.append(entry)
+            item.attempts += 1
+
+        # Graph throttles the inner requests, not the $batch call: charge them all
+        for _ in range(len(items) - 1):
+            self.client.bucket.acquire()
+        try:
+            data = self.client.post(f"{self.graph_base}/$batch", json={"requests": payload}) or {}
+        except Exception as exc:
+            for item in items:
+                item.future.set_exception(exc)
+            return
+        self.batches += 1
+        self.requests += len(items)
+
+        responses = {resp.get("id"): resp for resp in data.get("responses", [])}
+        for group in batch:
+            again: List[_Item] = []
+            delay = 0.0
+            for item in group:
+                resp = responses.get(ids[id(item)]) or {"status": 500, "body": {"error": "missing from $batch response"}}
+                status = int(resp.get("status", 500))
+                headers = resp.get("headers") or {}
+                if metrics.ENABLED:
+                    _ITEMS.inc(item.method, metrics.route_of(item.url), str(status))
+                retryable = status == 429 or (item.method in IDEMPOTENT_METHODS and status in RETRYABLE_STATUSES)
+                waiting_on_retry = status == 424 and any(dep in again for dep in item.depends_on)
+                if (retryable and item.attempts < self.max_attempts) or waiting_on_retry:
+                    if retryable:
+                        retry_after = CaseInsensitiveDict(headers).get("Retry-After")
+                        try:
+                            pause = max(0.0, float(retry_after))
+                            self.client.bucket.hold(pause)
+                        except (TypeError, ValueError):
+                            pause = _backoff(item.attempts - 1, RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+                        delay = max(delay, pause)
+                        logger.info("%s %s returned %s in $batch, retrying in %.1fs",
+                                    item.method, item.url, status, pause)
+                    again.append(item)
+                elif 200 <= status < 300:
+                    item.future.set_result(resp.get("body"))
+                else:
+                    item.future.set_exception(_item_error(item, status, headers, resp.get("body")))
+            if again:
+                self._enqueue(again, self._clock() + delay, retry=True)
+
+    def close(self) -> None:
+        """Send what is queued, then stop the dispatcher."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self._pool.shutdown(wait=True)
+        # retries queued by the last batches have no dispatcher left to send them
+        with self._cond:
+            for _, group in self._queue:
+                for item in group:
+                    item.future.set_exception(RuntimeError("GraphBatcher closed before the request could be retried"))
+            self._queue.clear()
+
+
+_batchers: Dict[GraphClient, GraphBatcher] = {}
+_batchers_lock = threading.Lock()
+
+
+def batcher_for(client: GraphClient) -> GraphBatcher:
+    """
+    The shared GraphBatcher for *client* (created on first use).  It is
+    closed and forgotten when the client is closed, e.g. when its tenant is
+    removed.  Raises RuntimeError for a closed client, whose batcher would
+    never be closed; send its requests directly instead.
+    """
+    with _batchers_lock:
+        if client not in _batchers:
+            client.on_close(lambda: _release_batcher(client))
+            _batchers[client] = GraphBatcher(client)
+        return _batchers[client]
+
+
+def _release_batcher(client: GraphClient) -> None:
+    with _batchers_lock:
+        batcher = _batchers.pop(client, None)
+    if batcher is not None:
+        batcher.close()
+
+
+def batch_stats() -> Dict[str, int]:
+    """$batch calls sent and the requests they carried, over all shared batchers."""
+    with _batchers_lock:
+        batchers = list(_batchers.values())
+    return {"batches": sum(b.batches for b in batchers), "requests": sum(b.requests for b in batchers)}
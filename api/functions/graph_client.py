@@ -0,0 +1,174 @@
+"""
+Shared, pooled HTTP client for Microsoft Graph.
+
+Every Graph call used to go through a bare ``requests.request``, which opens
+(and TLS-handshakes) a fresh connection each time.  ``GraphClient`` keeps one
+``requests.Session`` with a keep-alive connection pool instead; the uploader
+and any other Graph caller should use ``get_graph_client()`` so they all share
+it.
+Requests are rate limited per tenant and retried on throttling by the
+``throttle`` module, and counted and timed by route (see ``metrics``).
+
+Pool sizes and the request timeout can be tuned through environment
+variables:
+
+- GRAPH_POOL_CONNECTIONS: number of host pools to cache (default 4)
+- GRAPH_POOL_MAXSIZE: connections kept per host (default 16)
+- GRAPH_TIMEOUT: seconds to wait for a response (default 60)
+"""
+
+import json
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+import requests
+import requests.adapters
+
+from . import metrics
+from .auth import get_auth_headers
+from .throttle import TokenBucket, bucket_for, send_with_retry
+
+logger = logging.getLogger(__name__)
+
+GRAPH_POOL_CONNECTIONS = int(os.environ.get("GRAPH_POOL_CONNECTIONS", "4"))
+GRAPH_POOL_MAXSIZE = int(os.environ.get("GRAPH_POOL_MAXSIZE", "16"))
+GRAPH_TIMEOUT = float(os.environ.get("GRAPH_TIMEOUT", "60"))
+
+GRAPH_BASE = "https://graph.microsoft.com/beta"  # use v1.0 if you prefer
+
+_REQUESTS = metrics.counter("graph_requests_total", "Graph requests sent directly (not in $batch), by outcome",
+                            ("method", "route", "status"))
+_LATENCY = metrics.histogram("graph_request_duration_seconds",
+                             "Time for a direct Graph request, including retries", ("method", "route"))
+_RETRIES = metrics.counter("graph_request_retries_total", "Retries of direct Graph requests", ("method", "route"))
+
+
+def parse_graph_datetime(value: Optional[str]) -> Optional[datetime]:
+    """A Graph timestamp as an aware datetime, or None if missing/invalid."""
+    # Graph sends up to 7 fractional digits, fromisoformat takes at most 6
+    try:
+        return datetime.fromisoformat(re.sub(r"(\.\d{6})\d+", r"\1", value).replace("Z", "+00:00"))
+    except (TypeError, ValueError):
+        return None
+
+
+class GraphClient:
+    """Thin wrapper around a pooled ``requests.Session`` for Graph calls."""
+
+    def __init__(
+        self,
+        auth_headers: Callable[[], Dict[str, str]] = get_auth_headers,
+        pool_connections: int = GRAPH_POOL_CONNECTIONS,
+        pool_maxsize: int = GRAPH_POOL_MAXSIZE,
+        timeout: float = GRAPH_TIMEOUT,
+        tenant_id: Optional[str] = None,
+        bucket: Optional[TokenBucket] = None,
+    ):
+        self._auth_headers = auth_headers
+        self.timeout = timeout
+        # concurrent callers for the same tenant share one request budget
+        self.bucket = bucket or bucket_for(tenant_id or os.environ.get("GRAPH_TENANT_ID"))
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._on_close: List[Callable[[], None]] = []
+        self._close_lock = threading.Lock()
+        self.closed = False
+
+    def on_close(self, callback: Callable[[], None]) -> None:
+        """
+        Call *callback* when the client is closed, before its session is (e.g.
+        to drop per-client state).  Raises RuntimeError once the client is
+        closed, since the callback would never run.
+        """
+        with self._close_lock:
+            if self.closed:
+                raise RuntimeError("GraphClient is closed")
+            self._on_close.append(callback)
+
+    def request(self, method: str, url: str, **kwargs):
+        """
+        Send a Graph request and return the decoded JSON body (or None).
+
+        Throttled and transient failures are retried (see ``throttle``).
+        Raises ``requests.HTTPError`` carrying Graph's error body in the message
+        and the response on ``.response``.
+        """
+        extra_headers = kwargs.pop("headers", None) or {}
+        kwargs.setdefault("timeout", self.timeout)
+        logger.debug("GRAPH %s %s", method, url)
+        if 'json' in kwargs and kwargs['json'] is not None:
+            try:
+                logger.debug("Payload: %s", json.dumps(kwargs['json'])[:1000])
+            except Exception:
+                pass
+
+        def _send():
+            # fresh headers per attempt: the token may be refreshed between retries
+            headers = self._auth_headers()
+            headers.update(extra_headers)
+            return self.session.request(method, url, headers=headers, **kwargs)
+
+        started = time.perf_counter()
+        try:
+            resp = send_with_retry(_send, method, bucket=self.bucket)
+        except Exception:
+            if metrics.ENABLED:
+                _REQUESTS.inc(method, metrics.route_of(url), "error")
+            raise
+        if metrics.ENABLED:
+            route = metrics.route_of(url)
+            _LATENCY.observe(time.perf_counter() - started, method, route)
+            _REQUESTS.inc(method, route, str(resp.status_code))
+            if getattr(resp, "attempts", 1) > 1:
+                _RETRIES.inc(method, route, amount=resp.attempts - 1)
+        logger.debug("Response status: %s", resp.status_code)
+        logger.debug("Response snippet: %s", resp.text[:500])
+        try:
+            resp.raise_for_status()
+        except requests.HTTPError as exc:
+            # Surface error details from Graph for easier troubleshooting
+            raise requests.HTTPError(f"{exc}\n{resp.text}", response=resp) from None
+        return resp.json() if resp.content else None
+
+    def get(self, url: str, **kwargs):
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs):
+        return self.request("POST", url, **kwargs)
+
+    def patch(self, url: str, **kwargs):
+        return self.request("PATCH", url, **kwargs)
+
+    def close(self) -> None:
+        # requests still work afterwards (the session reconnects), e.g. for
+        # uploads that held the client of a tenant whose credentials changed
+        with self._close_lock:
+            self.closed = True
+            callbacks, self._on_close = self._on_close, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception:
+                logger.exception("GraphClient close callback %r failed", callback)
+        self.session.close()
+
+
+_default_client: Optional[GraphClient] = None
+_default_lock = threading.Lock()
+
+
+def get_graph_client() -> GraphClient:
+    """Return the process-wide GraphClient, creating it on first use."""
+    global _default_client
+    if _default_client is None:
+        with _default_lock:
+            if _default_client is None:
+                _default_client = GraphClient()
+    return _default_client
@@ -10,24 +10,47 @@ pip install requests cryptography azure-storage-blob python-dotenv
 from __future__ import annotations
 import base64
 import hashlib
+import hmac
 import json
 import logging
 import re
 
 import math
+import mmap
 import os
+import queue
+import struct
+import threading
 import time
 import uuid
 import xml.etree.ElementTree as ET
 import zipfile
+from datetime import datetime, timedelta, timezone
+from contextlib import contextmanager
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from pathlib import Path
-from typing import Dict, Tuple, Optional
+from typing import BinaryIO, Callable, Dict, Iterator, List, Tuple, Optional
 
 import requests
+import requests.adapters
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
 
 # Change from absolute import to relative import to fix circular reference
-from .auth import get_auth_headers  # Use relative import
+from . import metrics
+from .assignments import assigner_for
+from .auth import get_access_token  # Use relative import
+from .deployments import get_deployment_index, tenant_key
+from .graph_batch import GRAPH_BATCH_WINDOW, batcher_for
+from .graph_client import GRAPH_BASE, GraphClient, get_graph_client, parse_graph_datetime
+from .journal import UploadJournal
+from .polling import poll_until
+from .tenants import access_token_for, client_for
+from .throttle import send_with_retry
+
+try:
+    from ..classes.win32app import Win32LobApp
+except ImportError:  # run from api/ (``uvicorn api:app``), where classes is top level
+    from classes.win32app import Win32LobApp
 
 
 logger = logging.getLogger(__name__)
@@ -36,14 +59,126 @@ if not logger.handlers:
     logging.basicConfig(level=logging.INFO)
 
 
-GRAPH_BASE = "https://graph.microsoft.com/beta"  # use v1.0 if you prefer
+# Receives ``(stage, **info)`` as an upload moves through its stages.
+ProgressCallback = Callable[..., None]
+
+_STAGE_SECONDS = metrics.histogram("intune_upload_stage_duration_seconds",
+                                   "Time upload_intunewin spent in each stage", ("stage",))
+_UPLOADS = metrics.counter("intune_uploads_total", "upload_intunewin calls by outcome", ("outcome",))
+_BLOB_BYTES = metrics.counter("blob_upload_bytes_total", "Payload bytes stored as Azure blob blocks")
+_BLOCK_SECONDS = metrics.histogram("blob_block_duration_seconds", "Time to PUT one blob block, including retries")
+_BLOB_THROUGHPUT = metrics.histogram(
+    "blob_upload_throughput_bytes_per_second", "Throughput of each blob upload, over all its targets",
+    buckets=tuple(mib * 1024 * 1024 for mib in (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)),
+)
+
+
+def _report(progress: Optional[ProgressCallback], stage: str, **info) -> None:
+    if progress is None:
+        return
+    try:
+        progress(stage, **info)
+    except Exception:  # a broken listener must never fail the upload
+        logger.exception("Progress callback failed for stage %s", stage)
 
 
 # --------------------------------------------------------------------------------------
 # 1.  ── helper: read metadata & decrypt payload inside the .intunewin
 # --------------------------------------------------------------------------------------
-def _parse_detection_xml(intunewin: Path) -> Tuple[Dict, Path]:
-    """Return encryption metadata + path to the *encrypted* payload file."""
+class _FilePayload:
+    """An encrypted payload that already sits on disk as a plain file."""
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.size = os.path.getsize(self.path)
+
+    def open(self) -> BinaryIO:
+        return open(self.path, "rb")
+
+
+class _MappedPayload:
+    """
+    Reader over *size* bytes of a memory map starting at *base*, so that
+    offsets (``seek``/``tell``) count from the payload start like they do
+    for a plain file.
+    """
+
+    def __init__(self, mapped: mmap.mmap, base: int, size: int):
+        self._view = memoryview(mapped)[base:base + size]
+        self._pos = 0
+
+    def seek(self, offset: int, whence: int = os.SEEK_SET) -> int:
+        base = {os.SEEK_SET: 0, os.SEEK_CUR: self._pos, os.SEEK_END: len(self._view)}[whence]
+        self._pos = max(0, base + offset)
+        return self._pos
+
+    def tell(self) -> int:
+        return self._pos
+
+    def readinto(self, buf) -> int:
+        n = max(0, min(len(buf), len(self._view) - self._pos))
+        buf[:n] = self._view[self._pos:self._pos + n]
+        self._pos += n
+        return n
+
+    def read(self, size: int = -1) -> bytes:
+        end = len(self._view) if size is None or size < 0 else min(len(self._view), self._pos + size)
+        data = bytes(self._view[self._pos:end])
+        self._pos = max(self._pos, end)
+        return data
+
+    def release(self) -> None:
+        # the map cannot be closed while a view of it is exported
+        self._view.release()
+
+
+class _ZipPayload:
+    """
+    The encrypted payload read in place from inside the .intunewin zip.
+
+    Nothing is extracted: a stored (uncompressed) member is memory-mapped
+    straight out of the package, a deflated one is streamed through
+    ``ZipFile.open``.
+    """
+
+    def __init__(self, package: Path, info: zipfile.ZipInfo):
+        self.package = Path(package)
+        self.info = info
+        self.size = info.file_size
+
+    def _data_offset(self, fh: BinaryIO) -> int:
+        # The central directory records where the local header starts; the
+        # data follows the header plus its own (possibly different) name and
+        # extra field lengths.
+        fh.seek(self.info.header_offset)
+        header = fh.read(zipfile.sizeFileHeader)
+        fields = struct.unpack(zipfile.structFileHeader, header)
+        if fields[zipfile._FH_SIGNATURE] != zipfile.stringFileHeader:
+            raise zipfile.BadZipFile(f"Bad local header for {self.info.filename}")
+        return (self.info.header_offset + zipfile.sizeFileHeader
+                + fields[zipfile._FH_FILENAME_LENGTH] + fields[zipfile._FH_EXTRA_FIELD_LENGTH])
+
+    @contextmanager
+    def open(self) -> Iterator[BinaryIO]:
+        if self.info.compress_type == zipfile.ZIP_STORED and self.size:
+            with open(self.package, "rb") as fh:
+                start = self._data_offset(fh)
+                # mmap offsets must be aligned to the allocation granularity
+                aligned = start - start % mmap.ALLOCATIONGRANULARITY
+                with mmap.mmap(fh.fileno(), start - aligned + self.size,
+                               access=mmap.ACCESS_READ, offset=aligned) as mapped:
+                    view = _MappedPayload(mapped, start - aligned, self.size)
+                    try:
+                        yield view
+                    finally:
+                        view.release()
+        else:
+            with zipfile.ZipFile(self.package) as zf, zf.open(self.info) as stream:
+                yield stream
+
+
+def _parse_detection_xml(intunewin: Path) -> Tuple[Dict, _ZipPayload]:
+    """Return encryption metadata + a reader for the *encrypted* payload."""
     with zipfile.ZipFile(intunewin) as zf:
         with zf.open("IntuneWinPackage/Metadata/Detection.xml") as f:
             root = ET.parse(f).getroot()
@@ -65,11 +200,8 @@ def _parse_detection_xml(intunewin: Path) -> Tuple[Dict, Path]:
         }
 
         # encrypted blob lives under Contents/<file_name>
-        encrypted_blob = zf.extract(
-            f"IntuneWinPackage/Contents/{meta['file_name']}",
-            path=intunewin.parent,
-        )
-    return meta, Path(encrypted_blob)
+        info = zf.getinfo(f"IntuneWinPackage/Contents/{meta['file_name']}")
+    return meta, _ZipPayload(intunewin, info)
 
 
 def _decrypt_file(src: Path, dst: Path, key: bytes, iv: bytes) -> None:
@@ -84,30 +216,128 @@ def _decrypt_file(src: Path, dst: Path, key: bytes, iv: bytes) -> None:
         fout.write(decryptor.finalize())
 
 
+class PayloadIntegrityError(ValueError):
+    """The encrypted payload does not match the Mac/FileDigest in Detection.xml."""
+
+
+class _PayloadVerifier:
+    """
+    Checks the encrypted payload against Detection.xml while it is uploaded.
+
+    The payload is ``HMAC (32 bytes) | IV (16 bytes) | AES-CBC ciphertext``;
+    the HMAC-SHA256 (keyed with MacKey) covers IV and ciphertext and
+    FileDigest is the SHA-256 of the decrypted, unpadded content.  Feed
+    ``update`` the same buffers that are sent, in order; the stored HMAC and
+    IV are compared as soon as the header has been seen and everything else
+    in ``finish``.  Each byte is only touched once, by buffers already in
+    memory for the upload.
+    """
+
+    HEADER = 48
+    FIELDS = ("mac", "mac_key", "iv", "encryption_key", "file_digest")
+
+    def __init__(self, meta: Dict):
+        self.expected_mac = base64.b64decode(meta["mac"])
+        self.expected_iv = base64.b64decode(meta["iv"])
+        self.expected_digest = base64.b64decode(meta["file_digest"])
+        self._key = base64.b64decode(meta["encryption_key"])
+        self._hmac = hmac.new(base64.b64decode(meta["mac_key"]), digestmod=hashlib.sha256)
+        self._sha = hashlib.sha256()
+        self._header = b""
+        self._decryptor = None
+        self._tail = b""  # last plaintext block, held back until the padding is known
+        self._buffer = bytearray()
+
+    @classmethod
+    def for_package(cls, meta: Dict, payload) -> Optional["_PayloadVerifier"]:
+        """
+        A verifier for *payload*, or None if Detection.xml lacks what is
+        needed.  The payload size is checked right away: PKCS7 padding always
+        adds 1-16 bytes, so it is fully determined by the unencrypted size.
+        """
+        if not all(meta.get(field) for field in cls.FIELDS) or meta.get("digest_algorithm", "SHA256") != "SHA256":
+            return None
+        expected = cls.HEADER + (meta["unencrypted_size"] // 16 + 1) * 16
+        if payload.size != expected:
+            raise PayloadIntegrityError(
+                f"Encrypted payload is {payload.size} bytes, expected {expected} for "
+                f"{meta['unencrypted_size']} bytes of content"
+            )
+        return cls(meta)
+
+    def update(self, chunk: bytes) -> None:
+        if self._decryptor is None:
+            need = self.HEADER - len(self._header)
+            self._header += bytes(chunk[:need])
+            chunk = memoryview(chunk)[need:]
+            if len(self._header) < self.HEADER:
+                return
+            if not hmac.compare_digest(self._header[:32], self.expected_mac):
+                raise PayloadIntegrityError("Payload HMAC header does not match the Mac in Detection.xml")
+            if self._header[32:] != self.expected_iv:
+                raise PayloadIntegrityError("Payload IV does not match the InitializationVector in Detection.xml")
+            self._hmac.update(self._header[32:])
+            self._decryptor = Cipher(algorithms.AES(self._key), modes.CBC(self.expected_iv)).decryptor()
+        if not chunk:
+            return
+        self._hmac.update(chunk)
+        # decrypt into a reused buffer and hash views of it: no per-block copies
+        if len(self._buffer) < len(chunk) + 16:
+            self._buffer = bytearray(len(chunk) + 16)
+        n = self._decryptor.update_into(chunk, self._buffer)
+        plain = memoryview(self._buffer)[:n]
+        if n >= 16:
+            self._sha.update(self._tail)
+            self._sha.update(plain[:n - 16])
+            self._tail = bytes(plain[n - 16:])
+        else:
+            held = self._tail + bytes(plain)
+            self._sha.update(held[:-16])
+            self._tail = held[-16:]
+
+    def finish(self) -> None:
+        """Raise PayloadIntegrityError unless the whole payload checked out."""
+        if self._decryptor is None:
+            raise PayloadIntegrityError("Payload is shorter than its header")
+        if not hmac.compare_digest(self._hmac.digest(), self.expected_mac):
+            raise PayloadIntegrityError("Payload HMAC does not match the Mac in Detection.xml")
+        last = self._tail + self._decryptor.finalize()
+        pad = last[-1] if last else 0
+        if not 1 <= pad <= 16 or last[-pad:] != bytes([pad]) * pad:
+            raise PayloadIntegrityError("Payload has invalid padding")
+        self._sha.update(last[:-pad])
+        if not hmac.compare_digest(self._sha.digest(), self.expected_digest):
+            raise PayloadIntegrityError("Decrypted payload does not match the FileDigest in Detection.xml")
+
+
 # --------------------------------------------------------------------------------------
 # 2.  ── graph helpers
 # --------------------------------------------------------------------------------------
-def _graph_request(method: str, url: str, **kwargs):
-    headers = get_auth_headers()
-    headers.update(kwargs.pop("headers", {}))
-    logger.debug("GRAPH %s %s", method, url)
-    if 'json' in kwargs and kwargs['json'] is not None:
-        try:
-            logger.debug("Payload: %s", json.dumps(kwargs['json'])[:1000])
-        except Exception:
-            pass
-    resp = requests.request(method, url, headers=headers, **kwargs)
-    logger.debug("Response status: %s", resp.status_code)
-    logger.debug("Response snippet: %s", resp.text[:500])
-    try:
-        resp.raise_for_status()
-    except requests.HTTPError as exc:
-        # Surface error details from Graph for easier troubleshooting
-        raise requests.HTTPError(f"{exc}\n{resp.text}") from None
-    return resp.json() if resp.content else None
+def _graph_request(method: str, url: str, client: Optional[GraphClient] = None, **kwargs):
+    # *client* selects the tenant; the environment tenant's client by default
+    return (client or get_graph_client()).request(method, url, **kwargs)
+
+
+def _poll_get(url: str, client: Optional[GraphClient] = None):
+    """
+    GET for a status poll.  Polls from concurrent uploads to one tenant are
+    coalesced into shared ``$batch`` round trips (see ``graph_batch``) unless
+    GRAPH_BATCH_WINDOW is 0 or the tenant's client was closed mid-upload.
+    """
+    client = client or get_graph_client()
+    if GRAPH_BATCH_WINDOW <= 0 or client.closed:
+        return client.request("GET", url)
+    return batcher_for(client).request("GET", url)
 
 
-def _create_app_shell(display_name: str, description: Optional[str], publisher: str, installer_name: str, package_id: str) -> str:
+def build_app_shell(display_name: str, description: Optional[str], publisher: str, installer_name: str,
+                    package_id: str, overrides: Optional[Dict] = None) -> Win32LobApp:
+    """
+    The Win32LobApp this API creates for a winget package.  *overrides* maps
+    Win32LobApp attributes (e.g. ``rules``, ``minimum_supported_windows_release``)
+    to values replacing the defaults; the model raises ValueError if the
+    result is invalid.
+    """
     if not description:
         description = display_name
     # Build install/uninstall command lines based on PackageID and display name
@@ -120,18 +350,16 @@ def _create_app_shell(display_name: str, description: Optional[str], publisher:
     )
     uninstall_cmd = install_cmd.replace("-mode install", "-mode uninstall")
 
-    body = {
-        "@odata.type": "#microsoft.graph.win32LobApp",
-        "displayName": display_name,
-        "description": description,
-        "publisher": publisher,
-        "fileName": installer_name,
-        "setupFilePath": installer_name,
-        "installCommandLine": install_cmd,
-        "uninstallCommandLine": uninstall_cmd,
-        "applicableArchitectures": "x64",
-        "minimumSupportedWindowsRelease": "1607",
-        "rules": [
+    fields = dict(
+        display_name=display_name,
+        description=description,
+        publisher=publisher,
+        install_command_line=install_cmd,
+        uninstall_command_line=uninstall_cmd,
+        setup_file_path=installer_name,
+        file_name=installer_name,
+        minimum_supported_windows_release="1607",
+        rules=[
             {
                 "@odata.type": "#microsoft.graph.win32LobAppPowerShellScriptRule",
                 "ruleType": "detection",
@@ -142,54 +370,97 @@ def _create_app_shell(display_name: str, description: Optional[str], publisher:
                 "operator": "notConfigured"
             }
         ],
-        "installExperience": {"@odata.type": "#microsoft.graph.win32LobAppInstallExperience",
-                              "runAsAccount": "system",
-                              "deviceRestartBehavior": "suppress"},
-        "returnCodes": [{"@odata.type": "#microsoft.graph.win32LobAppReturnCode",
-                         "returnCode": 0, "type": "success"}]
-    }
-    result = _graph_request("POST", f"{GRAPH_BASE}/deviceAppManagement/mobileApps", json=body)
+        install_experience={"runAsAccount": "system", "deviceRestartBehavior": "suppress"},
+        return_codes=[{"@odata.type": "#microsoft.graph.win32LobAppReturnCode", "returnCode": 0, "type": "success"}],
+    )
+    fields.update(overrides or {})
+    return Win32LobApp(**fields)
+
+
+def _create_app_shell(display_name: str, description: Optional[str], publisher: str, installer_name: str,
+                      package_id: str, client: Optional[GraphClient] = None, overrides: Optional[Dict] = None) -> str:
+    app = build_app_shell(display_name, description, publisher, installer_name, package_id, overrides)
+    result = _graph_request("POST", f"{GRAPH_BASE}/deviceAppManagement/mobileApps", client=client,
+                            data=app.to_json(), headers={"Content-Type": "application/json"})
     return result["id"]
 
 
-def _create_content_version(app_id: str) -> str:
+def _create_content_version(app_id: str, client: Optional[GraphClient] = None) -> str:
     result = _graph_request(
         "POST",
         f"{GRAPH_BASE}/deviceAppManagement/mobileApps/{app_id}"
         "/microsoft.graph.win32LobApp/contentVersions",
+        client=client,
         json={}
     )
     return result["id"]
 
 
-def _create_file_placeholder(app_id: str, version_id: str, meta: Dict, encrypted_path: Path) -> Dict:
+def _create_file_placeholder(app_id: str, version_id: str, meta: Dict, payload: _ZipPayload,
+                             client: Optional[GraphClient] = None) -> Dict:
     body = {
         "@odata.type": "#microsoft.graph.mobileAppContentFile",
         "name": meta["file_name"],
         "size": meta["unencrypted_size"],
-        "sizeEncrypted": os.path.getsize(encrypted_path),
+        "sizeEncrypted": payload.size,
         "isDependency": False,
     }
     return _graph_request(
         "POST",
         f"{GRAPH_BASE}/deviceAppManagement/mobileApps/{app_id}"
         f"/microsoft.graph.win32LobApp/contentVersions/{version_id}/files",
+        client=client,
         json=body
     )
 
 
-def _wait_for_storage_uri(app_id: str, version_id: str, file_id: str, timeout=300) -> Dict:
+def _wait_for_storage_uri(app_id: str, version_id: str, file_id: str, timeout=300,
+                          client: Optional[GraphClient] = None) -> Dict:
     url = (f"{GRAPH_BASE}/deviceAppManagement/mobileApps/{app_id}"
            f"/microsoft.graph.win32LobApp/contentVersions/{version_id}/files/{file_id}")
-    for _ in range(timeout // 5):
-        data = _graph_request("GET", url)
-        if data.get("azureStorageUri"):
-            return data
-        time.sleep(5)
-    raise TimeoutError("Timed out waiting for AzureStorageUri")
+    return poll_until(
+        lambda: _poll_get(url, client),
+        lambda data: bool(data.get("azureStorageUri")),
+        stage="storage_uri",
+        timeout=timeout,
+        timeout_message="Timed out waiting for AzureStorageUri",
+    )
+
+
+# A resumed upload asks for a new SAS URI if the old one has less than this left
+STORAGE_URI_MIN_LIFETIME = timedelta(minutes=5)
 
 
-def _commit_file(app_id: str, version_id: str, file_id: str, meta: Dict):
+def _fresh_storage_uri(app_id: str, version_id: str, file_id: str, client: Optional[GraphClient] = None) -> Dict:
+    """
+    The content file of an interrupted upload with a usable SAS URI,
+    renewing the URI (``renewUpload``) if it has expired or is about to.
+    """
+    url = (f"{GRAPH_BASE}/deviceAppManagement/mobileApps/{app_id}"
+           f"/microsoft.graph.win32LobApp/contentVersions/{version_id}/files/{file_id}")
+    data = _graph_request("GET", url, client=client)
+    expires = parse_graph_datetime(data.get("azureStorageUriExpirationDateTime"))
+    if data.get("azureStorageUri") and expires and expires - datetime.now(timezone.utc) > STORAGE_URI_MIN_LIFETIME:
+        return data
+
+    logger.info("SAS URI for file %s expired, requesting a new one...", file_id)
+    _graph_request("POST", f"{url}/renewUpload", client=client, json={})
+
+    def _renewed(data: Dict) -> bool:
+        if data.get("uploadState") == "azureStorageUriRenewalFailed":
+            raise RuntimeError(f"Intune could not renew the upload URI: {json.dumps(data)[:1000]}")
+        return data.get("uploadState") == "azureStorageUriRenewalSuccess" and bool(data.get("azureStorageUri"))
+
+    return poll_until(
+        lambda: _graph_request("GET", url, client=client),
+        _renewed,
+        stage="storage_uri",
+        timeout=300,
+        timeout_message="Timed out renewing AzureStorageUri",
+    )
+
+
+def _commit_file(app_id: str, version_id: str, file_id: str, meta: Dict, client: Optional[GraphClient] = None):
     logger.info("Committing file to Intune...")
     body = {
         "fileEncryptionInfo": {
@@ -207,11 +478,12 @@ def _commit_file(app_id: str, version_id: str, file_id: str, meta: Dict):
         "POST",
         f"{GRAPH_BASE}/deviceAppManagement/mobileApps/{app_id}"
         f"/microsoft.graph.win32LobApp/contentVersions/{version_id}/files/{file_id}/commit",
+        client=client,
         json=body
     )
 
 
-def _commit_content_version(app_id: str, version_id: str):
+def _commit_content_version(app_id: str, version_id: str, client: Optional[GraphClient] = None):
     """
     Finalize the content version after all files are committed.
     Without this call the mobileApp remains 'notPublished'.
@@ -224,16 +496,18 @@ def _commit_content_version(app_id: str, version_id: str):
     _graph_request(
         "PATCH",
         f"{GRAPH_BASE}/deviceAppManagement/mobileApps/{app_id}",
+        client=client,
         json=body
     )
 
 
-def _wait_for_commit(app_id: str, version_id: str, file_id: str, timeout=600):
+def _wait_for_commit(app_id: str, version_id: str, file_id: str, timeout=600,
+                     client: Optional[GraphClient] = None):
     url = (f"{GRAPH_BASE}/deviceAppManagement/mobileApps/{app_id}"
            f"/microsoft.graph.win32LobApp/contentVersions/{version_id}/files/{file_id}")
     logger.info("Waiting for Intune to finish processing the file commit...")
-    for _ in range(timeout // 10):
-        data = _graph_request("GET", url)
+
+    def _committed(data: Dict) -> bool:
         # Verbose progress logging
         logger.info(
             "Commit poll → isCommitted=%s  uploadState=%s  size=%s",
@@ -244,75 +518,553 @@ def _wait_for_commit(app_id: str, version_id: str, file_id: str, timeout=600):
         logger.debug("Full commit poll payload: %s", json.dumps(data)[:1000])
         if data.get("uploadState") == "commitFileFailed":
             raise RuntimeError(f"Intune reported commit failure: {json.dumps(data)[:1000]}")
-        if data.get("isCommitted"):
-            logger.info("File commit completed!")
-            return
-        time.sleep(10)
-    raise TimeoutError("Timed out waiting for file commit")
+        return bool(data.get("isCommitted"))
+
+    poll_until(
+        lambda: _poll_get(url, client),
+        _committed,
+        stage="file_commit",
+        timeout=timeout,
+        timeout_message="Timed out waiting for file commit",
+    )
+    logger.info("File commit completed!")
 
 
 # --------------------------------------------------------------------------------------
 # 3.  ── upload helper (Azure BlockBlob over raw HTTP – no SDK dependency)
 # --------------------------------------------------------------------------------------
 
-def _wait_for_published(app_id: str, timeout=900):
+def _wait_for_published(app_id: str, timeout=900, client: Optional[GraphClient] = None):
     """
     Poll the mobileApp object until Intune finishes backend processing
     (publishingState == 'published') or until timeout is reached.
     """
     url = f"{GRAPH_BASE}/deviceAppManagement/mobileApps/{app_id}"
     logger.info("Waiting for Intune to publish the app …")
-    for _ in range(timeout // 10):
-        data = _graph_request("GET", url)  # full object; not all tenants expose processingState
+
+    def _published(data: Dict) -> bool:
         logger.info(
             "Publish poll → publishingState=%s",
             data.get("publishingState")
         )
         logger.debug("Full publish poll payload: %s", json.dumps(data)[:1000])
-        if data.get("publishingState") == "published":
-            logger.info("App is now published and ready!")
-            return
-        time.sleep(10)
-    raise TimeoutError("Timed out waiting for publishingState='published'")
+        return data.get("publishingState") == "published"
+
+    poll_until(
+        lambda: _poll_get(url, client),  # full object; not all tenants expose processingState
+        _published,
+        stage="publish",
+        timeout=timeout,
+        timeout_message="Timed out waiting for publishingState='published'",
+    )
+    logger.info("App is now published and ready!")
 
 
 # --------------------------------------------------------------------------------------
 # 3.  ── upload helper (Azure BlockBlob over raw HTTP – no SDK dependency)
 # --------------------------------------------------------------------------------------
-def _upload_to_blob(payload_file: Path, sas_uri: str, block_size=4 * 1024 * 1024):
-    total = os.path.getsize(payload_file)
-    blocks = []
-
-    logger.info("Uploading decrypted payload to Azure Blob (%s bytes)...", total)
-    with open(payload_file, "rb") as fh:
-        idx = 0
-        while chunk := fh.read(block_size):
-            block_id = base64.b64encode(f"{idx:05}".encode()).decode()
-            params = {"comp": "block", "blockid": block_id}
-            requests.put(sas_uri, params=params, data=chunk).raise_for_status()
-            blocks.append(block_id)
-            idx += 1
-    logger.info("Upload complete, committing block list...")
-
-    # commit the block list
+# Azure limits a block blob to 50,000 blocks; Intune's SAS URIs accept the
+# default 4 MiB blocks, which we grow for very large payloads so the number of
+# round trips stays bounded.
+BLOB_BLOCK_SIZE = 4 * 1024 * 1024
+BLOB_MAX_BLOCK_SIZE = 16 * 1024 * 1024
+BLOB_TARGET_BLOCKS = 512
+BLOB_MAX_BLOCKS = 50_000
+BLOB_UPLOAD_CONCURRENCY = int(os.environ.get("BLOB_UPLOAD_CONCURRENCY", "8"))
+# Blocks held in memory at once: read ahead, being verified or being sent
+BLOB_BUFFER_POOL = int(os.environ.get("BLOB_BUFFER_POOL", "8"))
+
+
+def _choose_block_size(total: int, block_size: Optional[int] = None) -> int:
+    """Pick a block size for *total* bytes.
+
+    An explicit *block_size* is honoured as long as it keeps the blob under the
+    50,000 block limit.  Otherwise the default is doubled until the payload fits
+    in roughly BLOB_TARGET_BLOCKS blocks (capped at BLOB_MAX_BLOCK_SIZE).
+    """
+    minimum = math.ceil(total / BLOB_MAX_BLOCKS) if total else 1
+    if block_size:
+        return max(block_size, minimum)
+
+    size = BLOB_BLOCK_SIZE
+    while size < BLOB_MAX_BLOCK_SIZE and total > size * BLOB_TARGET_BLOCKS:
+        size *= 2
+    return max(size, minimum)
+
+
+def _blob_session(pool_size: int) -> requests.Session:
+    """A keep-alive session whose pool can hold one connection per worker."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def _block_id(idx: int) -> str:
+    # Azure requires every block id in a blob to have the same length.
+    return base64.b64encode(f"{idx:05}".encode()).decode()
+
+
+def _put_block(session: requests.Session, sas_uri: str, block_id: str, chunk: bytes) -> int:
+    params = {"comp": "block", "blockid": block_id}
+    # Azure rejects the block if it was corrupted on the way; an integrity
+    # check, not security, so FIPS-mode OpenSSL still allows the digest
+    digest = hashlib.md5(chunk, usedforsecurity=False).digest()
+    headers = {"Content-MD5": base64.b64encode(digest).decode()}
+    # Put Block is idempotent, so busy/throttled responses are simply retried
+    started = time.perf_counter()
+    send_with_retry(lambda: session.put(sas_uri, params=params, data=chunk, headers=headers),
+                    "PUT").raise_for_status()
+    if metrics.ENABLED:
+        _BLOCK_SECONDS.observe(time.perf_counter() - started)
+        _BLOB_BYTES.inc(amount=len(chunk))
+    return len(chunk)
+
+
+def _get_block_list(session: Optional[requests.Session], sas_uri: str) -> Dict[str, int]:
+    """Block ids already staged (or committed) on the blob, with their sizes."""
+    resp = send_with_retry(
+        lambda: (session or requests).get(sas_uri, params={"comp": "blocklist", "blocklisttype": "all"}),
+        "GET",
+    )
+    if resp.status_code == 404:  # nothing staged yet
+        return {}
+    resp.raise_for_status()
+    root = ET.fromstring(resp.content)
+    return {block.findtext("Name"): int(block.findtext("Size") or 0) for block in root.iter("Block")}
+
+
+def _commit_block_list(session: requests.Session, sas_uri: str, blocks: List[str]) -> None:
+    # the order here defines the blob layout
     block_list_xml = (
         '<?xml version="1.0" encoding="utf-8"?><BlockList>'
         + "".join(f"<Latest>{b}</Latest>" for b in blocks)
         + "</BlockList>"
     )
-    requests.put(sas_uri, params={"comp": "blocklist"}, data=block_list_xml,
-                 headers={"Content-Type": "application/xml"}).raise_for_status()
+    send_with_retry(
+        lambda: session.put(sas_uri, params={"comp": "blocklist"}, data=block_list_xml,
+                            headers={"Content-Type": "application/xml"}),
+        "PUT",
+    ).raise_for_status()
+
+
+def _read_into(fh, view: memoryview) -> int:
+    """Fill *view* from *fh*; returns the bytes read (short only at EOF)."""
+    readinto = getattr(fh, "readinto", None)
+    if readinto is None:  # mmap
+        data = fh.read(len(view))
+        view[:len(data)] = data
+        return len(data)
+    filled = 0
+    while filled < len(view):
+        n = readinto(view[filled:])
+        if not n:
+            break
+        filled += n
+    return filled
+
+
+_END = object()
+
+
+class _BlockPipeline:
+    """
+    Reads blocks of a payload ahead of the uploader on background threads.
+
+    A reader thread fills buffers from a fixed pool of reusable bytearrays
+    and, when there is a *verifier*, a second thread feeds it each block in
+    file order, so disk reads, decryption/hashing and the PUTs all overlap.
+    Iterating yields ``(idx, view)`` for each index in *indexes*; the buffer
+    behind *view* is only reused after ``release(idx)``.  Once every buffer
+    is in use the reader waits, which bounds memory to *buffers* blocks
+    whatever the payload size.  Errors from either stage (I/O,
+    PayloadIntegrityError) are raised from the iterator.
+    """
+
+    def __init__(self, payload, block_size: int, indexes: List[int], buffers: int,
+                 verifier: Optional[_PayloadVerifier] = None):
+        self._payload = payload
+        self._block_size = block_size
+        self._indexes = indexes
+        self._verifier = verifier
+        self._free: queue.Queue = queue.Queue()
+        for _ in range(max(1, min(buffers, len(indexes)))):
+            self._free.put(bytearray(block_size))
+        self._read: queue.Queue = queue.Queue()
+        self._ready = self._read if verifier is None else queue.Queue()
+        self._held: Dict[int, bytearray] = {}
+        self._stopped = False
+        self._threads = [threading.Thread(target=self._reader, name="blob-reader", daemon=True)]
+        if verifier is not None:
+            self._threads.append(threading.Thread(target=self._checker, name="blob-verifier", daemon=True))
+        for thread in self._threads:
+            thread.start()
+
+    def _reader(self) -> None:
+        try:
+            with self._payload.open() as fh:
+                position = 0
+                for idx in self._indexes:
+                    buf = self._free.get()
+                    if buf is None or self._stopped:
+                        break
+                    offset = idx * self._block_size
+                    if position != offset:
+                        fh.seek(offset)
+                    n = _read_into(fh, memoryview(buf)[:min(self._block_size, self._payload.size - offset)])
+                    position = offset + n
+                    self._read.put((idx, buf, n))
+            self._read.put(_END)
+        except BaseException as exc:
+            self._read.put(exc)
+
+    def _checker(self) -> None:
+        while True:
+            item = self._read.get()
+            if isinstance(item, tuple) and not self._stopped:
+                try:
+                    self._verifier.update(memoryview(item[1])[:item[2]])
+                except BaseException as exc:
+                    item = exc
+            self._ready.put(item)
+            if not isinstance(item, tuple):
+                return
+
+    def __iter__(self) -> Iterator[Tuple[int, memoryview]]:
+        while True:
+            item = self._ready.get()
+            if item is _END:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            idx, buf, n = item
+            self._held[idx] = buf
+            yield idx, memoryview(buf)[:n]
+
+    def release(self, idx: int) -> None:
+        """Hand block *idx*'s buffer back to the reader (thread-safe)."""
+        self._free.put(self._held.pop(idx))
+
+    def close(self) -> None:
+        """Stop both stages and wait for them to exit."""
+        self._stopped = True
+        self._free.put(None)  # wakes a reader waiting for a buffer
+        for thread in self._threads:
+            thread.join()
+
+
+def _upload_to_blobs(
+    payload: _ZipPayload | _FilePayload,
+    targets: Dict[str, str],
+    block_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    session: Optional[requests.Session] = None,
+    progress: Optional[ProgressCallback] = None,
+    skip: Optional[set] = None,
+    on_block: Optional[Callable[[str, str], None]] = None,
+    verifier: Optional[_PayloadVerifier] = None,
+    buffers: Optional[int] = None,
+) -> Dict[str, Exception]:
+    """
+    Upload *payload* as a block blob to every SAS URI in *targets* (keyed by
+    an arbitrary name, e.g. tenant id), reading each block only once.
+
+    Blocks are read (and verified) ahead on background threads into a pool
+    of *buffers* reusable block buffers (BLOB_BUFFER_POOL by default, see
+    ``_BlockPipeline``), and up to *concurrency* block PUTs are kept in
+    flight over one pooled keep-alive session; a buffer is reused once every
+    target has its block.  Then each target's block list is committed in
+    file order.  A target whose PUT fails stops receiving blocks; the others carry
+    on.  *progress* is told the bytes every remaining target has received.
+
+    Block ids in *skip* are already staged on every target and are neither
+    read nor sent, only included in the block list.  *on_block* is called as
+    ``on_block(target, block_id)`` after each block is stored.
+
+    A *verifier* sees every block as it is read (skipped blocks are read for
+    it too but not sent).  A mismatch raises PayloadIntegrityError straight
+    away, for a bad header before anything is sent and otherwise before any
+    block list is committed.
+
+    Returns the failures, keyed like *targets*.
+    """
+    total = payload.size
+    block_size = _choose_block_size(total, block_size)
+    concurrency = max(1, concurrency or BLOB_UPLOAD_CONCURRENCY)
+    buffers = max(1, buffers or BLOB_BUFFER_POOL)
+    own_session = session is None
+    if own_session:
+        session = _blob_session(concurrency)
+
+    skip = skip or set()
+    count = math.ceil(total / block_size)
+    skipped = sum(min(block_size, total - idx * block_size) for idx in range(count) if _block_id(idx) in skip)
+    failed: Dict[str, Exception] = {}
+    sent = {key: skipped for key in targets}
+    blocks = [_block_id(idx) for idx in range(count)]
+    logger.info(
+        "Uploading encrypted payload to Azure Blob (%s bytes, %s byte blocks, %s in flight, %s target(s))...",
+        total, block_size, concurrency, len(targets),
+    )
+    started = time.monotonic()
+    pipeline = _BlockPipeline(payload, block_size, [
+        idx for idx in range(count) if verifier is not None or blocks[idx] not in skip
+    ], buffers, verifier)
+    try:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            pending: Dict = {}
+            # PUTs still using each block's buffer, plus one held while submitting
+            users: Dict[int, int] = {}
+            users_lock = threading.Lock()
+
+            def _done_with(idx):
+                with users_lock:
+                    users[idx] -= 1
+                    last = not users[idx]
+                if last:
+                    del users[idx]
+                    pipeline.release(idx)
+
+            def _collect(done):
+                for fut in done:
+                    key, block_id = pending.pop(fut)
+                    try:
+                        sent[key] += fut.result()
+                    except Exception as exc:
+                        if key not in failed:
+                            logger.error("Blob upload to %s failed: %s", key, exc)
+                            failed[key] = exc
+                        continue
+                    if on_block is not None:
+                        on_block(key, block_id)
+                live = [n for key, n in sent.items() if key not in failed]
+                if live:
+                    _report(progress, "upload", bytes_sent=min(live), total_bytes=total)
+
+            for idx, chunk in pipeline:
+                if len(failed) == len(targets):
+                    break
+                block_id = blocks[idx]
+                users[idx] = 1
+                for key, sas_uri in targets.items():
+                    if key in failed or block_id in skip:
+                        continue
+                    # Bound in-flight requests: wait for a slot before sending
+                    while len(pending) >= concurrency:
+                        done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        _collect(done)
+                    with users_lock:
+                        users[idx] += 1
+                    fut = pool.submit(_put_block, session, sas_uri, block_id, chunk)
+                    pending[fut] = key, block_id
+                    fut.add_done_callback(lambda fut, idx=idx: _done_with(idx))
+                _done_with(idx)
+            try:
+                _collect(as_completed(list(pending)))
+            finally:
+                for fut in pending:
+                    fut.cancel()
+        if verifier is not None and len(failed) < len(targets):
+            verifier.finish()
+        elapsed = time.monotonic() - started
+        rate = (total - skipped) * len(targets) / elapsed if elapsed else 0.0
+        logger.info("Upload complete (%.1f MiB/s), committing block list...", rate / (1024 * 1024))
+        if rate and metrics.ENABLED:
+            _BLOB_THROUGHPUT.observe(rate)
+
+        for key, sas_uri in targets.items():
+            if key in failed:
+                continue
+            try:
+                _commit_block_list(session, sas_uri, blocks)
+            except Exception as exc:
+                logger.error("Committing block list for %s failed: %s", key, exc)
+                failed[key] = exc
+    finally:
+        pipeline.close()
+        if own_session:
+            session.close()
+    return failed
+
+
+def _upload_to_blob(
+    payload: _ZipPayload | _FilePayload | Path,
+    sas_uri: str,
+    block_size: Optional[int] = None,
+    concurrency: Optional[int] = None,
+    session: Optional[requests.Session] = None,
+    progress: Optional[ProgressCallback] = None,
+    skip: Optional[set] = None,
+    on_block: Optional[Callable[[str], None]] = None,
+    verifier: Optional[_PayloadVerifier] = None,
+    buffers: Optional[int] = None,
+):
+    """
+    Upload *payload* as a block blob to a single SAS URI (see
+    ``_upload_to_blobs``), raising the first failure.  *on_block* is called
+    with each block id once it is stored.
+    """
+    if isinstance(payload, (str, Path)):
+        payload = _FilePayload(payload)
+    failed = _upload_to_blobs(payload, {"blob": sas_uri}, block_size=block_size, concurrency=concurrency,
+                              session=session, progress=progress, skip=skip, verifier=verifier, buffers=buffers,
+                              on_block=on_block and (lambda key, block_id: on_block(block_id)))
+    if failed:
+        raise failed["blob"]
 
 
 # --------------------------------------------------------------------------------------
 # 4.  ── public one‑liner
 # --------------------------------------------------------------------------------------
+def _existing_deployment(meta: Dict, tenant_id: Optional[str], package_id: str,
+                         client: Optional[GraphClient] = None) -> Optional[str]:
+    """
+    App id of an earlier deployment of this exact package (same FileDigest)
+    and package id to the tenant, if it is still in Intune with the content
+    version we committed.  Stale index entries are dropped.
+    """
+    if not meta.get("file_digest"):
+        return None
+    index = get_deployment_index()
+    record = index.lookup(meta["file_digest"], tenant_id, package_id)
+    if record is None:
+        return None
+    try:
+        app = _graph_request(
+            "GET",
+            f"{GRAPH_BASE}/deviceAppManagement/mobileApps/{record['app_id']}?$select=id,committedContentVersion",
+            client=client,
+        )
+    except requests.HTTPError as exc:
+        if exc.response is None or exc.response.status_code != 404:
+            raise
+        app = None
+    if not app or (record["content_version_id"]
+                   and app.get("committedContentVersion") != record["content_version_id"]):
+        logger.info("Deployment index entry for %s is stale (app %s); deploying again", package_id, record["app_id"])
+        index.forget(record["app_id"])
+        return None
+    return record["app_id"]
+
+
+def _record_deployment(meta: Dict, tenant_id: Optional[str], package_id: str, app_id: str, version_id: str,
+                       display_name: str) -> None:
+    if not meta.get("file_digest"):
+        return
+    try:
+        get_deployment_index().record(meta["file_digest"], tenant_id, package_id, app_id, version_id, display_name)
+    except Exception:  # the app is deployed either way
+        logger.exception("Could not record deployment of %s", package_id)
+
+
+def _assign(app_id: str, assignments: List[Dict], client: GraphClient,
+            progress: Optional[ProgressCallback] = None) -> None:
+    _report(progress, "assign", app_id=app_id)
+    result = assigner_for(client).assign({app_id: assignments})[app_id]
+    if result["status"] != "succeeded":
+        raise RuntimeError(f"App {app_id} was deployed but could not be assigned: {result['error']}")
+    logger.info("Assigned app %s (%s assignments)", app_id, result["assignments"])
+
+
+def _prepare_app(
+    meta: Dict,
+    payload: _ZipPayload,
+    display_name: str,
+    package_id: str,
+    description: Optional[str],
+    publisher: str,
+    client: Optional[GraphClient] = None,
+    progress: Optional[ProgressCallback] = None,
+    journal: Optional[UploadJournal] = None,
+    overrides: Optional[Dict] = None,
+) -> Tuple[str, str, Dict]:
+    """
+    Create the app shell, content version and file; returns (app_id,
+    version_id, file with SAS URI).  Objects already recorded in *journal*
+    are reused rather than created again.  *overrides* customise the shell
+    (see ``build_app_shell``).
+    """
+    journal = journal or UploadJournal()
+    app_id = journal.get("app_id")
+    if not app_id:
+        _report(progress, "shell")
+        app_id = _create_app_shell(display_name, description, publisher or "Unknown", meta["file_name"], package_id,
+                                   client=client, overrides=overrides)
+        journal.update(app_id=app_id)
+        logger.info("Created app shell. ID: %s", app_id)
+    version_id = journal.get("version_id")
+    if not version_id:
+        _report(progress, "content_version", app_id=app_id)
+        version_id = _create_content_version(app_id, client=client)
+        journal.update(version_id=version_id)
+        logger.info("Created content version: %s", version_id)
+    file_id = journal.get("file_id")
+    if not file_id:
+        _report(progress, "file_placeholder", app_id=app_id)
+        file_id = _create_file_placeholder(app_id, version_id, meta, payload, client=client)["id"]
+        journal.update(file_id=file_id)
+        logger.info("Placeholder file created: %s", file_id)
+        _report(progress, "storage_uri", app_id=app_id)
+        ph = _wait_for_storage_uri(app_id, version_id, file_id, client=client)
+    else:
+        _report(progress, "storage_uri", app_id=app_id)
+        ph = _fresh_storage_uri(app_id, version_id, file_id, client=client)
+    return app_id, version_id, ph
+
+
+def _finish_app(
+    app_id: str,
+    version_id: str,
+    file_id: str,
+    meta: Dict,
+    client: Optional[GraphClient] = None,
+    progress: Optional[ProgressCallback] = None,
+    journal: Optional[UploadJournal] = None,
+) -> None:
+    """
+    Commit the uploaded file and content version and wait for publishing,
+    skipping commits that *journal* records as already sent.
+    """
+    journal = journal or UploadJournal()
+    _report(progress, "commit", app_id=app_id)
+    if not journal.get("file_committed"):
+        _commit_file(app_id, version_id, file_id, meta, client=client)
+        journal.update(file_committed=True)
+    _wait_for_commit(app_id, version_id, file_id, client=client)
+    if not journal.get("version_committed"):
+        _commit_content_version(app_id, version_id, client=client)
+        journal.update(version_committed=True)
+    _report(progress, "publish", app_id=app_id)
+    _wait_for_published(app_id, client=client)
+
+
+def _staged_blocks(session: Optional[requests.Session], sas_uri: str, total: int, block_size: int) -> set:
+    """Ids of blocks already on the blob with the size this upload would send."""
+    expected = {_block_id(idx): min(block_size, total - idx * block_size)
+                for idx in range(math.ceil(total / block_size))}
+    staged = _get_block_list(session, sas_uri)
+    return {block_id for block_id, size in staged.items() if expected.get(block_id) == size}
+
+
+@metrics.timed_stages(_STAGE_SECONDS, _UPLOADS)
 def upload_intunewin(
     path: str | Path,
     display_name: str,
     package_id: str,
     description: Optional[str] = None,
     publisher: str = "",
+    package: Optional[Tuple[Dict, _ZipPayload]] = None,
+    session: Optional[requests.Session] = None,
+    progress: Optional[ProgressCallback] = None,
+    tenant_id: Optional[str] = None,
+    client: Optional[GraphClient] = None,
+    reuse: bool = True,
+    resume: bool = True,
+    verify: bool = True,
+    overrides: Optional[Dict] = None,
+    assignments: Optional[List[Dict]] = None,
+    app_id: Optional[str] = None,
 ) -> str:
     """
     End‑to‑end helper.
@@ -323,27 +1075,299 @@ def upload_intunewin(
         Descriptive text shown in Intune. Defaults to display_name if omitted.
     package_id : str
         The Winget package identifier.
+    package : tuple, optional
+        Pre-parsed ``(meta, payload)`` from ``_parse_detection_xml``; lets
+        batch callers parse a shared package once.
+    session : requests.Session, optional
+        Pooled session to use for the blob upload.
+    progress : callable, optional
+        Called as ``progress(stage, **info)`` when each stage starts and as
+        blob bytes are sent.  Stages are also timed into the
+        ``intune_upload_stage_duration_seconds`` metric (see ``metrics``).
+    tenant_id : str, optional
+        Registered tenant to deploy to (see ``tenants``); defaults to the
+        GRAPH_TENANT_ID tenant.
+    client : GraphClient, optional
+        Graph client to use instead of looking one up from *tenant_id*.
+    reuse : bool
+        If this exact package (same FileDigest) was already deployed to the
+        tenant under *package_id* and the app still exists, return that app
+        instead of uploading again; progress then reports the
+        ``already_deployed`` stage.  Pass False to always create a new app.
+    resume : bool
+        Checkpoint progress to an on-disk journal (see ``journal``) and, if
+        an earlier upload of the same package, tenant and package id was
+        interrupted, continue it: its app is reused, an expired SAS URI is
+        renewed and blocks already on the blob are not sent again.  Uploads
+        of the same package, tenant and package id run one at a time within
+        the process, so they never share a journal.
+    verify : bool
+        Check the encrypted payload against the Mac and FileDigest in
+        Detection.xml while it is uploaded (see ``_PayloadVerifier``) and
+        fail before committing anything if it does not match.
+    overrides : dict, optional
+        Win32LobApp attributes replacing the defaults of the app shell, e.g.
+        custom detection ``rules`` (see ``build_app_shell``).
+    assignments : list, optional
+        Assignment specs (see ``assignments``) applied once the app is
+        published, or to the already deployed app.  They are checked before
+        anything is uploaded; progress reports the ``assign`` stage.
+    app_id : str, optional
+        Upload the package as a new content version of this existing app
+        instead of creating an app; *overrides* and *reuse* do not apply.
 
     Returns
     -------
-    The new mobileApp (Win32 LOB) ID.
+    The new (or already deployed) mobileApp (Win32 LOB) ID.
     """
     logger.info("Starting Win32 upload: %s → '%s'", path, display_name)
-    intunewin = Path(path).expanduser().resolve()
-    meta, encrypted = _parse_detection_xml(intunewin)
-
-    app_id = _create_app_shell(display_name, description, publisher or "Unknown", meta["file_name"], package_id)
-    logger.info("Created app shell. ID: %s", app_id)
-    version_id = _create_content_version(app_id)
-    logger.info("Created content version: %s", version_id)
-    ph = _create_file_placeholder(app_id, version_id, meta, encrypted)
-    logger.info("Placeholder file created: %s", ph["id"])
-    ph = _wait_for_storage_uri(app_id, version_id, ph["id"])
-    _upload_to_blob(encrypted, ph["azureStorageUri"])
-    _commit_file(app_id, version_id, ph["id"], meta)
-    _wait_for_commit(app_id, version_id, ph["id"])
-    _commit_content_version(app_id, version_id)
-    _wait_for_published(app_id)
-
-    logger.info("Upload finished successfully. App ID: %s", app_id)
-    return app_id
\ No newline at end of file
+    if client is None:
+        client = client_for(tenant_id)
+    if package is None:
+        package = _parse_detection_xml(Path(path).expanduser().resolve())
+    meta, payload = package
+    if assignments:
+        # unknown groups fail here rather than after a long upload
+        assigner_for(client).resolve(assignments)
+
+    key = "|".join((tenant_key(tenant_id), package_id, meta.get("file_digest") or str(path)))
+    if app_id:
+        key += f"|{app_id}"
+    # an identical upload already running goes first; with *reuse* this one
+    # then finds its app instead of uploading the package a second time
+    with UploadJournal.exclusive(key):
+        if reuse and not app_id:
+            existing = _existing_deployment(meta, tenant_id, package_id, client=client)
+            if existing:
+                logger.info("%s is already deployed with this package. App ID: %s", package_id, existing)
+                _report(progress, "already_deployed", app_id=existing)
+                if assignments:
+                    _assign(existing, assignments, client, progress)
+                return existing
+
+        # before anything is created in Intune: a truncated payload fails here
+        verifier = _PayloadVerifier.for_package(meta, payload) if verify else None
+
+        journal = UploadJournal.open(key) if resume else UploadJournal()
+        resumed = journal.resumed
+        if resumed:
+            logger.info("Resuming interrupted upload of %s into app %s", package_id, journal.get("app_id"))
+            _report(progress, "resume", app_id=journal.get("app_id"))
+        journal.update(path=str(path), display_name=display_name, package_id=package_id, tenant_id=tenant_id)
+        if app_id and not journal.get("app_id"):
+            # _prepare_app then only adds a content version to the app
+            journal.update(app_id=app_id)
+
+        try:
+            app_id, version_id, ph = _prepare_app(meta, payload, display_name, package_id, description, publisher,
+                                                  client=client, progress=progress, journal=journal,
+                                                  overrides=overrides)
+        except requests.HTTPError as exc:
+            # the app (or its content) was deleted since the upload was interrupted
+            if not resumed or app_id or exc.response is None or exc.response.status_code != 404:
+                raise
+            logger.warning("App %s from the interrupted upload is gone; starting over", journal.get("app_id"))
+            journal.discard()
+            journal.update(path=str(path), display_name=display_name, package_id=package_id, tenant_id=tenant_id)
+            app_id, version_id, ph = _prepare_app(meta, payload, display_name, package_id, description, publisher,
+                                                  client=client, progress=progress, journal=journal,
+                                                  overrides=overrides)
+
+        if not journal.get("uploaded"):
+            block_size = journal.get("block_size") or _choose_block_size(payload.size)
+            skip = set()
+            if journal.get("blocks") is not None:
+                skip = _staged_blocks(session, ph["azureStorageUri"], payload.size, block_size)
+                logger.info("%s blocks already staged, sending the rest", len(skip))
+            journal.update(block_size=block_size, blocks=sorted(skip))
+            _report(progress, "upload", app_id=app_id, bytes_sent=0, total_bytes=payload.size)
+            _upload_to_blob(payload, ph["azureStorageUri"], block_size=block_size, session=session, progress=progress,
+                            skip=skip, on_block=journal.add_block, verifier=verifier)
+            journal.update(uploaded=True)
+        _finish_app(app_id, version_id, ph["id"], meta, client=client, progress=progress, journal=journal)
+        _record_deployment(meta, tenant_id, package_id, app_id, version_id, display_name)
+        journal.discard()
+
+        logger.info("Upload finished successfully. App ID: %s", app_id)
+        if assignments:
+            _assign(app_id, assignments, client, progress)
+        return app_id
+
+
+def upload_intunewin_to_tenants(
+    path: str | Path,
+    display_name: str,
+    package_id: str,
+    tenant_ids: List[str],
+    description: Optional[str] = None,
+    publisher: str = "",
+    progress: Optional[ProgressCallback] = None,
+    reuse: bool = True,
+    overrides: Optional[Dict] = None,
+) -> List[Dict]:
+    """
+    Deploy one package to several tenants in parallel.
+
+    The package is parsed once.  Each tenant's app, content version and file
+    are created concurrently; the encrypted payload is then read a single
+    time and every block is sent to all tenants' SAS URIs, after which the
+    tenants commit and publish concurrently.  A failure in one tenant does
+    not stop the others.  With *reuse*, tenants that already have this
+    package are skipped (see ``upload_intunewin``).  *overrides* customise
+    every tenant's app shell, as in ``upload_intunewin``.
+
+    Returns
+    -------
+    One result per tenant, in input order: ``{"tenant_id", "status", "app_id",
+    "already_deployed"}`` on success or ``{"tenant_id", "status", "error"}`` on
+    failure.
+    """
+    tenant_ids = list(dict.fromkeys(tenant_ids))
+    meta, payload = _parse_detection_xml(Path(path).expanduser().resolve())
+    verifier = _PayloadVerifier.for_package(meta, payload)
+    errors: Dict[str, Exception] = {}
+    existing: Dict[str, str] = {}
+    prepared: Dict[str, Tuple[GraphClient, str, str, Dict]] = {}
+
+    def _prepare(tenant_id: str):
+        client = client_for(tenant_id)
+        app_id = _existing_deployment(meta, tenant_id, package_id, client=client) if reuse else None
+        if app_id:
+            return app_id
+        return (client,) + _prepare_app(meta, payload, display_name, package_id, description, publisher,
+                                        client=client, overrides=overrides)
+
+    def _finish(tenant_id: str):
+        client, app_id, version_id, ph = prepared[tenant_id]
+        _finish_app(app_id, version_id, ph["id"], meta, client=client)
+        _record_deployment(meta, tenant_id, package_id, app_id, version_id, display_name)
+
+    logger.info("Deploying %s to %s tenants", package_id, len(tenant_ids))
+    with ThreadPoolExecutor(max_workers=max(1, len(tenant_ids))) as pool:
+        futures = {tenant_id: pool.submit(_prepare, tenant_id) for tenant_id in tenant_ids}
+        for tenant_id, fut in futures.items():
+            try:
+                result = fut.result()
+            except Exception as exc:
+                logger.error("Preparing %s in tenant %s failed: %s", package_id, tenant_id, exc)
+                errors[tenant_id] = exc
+                continue
+            if isinstance(result, str):
+                existing[tenant_id] = result
+            else:
+                prepared[tenant_id] = result
+
+        if prepared:
+            _report(progress, "upload", bytes_sent=0, total_bytes=payload.size)
+            targets = {tenant_id: ph["azureStorageUri"] for tenant_id, (_, _, _, ph) in prepared.items()}
+            with _blob_session(BLOB_UPLOAD_CONCURRENCY) as session:
+                try:
+                    errors.update(_upload_to_blobs(payload, targets, session=session, progress=progress,
+                                                   verifier=verifier))
+                except PayloadIntegrityError as exc:
+                    errors.update(dict.fromkeys(targets, exc))
+
+        _report(progress, "publish")
+        futures = {tenant_id: pool.submit(_finish, tenant_id) for tenant_id in prepared if tenant_id not in errors}
+        for tenant_id, fut in futures.items():
+            try:
+                fut.result()
+            except Exception as exc:
+                logger.error("Publishing %s in tenant %s failed: %s", package_id, tenant_id, exc)
+                errors[tenant_id] = exc
+
+    results = []
+    for tenant_id in tenant_ids:
+        if tenant_id in errors:
+            results.append({"tenant_id": tenant_id, "status": "failed", "error": str(errors[tenant_id])})
+        elif tenant_id in existing:
+            results.append({"tenant_id": tenant_id, "status": "succeeded", "app_id": existing[tenant_id],
+                            "already_deployed": True})
+        else:
+            results.append({"tenant_id": tenant_id, "status": "succeeded", "app_id": prepared[tenant_id][1],
+                            "already_deployed": False})
+    return results
+
+
+BATCH_MAX_CONCURRENCY = int(os.environ.get("BATCH_MAX_CONCURRENCY", "4"))
+
+
+def upload_intunewin_batch(items: List[Dict], max_concurrency: Optional[int] = None) -> List[Dict]:
+    """
+    Upload many packages concurrently.
+
+    Each item holds the keyword arguments of ``upload_intunewin``, including
+    an optional ``tenant_id``.  Up to *max_concurrency* uploads (capped at
+    BATCH_MAX_CONCURRENCY) run at once; they share one access token per
+    tenant, one pooled blob session and each distinct .intunewin is parsed
+    only once.  Items' ``assignments`` are applied together, per tenant,
+    once all uploads are done (see ``AppAssigner.assign``).
+
+    Returns
+    -------
+    One result per item, in input order: ``{"package_id", "status", "app_id",
+    "already_deployed"}`` on success or ``{"package_id", "status", "error"}``
+    on failure (with ``app_id`` if the app was deployed but not assigned).
+    """
+    workers = max(1, min(max_concurrency or BATCH_MAX_CONCURRENCY, BATCH_MAX_CONCURRENCY, len(items) or 1))
+
+    # Fail fast (and warm each token cache once) instead of every worker
+    # discovering bad credentials on its own.
+    for tenant_id in dict.fromkeys(item.get("tenant_id") for item in items):
+        token = get_access_token() if tenant_id is None else access_token_for(tenant_id)
+        if not token:
+            raise RuntimeError(f"Could not acquire an access token for Microsoft Graph"
+                               + (f" in tenant {tenant_id}" if tenant_id else ""))
+
+    # A package that fails to parse is remembered as its exception so every
+    # item referencing it reports the same error.
+    packages: Dict[Path, Tuple[Dict, _ZipPayload] | Exception] = {}
+    for item in items:
+        intunewin = Path(item["path"]).expanduser().resolve()
+        if intunewin not in packages:
+            try:
+                packages[intunewin] = _parse_detection_xml(intunewin)
+            except Exception as exc:
+                packages[intunewin] = exc
+
+    def _run(item: Dict) -> Dict:
+        item = dict(item)
+        assignments = item.pop("assignments", None)
+        package = packages[Path(item["path"]).expanduser().resolve()]
+        try:
+            if isinstance(package, Exception):
+                raise package
+            if assignments:
+                assigner_for(client_for(item.get("tenant_id"))).resolve(assignments)
+            stages = []
+            app_id = upload_intunewin(**item, package=package, session=session,
+                                      progress=lambda stage, **info: stages.append(stage))
+            return {"package_id": item["package_id"], "status": "succeeded", "app_id": app_id,
+                    "already_deployed": "already_deployed" in stages}
+        except Exception as exc:
+            logger.error("Batch upload of %s failed: %s", item["package_id"], exc)
+            return {"package_id": item["package_id"], "status": "failed", "error": str(exc)}
+
+    logger.info("Starting batch upload of %s packages (%s at a time)", len(items), workers)
+    session = _blob_session(workers * BLOB_UPLOAD_CONCURRENCY)
+    try:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run, items))
+    finally:
+        session.close()
+
+    # all of a tenant's assignments in one bulk call
+    pending: Dict[Optional[str], Dict[str, List[Dict]]] = {}
+    for item, result in zip(items, results):
+        if item.get("assignments") and result["status"] == "succeeded":
+            pending.setdefault(item.get("tenant_id"), {}).setdefault(result["app_id"], []).extend(item["assignments"])
+    for tenant_id, apps in pending.items():
+        try:
+            outcome = assigner_for(client_for(tenant_id)).assign(apps)
+        except Exception as exc:
+            outcome = dict.fromkeys(apps, {"status": "failed", "error": str(exc)})
+        for result in results:
+            assigned = outcome.get(result.get("app_id"))
+            if assigned and assigned["status"] != "succeeded" and result["status"] == "succeeded":
+                result.update(status="failed", error=f"Deployed but not assigned: {assigned['error']}")
+    return results
@@ -0,0 +1,265 @@
+"""
+Build .intunewin packages without IntuneWinAppUtil.
+
+A .intunewin is a (stored) zip holding two members:
+
+- ``IntuneWinPackage/Contents/IntunePackage.intunewin``: the source folder,
+  zipped, then encrypted as ``HMAC (32 bytes) | IV (16 bytes) | AES-256-CBC
+  ciphertext`` with PKCS7 padding.  The HMAC-SHA256 is keyed with a separate
+  MAC key and covers IV and ciphertext.
+- ``IntuneWinPackage/Metadata/Detection.xml``: the keys, IV, MAC and the
+  SHA-256 of the inner zip (``FileDigest``) that Intune needs to decrypt it.
+
+``build_intunewin`` produces both in a single streaming pass: the inner zip is
+written into an encrypting writer that hashes, encrypts and MACs each buffer
+and streams the ciphertext straight into the outer zip member.  The MAC is
+only known at the end, so its 32 bytes are reserved and patched in afterwards,
+with the member's CRC-32 derived from the already computed CRC of the rest
+(``crc32_combine``) rather than by reading the payload again.  Memory use does
+not depend on the size of the source folder.
+
+Command line (from the api directory):
+    python -m functions.intunewin SOURCE_DIR SETUP_FILE -o App.intunewin
+"""
+
+import argparse
+import base64
+import hashlib
+import hmac
+import os
+import struct
+import zipfile
+import zlib
+from pathlib import Path
+from typing import Dict, Optional
+from xml.sax.saxutils import escape
+
+from cryptography.hazmat.primitives import padding
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+CONTENTS_NAME = "IntunePackage.intunewin"
+CONTENTS_MEMBER = f"IntuneWinPackage/Contents/{CONTENTS_NAME}"
+DETECTION_MEMBER = "IntuneWinPackage/Metadata/Detection.xml"
+
+# Version of IntuneWinAppUtil whose Detection.xml layout we reproduce
+TOOL_VERSION = "1.8.6.0"
+
+# Sources larger than this get a ZIP64 contents member
+ZIP64_THRESHOLD = 2 * 1024 ** 3
+
+# Installer formats that are already compressed: deflating them again costs
+# most of the packaging time and saves next to nothing, so they are stored.
+STORED_SUFFIXES = frozenset({".exe", ".msi", ".msix", ".msixbundle", ".appx", ".cab", ".zip", ".7z", ".gz", ".nupkg"})
+
+
+# --------------------------------------------------------------------------------------
+# CRC-32 of a concatenation (zlib's crc32_combine, which Python does not expose)
+# --------------------------------------------------------------------------------------
+def _gf2_times(matrix, vector: int) -> int:
+    result = 0
+    i = 0
+    while vector:
+        if vector & 1:
+            result ^= matrix[i]
+        vector >>= 1
+        i += 1
+    return result
+
+
+def _gf2_square(matrix):
+    return [_gf2_times(matrix, row) for row in matrix]
+
+
+def crc32_combine(crc1: int, crc2: int, len2: int) -> int:
+    """CRC-32 of ``a + b`` from ``crc32(a)``, ``crc32(b)`` and ``len(b)``."""
+    if len2 <= 0:
+        return crc1
+    odd = [0xEDB88320] + [1 << i for i in range(31)]  # operator for one zero bit
+    even = _gf2_square(odd)  # two zero bits
+    odd = _gf2_square(even)  # four zero bits
+    while True:
+        # apply len2 zero bytes to crc1, one bit of len2 at a time
+        even = _gf2_square(odd)
+        if len2 & 1:
+            crc1 = _gf2_times(even, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+        odd = _gf2_square(even)
+        if len2 & 1:
+            crc1 = _gf2_times(odd, crc1)
+        len2 >>= 1
+        if not len2:
+            break
+    return crc1 ^ crc2
+
+
+# --------------------------------------------------------------------------------------
+# encryption
+# --------------------------------------------------------------------------------------
+class _EncryptingWriter:
+    """
+    Write-only file object: plaintext in, ``HMAC | IV | ciphertext`` out.
+
+    The HMAC slot is written as zeros and must be patched with ``mac`` once
+    ``finish`` has been called.  ``crc`` is the CRC-32 of everything after
+    that slot.  Having ``tell`` but no ``seek`` makes zipfile treat it as an
+    unseekable stream and write data descriptors instead of seeking back.
+    """
+
+    def __init__(self, out, key: bytes, mac_key: bytes, iv: bytes):
+        self._out = out
+        self._padder = padding.PKCS7(128).padder()
+        self._encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+        self._hmac = hmac.new(mac_key, iv, hashlib.sha256)
+        self._sha = hashlib.sha256()
+        self.crc = zlib.crc32(iv)
+        self.plain_size = 0
+        self.size = 32 + len(iv)
+        self.mac: Optional[bytes] = None
+        self.digest: Optional[bytes] = None
+        out.write(bytes(32))
+        out.write(iv)
+
+    def _emit(self, ciphertext: bytes) -> None:
+        if ciphertext:
+            self._hmac.update(ciphertext)
+            self.crc = zlib.crc32(ciphertext, self.crc)
+            self.size += len(ciphertext)
+            self._out.write(ciphertext)
+
+    def write(self, data) -> int:
+        self._sha.update(data)
+        self.plain_size += len(data)
+        self._emit(self._encryptor.update(self._padder.update(data)))
+        return len(data)
+
+    def tell(self) -> int:
+        return self.plain_size
+
+    def flush(self) -> None:
+        pass
+
+    def finish(self) -> None:
+        self._emit(self._encryptor.update(self._padder.finalize()) + self._encryptor.finalize())
+        self.mac = self._hmac.digest()
+        self.digest = self._sha.digest()
+
+
+def _detection_xml(setup_file: str, meta: Dict[str, str], unencrypted_size: int) -> bytes:
+    return (
+        '<ApplicationInfo xmlns:xsd="http://www.w3.org/2001/XMLSchema" '
+        f'xmlns:xsi="http://www.w3.org/2001/XMLSchema-instance" ToolVersion="{TOOL_VERSION}">\n'
+        f"  <Name>{escape(setup_file)}</Name>\n"
+        f"  <UnencryptedContentSize>{unencrypted_size}</UnencryptedContentSize>\n"
+        f"  <FileName>{CONTENTS_NAME}</FileName>\n"
+        f"  <SetupFile>{escape(setup_file)}</SetupFile>\n"
+        "  <EncryptionInfo>\n"
+        f"    <EncryptionKey>{meta['encryption_key']}</EncryptionKey>\n"
+        f"    <MacKey>{meta['mac_key']}</MacKey>\n"
+        f"    <InitializationVector>{meta['iv']}</InitializationVector>\n"
+        f"    <Mac>{meta['mac']}</Mac>\n"
+        "    <ProfileIdentifier>ProfileVersion1</ProfileIdentifier>\n"
+        f"    <FileDigest>{meta['file_digest']}</FileDigest>\n"
+        "    <FileDigestAlgorithm>SHA256</FileDigestAlgorithm>\n"
+        "  </EncryptionInfo>\n"
+        "</ApplicationInfo>"
+    ).encode("utf-8")
+
+
+def _local_data_offset(fh, header_offset: int) -> int:
+    fh.seek(header_offset)
+    fields = struct.unpack(zipfile.structFileHeader, fh.read(zipfile.sizeFileHeader))
+    return (header_offset + zipfile.sizeFileHeader
+            + fields[zipfile._FH_FILENAME_LENGTH] + fields[zipfile._FH_EXTRA_FIELD_LENGTH])
+
+
+# --------------------------------------------------------------------------------------
+# public API
+# --------------------------------------------------------------------------------------
+def build_intunewin(
+    source_dir: str | Path,
+    setup_file: str,
+    output: str | Path,
+    compresslevel: Optional[int] = None,
+) -> Dict:
+    """
+    Package *source_dir* as a .intunewin at *output*.
+
+    Parameters
+    ----------
+    source_dir : path
+        Folder whose contents (recursively) make up the package.
+    setup_file : str
+        File in *source_dir* that Intune runs, e.g. "Winget-InstallPackage.ps1".
+    output : path
+        Where to write the .intunewin; replaced if it exists.
+    compresslevel : int, optional
+        zlib level for the inner zip (1-9, or 0 to store everything); zlib's
+        default if omitted.  Files in STORED_SUFFIXES are always stored.
+
+    Returns
+    -------
+    The Detection.xml fields, keyed like ``_parse_detection_xml`` in the
+    uploader (``file_name``, ``unencrypted_size``, ``encryption_key`` ...).
+    """
+    source = Path(source_dir)
+    if not (source / setup_file).is_file():
+        raise FileNotFoundError(f"Setup file {setup_file} not found in {source}")
+    files = sorted(p for p in source.rglob("*") if p.is_file())
+    zip64 = sum(p.stat().st_size for p in files) > ZIP64_THRESHOLD
+
+    key, mac_key, iv = os.urandom(32), os.urandom(32), os.urandom(16)
+    output = Path(output)
+    with zipfile.ZipFile(output, "w", zipfile.ZIP_STORED) as outer:
+        with outer.open(CONTENTS_MEMBER, "w", force_zip64=zip64) as member:
+            writer = _EncryptingWriter(member, key, mac_key, iv)
+            with zipfile.ZipFile(writer, "w", zipfile.ZIP_DEFLATED, compresslevel=compresslevel or None) as inner:
+                for path in files:
+                    stored = compresslevel == 0 or path.suffix.lower() in STORED_SUFFIXES
+                    inner.write(path, path.relative_to(source).as_posix(),
+                                compress_type=zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED)
+            writer.finish()
+        # zipfile computed the CRC over the zeroed MAC slot; the central
+        # directory takes the real one, the local header is patched below
+        contents = outer.getinfo(CONTENTS_MEMBER)
+        contents.CRC = crc32_combine(zlib.crc32(writer.mac), writer.crc, writer.size - 32)
+
+        b64 = lambda raw: base64.b64encode(raw).decode()
+        meta = {
+            "file_name": CONTENTS_NAME,
+            "unencrypted_size": writer.plain_size,
+            "encryption_key": b64(key),
+            "iv": b64(iv),
+            "mac": b64(writer.mac),
+            "mac_key": b64(mac_key),
+            "profile_identifier": "ProfileVersion1",
+            "file_digest": b64(writer.digest),
+            "digest_algorithm": "SHA256",
+        }
+        outer.writestr(DETECTION_MEMBER, _detection_xml(setup_file, meta, writer.plain_size))
+
+    with open(output, "r+b") as fh:
+        data_offset = _local_data_offset(fh, contents.header_offset)
+        fh.seek(contents.header_offset + 14)  # CRC-32 field of the local header
+        fh.write(struct.pack("<L", contents.CRC))
+        fh.seek(data_offset)
+        fh.write(writer.mac)
+    return meta
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Build a .intunewin package from a folder")
+    parser.add_argument("source_dir", help="folder to package")
+    parser.add_argument("setup_file", help="file in the folder that Intune runs")
+    parser.add_argument("-o", "--output", help="output path (default <setup file name>.intunewin)")
+    parser.add_argument("--compresslevel", type=int, help="zlib level for the inner zip (1-9, 0 stores)")
+    args = parser.parse_args(argv)
+
+    output = args.output or f"{Path(args.setup_file).stem}.intunewin"
+    meta = build_intunewin(args.source_dir, args.setup_file, output, compresslevel=args.compresslevel)
+    print(f"Wrote {output} ({meta['unencrypted_size']} bytes of content, FileDigest {meta['file_digest']})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,431 @@
+"""
+Local mirror of the Win32 apps in Intune.
+
+Answering "what is already deployed" used to mean paging through
+``deviceAppManagement/mobileApps`` on every request.  ``AppInventory`` keeps
+the Win32 LOB apps of each tenant, with their assignments, in a SQLite file
+and refreshes it in the background, so listing and lookups are local queries.
+
+A sync only transfers what it needs:
+
+- The first (or a ``full``) sync pages every Win32 app with ``$select``ed
+  fields, assignments expanded and the largest page size Graph allows.
+- Later syncs fetch only apps whose ``lastModifiedDateTime`` is at or after
+  the newest one seen so far (``mobileApps`` has no delta query), with their
+  assignments, then sweep the ids of all apps (``$select=id`` and nothing
+  else, the cheapest listing there is) to drop apps deleted in Intune.
+- Assignment changes do not touch an app's timestamp, so they are only
+  picked up when the app changes or by the next full sync, which runs
+  every INVENTORY_FULL_SYNC_SECONDS.
+
+The winget package id of apps created by this API is recovered from their
+install command line, so apps can be looked up by package id.
+
+Configuration through environment variables:
+
+- INVENTORY_DB_PATH: SQLite file holding the mirror (default inventory.db in
+  the working directory)
+- INVENTORY_SYNC_SECONDS: background sync interval; 0 disables the schedule
+  (default 900)
+- INVENTORY_FULL_SYNC_SECONDS: how old the last full sync of a tenant may
+  get before a sync is made full again; 0 never forces one (default 86400)
+- INVENTORY_PAGE_SIZE: ``$top`` for mobileApps pages (default 999)
+"""
+
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional
+
+from .auth import get_token_provider
+from .deployments import tenant_key
+from .graph_client import GRAPH_BASE, GraphClient, parse_graph_datetime
+from .tenants import client_for, get_tenant_registry
+
+logger = logging.getLogger(__name__)
+
+INVENTORY_DB_PATH = os.environ.get("INVENTORY_DB_PATH", "inventory.db")
+INVENTORY_SYNC_SECONDS = int(os.environ.get("INVENTORY_SYNC_SECONDS", "900"))
+INVENTORY_FULL_SYNC_SECONDS = int(os.environ.get("INVENTORY_FULL_SYNC_SECONDS", "86400"))
+INVENTORY_PAGE_SIZE = int(os.environ.get("INVENTORY_PAGE_SIZE", "999"))
+
+WIN32_FILTER = "isof('microsoft.graph.win32LobApp')"
+
+# Graph property -> column
+_FIELDS = {
+    "id": "id",
+    "displayName": "display_name",
+    "publisher": "publisher",
+    "displayVersion": "display_version",
+    "fileName": "file_name",
+    "size": "size",
+    "publishingState": "publishing_state",
+    "committedContentVersion": "committed_content_version",
+    "isAssigned": "is_assigned",
+    "createdDateTime": "created_at",
+    "lastModifiedDateTime": "modified_at",
+}
+_SELECT = ",".join([*_FIELDS, "installCommandLine"])
+_APP_COLUMNS = ("tenant_id", *_FIELDS.values(), "package_id", "synced_at")
+_ASSIGNMENT_COLUMNS = ("tenant_id", "app_id", "id", "intent", "target_type", "group_id")
+
+# how upload_intunewin passes the package id to Winget-InstallPackage.ps1
+_PACKAGE_ID_RE = re.compile(r'-PackageID\s+"([^"]+)"', re.IGNORECASE)
+
+_ORDERS = {
+    "name": "display_name COLLATE NOCASE, id",
+    "modified": "modified_at DESC, id",
+}
+
+
+def package_id_of(install_command_line: Optional[str]) -> Optional[str]:
+    """The winget package id in an install command line built by this API."""
+    match = _PACKAGE_ID_RE.search(install_command_line or "")
+    return match.group(1) if match else None
+
+
+def _assignment_row(tenant: str, app_id: str, assignment: Dict) -> tuple:
+    target = assignment.get("target") or {}
+    target_type = (target.get("@odata.type") or "").rsplit(".", 1)[-1]
+    return (tenant, app_id, assignment.get("id"), assignment.get("intent"), target_type, target.get("groupId"))
+
+
+def _like(value: str) -> str:
+    return "%" + re.sub(r"([\\%_])", r"\\\1", value) + "%"
+
+
+class AppInventory:
+    """
+    SQLite mirror of each tenant's Win32 apps and their assignments, synced
+    from Graph on demand or on a schedule.
+    """
+
+    def __init__(
+        self,
+        path: str = INVENTORY_DB_PATH,
+        graph_base: str = GRAPH_BASE,
+        client_factory: Callable[[Optional[str]], GraphClient] = client_for,
+        page_size: int = INVENTORY_PAGE_SIZE,
+        full_sync_interval: int = INVENTORY_FULL_SYNC_SECONDS,
+    ):
+        self.path = path
+        self.graph_base = graph_base
+        self.page_size = page_size
+        self.full_sync_interval = full_sync_interval
+        self._client_factory = client_factory
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS apps ("
+                " tenant_id TEXT NOT NULL,"
+                " id TEXT NOT NULL,"
+                " display_name TEXT,"
+                " publisher TEXT,"
+                " display_version TEXT,"
+                " file_name TEXT,"
+                " size INTEGER,"
+                " publishing_state TEXT,"
+                " committed_content_version TEXT,"
+                " is_assigned INTEGER,"
+                " created_at TEXT,"
+                " modified_at TEXT,"
+                " package_id TEXT,"
+                " synced_at REAL NOT NULL,"
+                " PRIMARY KEY (tenant_id, id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS apps_name ON apps (tenant_id, display_name COLLATE NOCASE)")
+            conn.execute("CREATE INDEX IF NOT EXISTS apps_package ON apps (tenant_id, package_id)")
+            conn.execute("CREATE INDEX IF NOT EXISTS apps_modified ON apps (tenant_id, modified_at)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS assignments ("
+                " tenant_id TEXT NOT NULL,"
+                " app_id TEXT NOT NULL,"
+                " id TEXT NOT NULL,"
+                " intent TEXT,"
+                " target_type TEXT,"
+                " group_id TEXT,"
+                " PRIMARY KEY (tenant_id, app_id, id))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS assignments_group ON assignments (tenant_id, group_id)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sync_state ("
+                " tenant_id TEXT PRIMARY KEY,"
+                " watermark TEXT,"
+                " synced_at REAL,"
+                " last_error TEXT,"
+                " full_synced_at REAL)"
+            )
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(sync_state)")}
+            if "full_synced_at" not in columns:  # mirrors created before full syncs were scheduled
+                conn.execute("ALTER TABLE sync_state ADD COLUMN full_synced_at REAL")
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path, timeout=30)
+
+    def _lock_for(self, tenant: str) -> threading.Lock:
+        with self._locks_lock:
+            return self._locks.setdefault(tenant, threading.Lock())
+
+    # ----------------------------------------------------------------------------------
+    # sync
+    # ----------------------------------------------------------------------------------
+    def _pages(self, client: GraphClient, params: Dict[str, str]) -> Iterator[List[Dict]]:
+        url = f"{self.graph_base}/deviceAppManagement/mobileApps"
+        params = {"$top": str(self.page_size), **params}
+        while url:
+            data = client.get(url, params=params) or {}
+            yield data.get("value", [])
+            # the next link carries the whole query
+            url, params = data.get("@odata.nextLink"), None
+
+    def _store_apps(self, conn: sqlite3.Connection, tenant: str, apps: List[Dict], synced_at: float) -> None:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO apps ({', '.join(_APP_COLUMNS)}) VALUES ({', '.join('?' * len(_APP_COLUMNS))})",
+            [
+                (tenant, *(app.get(field) for field in _FIELDS), package_id_of(app.get("installCommandLine")),
+                 synced_at)
+                for app in apps
+            ],
+        )
+
+    def _store_assignments(self, conn: sqlite3.Connection, tenant: str, apps: List[Dict]) -> None:
+        conn.executemany("DELETE FROM assignments WHERE tenant_id = ? AND app_id = ?",
+                         [(tenant, app["id"]) for app in apps])
+        conn.executemany(
+            f"INSERT OR REPLACE INTO assignments ({', '.join(_ASSIGNMENT_COLUMNS)}) VALUES (?, ?, ?, ?, ?, ?)",
+            [_assignment_row(tenant, app["id"], assignment)
+             for app in apps for assignment in app.get("assignments") or []],
+        )
+
+    def _prune(self, conn: sqlite3.Connection, tenant: str, live: set) -> int:
+        """Drop the tenant's apps (and their assignments) that are not in *live*."""
+        conn.execute("CREATE TEMP TABLE IF NOT EXISTS live_apps (id TEXT PRIMARY KEY)")
+        conn.execute("DELETE FROM live_apps")
+        conn.executemany("INSERT OR IGNORE INTO live_apps VALUES (?)", [(app_id,) for app_id in live])
+        conn.execute("DELETE FROM assignments WHERE tenant_id = ? AND app_id NOT IN (SELECT id FROM live_apps)",
+                     (tenant,))
+        removed = conn.execute("DELETE FROM apps WHERE tenant_id = ? AND id NOT IN (SELECT id FROM live_apps)",
+                               (tenant,)).rowcount
+        conn.execute("DELETE FROM live_apps")
+        return removed
+
+    def sync(self, tenant_id: Optional[str] = None, full: bool = False) -> Dict:
+        """
+        Bring the mirror of *tenant_id* (the environment tenant if None) up to
+        date and return what changed.  Incremental unless *full* is set, the
+        tenant was never synced or its last full sync is older than
+        ``full_sync_interval``.  Concurrent syncs of one tenant run one after
+        the other; a failed sync leaves the previous state in place.
+        """
+        tenant = tenant_key(tenant_id)
+        client = self._client_factory(tenant_id)  # UnknownTenantError before anything is recorded
+        with self._lock_for(tenant):
+            started = time.monotonic()
+            synced_at = time.time()
+            try:
+                with self._connect() as conn:
+                    row = conn.execute("SELECT watermark, full_synced_at FROM sync_state WHERE tenant_id = ?",
+                                       (tenant,)).fetchone()
+                stale = (row is not None and self.full_sync_interval > 0
+                         and synced_at - (row[1] or 0) >= self.full_sync_interval)
+                watermark = None if full or row is None or stale else row[0]
+                result = self._sync(client, tenant, watermark, synced_at)
+            except Exception as exc:
+                logger.error("Inventory sync for tenant %s failed: %s", tenant or "(default)", exc)
+                with self._connect() as conn:
+                    conn.execute(
+                        "INSERT INTO sync_state (tenant_id, last_error) VALUES (?, ?) "
+                        "ON CONFLICT (tenant_id) DO UPDATE SET last_error = excluded.last_error",
+                        (tenant, str(exc)),
+                    )
+                raise
+        logger.info("Inventory sync for tenant %s: %s changed, %s removed, %s apps in %.1fs",
+                    tenant or "(default)", result["changed"], result["removed"], result["apps"],
+                    time.monotonic() - started)
+        return {"tenant_id": tenant, **result, "synced_at": synced_at}
+
+    def _sync(self, client: GraphClient, tenant: str, watermark: Optional[str], synced_at: float) -> Dict:
+        full = watermark is None
+        params = {"$select": _SELECT, "$filter": WIN32_FILTER, "$expand": "assignments"}
+        if not full:
+            params["$filter"] += f" and lastModifiedDateTime ge {watermark}"
+
+        newest, newest_at = watermark, parse_graph_datetime(watermark)
+        seen = set()
+        changed = 0
+        with self._connect() as conn:
+            for apps in self._pages(client, params):
+                self._store_apps(conn, tenant, apps, synced_at)
+                self._store_assignments(conn, tenant, apps)
+                changed += len(apps)
+                seen.update(app["id"] for app in apps)
+                for app in apps:
+                    modified = parse_graph_datetime(app.get("lastModifiedDateTime"))
+                    if modified and (newest_at is None or modified > newest_at):
+                        newest, newest_at = app["lastModifiedDateTime"], modified
+
+            if not full:
+                # ids only: enough to catch deletions, which leave no timestamp behind
+                seen = set()
+                for apps in self._pages(client, {"$select": "id", "$filter": WIN32_FILTER}):
+                    seen.update(app["id"] for app in apps)
+            removed = self._prune(conn, tenant, seen)
+
+            total = conn.execute("SELECT COUNT(*) FROM apps WHERE tenant_id = ?", (tenant,)).fetchone()[0]
+            conn.execute(
+                "INSERT INTO sync_state (tenant_id, watermark, synced_at, last_error, full_synced_at) "
+                "VALUES (?, ?, ?, NULL, ?) ON CONFLICT (tenant_id) DO UPDATE SET watermark = excluded.watermark, "
+                "synced_at = excluded.synced_at, last_error = NULL, "
+                "full_synced_at = COALESCE(excluded.full_synced_at, sync_state.full_synced_at)",
+                (tenant, newest, synced_at, synced_at if full else None),
+            )
+        return {"full": full, "changed": changed, "removed": removed, "apps": total}
+
+    def tenants(self) -> List[Optional[str]]:
+        """Tenants the background sync covers: the environment tenant (if configured) and every registered one."""
+        tenants: List[Optional[str]] = [None] if get_token_provider() is not None else []
+        keys = {tenant_key(None)} if tenants else set()
+        for entry in get_tenant_registry().list():
+            if entry["tenant_id"] not in keys:
+                keys.add(entry["tenant_id"])
+                tenants.append(entry["tenant_id"])
+        return tenants
+
+    def sync_all(self, full: bool = False) -> List[Dict]:
+        """Sync every tenant in ``tenants()``; failures are reported per tenant."""
+        results = []
+        for tenant_id in self.tenants():
+            try:
+                results.append(self.sync(tenant_id, full=full))
+            except Exception as exc:
+                results.append({"tenant_id": tenant_key(tenant_id), "error": str(exc)})
+        return results
+
+    def start(self, interval: int = INVENTORY_SYNC_SECONDS) -> None:
+        """Sync all tenants in the background now and then every *interval* seconds."""
+        if self._thread is not None or interval <= 0:
+            return
+
+        def _loop():
+            while not self._stop.is_set():
+                self.sync_all()
+                if self._stop.wait(interval):
+                    break
+
+        self._thread = threading.Thread(target=_loop, name="app-inventory", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # ----------------------------------------------------------------------------------
+    # queries
+    # ----------------------------------------------------------------------------------
+    def list(
+        self,
+        tenant_id: Optional[str] = None,
+        search: Optional[str] = None,
+        publisher: Optional[str] = None,
+        package_id: Optional[str] = None,
+        publishing_state: Optional[str] = None,
+        assigned: Optional[bool] = None,
+        group_id: Optional[str] = None,
+        order: str = "name",
+        offset: int = 0,
+        limit: int = 50,
+    ) -> Dict:
+        """
+        One page of mirrored apps matching every given filter, plus the total
+        number of matches.  *search* matches display name, publisher or
+        package id (case-insensitive substring); *order* is "name" or
+        "modified" (newest first).
+        """
+        if order not in _ORDERS:
+            raise ValueError(f"order must be one of {', '.join(_ORDERS)}")
+        where = ["tenant_id = ?"]
+        params: list = [tenant_key(tenant_id)]
+        if search:
+            where.append("(display_name LIKE ? ESCAPE '\\' OR publisher LIKE ? ESCAPE '\\'"
+                         " OR package_id LIKE ? ESCAPE '\\')")
+            params += [_like(search)] * 3
+        for column, value in (("publisher", publisher), ("package_id", package_id),
+                              ("publishing_state", publishing_state)):
+            if value is not None:
+                where.append(f"{column} = ?")
+                params.append(value)
+        if assigned is not None:
+            where.append("is_assigned = ?")
+            params.append(int(assigned))
+        if group_id is not None:
+            where.append("id IN (SELECT app_id FROM assignments WHERE tenant_id = apps.tenant_id AND group_id = ?)")
+            params.append(group_id)
+        clause = " AND ".join(where)
+        columns = _APP_COLUMNS[1:]
+        with self._connect() as conn:
+            total = conn.execute(f"SELECT COUNT(*) FROM apps WHERE {clause}", params).fetchone()[0]
+            rows = conn.execute(
+                f"SELECT {', '.join(columns)} FROM apps WHERE {clause} ORDER BY {_ORDERS[order]} LIMIT ? OFFSET ?",
+                [*params, limit, offset],
+            ).fetchall()
+        return {"items": [self._app(columns, row) for row in rows], "total": total, "offset": offset, "limit": limit}
+
+    @staticmethod
+    def _app(columns, row) -> Dict:
+        app = dict(zip(columns, row))
+        if app.get("is_assigned") is not None:
+            app["is_assigned"] = bool(app["is_assigned"])
+        return app
+
+    def get(self, app_id: str, tenant_id: Optional[str] = None) -> Optional[Dict]:
+        """A mirrored app with its assignments, or None."""
+        tenant = tenant_key(tenant_id)
+        columns = _APP_COLUMNS[1:]
+        with self._connect() as conn:
+            row = conn.execute(f"SELECT {', '.join(columns)} FROM apps WHERE tenant_id = ? AND id = ?",
+                               (tenant, app_id)).fetchone()
+            if row is None:
+                return None
+            assignments = conn.execute(
+                "SELECT id, intent, target_type, group_id FROM assignments WHERE tenant_id = ? AND app_id = ? ORDER BY id",
+                (tenant, app_id),
+            ).fetchall()
+        app = self._app(columns, row)
+        app["assignments"] = [dict(zip(("id", "intent", "target_type", "group_id"), a)) for a in assignments]
+        return app
+
+    def packages(self, tenant_id: Optional[str] = None) -> List[Dict]:
+        """Every mirrored app of the tenant that was deployed from a winget package id."""
+        columns = ("id", "package_id", "display_name", "publisher", "display_version", "modified_at")
+        with self._connect() as conn:
+            rows = conn.execute(
+                f"SELECT {', '.join(columns)} FROM apps WHERE tenant_id = ? AND package_id IS NOT NULL",
+                (tenant_key(tenant_id),),
+            ).fetchall()
+        return [dict(zip(columns, row)) for row in rows]
+
+    def status(self) -> List[Dict]:
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT s.tenant_id, s.synced_at, s.full_synced_at, s.last_error, COUNT(a.id) FROM sync_state s "
+                "LEFT JOIN apps a ON a.tenant_id = s.tenant_id GROUP BY s.tenant_id ORDER BY s.tenant_id"
+            ).fetchall()
+        return [dict(zip(("tenant_id", "synced_at", "full_synced_at", "last_error", "apps"), row)) for row in rows]
+
+
+_inventory: Optional[AppInventory] = None
+_inventory_lock = threading.Lock()
+
+
+def get_app_inventory() -> AppInventory:
+    """Return the process-wide AppInventory, creating it on first use."""
+    global _inventory
+    with _inventory_lock:
+        if _inventory is None:
+            _inventory = AppInventory()
+        return _inventory
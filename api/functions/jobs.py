@@ -0,0 +1,136 @@
+"""
+Background job runner for long-running uploads.
+
+Uploads take minutes (blob transfer, Intune commit and publish waits), so the
+API submits them here and returns a job id straight away.  Jobs run on a
+thread pool, off the FastAPI event loop, and record every progress report as
+a numbered event that clients can poll (``GET /jobs/{id}``) or stream
+(``GET /jobs/{id}/events``).
+"""
+
+import logging
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_MAX_WORKERS = int(os.environ.get("JOB_MAX_WORKERS", "4"))
+JOB_RETENTION_SECONDS = int(os.environ.get("JOB_RETENTION_SECONDS", "3600"))
+JOB_MAX_EVENTS = 256
+
+FINISHED_STATES = ("succeeded", "failed")
+
+
+class Job:
+    """State of a single background job."""
+
+    def __init__(self, kind: str, params: Optional[Dict[str, Any]] = None):
+        self.id = uuid.uuid4().hex
+        self.kind = kind
+        self.params = params or {}
+        self.status = "queued"
+        self.stage: Optional[str] = None
+        self.info: Dict[str, Any] = {}
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        self.finished_at: Optional[float] = None
+        self._seq = 0
+        self._events = deque(maxlen=JOB_MAX_EVENTS)
+        self._lock = threading.Lock()
+
+    @property
+    def finished(self) -> bool:
+        return self.status in FINISHED_STATES
+
+    def _record(self, **changes) -> None:
+        with self._lock:
+            for key, value in changes.items():
+                setattr(self, key, value)
+            self.updated_at = time.time()
+            self._seq += 1
+            self._events.append({"seq": self._seq, **self._snapshot()})
+
+    def progress(self, stage: str, **info) -> None:
+        """Progress callback handed to the job function."""
+        # info accumulates so the latest app_id / byte counts stay visible
+        # after later stages report.
+        self._record(stage=stage, info={**self.info, **info})
+
+    def events_since(self, seq: int) -> List[Dict[str, Any]]:
+        """Events newer than *seq*; older ones may already have been dropped."""
+        with self._lock:
+            return [event for event in self._events if event["seq"] > seq]
+
+    def _snapshot(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "status": self.status,
+            "stage": self.stage,
+            "info": dict(self.info),
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            return {**self._snapshot(), "params": self.params}
+
+
+class JobManager:
+    """Runs jobs on a bounded thread pool and keeps them for later lookup."""
+
+    def __init__(self, max_workers: int = JOB_MAX_WORKERS, retention: int = JOB_RETENTION_SECONDS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._retention = retention
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, kind: str, fn: Callable[..., Any], *args, params: Optional[Dict[str, Any]] = None,
+               **kwargs) -> Job:
+        """
+        Queue ``fn(*args, progress=job.progress, **kwargs)`` and return its Job.
+        """
+        self._prune()
+        job = Job(kind, params)
+        with self._lock:
+            self._jobs[job.id] = job
+        job._record()  # initial "queued" event
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def list(self) -> List[Job]:
+        with self._lock:
+            return sorted(self._jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait)
+
+    def _run(self, job: Job, fn: Callable[..., Any], args, kwargs) -> None:
+        job._record(status="running")
+        try:
+            result = fn(*args, progress=job.progress, **kwargs)
+        except Exception as exc:
+            logger.error("Job %s (%s) failed: %s", job.id, job.kind, exc)
+            job._record(status="failed", error=str(exc), finished_at=time.time())
+        else:
+            job._record(status="succeeded", stage="done", result=result, finished_at=time.time())
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self._retention
+        with self._lock:
+            for job_id in [j.id for j in self._jobs.values() if j.finished_at and j.finished_at < cutoff]:
+                del self._jobs[job_id]
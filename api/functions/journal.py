@@ -0,0 +1,129 @@
+"""
+On-disk checkpoints for in-progress uploads.
+
+An upload that dies part way (process restart, network loss) used to start
+over from a new app shell, leaving the half-created app behind.  Each upload
+now keeps a small JSON journal recording the Intune objects it has created,
+the blob block size and the blocks it has sent, and which commit steps are
+done.  The next ``upload_intunewin`` for the same package, tenant and package
+id picks the journal up and continues from there; the journal is deleted
+once the app is published.
+
+Journals are written atomically (temp file + rename) so a crash mid-write
+leaves the previous checkpoint intact.  Uploads of one key run one at a time
+(``UploadJournal.exclusive``): two identical uploads at once would share the
+journal and stage over each other's block lists.
+
+Configuration through environment variables:
+
+- UPLOAD_JOURNAL_DIR: directory for journal files (default upload_journal
+  in the working directory)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_JOURNAL_DIR = os.environ.get("UPLOAD_JOURNAL_DIR", "upload_journal")
+
+# Block checkpoints are flushed at most this often; the blob's own block
+# list is authoritative on resume, so losing the last few is harmless.
+FLUSH_INTERVAL = 1.0
+
+# key -> [lock, number of uploads holding or waiting for it]
+_claims: Dict[str, List] = {}
+_claims_lock = threading.Lock()
+
+
+class UploadJournal:
+    """
+    Checkpoint state of one upload, persisted as JSON.  Without a *path* the
+    journal only lives in memory (uploads that are not resumable).
+    """
+
+    def __init__(self, path: Optional[Path] = None, state: Optional[Dict[str, Any]] = None):
+        self.path = Path(path) if path else None
+        self.state: Dict[str, Any] = state or {}
+        self._lock = threading.Lock()
+        self._flushed_at = 0.0
+
+    @classmethod
+    def open(cls, key: str, directory: Optional[str] = None) -> "UploadJournal":
+        """The journal for *key*, loaded from disk if one exists."""
+        name = hashlib.sha256(key.encode()).hexdigest()[:32] + ".json"
+        path = Path(directory or UPLOAD_JOURNAL_DIR) / name
+        state = None
+        if path.exists():
+            try:
+                state = json.loads(path.read_text(encoding="utf-8"))
+            except (OSError, ValueError) as exc:
+                logger.warning("Ignoring unreadable upload journal %s: %s", path, exc)
+        return cls(path, state)
+
+    @staticmethod
+    @contextmanager
+    def exclusive(key: str) -> Iterator[None]:
+        """
+        Hold *key* for the duration of one upload in this process; further
+        uploads of the same key wait until it is done.
+        """
+        with _claims_lock:
+            claim = _claims.setdefault(key, [threading.Lock(), 0])
+            claim[1] += 1
+        try:
+            with claim[0]:
+                yield
+        finally:
+            with _claims_lock:
+                claim[1] -= 1
+                if not claim[1]:
+                    del _claims[key]
+
+    @property
+    def resumed(self) -> bool:
+        return bool(self.state.get("app_id"))
+
+    def get(self, name: str, default=None):
+        return self.state.get(name, default)
+
+    def update(self, **values) -> None:
+        """Record *values* and write the journal to disk."""
+        with self._lock:
+            self.state.update(values)
+            self._write()
+
+    def add_block(self, block_id: str) -> None:
+        """Record a staged block; flushed to disk at most every FLUSH_INTERVAL."""
+        with self._lock:
+            self.state.setdefault("blocks", []).append(block_id)
+            if time.monotonic() - self._flushed_at >= FLUSH_INTERVAL:
+                self._write()
+
+    def _write(self) -> None:
+        self.state["updated_at"] = time.time()
+        if self.path is None:
+            return
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps(self.state), encoding="utf-8")
+        os.replace(tmp, self.path)
+        self._flushed_at = time.monotonic()
+
+    def discard(self) -> None:
+        """Forget the upload (finished, or its app no longer exists)."""
+        with self._lock:
+            self.state = {}
+            if self.path is None:
+                return
+            try:
+                self.path.unlink()
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,435 @@
+"""
+Declarative deployment manifests: diff them against Intune, then apply.
+
+A manifest lists the winget packages a tenant should have, as JSON or YAML
+(YAML needs PyYAML):
+
+    tenant_id: 00000000-0000-0000-0000-000000000000   # optional, GRAPH_TENANT_ID if omitted
+    defaults:                                         # optional, merged into every app
+      publisher: Contoso IT
+    apps:
+      - package_id: Notepad++.Notepad++
+        display_name: Notepad++
+        publisher: Don Ho                 # optional
+        description: Text editor          # optional
+        path: packages/custom.intunewin   # optional, the bundled Winget-InstallPackage.intunewin by default
+        detection:                        # optional Graph detection rules, replacing the default
+          - "@odata.type": "#microsoft.graph.win32LobAppRegistryRule"
+            ruleType: detection
+            keyPath: HKEY_LOCAL_MACHINE\\SOFTWARE\\Notepad++
+            operationType: exists
+        overrides:                        # optional, other Win32LobApp attributes
+          minimum_supported_windows_release: "1809"
+
+Entries are validated once, when the manifest is loaded, by building the
+Win32LobApp each of them would create.
+
+``plan_manifest`` reads the tenant's Win32 apps in one paged query, matches
+them to entries by the package id in their install command line and sorts
+every entry into:
+
+- create: Intune has no app for the package id; ``apply`` uploads one
+- update: the app exists but properties the manifest sets differ; ``apply``
+  PATCHes only those properties (through ``$batch``)
+- skip: the app already matches
+
+``apply_manifest`` runs the creates on parallel upload workers
+(``upload_intunewin_batch``) while the updates go out.  Packages already
+uploaded are not compared byte for byte: re-uploading content is left to
+``POST /apps`` with ``force``.
+
+Command line (from the api directory):
+    python -m functions.manifest plan apps.yaml
+    python -m functions.manifest apply apps.yaml --workers 8
+"""
+
+import argparse
+import json
+import logging
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+
+from .deployments import tenant_key
+from .detection import catalog_overrides
+from .graph_batch import GRAPH_BATCH_WINDOW, GraphBatcher, batcher_for
+from .graph_client import GRAPH_BASE, GraphClient, parse_graph_datetime
+from .intune_win32_uploader import ProgressCallback, build_app_shell, upload_intunewin_batch
+from .inventory import INVENTORY_PAGE_SIZE, WIN32_FILTER, package_id_of
+from .tenants import client_for
+from .winget_catalog import WingetCatalog
+
+try:
+    from ..classes.win32app import GRAPH_PROPERTIES
+except ImportError:  # run from api/, where classes is top level
+    from classes.win32app import GRAPH_PROPERTIES
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PACKAGE = Path(__file__).resolve().parent.parent / "files" / "Winget-InstallPackage.intunewin"
+
+_APP_KEYS = {"package_id", "display_name", "publisher", "description", "path", "detection", "overrides"}
+_TOP_KEYS = {"tenant_id", "defaults", "apps"}
+# set by the uploader or by Intune, not by manifests
+_MANAGED = {"display_name", "description", "publisher", "install_command_line", "uninstall_command_line",
+            "setup_file_path", "file_name", "id", "publishing_state", "committed_content_version", "size"}
+OVERRIDABLE = frozenset(GRAPH_PROPERTIES) - _MANAGED
+
+ACTIONS = ("create", "update", "skip")
+
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+
+class ManifestError(ValueError):
+    """The manifest is malformed or describes an app that cannot be created."""
+
+
+# --------------------------------------------------------------------------------------
+# loading
+# --------------------------------------------------------------------------------------
+def _entry(raw: Dict, defaults: Dict, base_dir: Path, n: int) -> Dict:
+    if not isinstance(raw, dict):
+        raise ManifestError(f"apps[{n}] must be a mapping")
+    merged = {**defaults, **raw}
+    merged["overrides"] = {**(defaults.get("overrides") or {}), **(raw.get("overrides") or {})}
+    where = f"apps[{n}] ({merged.get('package_id') or 'no package_id'})"
+    unknown = set(merged) - _APP_KEYS
+    if unknown:
+        raise ManifestError(f"{where}: unknown keys {', '.join(sorted(unknown))}")
+    for key in ("package_id", "display_name"):
+        if not isinstance(merged.get(key), str) or not merged[key].strip():
+            raise ManifestError(f"{where}: {key} is required")
+
+    overrides = dict(merged["overrides"])
+    bad = set(overrides) - OVERRIDABLE
+    if bad:
+        raise ManifestError(f"{where}: cannot override {', '.join(sorted(bad))}")
+    if merged.get("detection") is not None:
+        overrides["rules"] = merged["detection"]
+
+    path = Path(merged["path"]).expanduser() if merged.get("path") else DEFAULT_PACKAGE
+    if not path.is_absolute():
+        path = base_dir / path
+    if not path.is_file():
+        raise ManifestError(f"{where}: package {path} not found")
+
+    entry = {
+        "package_id": merged["package_id"].strip(),
+        "display_name": merged["display_name"],
+        "publisher": merged.get("publisher"),
+        "description": merged.get("description"),
+        "path": str(path),
+        "overrides": overrides,
+    }
+    try:
+        build_app_shell(entry["display_name"], entry["description"], entry["publisher"] or "Unknown",
+                        path.name, entry["package_id"], overrides)
+    except (TypeError, ValueError) as exc:
+        raise ManifestError(f"{where}: {exc}") from None
+    return entry
+
+
+def parse_manifest(data, base_dir: Optional[Path] = None) -> Dict:
+    """
+    Validate a decoded manifest (a mapping, or just the list of apps) and
+    return ``{"tenant_id", "apps"}`` with every app normalised.  Relative
+    package paths are resolved against *base_dir* (the working directory by
+    default).  Raises ManifestError.
+    """
+    if isinstance(data, list):
+        data = {"apps": data}
+    if not isinstance(data, dict):
+        raise ManifestError("A manifest is a mapping with an 'apps' list, or the list itself")
+    unknown = set(data) - _TOP_KEYS
+    if unknown:
+        raise ManifestError(f"Unknown top-level keys {', '.join(sorted(unknown))}")
+    defaults = data.get("defaults") or {}
+    if not isinstance(defaults, dict) or {"package_id", "display_name"} & set(defaults):
+        raise ManifestError("defaults must be a mapping without package_id or display_name")
+    if not isinstance(data.get("apps"), list):
+        raise ManifestError("'apps' must be a list")
+
+    base_dir = Path(base_dir) if base_dir else Path.cwd()
+    apps = [_entry(raw, defaults, base_dir, n) for n, raw in enumerate(data["apps"])]
+    seen = set()
+    for app in apps:
+        key = app["package_id"].lower()
+        if key in seen:
+            raise ManifestError(f"{app['package_id']} is listed more than once")
+        seen.add(key)
+    return {"tenant_id": data.get("tenant_id"), "apps": apps}
+
+
+def load_manifest(path: str | Path) -> Dict:
+    """Read and validate the JSON or YAML manifest at *path* (see ``parse_manifest``)."""
+    path = Path(path).expanduser()
+    text = path.read_text(encoding="utf-8")
+    if path.suffix.lower() in (".yaml", ".yml"):
+        try:
+            import yaml
+        except ImportError:
+            raise ManifestError("PyYAML is needed for YAML manifests (pip install pyyaml); "
+                                "JSON manifests work without it") from None
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as exc:
+            raise ManifestError(f"{path}: {exc}") from None
+    else:
+        try:
+            data = json.loads(text)
+        except json.JSONDecodeError as exc:
+            raise ManifestError(f"{path}: {exc}") from None
+    return parse_manifest(data, base_dir=path.resolve().parent)
+
+
+# --------------------------------------------------------------------------------------
+# plan
+# --------------------------------------------------------------------------------------
+def _desired(app: Dict) -> Dict:
+    """Graph properties (and values) that *app* pins down."""
+    body = build_app_shell(app["display_name"], app["description"], app["publisher"] or "Unknown",
+                           Path(app["path"]).name, app["package_id"], app["overrides"]).to_dict()
+    keys = ["displayName"]
+    keys += [key for key, attr in (("description", "description"), ("publisher", "publisher")) if app[attr]]
+    keys += [GRAPH_PROPERTIES[attr] for attr in app["overrides"]]
+    return {key: body.get(key) for key in keys}
+
+
+def _differs(want, have) -> bool:
+    """
+    True if *have* (from Graph) does not match *want*.  Dicts only compare
+    the keys *want* sets, since Graph returns every property of a rule or
+    setting; ``@odata.type`` is not compared.
+    """
+    if isinstance(want, dict):
+        return not isinstance(have, dict) or any(
+            key != "@odata.type" and _differs(value, have.get(key)) for key, value in want.items())
+    if isinstance(want, list):
+        return (not isinstance(have, list) or len(want) != len(have)
+                or any(_differs(w, h) for w, h in zip(want, have)))
+    return want != have
+
+
+def _modified(app: Dict) -> datetime:
+    return parse_graph_datetime(app.get("lastModifiedDateTime")) or _EPOCH
+
+
+def _live_apps(client: GraphClient, graph_base: str, select: List[str], page_size: int):
+    url = f"{graph_base}/deviceAppManagement/mobileApps"
+    params = {"$select": ",".join(select), "$filter": WIN32_FILTER, "$top": str(page_size)}
+    while url:
+        data = client.get(url, params=params) or {}
+        yield from data.get("value", [])
+        url, params = data.get("@odata.nextLink"), None
+
+
+def plan_manifest(
+    manifest: Dict,
+    tenant_id: Optional[str] = None,
+    client: Optional[GraphClient] = None,
+    graph_base: str = GRAPH_BASE,
+    page_size: int = INVENTORY_PAGE_SIZE,
+) -> Dict:
+    """
+    Compare *manifest* with the Win32 apps in Intune.  *tenant_id* overrides
+    the manifest's tenant.
+
+    Returns ``{"tenant_id", "actions", "counts"}``; ``actions`` holds one
+    ``{"action", "package_id", "display_name", "app_id", "changes"}`` per
+    app, in manifest order, where ``changes`` maps each Graph property to
+    update to its new value.
+    """
+    tenant_id = tenant_id or manifest.get("tenant_id")
+    client = client or client_for(tenant_id)
+    desired = {app["package_id"].lower(): _desired(app) for app in manifest["apps"]}
+    select = {"id", "installCommandLine", "lastModifiedDateTime"}
+    for props in desired.values():
+        select.update(props)
+
+    # newest app per package id, should a package have been deployed twice
+    live: Dict[str, Dict] = {}
+    for app in _live_apps(client, graph_base.rstrip("/"), sorted(select), page_size):
+        package_id = (package_id_of(app.get("installCommandLine")) or "").lower()
+        if package_id not in desired:
+            continue
+        current = live.get(package_id)
+        if current is None or _modified(app) > _modified(current):
+            live[package_id] = app
+
+    actions = []
+    for app in manifest["apps"]:
+        key = app["package_id"].lower()
+        action = {"action": "create", "package_id": app["package_id"], "display_name": app["display_name"],
+                  "app_id": None, "changes": {}}
+        if key in live:
+            have = live[key]
+            changes = {prop: value for prop, value in desired[key].items() if _differs(value, have.get(prop))}
+            action.update(action="update" if changes else "skip", app_id=have["id"], changes=changes)
+        actions.append(action)
+    counts = {name: sum(a["action"] == name for a in actions) for name in ACTIONS}
+    logger.info("Manifest plan for tenant %s: %s", tenant_key(tenant_id) or "(default)", counts)
+    return {"tenant_id": tenant_id, "actions": actions, "counts": counts}
+
+
+# --------------------------------------------------------------------------------------
+# apply
+# --------------------------------------------------------------------------------------
+def apply_manifest(
+    manifest: Dict,
+    plan: Optional[Dict] = None,
+    tenant_id: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    progress: Optional[ProgressCallback] = None,
+    client: Optional[GraphClient] = None,
+    graph_base: str = GRAPH_BASE,
+    batcher_factory: Callable[[GraphClient], GraphBatcher] = batcher_for,
+    catalog: Optional[WingetCatalog] = None,
+) -> Dict:
+    """
+    Carry out *plan* (computed now if omitted): upload the apps to create,
+    up to *max_workers* at a time (capped at BATCH_MAX_CONCURRENCY), while
+    the updates are PATCHed in ``$batch`` calls.  One failure does not stop
+    the others.  With a loaded winget *catalog*, created apps record the
+    package's catalog version and detect it (see ``catalog_overrides``)
+    unless the manifest sets their detection or displayVersion.
+
+    Returns ``{"tenant_id", "results", "succeeded", "failed"}`` with one
+    ``{"package_id", "action", "status", "app_id"}`` (or ``"error"``) result
+    per planned action, in plan order; skipped apps count as succeeded.
+    """
+    if plan is None:
+        if progress:
+            progress("plan")
+        plan = plan_manifest(manifest, tenant_id=tenant_id, client=client, graph_base=graph_base)
+    tenant_id = plan["tenant_id"]
+    entries = {app["package_id"]: app for app in manifest["apps"]}
+    results: Dict[str, Dict] = {
+        action["package_id"]: {"package_id": action["package_id"], "action": action["action"],
+                               "status": "succeeded", "app_id": action["app_id"]}
+        for action in plan["actions"]
+    }
+    creates = [action for action in plan["actions"] if action["action"] == "create"]
+    updates = [action for action in plan["actions"] if action["action"] == "update"]
+    if progress:
+        progress("apply", **plan["counts"])
+
+    # queued first: the PATCHes go out while the uploads run
+    pending = {}
+    if updates:
+        client = client or client_for(tenant_id)
+        base = graph_base.rstrip("/")
+        for action in updates:
+            url = f"{base}/deviceAppManagement/mobileApps/{action['app_id']}"
+            body = {"@odata.type": "#microsoft.graph.win32LobApp", **action["changes"]}
+            if GRAPH_BATCH_WINDOW <= 0:
+                try:
+                    client.request("PATCH", url, json=body)
+                except Exception as exc:
+                    pending[action["package_id"]] = exc
+            else:
+                pending[action["package_id"]] = batcher_factory(client).submit("PATCH", url, json=body)
+
+    if creates:
+        items = [
+            {
+                "path": entries[action["package_id"]]["path"],
+                "display_name": entries[action["package_id"]]["display_name"],
+                "package_id": action["package_id"],
+                "description": entries[action["package_id"]]["description"],
+                "publisher": entries[action["package_id"]]["publisher"] or "",
+                "tenant_id": tenant_id,
+                "overrides": catalog_overrides(catalog, action["package_id"],
+                                               entries[action["package_id"]]["overrides"]),
+            }
+            for action in creates
+        ]
+        try:
+            uploaded = upload_intunewin_batch(items, max_workers)
+        except Exception as exc:  # e.g. no access token: every create fails alike
+            uploaded = [{"package_id": item["package_id"], "status": "failed", "error": str(exc)} for item in items]
+        for outcome in uploaded:
+            result = results[outcome["package_id"]]
+            result.update(status=outcome["status"], app_id=outcome.get("app_id"))
+            if "error" in outcome:
+                result["error"] = outcome["error"]
+
+    for package_id, outcome in pending.items():
+        try:
+            if isinstance(outcome, Exception):
+                raise outcome
+            outcome.result()
+        except Exception as exc:
+            logger.error("Updating %s failed: %s", package_id, exc)
+            results[package_id].update(status="failed", error=str(exc))
+
+    ordered = [results[action["package_id"]] for action in plan["actions"]]
+    return {
+        "tenant_id": tenant_id,
+        "results": ordered,
+        "succeeded": sum(r["status"] == "succeeded" for r in ordered),
+        "failed": sum(r["status"] == "failed" for r in ordered),
+    }
+
+
+# --------------------------------------------------------------------------------------
+# command line
+# --------------------------------------------------------------------------------------
+_SYMBOLS = {"create": "+", "update": "~", "skip": "="}
+
+
+def _print_plan(plan: Dict) -> None:
+    for action in plan["actions"]:
+        line = f"{_SYMBOLS[action['action']]} {action['action']:<6} {action['package_id']}"
+        if action["app_id"]:
+            line += f"  ({action['app_id']})"
+        if action["changes"]:
+            line += f": {', '.join(action['changes'])}"
+        print(line)
+    counts = plan["counts"]
+    print(f"Plan: {counts['create']} to create, {counts['update']} to update, {counts['skip']} unchanged.")
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Reconcile Intune with a deployment manifest")
+    parser.add_argument("command", choices=("plan", "apply"))
+    parser.add_argument("manifest", help="JSON or YAML manifest")
+    parser.add_argument("--tenant", help="tenant to reconcile instead of the manifest's")
+    parser.add_argument("--workers", type=int, help="uploads to run at once (capped by BATCH_MAX_CONCURRENCY)")
+    parser.add_argument("--json", action="store_true", help="print the plan or results as JSON")
+    args = parser.parse_args(argv)
+
+    try:
+        manifest = load_manifest(args.manifest)
+    except (OSError, ManifestError) as exc:
+        print(f"Invalid manifest: {exc}", file=sys.stderr)
+        return 2
+    plan = plan_manifest(manifest, tenant_id=args.tenant)
+    if args.command == "plan":
+        if args.json:
+            print(json.dumps(plan, indent=2))
+        else:
+            _print_plan(plan)
+        return 0
+
+    if not args.json:
+        _print_plan(plan)
+    catalog = WingetCatalog()
+    try:
+        catalog.refresh()
+    except Exception:  # already logged; the apps are created unversioned
+        pass
+    outcome = apply_manifest(manifest, plan, max_workers=args.workers, catalog=catalog)
+    if args.json:
+        print(json.dumps(outcome, indent=2))
+    else:
+        for result in outcome["results"]:
+            if result["action"] != "skip":
+                print(f"{result['status']:<9} {result['action']:<6} {result['package_id']}  "
+                      f"{result.get('app_id') or result.get('error')}")
+        print(f"Applied: {outcome['succeeded']} succeeded, {outcome['failed']} failed.")
+    return 1 if outcome["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,343 @@
+"""
+Counters, histograms and stage timers, exposed in the Prometheus text format.
+
+Logging alone cannot say whether a slow deployment spent its time uploading
+blocks, waiting for Intune to commit the file or waiting for it to publish.
+Modules declare their metrics once, at import time:
+
+    _REQUESTS = metrics.counter("graph_requests_total", "Graph requests", ("method", "route", "status"))
+    ...
+    if metrics.ENABLED:
+        _REQUESTS.inc(method, route, str(status))
+
+and ``render()`` (served at ``/metrics``) writes every metric in the
+Prometheus exposition format, together with values that collectors
+registered through ``register_collector`` compute at scrape time (e.g. cache
+hit counts kept elsewhere), which costs nothing on the hot path.
+
+``timed_stages`` times the stages an upload reports to its progress
+callback: the time from one stage to the next goes into a histogram per
+stage, so a deployment's time splits into shell, upload, commit, publish
+and so on.
+
+When disabled, ``inc``/``observe`` return on their first line and
+``timed_stages`` calls straight through, well under a microsecond (see
+``benchmarks/bench_metrics.py``).  No third-party package is needed for
+Prometheus.  With METRICS_OTEL set, every metric is also recorded through
+the OpenTelemetry metrics API and every timed upload becomes a trace with
+one span per stage; that needs ``opentelemetry-api``, plus the SDK and an
+exporter configured by the application to send anything anywhere.
+
+Configuration through environment variables:
+
+- METRICS_ENABLED: record metrics (default true)
+- METRICS_OTEL: also record through OpenTelemetry (default false)
+"""
+
+import bisect
+import functools
+import logging
+import math
+import os
+import re
+import threading
+import time
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+
+logger = logging.getLogger(__name__)
+
+ENABLED = os.environ.get("METRICS_ENABLED", "true").lower() == "true"
+METRICS_OTEL = os.environ.get("METRICS_OTEL", "false").lower() == "true"
+
+# seconds, from a fast Graph call to a slow Intune publish
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800)
+
+_registry: Dict[str, "_Metric"] = {}
+_collectors: List[Callable[[], Iterable[Tuple]]] = []
+_registry_lock = threading.Lock()
+
+_meter = None
+_tracer = None
+if METRICS_OTEL:
+    try:
+        from opentelemetry import metrics as otel_metrics, trace as otel_trace
+
+        _meter = otel_metrics.get_meter(__name__)
+        _tracer = otel_trace.get_tracer(__name__)
+    except ImportError:
+        logger.warning("METRICS_OTEL is set but opentelemetry-api is not installed; exporting to Prometheus only")
+
+
+def set_enabled(enabled: bool) -> None:
+    """Turn recording on or off at runtime (metrics keep the values they have)."""
+    global ENABLED
+    ENABLED = enabled
+
+
+# --------------------------------------------------------------------------------------
+# metrics
+# --------------------------------------------------------------------------------------
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        self._otel = None
+
+    def _attributes(self, labels: Tuple[str, ...]) -> Dict[str, str]:
+        return dict(zip(self.labels, labels))
+
+    def samples(self) -> List[Tuple[str, Dict[str, str], float]]:
+        raise NotImplementedError
+
+    def clear(self) -> None:
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    """A value that only goes up, per combination of label values."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        super().__init__(name, documentation, labels)
+        if _meter is not None:
+            self._otel = _meter.create_counter(name, description=documentation)
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        if not ENABLED:
+            return
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0.0) + amount
+        if self._otel is not None:
+            self._otel.add(amount, self._attributes(labels))
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0.0)
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, self._attributes(labels), value) for labels, value in sorted(self._values.items())]
+
+
+class Histogram(_Metric):
+    """Observations counted into cumulative buckets, with their sum, per combination of label values."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(sorted(buckets))
+        if _meter is not None:
+            self._otel = _meter.create_histogram(name, description=documentation)
+
+    def observe(self, value: float, *labels: str) -> None:
+        if not ENABLED:
+            return
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                # per-bucket counts (the last is +Inf), then the sum
+                entry = self._values[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+            entry[slot] += 1
+            entry[-1] += value
+        if self._otel is not None:
+            self._otel.record(value, self._attributes(labels))
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            entry = self._values.get(labels)
+            return sum(entry[:-1]) if entry else 0
+
+    def sum(self, *labels: str) -> float:
+        with self._lock:
+            entry = self._values.get(labels)
+            return entry[-1] if entry else 0.0
+
+    def samples(self):
+        with self._lock:
+            values = sorted((labels, list(entry)) for labels, entry in self._values.items())
+        samples = []
+        for labels, entry in values:
+            attributes = self._attributes(labels)
+            cumulative = 0
+            for bound, n in zip((*self.buckets, math.inf), entry[:-1]):
+                cumulative += n
+                samples.append((f"{self.name}_bucket", {**attributes, "le": _number(bound)}, cumulative))
+            samples.append((f"{self.name}_sum", attributes, entry[-1]))
+            samples.append((f"{self.name}_count", attributes, cumulative))
+        return samples
+
+
+def _register(metric: _Metric) -> _Metric:
+    with _registry_lock:
+        existing = _registry.get(metric.name)
+        if existing is not None:
+            if type(existing) is not type(metric) or existing.labels != metric.labels:
+                raise ValueError(f"Metric {metric.name} is already registered differently")
+            return existing
+        _registry[metric.name] = metric
+        return metric
+
+
+def counter(name: str, documentation: str, labels: Sequence[str] = ()) -> Counter:
+    """The Counter registered as *name*, created on first use."""
+    return _register(Counter(name, documentation, labels))
+
+
+def histogram(name: str, documentation: str, labels: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    """The Histogram registered as *name*, created on first use."""
+    return _register(Histogram(name, documentation, labels, buckets))
+
+
+def register_collector(collect: Callable[[], Iterable[Tuple]]) -> None:
+    """
+    Add values computed at scrape time.  *collect* returns
+    ``(name, kind, documentation, [(labels, value), ...])`` tuples, where
+    kind is counter or gauge.
+    """
+    with _registry_lock:
+        _collectors.append(collect)
+
+
+# --------------------------------------------------------------------------------------
+# exposition
+# --------------------------------------------------------------------------------------
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _line(name: str, labels: Dict[str, str], value: float) -> str:
+    if labels:
+        name += "{" + ",".join(f'{key}="{_escape(val)}"' for key, val in labels.items()) + "}"
+    return f"{name} {_number(value)}"
+
+
+def render() -> str:
+    """Every metric and collected value in the Prometheus text exposition format (version 0.0.4)."""
+    with _registry_lock:
+        metrics = sorted(_registry.values(), key=lambda metric: metric.name)
+        collectors = list(_collectors)
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {_escape(metric.documentation)}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(_line(*sample) for sample in metric.samples())
+    for collect in collectors:
+        try:
+            collected = list(collect())
+        except Exception:  # one broken collector must not hide the rest
+            logger.exception("Metrics collector %r failed", collect)
+            continue
+        for name, kind, documentation, values in collected:
+            lines.append(f"# HELP {name} {_escape(documentation)}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(_line(name, labels, value) for labels, value in values)
+    return "\n".join(lines) + "\n"
+
+
+# --------------------------------------------------------------------------------------
+# helpers
+# --------------------------------------------------------------------------------------
+_ID_SEGMENT = re.compile(r"^(?:[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}|\d+)$")
+_VERSION_SEGMENT = re.compile(r"^(?:beta|v\d+\.\d+)$")
+
+
+@functools.lru_cache(maxsize=1024)
+def _route_of_path(path: str) -> str:
+    segments = [segment for segment in path.split("/") if segment]
+    if segments and _VERSION_SEGMENT.match(segments[0]):
+        segments = segments[1:]
+    return "/" + "/".join("{id}" if _ID_SEGMENT.match(segment) else segment for segment in segments)
+
+
+def route_of(url: str) -> str:
+    """
+    URL template of a Graph request for use as a label: no host, API version
+    or query, and ids replaced by ``{id}``, e.g.
+    ``/deviceAppManagement/mobileApps/{id}/contentVersions/{id}``.
+    """
+    return _route_of_path(urlsplit(url).path)
+
+
+class _StageTimer:
+    """Progress callback wrapper that times the stages it is told about."""
+
+    __slots__ = ("histogram", "name", "progress", "stage", "started", "root", "span")
+
+    def __init__(self, histogram: Histogram, name: str, progress: Optional[Callable]):
+        self.histogram = histogram
+        self.name = name
+        self.progress = progress
+        self.stage: Optional[str] = None
+        self.started = 0.0
+        self.root = _tracer.start_span(name) if _tracer is not None else None
+        self.span = None
+
+    def _close(self, now: float) -> None:
+        if self.stage is not None:
+            self.histogram.observe(now - self.started, self.stage)
+        if self.span is not None:
+            self.span.end()
+            self.span = None
+
+    def __call__(self, stage: str, **info) -> None:
+        if stage != self.stage:
+            now = time.perf_counter()
+            self._close(now)
+            self.stage, self.started = stage, now
+            if self.root is not None:
+                self.span = _tracer.start_span(f"{self.name}.{stage}",
+                                               context=otel_trace.set_span_in_context(self.root))
+        if self.progress is not None:
+            self.progress(stage, **info)
+
+    def finish(self, outcome: str) -> None:
+        self._close(time.perf_counter())
+        if self.root is not None:
+            self.root.set_attribute("outcome", outcome)
+            if self.stage is not None:
+                self.root.set_attribute("last_stage", self.stage)
+            self.root.end()
+
+
+def timed_stages(histogram: Histogram, outcomes: Counter):
+    """
+    Decorator for functions taking a ``progress`` keyword callback: each
+    stage they report is timed into *histogram* (labelled by stage) until
+    the next one or the return, and *outcomes* counts ``succeeded`` and
+    ``failed`` calls.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, progress=None, **kwargs):
+            if not ENABLED:
+                return fn(*args, progress=progress, **kwargs)
+            timer = _StageTimer(histogram, fn.__name__, progress)
+            try:
+                result = fn(*args, progress=timer, **kwargs)
+            except BaseException:
+                timer.finish("failed")
+                outcomes.inc("failed")
+                raise
+            timer.finish("succeeded")
+            outcomes.inc("succeeded")
+            return result
+        return wrapper
+    return decorate
@@ -0,0 +1,139 @@
+"""
+Shared polling primitive for waiting on Intune's asynchronous processing.
+
+Intune finishes most stages (storage URI allocation, file commit, publishing)
+in a few seconds for small apps but can take many minutes for large ones.
+``poll_until`` starts with a short delay and grows it exponentially, with
+jitter, up to a cap, so fast stages return quickly and slow ones do not burn
+through Graph's throttling budget.  Throttled polls (429/503) wait for the
+server's ``Retry-After`` instead.
+
+Defaults can be tuned through environment variables:
+
+- POLL_INITIAL_DELAY: seconds before the second poll (default 1)
+- POLL_MAX_DELAY: cap on the delay between polls (default 30)
+- POLL_BACKOFF: growth factor per poll (default 1.6)
+- POLL_JITTER: +/- fraction of randomisation applied to each delay (default 0.2)
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Callable, Dict, Optional, TypeVar
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+POLL_INITIAL_DELAY = float(os.environ.get("POLL_INITIAL_DELAY", "1"))
+POLL_MAX_DELAY = float(os.environ.get("POLL_MAX_DELAY", "30"))
+POLL_BACKOFF = float(os.environ.get("POLL_BACKOFF", "1.6"))
+POLL_JITTER = float(os.environ.get("POLL_JITTER", "0.2"))
+
+# HTTP statuses that mean "try again later" rather than "this failed"
+THROTTLE_STATUSES = (429, 503)
+
+_stats: Dict[str, Dict[str, float]] = {}
+_stats_lock = threading.Lock()
+
+
+def retry_after_seconds(response: Optional[requests.Response]) -> Optional[float]:
+    """Parse a Retry-After header (delta-seconds or HTTP-date), if present."""
+    if response is None:
+        return None
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def _record(stage: str, waited: float, polls: int, timed_out: bool) -> None:
+    with _stats_lock:
+        entry = _stats.setdefault(
+            stage, {"count": 0, "timeouts": 0, "polls": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+        )
+        entry["count"] += 1
+        entry["timeouts"] += int(timed_out)
+        entry["polls"] += polls
+        entry["total_seconds"] += waited
+        entry["max_seconds"] = max(entry["max_seconds"], waited)
+
+
+def poll_stats() -> Dict[str, Dict[str, float]]:
+    """
+    Per-stage wait metrics: how many waits ran, how many timed out, total
+    polls issued and total / max seconds spent waiting.
+    """
+    with _stats_lock:
+        return {stage: dict(entry) for stage, entry in _stats.items()}
+
+
+def poll_until(
+    fetch: Callable[[], T],
+    done: Callable[[T], bool],
+    *,
+    stage: str,
+    timeout: float,
+    timeout_message: Optional[str] = None,
+    initial_delay: float = POLL_INITIAL_DELAY,
+    max_delay: float = POLL_MAX_DELAY,
+    backoff: float = POLL_BACKOFF,
+    jitter: float = POLL_JITTER,
+    sleep: Callable[[float], None] = time.sleep,
+    clock: Callable[[], float] = time.monotonic,
+) -> T:
+    """
+    Call *fetch* until ``done(result)`` is true and return that result.
+
+    *done* may raise to abort the wait (e.g. on a reported failure).  The
+    wait is bounded by a monotonic deadline *timeout* seconds from now;
+    ``TimeoutError`` is raised once it passes.
+    """
+    started = clock()
+    deadline = started + timeout
+    delay = initial_delay
+    polls = 0
+    try:
+        while True:
+            polls += 1
+            pause = None
+            try:
+                result = fetch()
+            except requests.HTTPError as exc:
+                status = exc.response.status_code if exc.response is not None else None
+                if status not in THROTTLE_STATUSES:
+                    raise
+                pause = retry_after_seconds(exc.response)
+                logger.info("%s poll throttled (HTTP %s), retrying in %ss", stage, status, pause or delay)
+            else:
+                if done(result):
+                    _record(stage, clock() - started, polls, timed_out=False)
+                    return result
+
+            if pause is None:
+                pause = delay * random.uniform(1 - jitter, 1 + jitter)
+                delay = min(delay * backoff, max_delay)
+
+            remaining = deadline - clock()
+            if remaining <= 0:
+                _record(stage, clock() - started, polls, timed_out=True)
+                raise TimeoutError(timeout_message or f"Timed out waiting for {stage}")
+            # never sleep past the deadline; poll once more right at it
+            sleep(min(pause, remaining))
+    except TimeoutError:
+        raise
+    except Exception:
+        _record(stage, clock() - started, polls, timed_out=False)
+        raise
@@ -0,0 +1,160 @@
+"""
+Registry of Intune tenants this API can deploy to.
+
+One API process used to serve exactly the tenant named by GRAPH_TENANT_ID.
+The registry stores an app registration (client id and secret) per tenant in
+a small SQLite database and hands out, per tenant, a ``TokenProvider`` and a
+pooled ``GraphClient`` that are created once and reused, so every tenant gets
+its own cached token, connection pool and request budget.
+
+The environment tenant keeps working without being registered: asking for
+no tenant, or for GRAPH_TENANT_ID, returns the process-wide Graph client.
+
+Configuration through environment variables:
+
+- TENANT_DB_PATH: SQLite file holding the registry (default tenants.db in
+  the working directory).  Client secrets are stored in it as given, so the
+  file is created readable by its owner only.
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from .auth import TokenProvider, get_access_token
+from .graph_client import GraphClient, get_graph_client
+
+TENANT_DB_PATH = os.environ.get("TENANT_DB_PATH", "tenants.db")
+
+
+class UnknownTenantError(LookupError):
+    """Raised for a tenant id that is neither registered nor the environment tenant."""
+
+
+class TenantRegistry:
+    """SQLite-backed tenant credentials plus per-tenant token and HTTP pools."""
+
+    def __init__(self, path: str = TENANT_DB_PATH):
+        self.path = Path(path)
+        self._lock = threading.Lock()
+        self._providers: Dict[str, TokenProvider] = {}
+        self._clients: Dict[str, GraphClient] = {}
+        if not self.path.exists():
+            self.path.touch(mode=0o600)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tenants ("
+                " tenant_id TEXT PRIMARY KEY,"
+                " name TEXT,"
+                " client_id TEXT NOT NULL,"
+                " client_secret TEXT NOT NULL,"
+                " created_at REAL NOT NULL)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.path)
+
+    def add(self, tenant_id: str, client_id: str, client_secret: str, name: Optional[str] = None) -> Dict:
+        """Register or update a tenant; cached tokens and clients are dropped."""
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO tenants (tenant_id, name, client_id, client_secret, created_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(tenant_id) DO UPDATE SET name = excluded.name, client_id = excluded.client_id, "
+                "client_secret = excluded.client_secret",
+                (tenant_id, name, client_id, client_secret, time.time()),
+            )
+        self._forget(tenant_id)
+        return self.get(tenant_id)
+
+    def remove(self, tenant_id: str) -> bool:
+        with self._connect() as conn:
+            removed = conn.execute("DELETE FROM tenants WHERE tenant_id = ?", (tenant_id,)).rowcount
+        self._forget(tenant_id)
+        return bool(removed)
+
+    def get(self, tenant_id: str) -> Optional[Dict]:
+        """Tenant details without the secret, or None if not registered."""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT tenant_id, name, client_id, created_at FROM tenants WHERE tenant_id = ?", (tenant_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"tenant_id": row[0], "name": row[1], "client_id": row[2], "created_at": row[3]}
+
+    def list(self) -> List[Dict]:
+        with self._connect() as conn:
+            rows = conn.execute("SELECT tenant_id FROM tenants ORDER BY name, tenant_id").fetchall()
+        return [self.get(tenant_id) for (tenant_id,) in rows]
+
+    def provider(self, tenant_id: str) -> TokenProvider:
+        """The tenant's TokenProvider (created on first use)."""
+        with self._lock:
+            provider = self._providers.get(tenant_id)
+            if provider is None:
+                with self._connect() as conn:
+                    row = conn.execute(
+                        "SELECT client_id, client_secret FROM tenants WHERE tenant_id = ?", (tenant_id,)
+                    ).fetchone()
+                if row is None:
+                    raise UnknownTenantError(f"Unknown tenant: {tenant_id}")
+                provider = self._providers[tenant_id] = TokenProvider(row[0], row[1], tenant_id)
+            return provider
+
+    def client(self, tenant_id: str) -> GraphClient:
+        """The tenant's pooled GraphClient (created on first use)."""
+        provider = self.provider(tenant_id)
+        with self._lock:
+            client = self._clients.get(tenant_id)
+            if client is None:
+                client = self._clients[tenant_id] = GraphClient(auth_headers=provider.auth_headers,
+                                                                tenant_id=tenant_id)
+            return client
+
+    def _forget(self, tenant_id: str) -> None:
+        with self._lock:
+            provider = self._providers.pop(tenant_id, None)
+            client = self._clients.pop(tenant_id, None)
+        if provider is not None:
+            provider.close()
+        if client is not None:
+            client.close()
+
+    def close(self) -> None:
+        for tenant_id in list(self._providers):
+            self._forget(tenant_id)
+
+
+_registry: Optional[TenantRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_tenant_registry() -> TenantRegistry:
+    """Return the process-wide TenantRegistry, creating it on first use."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = TenantRegistry()
+        return _registry
+
+
+def _is_default(tenant_id: Optional[str]) -> bool:
+    return not tenant_id or (tenant_id == os.environ.get("GRAPH_TENANT_ID")
+                             and get_tenant_registry().get(tenant_id) is None)
+
+
+def client_for(tenant_id: Optional[str]) -> GraphClient:
+    """GraphClient for *tenant_id*; the environment tenant when it is None."""
+    if _is_default(tenant_id):
+        return get_graph_client()
+    return get_tenant_registry().client(tenant_id)
+
+
+def access_token_for(tenant_id: Optional[str]) -> Optional[str]:
+    """Graph access token for *tenant_id*, or None if it cannot be acquired."""
+    if _is_default(tenant_id):
+        return get_access_token()
+    return get_tenant_registry().provider(tenant_id).get_token()
@@ -0,0 +1,151 @@
+"""
+Retry and client-side rate limiting for Graph and blob requests.
+
+A single 429 from Intune used to abort a whole deployment.  ``send_with_retry``
+retries throttled and transiently failing requests, honouring ``Retry-After``
+and otherwise backing off exponentially with jitter.  Non-idempotent calls
+(POST/PATCH) are only retried on 429, where the service guarantees the
+request was not processed.
+
+Each tenant also gets a ``TokenBucket`` so that concurrent uploads share one
+request budget and slow down together, instead of each discovering the limit
+on its own.  When Graph does throttle, the bucket is held for the
+``Retry-After`` period so every worker for that tenant pauses.
+
+Tunable through environment variables:
+
+- GRAPH_RATE_PER_SECOND: sustained Graph requests per second per tenant (default 8)
+- GRAPH_BURST: bucket capacity, i.e. the allowed burst (default 16)
+- RETRY_MAX_ATTEMPTS: attempts per request including the first (default 5)
+- RETRY_BASE_DELAY / RETRY_MAX_DELAY: backoff bounds in seconds (default 1 / 60)
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from typing import Callable, Dict, Optional
+
+import requests
+
+from .polling import retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+GRAPH_RATE_PER_SECOND = float(os.environ.get("GRAPH_RATE_PER_SECOND", "8"))
+GRAPH_BURST = int(os.environ.get("GRAPH_BURST", "16"))
+RETRY_MAX_ATTEMPTS = int(os.environ.get("RETRY_MAX_ATTEMPTS", "5"))
+RETRY_BASE_DELAY = float(os.environ.get("RETRY_BASE_DELAY", "1"))
+RETRY_MAX_DELAY = float(os.environ.get("RETRY_MAX_DELAY", "60"))
+
+IDEMPOTENT_METHODS = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+
+class TokenBucket:
+    """Thread-safe token bucket; ``acquire`` blocks until a token is free."""
+
+    def __init__(
+        self,
+        rate: float = GRAPH_RATE_PER_SECOND,
+        capacity: int = GRAPH_BURST,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.rate = rate
+        self.capacity = capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._tokens = float(capacity)
+        self._updated = clock()
+        self._held_until = 0.0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping if necessary; returns the seconds waited."""
+        with self._lock:
+            now = self._clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            # Reserve the token now (possibly going negative) so callers queue
+            # up fairly instead of racing once the lock is released.
+            self._tokens -= 1
+            wait = max(-self._tokens / self.rate if self._tokens < 0 else 0.0, self._held_until - now)
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def hold(self, seconds: float) -> None:
+        """Stop handing out tokens for *seconds* (e.g. after a Retry-After)."""
+        with self._lock:
+            self._held_until = max(self._held_until, self._clock() + seconds)
+
+
+_buckets: Dict[str, TokenBucket] = {}
+_buckets_lock = threading.Lock()
+
+
+def bucket_for(tenant_id: Optional[str]) -> TokenBucket:
+    """The shared TokenBucket for *tenant_id* (created on first use)."""
+    key = tenant_id or "default"
+    with _buckets_lock:
+        if key not in _buckets:
+            _buckets[key] = TokenBucket()
+        return _buckets[key]
+
+
+def _backoff(attempt: int, base: float, cap: float) -> float:
+    # "full jitter": a random delay up to the exponential bound
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+def send_with_retry(
+    send: Callable[[], requests.Response],
+    method: str,
+    bucket: Optional[TokenBucket] = None,
+    max_attempts: int = RETRY_MAX_ATTEMPTS,
+    base_delay: float = RETRY_BASE_DELAY,
+    max_delay: float = RETRY_MAX_DELAY,
+    sleep: Callable[[float], None] = time.sleep,
+) -> requests.Response:
+    """
+    Call *send* until it returns a response that should not be retried.
+
+    The final response is returned whatever its status, so callers keep their
+    own ``raise_for_status`` handling; ``response.attempts`` records how many
+    tries it took.  Connection errors are retried for idempotent methods and
+    re-raised once attempts run out.
+    """
+    idempotent = method.upper() in IDEMPOTENT_METHODS
+    attempt = 0
+    while True:
+        attempt += 1
+        if bucket is not None:
+            bucket.acquire()
+        try:
+            resp = send()
+        except (requests.ConnectionError, requests.Timeout) as exc:
+            if not idempotent or attempt >= max_attempts:
+                raise
+            delay = _backoff(attempt - 1, base_delay, max_delay)
+            logger.warning("%s failed (%s), retry %s/%s in %.1fs", method, exc, attempt, max_attempts - 1, delay)
+            sleep(delay)
+            continue
+
+        status = resp.status_code
+        retryable = status == 429 or (idempotent and status in RETRYABLE_STATUSES)
+        if not retryable or attempt >= max_attempts:
+            resp.attempts = attempt
+            return resp
+
+        delay = retry_after_seconds(resp)
+        if delay is not None:
+            if bucket is not None:
+                bucket.hold(delay)
+        else:
+            delay = _backoff(attempt - 1, base_delay, max_delay)
+        logger.warning("%s %s returned %s, retry %s/%s in %.1fs",
+                       method, resp.url, status, attempt, max_attempts - 1, delay)
+        resp.close()
+        sleep(delay)
@@ -0,0 +1,308 @@
+"""
+Keep deployed winget packages at the catalog's current version.
+
+``UpdatePipeline`` compares the version of every app this API deployed (from
+the local inventory mirror, see ``inventory``) with the latest version in the
+winget catalog index (see ``winget_catalog``) in one pass: both sides are
+local lookups, so checking hundreds of packages takes no Graph calls beyond
+the inventory's incremental sync.
+
+Every outdated package is then updated, concurrently through
+``upload_intunewin_batch``, in one of two ways (UPDATE_MODE):
+
+- supersede (the default): a new app is uploaded for the package with the
+  new ``displayVersion`` and a detection rule for that version (see
+  ``detection``).  It supersedes the old app (``supersedenceType`` update, so
+  Intune upgrades devices that have the old app) and gets its assignments.
+- content_version: the package is uploaded as a new content version of the
+  existing app, whose ``displayVersion`` and detection rule are then
+  PATCHed.
+
+The Graph calls after the uploads (supersedence, assignments, PATCHes) go
+out through the client's ``$batch`` coalescer.
+
+Apps deployed before versions were recorded have no ``displayVersion``; they
+are reported as unversioned and only updated if asked to (UPDATE_UNVERSIONED),
+which also gives them version-aware detection.
+
+Configuration through environment variables:
+
+- UPDATE_MODE: supersede or content_version (default supersede)
+- UPDATE_INTERVAL_SECONDS: how often the background pipeline runs for every
+  tenant; 0 disables the schedule (default 86400)
+- UPDATE_UNVERSIONED: also update apps without a displayVersion (default false)
+"""
+
+import logging
+import os
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional
+
+from .assignments import AppAssigner, assigner_for
+from .deployments import tenant_key
+from .detection import version_detection_rule, version_overrides
+from .graph_batch import GRAPH_BATCH_WINDOW, GraphBatcher, batcher_for
+from .graph_client import GRAPH_BASE, GraphClient
+from .intune_win32_uploader import ProgressCallback, upload_intunewin_batch
+from .inventory import AppInventory, get_app_inventory
+from .manifest import DEFAULT_PACKAGE
+from .tenants import client_for
+from .winget_catalog import WingetCatalog, version_key
+
+logger = logging.getLogger(__name__)
+
+UPDATE_MODE = os.environ.get("UPDATE_MODE", "supersede").lower()
+UPDATE_INTERVAL_SECONDS = int(os.environ.get("UPDATE_INTERVAL_SECONDS", "86400"))
+UPDATE_UNVERSIONED = os.environ.get("UPDATE_UNVERSIONED", "false").lower() == "true"
+
+MODES = ("supersede", "content_version")
+
+
+def _newest(apps: List[Dict]) -> Dict:
+    # after a supersedence both apps are in Intune; the newer version counts
+    return max(apps, key=lambda app: (version_key(app["display_version"] or ""), app["modified_at"] or ""))
+
+
+class UpdatePipeline:
+    """Finds deployed winget packages with a newer catalog version and updates them."""
+
+    def __init__(
+        self,
+        catalog: WingetCatalog,
+        inventory: Optional[AppInventory] = None,
+        mode: str = UPDATE_MODE,
+        max_workers: Optional[int] = None,
+        package: str = str(DEFAULT_PACKAGE),
+        client_factory: Callable[[Optional[str]], GraphClient] = client_for,
+        graph_base: str = GRAPH_BASE,
+        batcher_factory: Callable[[GraphClient], GraphBatcher] = batcher_for,
+        assigner_factory: Callable[[GraphClient], AppAssigner] = assigner_for,
+    ):
+        if mode not in MODES:
+            raise ValueError(f"mode must be one of {', '.join(MODES)}")
+        self.catalog = catalog
+        self._inventory = inventory
+        self.mode = mode
+        self.max_workers = max_workers
+        self.package = package
+        self.graph_base = graph_base.rstrip("/")
+        self._client_factory = client_factory
+        self._batcher_factory = batcher_factory
+        self._assigner_factory = assigner_factory
+        self._runs: Dict[str, Dict] = {}
+        self._run_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def inventory(self) -> AppInventory:
+        return self._inventory or get_app_inventory()
+
+    # ----------------------------------------------------------------------------------
+    # plan
+    # ----------------------------------------------------------------------------------
+    def plan(self, tenant_id: Optional[str] = None, include_unversioned: bool = UPDATE_UNVERSIONED) -> Dict:
+        """
+        Compare the tenant's mirrored apps with the catalog.  Returns
+        ``{"tenant_id", "updates", "current", "unversioned", "not_in_catalog"}``
+        where ``updates`` holds one ``{"package_id", "app_id", "display_name",
+        "publisher", "installed_version", "available_version"}`` per outdated
+        package; the others list package ids.
+        """
+        if not self.catalog.loaded:
+            raise RuntimeError("winget catalog is not loaded")
+        by_package: Dict[str, List[Dict]] = {}
+        for app in self.inventory.packages(tenant_id):
+            by_package.setdefault(app["package_id"].lower(), []).append(app)
+
+        plan = {"tenant_id": tenant_id, "updates": [], "current": [], "unversioned": [], "not_in_catalog": []}
+        for apps in by_package.values():
+            app = _newest(apps)
+            entry = self.catalog.get(app["package_id"])
+            if entry is None or not entry.get("Version"):
+                plan["not_in_catalog"].append(app["package_id"])
+                continue
+            installed = app["display_version"]
+            if not installed and not include_unversioned:
+                plan["unversioned"].append(app["package_id"])
+                continue
+            if installed and version_key(installed) >= version_key(entry["Version"]):
+                plan["current"].append(app["package_id"])
+                continue
+            plan["updates"].append({
+                # the catalog's spelling of the id is what winget list prints
+                "package_id": entry["Id"],
+                "app_id": app["id"],
+                "display_name": app["display_name"],
+                "publisher": app["publisher"],
+                "installed_version": installed,
+                "available_version": entry["Version"],
+            })
+        for key in ("current", "unversioned", "not_in_catalog"):
+            plan[key].sort(key=str.lower)
+        logger.info("Update plan for tenant %s: %s outdated, %s current, %s unversioned, %s not in the catalog",
+                    tenant_key(tenant_id) or "(default)", len(plan["updates"]), len(plan["current"]),
+                    len(plan["unversioned"]), len(plan["not_in_catalog"]))
+        return plan
+
+    # ----------------------------------------------------------------------------------
+    # run
+    # ----------------------------------------------------------------------------------
+    def _submit(self, client: GraphClient, method: str, url: str, json: Dict) -> Future:
+        if GRAPH_BATCH_WINDOW > 0:
+            return self._batcher_factory(client).submit(method, url, json=json)
+        future: Future = Future()
+        try:
+            future.set_result(client.request(method, url, json=json))
+        except Exception as exc:
+            future.set_exception(exc)
+        return future
+
+    def _item(self, update: Dict, tenant_id: Optional[str]) -> Dict:
+        item = {
+            "path": self.package,
+            "display_name": update["display_name"],
+            "package_id": update["package_id"],
+            "publisher": update["publisher"] or "",
+            "tenant_id": tenant_id,
+            "reuse": False,
+        }
+        if self.mode == "content_version":
+            item["app_id"] = update["app_id"]
+        else:
+            item["overrides"] = version_overrides(update["package_id"], update["available_version"])
+        return item
+
+    def run(self, tenant_id: Optional[str] = None, progress: Optional[ProgressCallback] = None,
+            include_unversioned: bool = UPDATE_UNVERSIONED, sync: bool = True) -> Dict:
+        """
+        Sync the tenant's inventory (unless *sync* is False), plan and update
+        every outdated package; one failure does not stop the others.
+
+        Returns ``{"tenant_id", "mode", "results", "succeeded", "failed"}``
+        with one ``{"package_id", "app_id", "from_version", "to_version",
+        "status"}`` result per update, plus ``new_app_id`` when superseding
+        and ``error`` on failure.  Progress reports the ``sync``, ``plan``,
+        ``apply`` and ``supersede`` stages.
+        """
+        key = tenant_key(tenant_id)
+        if not self._run_lock.acquire(blocking=False):
+            raise RuntimeError("An update run is already in progress")
+        try:
+            if sync:
+                if progress:
+                    progress("sync")
+                self.inventory.sync(tenant_id)
+            if progress:
+                progress("plan")
+            plan = self.plan(tenant_id, include_unversioned=include_unversioned)
+            updates = plan["updates"]
+            if progress:
+                progress("apply", updates=len(updates))
+
+            results = [{"package_id": u["package_id"], "app_id": u["app_id"], "from_version": u["installed_version"],
+                        "to_version": u["available_version"], "status": "succeeded"} for u in updates]
+            if updates:
+                self._apply(updates, results, tenant_id, progress)
+            outcome = {
+                "tenant_id": tenant_id,
+                "mode": self.mode,
+                "results": results,
+                "succeeded": sum(r["status"] == "succeeded" for r in results),
+                "failed": sum(r["status"] == "failed" for r in results),
+            }
+            self._runs[key] = {k: outcome[k] for k in ("mode", "succeeded", "failed")}
+            logger.info("Update run for tenant %s: %s updated, %s failed", key or "(default)",
+                        outcome["succeeded"], outcome["failed"])
+            return outcome
+        finally:
+            self._run_lock.release()
+
+    def _apply(self, updates: List[Dict], results: List[Dict], tenant_id: Optional[str],
+               progress: Optional[ProgressCallback]) -> None:
+        items = [self._item(update, tenant_id) for update in updates]
+        try:
+            uploaded = upload_intunewin_batch(items, self.max_workers)
+        except Exception as exc:  # e.g. no access token: every update fails alike
+            uploaded = [{"package_id": item["package_id"], "status": "failed", "error": str(exc)} for item in items]
+        for result, outcome in zip(results, uploaded):
+            if outcome["status"] != "succeeded":
+                result.update(status="failed", error=outcome.get("error"))
+            elif self.mode == "supersede":
+                result["new_app_id"] = outcome["app_id"]
+
+        done = [(update, result) for update, result in zip(updates, results) if result["status"] == "succeeded"]
+        if not done:
+            return
+        client = self._client_factory(tenant_id)
+        base = f"{self.graph_base}/deviceAppManagement/mobileApps"
+        pending = []
+        if self.mode == "supersede":
+            if progress:
+                progress("supersede", apps=len(done))
+            for update, result in done:
+                body = {"relationships": [{
+                    "@odata.type": "#microsoft.graph.mobileAppSupersedence",
+                    "targetId": update["app_id"],
+                    "supersedenceType": "update",
+                }]}
+                pending.append((result, self._submit(client, "POST", f"{base}/{result['new_app_id']}"
+                                                                      f"/updateRelationships", body)))
+            try:
+                copied = self._assigner_factory(client).copy({r["new_app_id"]: u["app_id"] for u, r in done})
+            except Exception as exc:
+                copied = {r["new_app_id"]: {"status": "failed", "error": str(exc)} for _, r in done}
+            for _, result in done:
+                assigned = copied.get(result["new_app_id"], {})
+                if assigned.get("status") != "succeeded":
+                    result.update(status="failed", error=f"Assignments not copied: {assigned.get('error')}")
+        else:
+            for update, result in done:
+                body = {
+                    "@odata.type": "#microsoft.graph.win32LobApp",
+                    "displayVersion": update["available_version"],
+                    "rules": [version_detection_rule(update["package_id"], update["available_version"])],
+                }
+                pending.append((result, self._submit(client, "PATCH", f"{base}/{update['app_id']}", body)))
+
+        for result, future in pending:
+            try:
+                future.result()
+            except Exception as exc:
+                logger.error("Updating %s failed: %s", result["package_id"], exc)
+                result.update(status="failed", error=str(exc))
+
+    # ----------------------------------------------------------------------------------
+    # schedule
+    # ----------------------------------------------------------------------------------
+    def run_all(self) -> List[Dict]:
+        """Run for every tenant the inventory syncs; failures are reported per tenant."""
+        results = []
+        for tenant_id in self.inventory.tenants():
+            try:
+                results.append(self.run(tenant_id))
+            except Exception as exc:
+                logger.error("Update run for tenant %s failed: %s", tenant_key(tenant_id) or "(default)", exc)
+                self._runs[tenant_key(tenant_id)] = {"mode": self.mode, "error": str(exc)}
+                results.append({"tenant_id": tenant_id, "error": str(exc)})
+        return results
+
+    def start(self, interval: int = UPDATE_INTERVAL_SECONDS) -> None:
+        """Run for all tenants every *interval* seconds, the first time after one interval."""
+        if self._thread is not None or interval <= 0:
+            return
+
+        def _loop():
+            # the first run waits so the catalog and inventory have loaded
+            while not self._stop.wait(interval):
+                self.run_all()
+
+        self._thread = threading.Thread(target=_loop, name="update-pipeline", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def status(self) -> Dict:
+        return {"mode": self.mode, "scheduled": self._thread is not None, "last_runs": dict(self._runs)}
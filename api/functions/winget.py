@@ -1,14 +1,167 @@
+import asyncio
+import json
+import logging
+import os
 import subprocess
 import re
-from typing import List, Dict, Any
+import sys
+import threading
+import unicodedata
+from typing import AsyncIterator, List, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# The winget executable and limits for the search subprocess
+WINGET_EXECUTABLE = os.environ.get("WINGET_EXECUTABLE", "winget")
+WINGET_TIMEOUT = float(os.environ.get("WINGET_TIMEOUT", "30"))
+WINGET_MAX_PROCESSES = int(os.environ.get("WINGET_MAX_PROCESSES", "4"))
+
+# "json" uses the Microsoft.WinGet.Client PowerShell module, "table" scrapes the
+# winget CLI output, "auto" tries json on Windows and falls back to table.
+WINGET_SEARCH_MODE = os.environ.get("WINGET_SEARCH_MODE", "auto").lower()
+
+# APPINSTALLER_CLI_ERROR_NO_APPLICATIONS_FOUND: winget's exit code when nothing matches
+WINGET_NO_MATCH = 0x8A150014
+
+# per thread: the event loop of the last search and its process slots
+_local = threading.local()
+_structured_available: Optional[bool] = None
+
+# Emits one compact JSON object per package.  The query arrives through the
+# environment so it is never parsed as PowerShell.
+_STRUCTURED_SCRIPT = (
+    "Import-Module Microsoft.WinGet.Client -ErrorAction Stop; "
+    "Find-WinGetPackage -Query $env:WINGET_SEARCH_QUERY | ForEach-Object { "
+    "[pscustomobject]@{Name=$_.Name; Id=$_.Id; Version=[string]$_.Version; Source=$_.Source} "
+    "| ConvertTo-Json -Compress }"
+)
+
+_HEADER_RE = re.compile(r'\bName\b.*\bId\b.*\bVersion\b.*\bSource\b', re.IGNORECASE)
+_COLUMNS = ("Name", "Id", "Version", "Match", "Source")
+ELLIPSIS = "…"
+
+
+def _winget_search_command(search_term: str) -> List[str]:
+    """
+    Argument list for a winget search.  The term is passed as its own
+    argument (never through a shell), so quotes or `;` in it are harmless.
+    """
+    return [WINGET_EXECUTABLE, "search", "--query", search_term, "--accept-source-agreements"]
+
+
+def _structured_search_command() -> List[str]:
+    return ["powershell", "-NoProfile", "-NonInteractive", "-Command", _STRUCTURED_SCRIPT]
+
+
+def _char_width(char: str) -> int:
+    """Terminal cells taken by *char*: wide East Asian characters take two."""
+    if unicodedata.combining(char):
+        return 0
+    return 2 if unicodedata.east_asian_width(char) in ("W", "F") else 1
+
+
+class WingetTableParser:
+    """
+    Incremental parser for the table printed by `winget search`.
+
+    Feed it one line at a time; it returns an application dict for each data
+    row.  Column offsets are taken once from the header and measured in
+    terminal cells, so rows containing double-width characters still split
+    in the right place.  Rows whose Id winget truncated with "…" are dropped
+    because they cannot be deployed.
+    """
+
+    def __init__(self):
+        self.columns: Optional[List[tuple]] = None  # (name, start cell)
+        self.truncated = 0
+
+    def _read_header(self, line: str) -> None:
+        starts = []
+        for name in _COLUMNS:
+            match = re.search(rf'\b{name}\b', line, re.IGNORECASE)
+            if match:
+                starts.append((name, match.start()))
+        self.columns = sorted(starts, key=lambda column: column[1])
+
+    def _split(self, line: str) -> Dict[str, str]:
+        fields = {name: [] for name, _ in self.columns}
+        bounds = [start for _, start in self.columns[1:]] + [sys.maxsize]
+        column = 0
+        cell = 0
+        for char in line:
+            while cell >= bounds[column]:
+                column += 1
+            fields[self.columns[column][0]].append(char)
+            cell += _char_width(char)
+        return {name: "".join(chars).strip() for name, chars in fields.items()}
+
+    def feed(self, line: str) -> Optional[Dict[str, str]]:
+        # winget redraws a progress spinner with carriage returns before the table
+        line = line.rstrip("\r\n").rsplit("\r", 1)[-1].rstrip()
+        if self.columns is None:
+            if _HEADER_RE.search(line):
+                self._read_header(line)
+            return None
+        if not line.strip() or set(line.strip()) == {"-"}:
+            return None
+
+        fields = self._split(line)
+        if not (fields["Name"] and fields["Id"]):
+            return None
+        if fields["Id"].endswith(ELLIPSIS):
+            self.truncated += 1
+            return None
+        return {
+            "Name": fields["Name"],
+            "Id": fields["Id"],
+            "Version": fields["Version"],
+            "Source": fields["Source"],
+        }
+
+
+def parse_winget_output(raw_output: str) -> List[Dict[str, str]]:
+    """
+    Parse the table printed by `winget search` into a list of applications.
+
+    Args:
+        raw_output (str): The stdout of the winget search command
+
+    Returns:
+        List[Dict[str, str]]: A list of applications, each represented as a dictionary
+                              with keys "Name", "Id", "Version", and "Source".
+    """
+    parser = WingetTableParser()
+    apps = []
+    for line in raw_output.split('\n'):
+        app = parser.feed(line)
+        if app:
+            apps.append(app)
+    if parser.columns is None and raw_output.strip():
+        print("Could not find header line in winget output")
+    return apps
+
+
+def _parse_json_line(line: str) -> Optional[Dict[str, str]]:
+    """One package from the structured (PowerShell) search output."""
+    line = line.strip()
+    if not line.startswith("{"):
+        return None
+    try:
+        item = json.loads(line)
+    except ValueError:
+        return None
+    if not item.get("Id"):
+        return None
+    return {key: str(item.get(key) or "") for key in ("Name", "Id", "Version", "Source")}
+
 
 def search_winget_packages(search_term: str) -> List[Dict[str, str]]:
     """
     Search for packages using winget and return structured JSON data.
-    
+
     Args:
         search_term (str): The term to search for in winget
-        
+
     Returns:
         List[Dict[str, str]]: A list of applications, each represented as a dictionary
                               with keys "Name", "Id", "Version", and "Source".
@@ -16,76 +169,144 @@ def search_winget_packages(search_term: str) -> List[Dict[str, str]]:
     try:
         # Execute winget search command
         result = subprocess.run(
-            ["powershell", "-Command", f"winget search {search_term} --accept-source-agreements"],
+            _winget_search_command(search_term),
             capture_output=True,
             text=True,
             encoding='utf-8',
-            errors='ignore'
+            errors='ignore',
+            timeout=WINGET_TIMEOUT
         )
-        
+
         if result.returncode != 0:
             print(f"Winget search failed with error: {result.stderr}")
             return []
-            
-        raw_output = result.stdout
-        if not raw_output:
-            return []
-            
-        # Split output into lines and find the header
-        lines = raw_output.strip().split('\n')
-        header_index = -1
-        
-        # Find the header line containing column names
-        for i, line in enumerate(lines):
-            if re.search(r'\bName\b.*\bId\b.*\bVersion\b.*\bSource\b', line, re.IGNORECASE):
-                header_index = i
-                break
-                
-        if header_index == -1:
-            print("Could not find header line in winget output")
-            return []
-            
-        # Find column positions from header
-        header_line = lines[header_index]
-        name_match = re.search(r'\bName\b', header_line, re.IGNORECASE)
-        id_match = re.search(r'\bId\b', header_line, re.IGNORECASE)
-        version_match = re.search(r'\bVersion\b', header_line, re.IGNORECASE)
-        source_match = re.search(r'\bSource\b', header_line, re.IGNORECASE)
-        
-        if not all([name_match, id_match, version_match, source_match]):
-            print("Could not find all required column names in header")
-            return []
-            
-        # Get column start positions
-        name_start = name_match.start()
-        id_start = id_match.start()
-        version_start = version_match.start()
-        source_start = source_match.start()
-        
-        # Process data lines (skip header and separator)
-        apps = []
-        for line in lines[header_index + 2:]:
-            line = line.rstrip()
-            if not line.strip():
-                continue
-                
-            # Extract fields based on column positions
-            name = line[name_start:id_start].strip()
-            id_part = line[id_start:version_start].strip()
-            version = line[version_start:source_start].strip()
-            source = line[source_start:].strip()
-            
-            # Only include entries with both name and id
-            if name and id_part:
-                apps.append({
-                    "Name": name,
-                    "Id": id_part,
-                    "Version": version,
-                    "Source": source
-                })
-                
-        return apps
-        
+
+        return parse_winget_output(result.stdout)
+
     except Exception as e:
         print(f"Error searching winget packages: {str(e)}")
         return []
+
+
+async def _stream_process(command: List[str], parse, timeout: float, env=None) -> AsyncIterator[Dict[str, str]]:
+    """
+    Run *command* and yield ``parse(line)`` results as stdout lines arrive.
+
+    The whole run is bounded by *timeout* (asyncio.TimeoutError); the process
+    is killed on timeout, cancellation or when the consumer stops early.
+    Raises ``subprocess.CalledProcessError`` if it exits non-zero without
+    having produced any results.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    proc = await asyncio.create_subprocess_exec(
+        *command,
+        stdin=asyncio.subprocess.DEVNULL,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.PIPE,
+        env=env,
+    )
+    # drain stderr alongside stdout so a chatty process can't block on a full pipe
+    stderr = asyncio.ensure_future(proc.stderr.read())
+    produced = 0
+    try:
+        while True:
+            raw = await asyncio.wait_for(proc.stdout.readline(), max(0.0, deadline - loop.time()))
+            if not raw:
+                break
+            item = parse(raw.decode('utf-8', errors='ignore'))
+            if item:
+                produced += 1
+                yield item
+        await asyncio.wait_for(proc.wait(), max(0.0, deadline - loop.time()))
+    finally:
+        # timeout, cancellation or an abandoned generator: don't leave it running
+        if proc.returncode is None:
+            proc.kill()
+            await proc.wait()
+        if not stderr.done():
+            stderr.cancel()
+
+    if proc.returncode != 0 and not produced:
+        raise subprocess.CalledProcessError(proc.returncode, command[0],
+                                            stderr=(await stderr).decode('utf-8', errors='ignore'))
+
+
+def _process_slots() -> asyncio.Semaphore:
+    """
+    The semaphore bounding winget processes on the running event loop.  A
+    semaphore only works on the loop it was first used on, so each loop
+    (e.g. each ``asyncio.run`` or test) gets its own.
+    """
+    loop = asyncio.get_running_loop()
+    if getattr(_local, "loop", None) is not loop:
+        _local.loop, _local.semaphore = loop, asyncio.Semaphore(WINGET_MAX_PROCESSES)
+    return _local.semaphore
+
+
+def _use_structured() -> bool:
+    if WINGET_SEARCH_MODE == "json":
+        return True
+    if WINGET_SEARCH_MODE == "table":
+        return False
+    return os.name == "nt" and _structured_available is not False
+
+
+async def iter_winget_search(search_term: str, timeout: float = WINGET_TIMEOUT) -> AsyncIterator[Dict[str, str]]:
+    """
+    Yield winget search results incrementally, as the process prints them.
+
+    Prefers the structured Microsoft.WinGet.Client output (one JSON object
+    per package) where it is available and otherwise parses the winget CLI
+    table line by line.  In "auto" mode a failing structured search marks it
+    unavailable and falls back to the table for this and later searches.
+
+    At most WINGET_MAX_PROCESSES searches run at once on an event loop;
+    further searches wait for a slot.  The process is killed if it runs longer than *timeout*
+    seconds (raising asyncio.TimeoutError) or if the consumer is cancelled,
+    e.g. because the client disconnected.
+
+    A search that matches nothing yields nothing; any other non-zero exit
+    of winget raises ``subprocess.CalledProcessError``, so that callers
+    (and their caches) can tell a failed search from an empty one.
+    """
+    global _structured_available
+    async with _process_slots():
+        if _use_structured():
+            env = {**os.environ, "WINGET_SEARCH_QUERY": search_term}
+            try:
+                async for app in _stream_process(_structured_search_command(), _parse_json_line, timeout, env):
+                    _structured_available = True
+                    yield app
+                return
+            except (OSError, subprocess.CalledProcessError) as exc:
+                if WINGET_SEARCH_MODE == "json" or _structured_available:
+                    raise
+                logger.warning("Structured winget search unavailable, using winget CLI: %s", exc)
+                _structured_available = False
+
+        parser = WingetTableParser()
+        try:
+            async for app in _stream_process(_winget_search_command(search_term), parser.feed, timeout):
+                yield app
+        except subprocess.CalledProcessError as exc:
+            # Windows reports the HRESULT unsigned, other platforms signed
+            if exc.returncode & 0xFFFFFFFF != WINGET_NO_MATCH:
+                raise
+
+
+async def search_winget_packages_async(search_term: str, timeout: float = WINGET_TIMEOUT) -> List[Dict[str, str]]:
+    """
+    Non-blocking variant of search_winget_packages for the async API.
+
+    Collects iter_winget_search; see there for concurrency, timeout and
+    cancellation behaviour.
+
+    Returns:
+        List[Dict[str, str]]: Same shape as search_winget_packages; empty when
+                              winget finds nothing.
+
+    Raises:
+        subprocess.CalledProcessError: winget failed.
+    """
+    return [app async for app in iter_winget_search(search_term, timeout)]
@@ -0,0 +1,301 @@
+"""
+In-memory, indexed copy of the winget community catalog.
+
+``search_winget_packages`` starts a PowerShell/winget process for every
+query.  This module instead downloads the winget source package (an MSIX that
+is just a zip holding ``Public/index.db``, a SQLite database), loads every
+package's Name, Id, Moniker and latest Version into memory and indexes them
+so searches complete in milliseconds without any subprocess.
+
+The index is a trigram index over the lower-cased Name, Id and Moniker of
+each package (with a word-prefix index for one and two character queries).  A
+query is answered by scanning the shortest posting list for its trigrams and
+confirming each candidate with a substring check.
+
+Configuration through environment variables:
+
+- WINGET_SOURCE_URL: source package to download
+  (default https://cdn.winget.microsoft.com/cache/source2.msix)
+- WINGET_CATALOG_PATH: load a local index.db or .msix instead of downloading
+- WINGET_CATALOG_REFRESH_SECONDS: background refresh interval; 0 disables
+  the schedule (default 21600, i.e. every 6 hours)
+- WINGET_CATALOG_RETRY_SECONDS: first retry after a failed initial load,
+  doubling up to the refresh interval until the catalog loads (default 30)
+"""
+
+import logging
+import os
+import re
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import zipfile
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+WINGET_SOURCE_URL = os.environ.get("WINGET_SOURCE_URL", "https://cdn.winget.microsoft.com/cache/source2.msix")
+WINGET_CATALOG_PATH = os.environ.get("WINGET_CATALOG_PATH")
+WINGET_CATALOG_REFRESH_SECONDS = int(os.environ.get("WINGET_CATALOG_REFRESH_SECONDS", "21600"))
+WINGET_CATALOG_RETRY_SECONDS = float(os.environ.get("WINGET_CATALOG_RETRY_SECONDS", "30"))
+
+INDEX_DB_MEMBER = "Public/index.db"
+
+
+# --------------------------------------------------------------------------------------
+# loading
+# --------------------------------------------------------------------------------------
+def version_key(version: str):
+    """Sort key that orders winget versions numerically where possible."""
+    parts = []
+    for part in re.split(r"[.\-+_]", version or ""):
+        parts.append((0, int(part), "") if part.isdigit() else (1, 0, part.lower()))
+    return parts
+
+
+def load_index_db(path: Path) -> List[Dict[str, str]]:
+    """
+    Read packages from a winget source index.db.
+
+    Supports both the current schema (a single ``packages`` table) and the
+    older v1 schema where ``manifest`` rows reference ``ids``/``names``/
+    ``monikers``/``versions`` tables, one row per published version.
+    """
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type='table'")}
+        if "packages" in tables:
+            rows = conn.execute("SELECT id, name, moniker, latest_version FROM packages")
+            return [
+                {"Name": name or pkg_id, "Id": pkg_id, "Version": version or "", "Source": "winget",
+                 "Moniker": moniker or ""}
+                for pkg_id, name, moniker, version in rows
+            ]
+
+        rows = conn.execute(
+            "SELECT ids.id, names.name, monikers.moniker, versions.version "
+            "FROM manifest "
+            "JOIN ids ON manifest.id = ids.rowid "
+            "JOIN names ON manifest.name = names.rowid "
+            "LEFT JOIN monikers ON manifest.moniker = monikers.rowid "
+            "JOIN versions ON manifest.version = versions.rowid"
+        )
+        latest: Dict[str, Dict[str, str]] = {}
+        for pkg_id, name, moniker, version in rows:
+            current = latest.get(pkg_id)
+            if current is None or version_key(version) > version_key(current["Version"]):
+                latest[pkg_id] = {"Name": name, "Id": pkg_id, "Version": version, "Source": "winget",
+                                  "Moniker": moniker or ""}
+        return list(latest.values())
+    finally:
+        conn.close()
+
+
+def load_source(path: Path) -> List[Dict[str, str]]:
+    """Load packages from an index.db or from a source .msix containing one."""
+    path = Path(path)
+    if not zipfile.is_zipfile(path):
+        return load_index_db(path)
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = Path(tmp) / "index.db"
+        with zipfile.ZipFile(path) as zf, zf.open(INDEX_DB_MEMBER) as src, open(db_path, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1 << 20)
+        return load_index_db(db_path)
+
+
+# --------------------------------------------------------------------------------------
+# index
+# --------------------------------------------------------------------------------------
+class CatalogIndex:
+    """Immutable trigram/prefix index over a list of catalog entries."""
+
+    def __init__(self, entries: List[Dict[str, str]]):
+        self.entries = entries
+        self._haystacks = [
+            "\0".join((e["Name"], e["Id"], e.get("Moniker", ""))).lower() for e in entries
+        ]
+        self._ids = [e["Id"].lower() for e in entries]
+        self._by_id = {pkg_id: idx for idx, pkg_id in enumerate(self._ids)}
+        self._grams: Dict[str, List[int]] = {}
+        self._prefixes: Dict[str, List[int]] = {}
+        for idx, hay in enumerate(self._haystacks):
+            for gram in {hay[i:i + 3] for i in range(len(hay) - 2)}:
+                self._grams.setdefault(gram, []).append(idx)
+            for word in {w for w in re.split(r"[\0\s.\-_]+", hay) if w}:
+                for prefix in {word[:1], word[:2]}:
+                    self._prefixes.setdefault(prefix, []).append(idx)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+    def _candidates(self, query: str) -> List[int]:
+        if len(query) < 3:
+            # too short for trigrams: match the start of any word instead
+            return self._prefixes.get(query, [])
+        postings = []
+        for i in range(len(query) - 2):
+            ids = self._grams.get(query[i:i + 3])
+            if ids is None:
+                return []
+            postings.append(ids)
+        return min(postings, key=len)
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        """
+        Case-insensitive substring search over Name, Id and Moniker, ranked
+        like winget: exact Id/Moniker matches first, then prefix matches.
+        """
+        query = query.strip().lower()
+        if not query:
+            return []
+        matches = [i for i in self._candidates(query) if query in self._haystacks[i]]
+
+        def rank(idx: int):
+            entry = self.entries[idx]
+            if self._ids[idx] == query or entry.get("Moniker", "").lower() == query:
+                tier = 0
+            elif self._ids[idx].startswith(query) or entry["Name"].lower().startswith(query):
+                tier = 1
+            else:
+                tier = 2
+            return tier, entry["Name"].lower()
+
+        matches.sort(key=rank)
+        if limit is not None:
+            matches = matches[:limit]
+        return [
+            {"Name": self.entries[i]["Name"], "Id": self.entries[i]["Id"],
+             "Version": self.entries[i]["Version"], "Source": self.entries[i]["Source"]}
+            for i in matches
+        ]
+
+    def get(self, package_id: str) -> Optional[Dict[str, str]]:
+        """Exact (case-insensitive) lookup by package Id."""
+        idx = self._by_id.get(package_id.lower())
+        return self.entries[idx] if idx is not None else None
+
+
+# --------------------------------------------------------------------------------------
+# catalog with refresh
+# --------------------------------------------------------------------------------------
+class WingetCatalog:
+    """
+    Holds the current CatalogIndex and refreshes it on demand or on a
+    schedule.  Searches always hit the last fully built index; a refresh
+    builds a new one and swaps it in.
+    """
+
+    def __init__(self, source_url: str = WINGET_SOURCE_URL, local_path: Optional[str] = WINGET_CATALOG_PATH):
+        self.source_url = source_url
+        self.local_path = local_path
+        self.index: Optional[CatalogIndex] = None
+        self.refreshed_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._etag: Optional[str] = None
+        self._refresh_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self.index is not None
+
+    def search(self, query: str, limit: Optional[int] = None) -> List[Dict[str, str]]:
+        if self.index is None:
+            raise RuntimeError("winget catalog is not loaded")
+        return self.index.search(query, limit)
+
+    def get(self, package_id: str) -> Optional[Dict[str, str]]:
+        """The catalog entry (with its latest Version) for *package_id*, or None."""
+        if self.index is None:
+            raise RuntimeError("winget catalog is not loaded")
+        return self.index.get(package_id)
+
+    def status(self) -> Dict:
+        return {
+            "loaded": self.loaded,
+            "packages": len(self.index) if self.index else 0,
+            "refreshed_at": self.refreshed_at,
+            "last_error": self.last_error,
+            "source": self.local_path or self.source_url,
+        }
+
+    def _download(self, dest: Path) -> bool:
+        """Fetch the source package; returns False if unchanged since last time."""
+        headers = {"If-None-Match": self._etag} if self._etag and self.index else {}
+        with requests.get(self.source_url, headers=headers, stream=True, timeout=120) as resp:
+            if resp.status_code == 304:
+                return False
+            resp.raise_for_status()
+            with open(dest, "wb") as fh:
+                for chunk in resp.iter_content(1 << 20):
+                    fh.write(chunk)
+            self._etag = resp.headers.get("ETag")
+        return True
+
+    def refresh(self) -> bool:
+        """
+        Rebuild the index from the source.  Returns True if a new index was
+        loaded, False if the source was unchanged.  Concurrent calls wait for
+        the refresh already in progress.
+        """
+        with self._refresh_lock:
+            started = time.monotonic()
+            try:
+                if self.local_path:
+                    entries = load_source(Path(self.local_path))
+                else:
+                    with tempfile.TemporaryDirectory() as tmp:
+                        msix = Path(tmp) / "source.msix"
+                        if not self._download(msix):
+                            logger.info("winget catalog unchanged")
+                            self.refreshed_at = time.time()
+                            return False
+                        entries = load_source(msix)
+                index = CatalogIndex(entries)
+            except Exception as exc:
+                self.last_error = str(exc)
+                logger.error("winget catalog refresh failed: %s", exc)
+                raise
+            self.index = index
+            self.refreshed_at = time.time()
+            self.last_error = None
+            logger.info("winget catalog loaded: %s packages in %.1fs", len(index), time.monotonic() - started)
+            return True
+
+    def start(self, interval: int = WINGET_CATALOG_REFRESH_SECONDS,
+              retry: float = WINGET_CATALOG_RETRY_SECONDS) -> None:
+        """
+        Load in the background now and then every *interval* seconds.  Until
+        a load succeeds, failures are retried after *retry* seconds, doubling
+        up to *interval*, so a network blip at startup does not leave
+        searches on the winget CLI for hours.
+        """
+        if self._thread is not None:
+            return
+
+        def _loop():
+            backoff = retry
+            while not self._stop.is_set():
+                try:
+                    self.refresh()
+                except Exception:
+                    pass  # already logged; keep serving the previous index
+                if self.loaded:
+                    if interval <= 0 or self._stop.wait(interval):
+                        break
+                    continue
+                if self._stop.wait(backoff):
+                    break
+                backoff = min(backoff * 2, max(interval, retry))
+
+        self._thread = threading.Thread(target=_loop, name="winget-catalog", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
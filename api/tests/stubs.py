@@ -0,0 +1,314 @@
+"""
+Local HTTP stand-ins used by the offline tests and benchmarks.
+
+BlobStubServer mimics the subset of the Azure Blob REST API that the uploader
+talks to through an Intune SAS URI (Put Block, Put Block List, Get Block List).
+GraphStubServer answers Microsoft Graph calls from a test-supplied responder.
+write_fake_winget creates a scriptable `winget` executable for search tests.
+encrypt_payload builds an encrypted .intunewin payload and its metadata.
+load_api imports the FastAPI app and asgi_request sends it a request directly.
+"""
+
+import asyncio
+import base64
+import importlib.util
+import hashlib
+import hmac
+import json
+import os
+import socket
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlparse
+
+
+class _StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so connection reuse is observable
+
+    def setup(self):
+        super().setup()
+        # headers and body go out as separate writes; without this, Nagle plus
+        # delayed ACKs add ~40ms to every keep-alive response
+        self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self.server.lock:
+            self.server.connections += 1
+
+    def log_message(self, format, *args):  # silence per-request logging
+        pass
+
+    def _read_body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _reply(self, status: int, body: bytes = b"", headers=None):
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if body:
+            self.wfile.write(body)
+
+
+class _BlobHandler(_StubHandler):
+    def do_PUT(self):
+        server = self.server
+        query = parse_qs(urlparse(self.path).query)
+        body = self._read_body()
+        comp = query.get("comp", [""])[0]
+        md5 = base64.b64encode(hashlib.md5(body, usedforsecurity=False).digest()).decode()
+
+        with server.lock:
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+            fault = server.faults.pop(0) if server.faults else None
+        try:
+            if server.latency:
+                time.sleep(server.latency)
+            if fault:
+                self._reply(fault, headers={"Retry-After": "0"})
+            elif comp == "block" and self.headers.get("Content-MD5", None if server.require_md5 else md5) != md5:
+                self._reply(400)  # Md5Mismatch
+            elif comp == "block":
+                with server.lock:
+                    server.blocks[query["blockid"][0]] = body if server.keep_data else b""
+                    server.block_puts += 1
+                self._reply(201)
+            elif comp == "blocklist":
+                ids = [el.text for el in ET.fromstring(body)]
+                with server.lock:
+                    server.block_list = ids
+                    server.blob = b"".join(server.blocks[i] for i in ids)
+                self._reply(201)
+            else:
+                self._reply(400)
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    def do_GET(self):
+        # Get Block List: every staged block, committed or not
+        query = parse_qs(urlparse(self.path).query)
+        if query.get("comp", [""])[0] != "blocklist":
+            self._reply(400)
+            return
+        with self.server.lock:
+            blocks = "".join(f"<Block><Name>{name}</Name><Size>{len(data)}</Size></Block>"
+                             for name, data in self.server.blocks.items())
+        body = f'<?xml version="1.0" encoding="utf-8"?><BlockList><UncommittedBlocks>{blocks}</UncommittedBlocks></BlockList>'
+        self._reply(200, body.encode(), {"Content-Type": "application/xml"})
+
+
+class BlobStubServer(ThreadingHTTPServer):
+    """
+    In-process block blob endpoint; ``sas_uri`` points at it.
+
+    Statuses queued on ``faults`` are returned, one per request, before
+    requests are served normally.  A block whose Content-MD5 does not match
+    is rejected; with ``require_md5`` so is a block without one.  With
+    ``keep_data`` off block bodies are checked and then dropped, so a
+    benchmark's memory use is not dominated by the stub.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, latency: float = 0.0, keep_data: bool = True):
+        super().__init__(("127.0.0.1", 0), _BlobHandler)
+        self.lock = threading.Lock()
+        self.latency = latency
+        self.keep_data = keep_data
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.blocks = {}
+        self.block_puts = 0
+        self.require_md5 = False
+        self.block_list = []
+        self.blob = b""
+        self.faults = []
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def sas_uri(self) -> str:
+        host, port = self.server_address
+        return f"http://{host}:{port}/container/blob?sv=stub&sig=stub"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+class _GraphHandler(_StubHandler):
+    def _dispatch(self):
+        server = self.server
+        body = self._read_body()
+        payload = json.loads(body) if body else None
+        with server.lock:
+            server.requests.append((self.command, self.path, dict(self.headers), payload))
+        status, data, headers = server.responder(self.command, self.path, payload)
+        raw = json.dumps(data).encode() if data is not None else b""
+        self._reply(status, raw, {"Content-Type": "application/json", **(headers or {})})
+
+    do_GET = do_POST = do_PATCH = do_PUT = do_DELETE = _dispatch
+
+
+class GraphStubServer(ThreadingHTTPServer):
+    """
+    In-process stand-in for graph.microsoft.com.
+
+    *responder* is called as ``responder(method, path, json_body)`` and returns
+    ``(status, json_data, extra_headers)``; every request is recorded in
+    ``requests``.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, responder=None):
+        super().__init__(("127.0.0.1", 0), _GraphHandler)
+        self.lock = threading.Lock()
+        self.responder = responder or (lambda method, path, body: (200, {"value": []}, None))
+        self.connections = 0
+        self.requests = []
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+
+    @property
+    def base_url(self) -> str:
+        host, port = self.server_address
+        return f"http://{host}:{port}/beta"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.shutdown()
+        self.server_close()
+
+
+FAKE_WINGET = r'''#!@PYTHON@
+import sys, time
+time.sleep(@DELAY@)
+query = sys.argv[sys.argv.index("--query") + 1]
+row = "%-40s %-40s %-15s %s"
+print("   - \r   \\ \r")
+print(row % ("Name", "Id", "Version", "Source"))
+print("-" * 105)
+print(row % (("Echo " + query)[:40], "Fake.Echo", "1.0", "winget"), flush=True)
+for i in range(@ROWS@):
+    print(row % ("Fake App %d" % i, "Fake.App%d" % i, "1.%d" % i, "winget"), flush=True)
+    time.sleep(@ROW_DELAY@)
+'''
+
+
+def write_fake_winget(directory, delay: float = 0.0, rows: int = 3, row_delay: float = 0.0):
+    """
+    Write an executable ``winget`` stand-in into *directory* that sleeps
+    *delay* seconds and prints a search table with the query echoed in the
+    first row, pausing *row_delay* after each further row.  Put *directory*
+    first on PATH to use it (POSIX only).
+    """
+    path = Path(directory) / "winget"
+    script = FAKE_WINGET.replace("@PYTHON@", sys.executable)
+    for key, value in (("@DELAY@", delay), ("@ROWS@", rows), ("@ROW_DELAY@", row_delay)):
+        script = script.replace(key, repr(value))
+    path.write_text(script)
+    path.chmod(0o755)
+    return path
+
+
+def encrypt_payload(content: bytes):
+    """
+    Encrypt *content* the way IntuneWinAppUtil does.  Returns ``(meta,
+    payload)`` where *meta* has the Detection.xml fields the uploader reads.
+    """
+    from cryptography.hazmat.primitives import padding
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+    key, mac_key, iv = os.urandom(32), os.urandom(32), os.urandom(16)
+    padder = padding.PKCS7(128).padder()
+    encryptor = Cipher(algorithms.AES(key), modes.CBC(iv)).encryptor()
+    ciphertext = encryptor.update(padder.update(content) + padder.finalize()) + encryptor.finalize()
+    mac = hmac.new(mac_key, iv + ciphertext, hashlib.sha256).digest()
+    b64 = lambda raw: base64.b64encode(raw).decode()
+    meta = {
+        "file_name": "IntunePackage.intunewin",
+        "unencrypted_size": len(content),
+        "encryption_key": b64(key),
+        "iv": b64(iv),
+        "mac": b64(mac),
+        "mac_key": b64(mac_key),
+        "profile_identifier": "ProfileVersion1",
+        "file_digest": b64(hashlib.sha256(content).digest()),
+        "digest_algorithm": "SHA256",
+    }
+    return meta, mac + iv + ciphertext
+
+
+def load_api():
+    """
+    Import api/api.py the way uvicorn runs it from the api directory (it
+    imports ``functions.*``), as the module ``api_app``.
+    """
+    if "api_app" in sys.modules:
+        return sys.modules["api_app"]
+    api_dir = Path(__file__).resolve().parent.parent
+    # appended, so ``api`` still resolves to the package for the other tests
+    if str(api_dir) not in sys.path:
+        sys.path.append(str(api_dir))
+    spec = importlib.util.spec_from_file_location("api_app", api_dir / "api.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["api_app"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def asgi_request(app, method: str, path: str, body=None, headers=None):
+    """
+    Send one request straight to the ASGI *app* (no HTTP client or lifespan)
+    and return ``(status, headers, body bytes)``.  *path* may carry a query
+    string; *body* is sent as JSON.  The client stays connected until the
+    response is complete.
+    """
+    async def call():
+        raw_path, _, query = path.partition("?")
+        data = json.dumps(body).encode() if body is not None else b""
+        request_headers = [(b"content-type", b"application/json"), (b"content-length", str(len(data)).encode())]
+        request_headers += [(key.lower().encode(), value.encode()) for key, value in (headers or {}).items()]
+        scope = {
+            "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": method,
+            "scheme": "http", "path": raw_path, "raw_path": raw_path.encode(), "query_string": query.encode(),
+            "root_path": "", "headers": request_headers, "client": ("127.0.0.1", 50000),
+            "server": ("testserver", 80),
+        }
+        complete = asyncio.Event()
+        received = []
+        response = {"status": None, "headers": {}, "chunks": []}
+
+        async def receive():
+            if not received:
+                received.append(True)
+                return {"type": "http.request", "body": data, "more_body": False}
+            await complete.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message):
+            if message["type"] == "http.response.start":
+                response["status"] = message["status"]
+                response["headers"] = {key.decode().lower(): value.decode() for key, value in message["headers"]}
+            elif message["type"] == "http.response.body":
+                response["chunks"].append(message.get("body", b""))
+                if not message.get("more_body"):
+                    complete.set()
+
+        await app(scope, receive, send)
+        return response["status"], response["headers"], b"".join(response["chunks"])
+
+    return asyncio.run(call())
@@ -0,0 +1,491 @@
+"""
+Tests for the HTTP endpoints in api.py: requests go straight to the ASGI app
+and the functions behind each endpoint are mocked out.
+"""
+
+import asyncio
+import json
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.tests.stubs import GraphStubServer, asgi_request, load_api
+
+api = load_api()
+
+# the module instances api.py uses
+from functions.graph_client import GraphClient
+from functions.inventory import AppInventory
+from functions.jobs import JobManager
+from functions.tenants import TenantRegistry, UnknownTenantError
+from functions.winget_catalog import CatalogIndex
+
+
+def request(method, path, body=None, headers=None):
+    """``(status, decoded JSON or text body)`` of one request to the app."""
+    status, response_headers, raw = asgi_request(api.app, method, path, body, headers)
+    if response_headers.get("content-type", "").startswith("application/json"):
+        return status, json.loads(raw) if raw else None
+    return status, raw.decode()
+
+
+def wait_for_job(test, job_id):
+    """Poll GET /jobs/{job_id} until the job has finished."""
+    deadline = time.monotonic() + 10
+    while True:
+        status, job = request("GET", f"/jobs/{job_id}")
+        if job["status"] in ("succeeded", "failed"):
+            return status, job
+        test.assertLess(time.monotonic(), deadline, "job did not finish")
+        time.sleep(0.01)
+
+
+def _item(n, **fields):
+    return {"path": f"/packages/{n}.intunewin", "display_name": f"App {n}", "package_id": f"Vendor.App{n}", **fields}
+
+
+def load_catalog(test, *entries):
+    """Give the app a loaded winget catalog for the rest of *test*."""
+    patcher = mock.patch.object(api.catalog, "index", CatalogIndex([
+        {"Name": name, "Id": package_id, "Version": version, "Source": "winget"}
+        for name, package_id, version in entries]))
+    patcher.start()
+    test.addCleanup(patcher.stop)
+
+
+class TestBatchUploadEndpoint(unittest.TestCase):
+    """POST /apps/batch"""
+
+    def test_uploads_every_item_and_counts_outcomes(self):
+        results = [{"package_id": "Vendor.App1", "status": "succeeded", "app_id": "app-1", "already_deployed": False},
+                   {"package_id": "Vendor.App2", "status": "failed", "error": "403"}]
+        with mock.patch.object(api, "upload_intunewin_batch", return_value=results) as upload:
+            status, body = request("POST", "/apps/batch", {
+                "items": [_item(1, force=True), _item(2, tenant_id="tenant-b", publisher="Vendor")],
+                "max_concurrency": 2,
+            })
+
+        self.assertEqual(status, 200)
+        self.assertEqual(body, {"results": results, "succeeded": 1, "failed": 1})
+        items, workers = upload.call_args.args
+        self.assertEqual(workers, 2)
+        self.assertEqual([(item["reuse"], item["tenant_id"], item["publisher"]) for item in items],
+                         [(False, None, ""), (True, "tenant-b", "Vendor")])
+
+    def test_rejects_empty_and_malformed_batches(self):
+        self.assertEqual(request("POST", "/apps/batch", {"items": []})[0], 400)
+        self.assertEqual(request("POST", "/apps/batch", {"items": [{"path": "x.intunewin"}]})[0], 422)
+        self.assertEqual(request("POST", "/apps/batch", {})[0], 422)
+
+    def test_batch_failure_is_a_server_error(self):
+        with mock.patch.object(api, "upload_intunewin_batch",
+                               side_effect=RuntimeError("Could not acquire an access token")):
+            status, body = request("POST", "/apps/batch", {"items": [_item(1)]})
+        self.assertEqual(status, 500)
+        self.assertIn("access token", body["detail"])
+
+
+class TestJobEndpoints(unittest.TestCase):
+    """/jobs"""
+
+    def setUp(self):
+        manager = JobManager(max_workers=1)
+        self.addCleanup(manager.shutdown)
+        patcher = mock.patch.object(api, "jobs", manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _upload(self, path, display_name, package_id, progress, **kwargs):
+        progress("upload", sent=1, total=2)
+        progress("done")
+        return "app-1"
+
+    def test_upload_job_runs_and_reports(self):
+        with mock.patch.object(api, "upload_intunewin", side_effect=self._upload) as upload:
+            status, body = request("POST", "/jobs/apps", _item(1, force=True))
+            self.assertEqual(status, 202)
+            status, job = wait_for_job(self, body["job_id"])
+
+        self.assertEqual(status, 200)
+        self.assertEqual((job["kind"], job["status"], job["result"]), ("upload", "succeeded", "app-1"))
+        self.assertEqual(job["params"]["package_id"], "Vendor.App1")
+        self.assertFalse(upload.call_args.kwargs["reuse"])
+        self.assertEqual([j["job_id"] for j in request("GET", "/jobs")[1]], [body["job_id"]])
+
+        status, stream = request("GET", f"/jobs/{body['job_id']}/events")
+        self.assertEqual(status, 200)
+        events = [json.loads(line[len("data: "):]) for line in stream.splitlines() if line.startswith("data: ")]
+        self.assertIn("upload", [event["stage"] for event in events])
+        self.assertEqual(events[-1]["status"], "succeeded", "the stream ends with the finished job")
+
+    def test_failed_job_keeps_its_error(self):
+        with mock.patch.object(api, "upload_intunewin", side_effect=RuntimeError("quota exceeded")):
+            _, body = request("POST", "/jobs/apps", _item(1))
+            _, job = wait_for_job(self, body["job_id"])
+        self.assertEqual(job["status"], "failed")
+        self.assertIn("quota exceeded", job["error"])
+
+    def test_unknown_job(self):
+        self.assertEqual(request("GET", "/jobs/nope"), (404, {"detail": "Job not found"}))
+        self.assertEqual(request("GET", "/jobs/nope/events")[0], 404)
+        self.assertEqual(request("GET", "/jobs"), (200, []))
+
+    def test_rejects_malformed_upload(self):
+        self.assertEqual(request("POST", "/jobs/apps", {"path": "x.intunewin"})[0], 422)
+
+
+class TestSearchStreamEndpoint(unittest.TestCase):
+    """GET /search/stream"""
+
+    def _lines(self, body):
+        return [json.loads(line) for line in body.splitlines()]
+
+    def test_streams_catalog_matches(self):
+        load_catalog(self, ("Firefox", "Mozilla.Firefox", "131.0"), ("Chrome", "Google.Chrome", "130.0"))
+        with mock.patch.object(api, "iter_winget_search") as cli:
+            status, headers, raw = asgi_request(api.app, "GET", "/search/stream?search_term=firefox")
+        self.assertEqual(status, 200)
+        self.assertTrue(headers["content-type"].startswith("application/x-ndjson"))
+        self.assertEqual(self._lines(raw.decode()),
+                         [{"Name": "Firefox", "Id": "Mozilla.Firefox", "Version": "131.0", "Source": "winget"}])
+        cli.assert_not_called()
+
+    def test_falls_back_to_winget_until_the_catalog_loads(self):
+        async def search(term):
+            for n in range(2):
+                yield {"Name": f"{term} {n}", "Id": f"Fake.App{n}", "Version": "1.0", "Source": "winget"}
+
+        with mock.patch.object(api, "iter_winget_search", side_effect=search):
+            status, body = request("GET", "/search/stream?search_term=fake")
+        self.assertEqual(status, 200)
+        self.assertEqual([app["Id"] for app in self._lines(body)], ["Fake.App0", "Fake.App1"])
+
+    def test_requires_a_search_term(self):
+        self.assertEqual(request("GET", "/search/stream")[0], 422)
+
+    def test_failed_search_is_an_error_status(self):
+        async def search(term):
+            raise subprocess.CalledProcessError(3, "winget", stderr="boom")
+            yield
+
+        async def slow(term):
+            raise asyncio.TimeoutError()
+            yield
+
+        for fake, expected in ((search, (502, {"detail": "winget search failed: boom"})),
+                               (slow, (504, {"detail": "winget search timed out"}))):
+            with self.subTest(fake=fake.__name__), mock.patch.object(api, "iter_winget_search", side_effect=fake):
+                self.assertEqual(request("GET", "/search/stream?search_term=fake"), expected)
+
+    def test_failure_after_the_first_result_ends_the_stream_with_an_error(self):
+        async def search(term):
+            yield {"Name": "Fake App", "Id": "Fake.App", "Version": "1.0", "Source": "winget"}
+            raise subprocess.CalledProcessError(3, "winget", stderr="boom")
+
+        with mock.patch.object(api, "iter_winget_search", side_effect=search):
+            status, body = request("GET", "/search/stream?search_term=fake")
+        self.assertEqual(status, 200)
+        self.assertEqual(self._lines(body), [{"Name": "Fake App", "Id": "Fake.App", "Version": "1.0", "Source": "winget"},
+                                             {"error": "winget search failed: boom"}])
+
+    def test_no_results_is_an_empty_stream(self):
+        async def search(term):
+            return
+            yield
+
+        with mock.patch.object(api, "iter_winget_search", side_effect=search):
+            self.assertEqual(request("GET", "/search/stream?search_term=nothing"), (200, ""))
+
+    def test_limits_results(self):
+        async def search(term):
+            for n in range(5):
+                yield {"Name": f"{term} {n}", "Id": f"Fake.App{n}", "Version": "1.0", "Source": "winget"}
+
+        with mock.patch.object(api, "iter_winget_search", side_effect=search):
+            status, body = request("GET", "/search/stream?search_term=fake&limit=2")
+        self.assertEqual([app["Id"] for app in self._lines(body)], ["Fake.App0", "Fake.App1"])
+
+        load_catalog(self, *((f"App {n}", f"Vendor.App{n}", "1.0") for n in range(5)))
+        for path in ("/search/stream", "/search"):
+            with self.subTest(path=path):
+                status, body = request("GET", f"{path}?search_term=a&limit=3")
+                self.assertEqual(status, 200)
+                self.assertEqual(len(body if isinstance(body, list) else self._lines(body)), 3)
+                self.assertEqual(request("GET", f"{path}?search_term=a&limit=0")[0], 422)
+
+
+class TestTenantEndpoints(unittest.TestCase):
+    """/tenants and POST /apps/tenants"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        registry = self.registry = TenantRegistry(str(Path(tmp.name) / "tenants.db"))
+        self.addCleanup(registry.close)
+        patcher = mock.patch.object(api, "get_tenant_registry", return_value=registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_register_list_and_remove(self):
+        status, tenant = request("POST", "/tenants", {"tenant_id": "tenant-a", "client_id": "client",
+                                                      "client_secret": "secret", "name": "Contoso"})
+        self.assertEqual(status, 201)
+        self.assertEqual((tenant["tenant_id"], tenant["name"]), ("tenant-a", "Contoso"))
+        self.assertNotIn("client_secret", tenant)
+
+        status, tenants = request("GET", "/tenants")
+        self.assertEqual(status, 200)
+        self.assertEqual([t["tenant_id"] for t in tenants], ["tenant-a"])
+        self.assertNotIn("secret", json.dumps(tenants))
+
+        self.assertEqual(request("DELETE", "/tenants/tenant-a")[0], 204)
+        self.assertEqual(request("GET", "/tenants"), (200, []))
+
+    def test_unknown_tenant_is_not_found(self):
+        self.assertEqual(request("DELETE", "/tenants/nope"), (404, {"detail": "Tenant not found"}))
+        with mock.patch.object(api, "upload_intunewin", side_effect=UnknownTenantError("Unknown tenant: nope")):
+            status, body = request("POST", "/apps", _item(1, tenant_id="nope"))
+        self.assertEqual((status, body["detail"]), (404, "Unknown tenant: nope"))
+
+    def test_registry_is_used_off_the_event_loop(self):
+        # closing a tenant's client waits for its requests; that must not stall the API
+        threads = []
+        for name in ("list", "add", "remove"):
+            method = getattr(self.registry, name)
+            patcher = mock.patch.object(self.registry, name, side_effect=lambda *args, _method=method, **kwargs:
+                                        threads.append(threading.current_thread()) or _method(*args, **kwargs))
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        request("POST", "/tenants", {"tenant_id": "tenant-a", "client_id": "client", "client_secret": "secret"})
+        request("GET", "/tenants")
+        request("DELETE", "/tenants/tenant-a")
+        self.assertEqual(len(threads), 3)
+        self.assertNotIn(threading.main_thread(), threads)
+
+    def test_rejects_incomplete_tenant(self):
+        self.assertEqual(request("POST", "/tenants", {"tenant_id": "tenant-a"})[0], 422)
+
+    def test_deploys_to_every_tenant(self):
+        results = [{"tenant_id": "tenant-a", "status": "succeeded", "app_id": "app-1"},
+                   {"tenant_id": "nope", "status": "failed", "error": "Unknown tenant: nope"}]
+        with mock.patch.object(api, "upload_intunewin_to_tenants", return_value=results) as upload:
+            status, body = request("POST", "/apps/tenants", {
+                "path": "/packages/1.intunewin", "display_name": "App 1", "package_id": "Vendor.App1",
+                "tenant_ids": ["tenant-a", "nope"]})
+        self.assertEqual(status, 200)
+        self.assertEqual(body, {"results": results, "succeeded": 1, "failed": 1})
+        self.assertEqual(upload.call_args.kwargs["tenant_ids"], ["tenant-a", "nope"])
+
+    def test_multi_tenant_errors(self):
+        item = {"path": "/packages/1.intunewin", "display_name": "App 1", "package_id": "Vendor.App1"}
+        self.assertEqual(request("POST", "/apps/tenants", {**item, "tenant_ids": []}),
+                         (400, {"detail": "No tenants to deploy to"}))
+        self.assertEqual(request("POST", "/apps/tenants", item)[0], 422)
+        with mock.patch.object(api, "upload_intunewin_to_tenants", side_effect=OSError("No such file")):
+            self.assertEqual(request("POST", "/apps/tenants", {**item, "tenant_ids": ["tenant-a"]}),
+                             (500, {"detail": "No such file"}))
+
+
+class TestInventoryEndpoints(unittest.TestCase):
+    """/apps, /apps/sync and /inventory"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.graph_status = 200
+        apps = [{"id": f"app-{n}", "displayName": f"App {n}", "publisher": "Contoso",
+                 "lastModifiedDateTime": f"2024-02-0{n}T00:00:00Z", "assignments": [],
+                 "installCommandLine": f'Winget-InstallPackage.ps1 -mode install -PackageID "Vendor.App{n}"'}
+                for n in (1, 2)]
+        stub = GraphStubServer(lambda method, path, body: (self.graph_status, {"value": apps}, None)).__enter__()
+        self.addCleanup(stub.__exit__)
+        client = GraphClient(auth_headers=lambda: {}, tenant_id="api-test")
+        self.addCleanup(client.close)
+
+        def client_for(tenant_id):
+            if tenant_id == "nope":
+                raise UnknownTenantError(f"Unknown tenant: {tenant_id}")
+            return client
+
+        inventory = AppInventory(str(Path(tmp.name) / "inventory.db"), graph_base=stub.base_url,
+                                 client_factory=client_for)
+        patcher = mock.patch.object(api, "get_app_inventory", return_value=inventory)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_sync_then_list_and_get(self):
+        status, result = request("POST", "/apps/sync?full=true")
+        self.assertEqual(status, 200)
+        self.assertEqual((result["full"], result["changed"], result["apps"]), (True, 2, 2))
+
+        status, page = request("GET", "/apps?search=app&order=modified&limit=1")
+        self.assertEqual(status, 200)
+        self.assertEqual((page["total"], [app["id"] for app in page["items"]]), (2, ["app-2"]))
+
+        status, app_info = request("GET", "/apps/app-1")
+        self.assertEqual((status, app_info["package_id"], app_info["assignments"]), (200, "Vendor.App1", []))
+        self.assertEqual(request("GET", "/apps/app-9"), (404, {"detail": "App not found in inventory"}))
+
+        status, body = request("GET", "/inventory")
+        self.assertEqual(status, 200)
+        self.assertEqual(set(body), {"enabled", "interval", "full_interval", "tenants"})
+        self.assertEqual(body["tenants"][0]["apps"], 2)
+        self.assertIsNotNone(body["tenants"][0]["full_synced_at"])
+
+    def test_bad_queries(self):
+        self.assertEqual(request("GET", "/apps?order=size"), (400, {"detail": "order must be one of name, modified"}))
+        self.assertEqual(request("GET", "/apps?limit=0")[0], 422)
+        self.assertEqual(request("GET", "/apps?offset=-1")[0], 422)
+
+    def test_sync_errors(self):
+        self.assertEqual(request("POST", "/apps/sync?tenant_id=nope"), (404, {"detail": "Unknown tenant: nope"}))
+        self.graph_status = 403
+        status, body = request("POST", "/apps/sync")
+        self.assertEqual(status, 502)
+        self.assertTrue(body["detail"].startswith("Inventory sync failed"))
+        self.assertIsNotNone(request("GET", "/inventory")[1]["tenants"][0]["last_error"])
+
+
+class TestManifestEndpoints(unittest.TestCase):
+    """POST /manifest/plan and /jobs/manifest"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        package = Path(tmp.name) / "app.intunewin"
+        package.write_bytes(b"")
+        self.manifest = {"tenant_id": "tenant-a",
+                         "apps": [{"package_id": "Vendor.App1", "display_name": "App 1", "path": str(package)}]}
+        manager = JobManager(max_workers=1)
+        self.addCleanup(manager.shutdown)
+        patcher = mock.patch.object(api, "jobs", manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_plan(self):
+        plan = {"tenant_id": "tenant-a", "actions": [{"package_id": "Vendor.App1", "action": "create"}],
+                "counts": {"create": 1, "update": 0, "skip": 0}}
+        with mock.patch.object(api, "plan_manifest", return_value=plan) as plan_manifest:
+            status, body = request("POST", "/manifest/plan", {"manifest": self.manifest, "tenant_id": "tenant-b"})
+        self.assertEqual((status, body), (200, plan))
+        manifest = plan_manifest.call_args.args[0]
+        self.assertEqual([app["package_id"] for app in manifest["apps"]], ["Vendor.App1"])
+        self.assertEqual(plan_manifest.call_args.kwargs["tenant_id"], "tenant-b")
+
+    def test_invalid_manifest_is_unprocessable(self):
+        missing = {"apps": [{"package_id": "Vendor.App1", "display_name": "App 1", "path": "/nowhere.intunewin"}]}
+        unknown = {"apps": [{**self.manifest["apps"][0], "colour": "blue"}]}
+        for path in ("/manifest/plan", "/jobs/manifest"):
+            for manifest in (missing, unknown):
+                with self.subTest(path=path, manifest=manifest):
+                    status, body = request("POST", path, {"manifest": manifest})
+                    self.assertEqual(status, 422)
+                    self.assertIn("apps[0] (Vendor.App1)", body["detail"])
+        self.assertEqual(api.jobs.list(), [], "nothing was queued")
+        self.assertEqual(request("POST", "/manifest/plan", {})[0], 422)
+
+    def test_plan_errors(self):
+        with mock.patch.object(api, "plan_manifest", side_effect=UnknownTenantError("Unknown tenant: tenant-a")):
+            self.assertEqual(request("POST", "/manifest/plan", {"manifest": self.manifest}),
+                             (404, {"detail": "Unknown tenant: tenant-a"}))
+        with mock.patch.object(api, "plan_manifest", side_effect=RuntimeError("throttled")):
+            self.assertEqual(request("POST", "/manifest/plan", {"manifest": self.manifest}),
+                             (502, {"detail": "Reading Intune apps failed: throttled"}))
+
+    def test_apply_job(self):
+        result = {"results": [], "succeeded": 1, "failed": 0}
+        with mock.patch.object(api, "apply_manifest", return_value=result) as apply:
+            status, body = request("POST", "/jobs/manifest", {"manifest": self.manifest, "max_workers": 2})
+            self.assertEqual(status, 202)
+            _, job = wait_for_job(self, body["job_id"])
+        self.assertEqual((job["kind"], job["status"], job["result"]), ("manifest", "succeeded", result))
+        self.assertEqual(job["params"], {"apps": 1, "tenant_id": "tenant-a"})
+        self.assertEqual(apply.call_args.kwargs["max_workers"], 2)
+        self.assertIs(apply.call_args.kwargs["catalog"], api.catalog)
+
+
+class TestUpdateEndpoints(unittest.TestCase):
+    """GET /updates and POST /jobs/updates"""
+
+    def setUp(self):
+        inventory = mock.Mock()
+        inventory.packages.return_value = [
+            {"id": f"app-{n}", "package_id": package_id, "display_name": package_id, "publisher": "Vendor",
+             "display_version": version, "modified_at": "2024-02-01T00:00:00Z"}
+            for n, (package_id, version) in enumerate((("Vendor.Old", "1.0"), ("Vendor.Current", "2.0"),
+                                                        ("Vendor.Local", "1.0")))]
+        manager = JobManager(max_workers=1)
+        self.addCleanup(manager.shutdown)
+        for target, value in (("_inventory", inventory), ("run", mock.Mock(return_value={"updated": 1}))):
+            patcher = mock.patch.object(api.updates, target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(api, "jobs", manager)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_unavailable_until_the_catalog_loads(self):
+        detail = {"detail": "The winget catalog is not loaded yet"}
+        self.assertEqual(request("GET", "/updates"), (503, detail))
+        self.assertEqual(request("POST", "/jobs/updates", {}), (503, detail))
+        self.assertEqual(api.jobs.list(), [])
+
+    def test_lists_outdated_packages(self):
+        load_catalog(self, ("Old", "Vendor.Old", "1.5"), ("Current", "Vendor.Current", "2.0"))
+        status, body = request("GET", "/updates?tenant_id=tenant-a")
+        self.assertEqual(status, 200)
+        self.assertEqual([(u["package_id"], u["installed_version"], u["available_version"]) for u in body["updates"]],
+                         [("Vendor.Old", "1.0", "1.5")])
+        self.assertEqual((body["current"], body["not_in_catalog"]), (["Vendor.Current"], ["Vendor.Local"]))
+        self.assertEqual((body["tenant_id"], body["mode"], body["enabled"]), ("tenant-a", api.updates.mode, False))
+        api.updates.inventory.packages.assert_called_once_with("tenant-a")
+
+    def test_update_job(self):
+        load_catalog(self, ("Old", "Vendor.Old", "1.5"))
+        status, body = request("POST", "/jobs/updates", {"tenant_id": "tenant-a", "sync": False})
+        self.assertEqual(status, 202)
+        _, job = wait_for_job(self, body["job_id"])
+        self.assertEqual((job["kind"], job["status"], job["result"]), ("update", "succeeded", {"updated": 1}))
+        self.assertEqual(job["params"], {"tenant_id": "tenant-a", "mode": api.updates.mode})
+        self.assertEqual(api.updates.run.call_args.kwargs,
+                         {"progress": mock.ANY, "tenant_id": "tenant-a", "include_unversioned": False, "sync": False})
+
+
+class TestMetricsEndpoint(unittest.TestCase):
+    """GET /metrics"""
+
+    def _scrape(self):
+        status, headers, raw = asgi_request(api.app, "GET", "/metrics")
+        self.assertEqual(status, 200)
+        self.assertEqual(headers["content-type"], "text/plain; version=0.0.4; charset=utf-8")
+        samples = {}
+        for line in raw.decode().splitlines():
+            if line and not line.startswith("#"):
+                name, value = line.rsplit(" ", 1)
+                samples[name] = float(value)
+        return raw.decode(), samples
+
+    def test_exposes_search_and_catalog_metrics(self):
+        load_catalog(self, ("Firefox", "Mozilla.Firefox", "131.0"))
+        count = 'winget_search_duration_seconds_count{backend="catalog"}'
+        before = self._scrape()[1].get(count, 0)
+        self.assertEqual(request("GET", "/search?search_term=firefox")[0], 200)
+
+        text, samples = self._scrape()
+        self.assertEqual(samples[count], before + 1)
+        self.assertEqual(samples["winget_catalog_packages"], 1)
+        self.assertIn('search_cache_requests_total{result="hit"}', samples)
+        for name in ("graph_requests_total", "intune_upload_stage_duration_seconds", "graph_batch_calls_total"):
+            self.assertIn(f"# TYPE {name} ", text)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,202 @@
+"""
+Tests for bulk app assignment through $batch, against a Graph stub.
+"""
+
+import sys
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+from urllib.parse import parse_qs, urlparse
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions import assignments, graph_batch, intune_win32_uploader as uploader
+from api.functions.assignments import AppAssigner, AssignmentError, parse_assignments
+from api.functions.graph_batch import GraphBatcher
+from api.functions.graph_client import GraphClient
+from api.functions.throttle import TokenBucket
+from api.tests.stubs import GraphStubServer
+
+GROUPS = {f"group-{n}": f"Group {n}" for n in range(10)}
+
+
+class FakeTenant:
+    """Answers $batch calls for group lookups, assignment filters and mobileApps assignments."""
+
+    def __init__(self):
+        self.batches = []
+        self.assigned = {}
+        self.existing = {}
+        self.throttle = set()  # app ids whose first /assign gets a 429
+        self.lock = threading.Lock()
+
+    def item(self, method, url):
+        parsed = urlparse(url)
+        parts = parsed.path.strip("/").split("/")
+        if parts[0] == "groups" and len(parts) == 2:
+            if parts[1] not in GROUPS:
+                return 404, {"error": {"code": "Request_ResourceNotFound"}}
+            return 200, {"id": parts[1], "displayName": GROUPS[parts[1]]}
+        if parts[0] == "groups":
+            name = parse_qs(parsed.query)["$filter"][0].split("'")[1]
+            return 200, {"value": [{"id": gid, "displayName": n} for gid, n in GROUPS.items() if n == name]}
+        if parts[:2] == ["deviceManagement", "assignmentFilters"]:
+            return 200, {"value": [{"id": "filter-1", "displayName": "Windows 11"}]}
+        app_id = parts[2]
+        if parts[3] == "assignments":
+            return 200, {"value": self.existing.get(app_id, [])}
+        return None, app_id
+
+    def __call__(self, method, path, body):
+        assert path.endswith("/$batch"), path
+        with self.lock:
+            self.batches.append(body["requests"])
+        responses = []
+        for request in body["requests"]:
+            status, data = self.item(request["method"], request["url"])
+            headers = {}
+            if status is None:  # POST .../assign
+                with self.lock:
+                    if data in self.throttle:
+                        self.throttle.discard(data)
+                        status, headers = 429, {"Retry-After": "0"}
+                    else:
+                        self.assigned[data] = request["body"]["mobileAppAssignments"]
+                        status = 204
+                data = None
+            responses.append({"id": request["id"], "status": status, "headers": headers, "body": data})
+        return 200, {"responses": responses}, None
+
+
+class TestAppAssigner(unittest.TestCase):
+    """AppAssigner"""
+
+    def setUp(self):
+        self.tenant = FakeTenant()
+        stub = GraphStubServer(self.tenant).__enter__()
+        self.addCleanup(stub.__exit__)
+        client = GraphClient(auth_headers=lambda: {}, bucket=TokenBucket(rate=10000, capacity=10000))
+        self.addCleanup(client.close)
+        batcher = GraphBatcher(client, graph_base=stub.base_url, window=0.2)
+        self.addCleanup(batcher.close)
+        self.assigner = AppAssigner(client, graph_base=stub.base_url, batcher=batcher)
+
+    def test_hundred_apps_to_ten_groups_in_a_few_batches(self):
+        specs = [{"group_id": gid, "intent": "required"} for gid in list(GROUPS)[:9]]
+        specs.append({"group": "Group 9", "intent": "available", "filter": "windows 11"})
+        apps = {f"app-{n}": specs for n in range(100)}
+        self.tenant.existing["app-0"] = [
+            {"id": "kept", "intent": "uninstall",
+             "target": {"@odata.type": "#microsoft.graph.allDevicesAssignmentTarget"}},
+            {"id": "replaced", "intent": "available",
+             "target": {"@odata.type": "#microsoft.graph.groupAssignmentTarget", "groupId": "group-0"}},
+        ]
+
+        results = self.assigner.assign(apps)
+
+        self.assertTrue(all(r == {"status": "succeeded", "assignments": 10} for app_id, r in results.items()
+                            if app_id != "app-0"))
+        self.assertEqual(results["app-0"]["assignments"], 11)
+        # 11 lookups, 100 assignment reads and 100 /assign calls, 20 per $batch
+        self.assertLessEqual(len(self.tenant.batches), 12)
+        self.assertEqual(len(self.tenant.assigned), 100)
+
+        app0 = {(a["target"]["@odata.type"], a["target"].get("groupId")): a for a in self.tenant.assigned["app-0"]}
+        self.assertEqual(app0[("#microsoft.graph.groupAssignmentTarget", "group-0")]["intent"], "required")
+        self.assertEqual(app0[("#microsoft.graph.allDevicesAssignmentTarget", None)]["intent"], "uninstall")
+        self.assertNotIn("id", app0[("#microsoft.graph.allDevicesAssignmentTarget", None)])
+        named = app0[("#microsoft.graph.groupAssignmentTarget", "group-9")]
+        self.assertEqual(named["target"]["deviceAndAppManagementAssignmentFilterId"], "filter-1")
+        self.assertEqual(named["settings"]["notifications"], "showAll")
+
+    def test_lookups_are_cached(self):
+        specs = [{"group": "Group 1"}, {"group_id": "group-2"}]
+        self.assigner.assign({"app-1": specs}, replace=True)
+        batches = len(self.tenant.batches)
+        self.assigner.assign({"app-2": specs}, replace=True)
+        self.assertEqual(len(self.tenant.batches), batches + 1, "only the /assign call")
+        self.assertEqual([r["method"] for r in self.tenant.batches[-1]], ["POST"])
+
+    def test_throttled_assign_is_retried(self):
+        self.tenant.throttle.add("app-1")
+        results = self.assigner.assign({"app-1": [{"group_id": "group-1"}]}, replace=True)
+        self.assertEqual(results["app-1"]["status"], "succeeded")
+        self.assertIn("app-1", self.tenant.assigned)
+
+    def test_unknown_group_fails_before_assigning(self):
+        with self.assertRaises(AssignmentError):
+            self.assigner.assign({"app-1": [{"group_id": "group-1"}], "app-2": [{"group_id": "missing"}]})
+        with self.assertRaises(AssignmentError):
+            self.assigner.assign({"app-1": [{"group": "Nobody"}]})
+        self.assertEqual(self.tenant.assigned, {})
+
+    def test_copy_gives_apps_the_assignments_of_others(self):
+        target = {"@odata.type": "#microsoft.graph.groupAssignmentTarget", "groupId": "group-3"}
+        self.tenant.existing["app-old"] = [{"id": "x", "intent": "available", "target": target}]
+        results = self.assigner.copy({"app-new": "app-old", "app-other": "app-old"})
+        self.assertEqual(results["app-new"], {"status": "succeeded", "assignments": 1})
+        self.assertEqual(self.tenant.assigned["app-new"], [
+            {"@odata.type": "#microsoft.graph.mobileAppAssignment", "intent": "available", "target": target}])
+        self.assertIn("app-other", self.tenant.assigned)
+
+    def test_invalid_specs_are_rejected(self):
+        for bad in ([{"intent": "required"}], [{"group_id": "g", "all_users": True}], [{"group_id": "g", "intent": "x"}],
+                    [{"all_devices": True, "exclude": True}], [{"group_id": "g", "exclude": True, "filter_id": "f"}],
+                    [{"group_id": "g", "colour": "red"}]):
+            with self.subTest(bad=bad), self.assertRaises(AssignmentError):
+                parse_assignments(bad)
+        self.assertEqual(parse_assignments([{"group_id": "g"}])[0]["intent"], "required")
+
+
+class TestSharedAssigners(unittest.TestCase):
+    """assigner_for"""
+
+    def test_closing_the_client_releases_its_assigner(self):
+        client = GraphClient(auth_headers=lambda: {}, bucket=TokenBucket(rate=1000, capacity=1000))
+        assigner = assignments.assigner_for(client)
+        self.assertIs(assignments.assigner_for(client), assigner)
+        client.close()
+        self.assertNotIn(client, assignments._assigners)
+
+    def test_closed_client_gets_an_unshared_assigner_without_batcher(self):
+        client = GraphClient(auth_headers=lambda: {}, bucket=TokenBucket(rate=1000, capacity=1000))
+        client.close()
+        assigner = assignments.assigner_for(client)
+        self.assertIsNone(assigner.batcher)
+        self.assertIsNot(assignments.assigner_for(client), assigner)
+        self.assertNotIn(client, assignments._assigners)
+        self.assertNotIn(client, graph_batch._batchers)
+
+
+class TestBatchUploadAssignments(unittest.TestCase):
+    """upload_intunewin_batch with assignments"""
+
+    def test_assigns_all_uploaded_apps_in_one_call(self):
+        package = str(Path(__file__).resolve().parent.parent / "files" / "Winget-InstallPackage.intunewin")
+        specs = [{"group_id": "group-1"}]
+        items = [{"path": package, "display_name": f"App {n}", "package_id": f"Vendor.App{n}", "assignments": specs}
+                 for n in range(3)]
+        assigner = mock.Mock()
+        assigner.assign.side_effect = lambda apps: {
+            app_id: {"status": "failed", "error": "403"} if app_id == "app-Vendor.App2"
+            else {"status": "succeeded", "assignments": 1} for app_id in apps}
+
+        with mock.patch.object(uploader, "get_access_token", return_value="token"), \
+                mock.patch.object(uploader, "client_for"), \
+                mock.patch.object(uploader, "assigner_for", return_value=assigner), \
+                mock.patch.object(uploader, "upload_intunewin",
+                                  side_effect=lambda **kw: "app-" + kw["package_id"]) as upload:
+            results = uploader.upload_intunewin_batch(items)
+
+        self.assertTrue(all("assignments" not in call.kwargs for call in upload.call_args_list))
+        self.assertEqual(assigner.resolve.call_count, 3)
+        assigner.assign.assert_called_once_with({f"app-Vendor.App{n}": specs for n in range(3)})
+        self.assertEqual([r["status"] for r in results], ["succeeded", "succeeded", "failed"])
+        self.assertEqual(results[2]["app_id"], "app-Vendor.App2")
+        self.assertIn("not assigned", results[2]["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""
+Tests for concurrent batch uploads; Graph and the blob upload are mocked out.
+"""
+
+import sys
+import threading
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions import intune_win32_uploader as uploader
+
+PACKAGE = str(Path(__file__).resolve().parent.parent / "files" / "Winget-InstallPackage.intunewin")
+
+
+class TestBatchUpload(unittest.TestCase):
+    """upload_intunewin_batch"""
+
+    def setUp(self):
+        patcher = mock.patch.object(uploader, "get_access_token", return_value="token")
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _items(self, n, path=PACKAGE):
+        return [{"path": path, "display_name": f"App {i}", "package_id": f"Vendor.App{i}"} for i in range(n)]
+
+    def test_results_in_order_with_bounded_concurrency(self):
+        lock = threading.Lock()
+        running = {"now": 0, "max": 0}
+        packages = set()
+
+        def fake_upload(**kwargs):
+            with lock:
+                running["now"] += 1
+                running["max"] = max(running["max"], running["now"])
+                packages.add(id(kwargs["package"]))
+            time.sleep(0.02)
+            with lock:
+                running["now"] -= 1
+            if kwargs["package_id"] == "Vendor.App3":
+                raise RuntimeError("boom")
+            return "app-" + kwargs["package_id"]
+
+        with mock.patch.object(uploader, "upload_intunewin", side_effect=fake_upload):
+            results = uploader.upload_intunewin_batch(self._items(8), max_concurrency=3)
+
+        self.assertEqual([r["package_id"] for r in results], [f"Vendor.App{i}" for i in range(8)])
+        self.assertEqual(results[0], {"package_id": "Vendor.App0", "status": "succeeded", "app_id": "app-Vendor.App0",
+                                      "already_deployed": False})
+        self.assertEqual(results[3]["status"], "failed")
+        self.assertIn("boom", results[3]["error"])
+        self.assertLessEqual(running["max"], 3)
+        self.assertEqual(len(packages), 1, "package should be parsed once and shared")
+
+    def test_unreadable_package_fails_its_items_only(self):
+        items = self._items(1) + self._items(1, path="/nonexistent/App.intunewin")
+        with mock.patch.object(uploader, "upload_intunewin", return_value="app-id"):
+            results = uploader.upload_intunewin_batch(items)
+        self.assertEqual([r["status"] for r in results], ["succeeded", "failed"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,196 @@
+"""
+Tests for the parallel Azure block blob uploader, run against a local stub.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+from contextlib import contextmanager
+from pathlib import Path
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions import intune_win32_uploader as uploader
+from api.tests.stubs import BlobStubServer, encrypt_payload
+
+
+class TestBlockSize(unittest.TestCase):
+    """Adaptive block sizing"""
+
+    def test_small_payload_uses_default(self):
+        self.assertEqual(uploader._choose_block_size(10 * 1024 * 1024), uploader.BLOB_BLOCK_SIZE)
+
+    def test_large_payload_grows_block_size(self):
+        size = uploader._choose_block_size(8 * 1024 ** 3)
+        self.assertGreater(size, uploader.BLOB_BLOCK_SIZE)
+        self.assertLessEqual(size, uploader.BLOB_MAX_BLOCK_SIZE)
+
+    def test_never_exceeds_block_limit(self):
+        total = 1024 ** 4
+        size = uploader._choose_block_size(total, block_size=1024)
+        self.assertLessEqual(-(-total // size), uploader.BLOB_MAX_BLOCKS)
+
+
+class TestParallelUpload(unittest.TestCase):
+    """Blocks go up concurrently but are committed in file order"""
+
+    def setUp(self):
+        fd, name = tempfile.mkstemp()
+        self.payload = os.urandom(64 * 1024 + 123)
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(self.payload)
+        self.path = Path(name)
+
+    def tearDown(self):
+        self.path.unlink()
+
+    def test_blocks_committed_in_order(self):
+        with BlobStubServer(latency=0.02) as stub:
+            uploader._upload_to_blob(self.path, stub.sas_uri, block_size=4096, concurrency=4)
+
+        self.assertEqual(stub.blob, self.payload)
+        self.assertEqual(stub.block_list, [uploader._block_id(i) for i in range(len(stub.block_list))])
+        self.assertGreater(stub.max_in_flight, 1)
+        self.assertLessEqual(stub.max_in_flight, 4)
+        # one pooled connection per worker at most, not one per block
+        self.assertLessEqual(stub.connections, 4)
+
+    def test_buffer_pool_bounds_blocks_in_memory(self):
+        # with two buffers at most two blocks can be in flight, however many workers
+        with BlobStubServer(latency=0.02) as stub:
+            uploader._upload_to_blob(self.path, stub.sas_uri, block_size=4096, concurrency=8, buffers=2)
+        self.assertEqual(stub.blob, self.payload)
+        self.assertLessEqual(stub.max_in_flight, 2)
+
+    def test_read_error_is_raised_without_committing(self):
+        class FailingPayload(uploader._FilePayload):
+            @contextmanager
+            def open(self):
+                with open(self.path, "rb") as fh:
+                    yield FailingReader(fh)
+
+        class FailingReader:
+            def __init__(self, fh):
+                self.fh = fh
+
+            def readinto(self, view):
+                if self.fh.tell() >= 32 * 1024:
+                    raise OSError("disk went away")
+                return self.fh.readinto(view)
+
+        with BlobStubServer() as stub, self.assertRaisesRegex(OSError, "disk went away"):
+            uploader._upload_to_blob(FailingPayload(self.path), stub.sas_uri, block_size=4096, concurrency=4)
+        self.assertEqual(stub.block_list, [])
+
+
+DETECTION_XML = """<ApplicationInfo>
+  <FileName>IntunePackage.intunewin</FileName>
+  <UnencryptedContentSize>1</UnencryptedContentSize>
+  <EncryptionInfo><EncryptionKey>k</EncryptionKey></EncryptionInfo>
+</ApplicationInfo>"""
+
+
+class TestZipPayload(unittest.TestCase):
+    """The encrypted payload is read straight out of the package"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+        self.payload = os.urandom(200 * 1024 + 7)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _package(self, compression):
+        path = self.dir / "App.intunewin"
+        with zipfile.ZipFile(path, "w") as zf:
+            # push the payload to an offset that is not page aligned
+            zf.writestr("padding.bin", os.urandom(70001))
+            zf.writestr("IntuneWinPackage/Contents/IntunePackage.intunewin", self.payload,
+                        compress_type=compression)
+            zf.writestr("IntuneWinPackage/Metadata/Detection.xml", DETECTION_XML)
+        return path
+
+    def _roundtrip(self, compression):
+        meta, payload = uploader._parse_detection_xml(self._package(compression))
+        self.assertEqual(payload.size, len(self.payload))
+        with BlobStubServer() as stub:
+            uploader._upload_to_blob(payload, stub.sas_uri, block_size=16 * 1024, concurrency=3)
+        self.assertEqual(stub.blob, self.payload)
+        self.assertEqual(sorted(p.name for p in self.dir.iterdir()), ["App.intunewin"])
+
+    def test_stored_member_is_memory_mapped(self):
+        self._roundtrip(zipfile.ZIP_STORED)
+
+    def test_deflated_member_is_streamed(self):
+        self._roundtrip(zipfile.ZIP_DEFLATED)
+
+    def test_bundled_package(self):
+        package = Path(__file__).resolve().parent.parent / "files" / "Winget-InstallPackage.intunewin"
+        meta, payload = uploader._parse_detection_xml(package)
+        with payload.open() as fh:
+            data = fh.read()
+        with zipfile.ZipFile(package) as zf:
+            self.assertEqual(data, zf.read("IntuneWinPackage/Contents/" + meta["file_name"]))
+
+
+class TestPayloadVerification(unittest.TestCase):
+    """The payload is checked against Detection.xml while it is uploaded"""
+
+    def setUp(self):
+        self.meta, self.encrypted = encrypt_payload(os.urandom(50 * 1024 + 5))
+        fd, name = tempfile.mkstemp()
+        os.close(fd)
+        self.path = Path(name)
+        self.addCleanup(self.path.unlink)
+
+    def _upload(self, data, stub):
+        self.path.write_bytes(data)
+        payload = uploader._FilePayload(self.path)
+        verifier = uploader._PayloadVerifier.for_package(self.meta, payload)
+        uploader._upload_to_blob(payload, stub.sas_uri, block_size=4096, concurrency=3, verifier=verifier)
+
+    def test_valid_payload_is_committed(self):
+        with BlobStubServer() as stub:
+            self._upload(self.encrypted, stub)
+        self.assertEqual(stub.blob, self.encrypted)
+
+    def test_corrupt_content_is_not_committed(self):
+        corrupt = bytearray(self.encrypted)
+        corrupt[30000] ^= 1
+        with BlobStubServer() as stub, self.assertRaises(uploader.PayloadIntegrityError):
+            self._upload(bytes(corrupt), stub)
+        self.assertEqual(stub.block_list, [])
+
+    def test_wrong_header_fails_before_sending(self):
+        corrupt = bytearray(self.encrypted)
+        corrupt[0] ^= 1
+        with BlobStubServer() as stub, self.assertRaises(uploader.PayloadIntegrityError):
+            self._upload(bytes(corrupt), stub)
+        self.assertEqual(stub.block_puts, 0)
+
+    def test_truncated_payload_fails_up_front(self):
+        self.path.write_bytes(self.encrypted[:-16])
+        with self.assertRaises(uploader.PayloadIntegrityError):
+            uploader._PayloadVerifier.for_package(self.meta, uploader._FilePayload(self.path))
+
+    def test_bundled_package_verifies(self):
+        package = Path(__file__).resolve().parent.parent / "files" / "Winget-InstallPackage.intunewin"
+        meta, payload = uploader._parse_detection_xml(package)
+        verifier = uploader._PayloadVerifier.for_package(meta, payload)
+        with payload.open() as fh:
+            for chunk in iter(lambda: fh.read(7), b""):
+                verifier.update(chunk)
+        verifier.finish()
+
+    def test_blocks_carry_content_md5(self):
+        with BlobStubServer() as stub:
+            stub.require_md5 = True
+            self._upload(self.encrypted, stub)
+        self.assertEqual(stub.blob, self.encrypted)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,102 @@
+"""
+Tests for the async TTL/LRU cache used by /search.
+"""
+
+import asyncio
+import sys
+import unittest
+from pathlib import Path
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions.cache import AsyncTTLCache
+
+
+class TestAsyncTTLCache(unittest.IsolatedAsyncioTestCase):
+    """AsyncTTLCache"""
+
+    def setUp(self):
+        self.now = 0.0
+        self.calls = 0
+        self.cache = AsyncTTLCache(maxsize=2, ttl=10, clock=lambda: self.now)
+
+    def _loader(self, value, delay=0.0, error=None):
+        async def load():
+            self.calls += 1
+            await asyncio.sleep(delay)
+            if error:
+                raise error
+            return value
+        return load
+
+    async def test_hit_and_ttl_expiry(self):
+        self.assertEqual(await self.cache.get_or_load("a", self._loader(1)), 1)
+        self.assertEqual(await self.cache.get_or_load("a", self._loader(2)), 1)
+        self.now = 11
+        self.assertEqual(await self.cache.get_or_load("a", self._loader(3)), 3)
+        self.assertEqual(self.cache.stats()["hits"], 1)
+        self.assertEqual(self.cache.stats()["misses"], 2)
+
+    async def test_lru_eviction(self):
+        for key in ("a", "b"):
+            await self.cache.get_or_load(key, self._loader(key))
+        await self.cache.get_or_load("a", self._loader("a"))  # a is now most recent
+        await self.cache.get_or_load("c", self._loader("c"))
+        await self.cache.get_or_load("a", self._loader("x"))
+        self.assertEqual(await self.cache.get_or_load("b", self._loader("new-b")), "new-b")
+        self.assertEqual(self.cache.stats()["evictions"], 2)
+
+    async def test_concurrent_identical_requests_share_one_load(self):
+        results = await asyncio.gather(*(self.cache.get_or_load("q", self._loader("r", delay=0.05))
+                                         for _ in range(10)))
+        self.assertEqual(results, ["r"] * 10)
+        self.assertEqual(self.calls, 1)
+        self.assertEqual(self.cache.stats()["coalesced"], 9)
+
+    async def test_failures_are_not_cached(self):
+        with self.assertRaises(RuntimeError):
+            await self.cache.get_or_load("q", self._loader(None, error=RuntimeError("winget failed")))
+        self.assertEqual(await self.cache.get_or_load("q", self._loader("ok")), "ok")
+
+    async def test_cancelled_waiter_does_not_cancel_shared_load(self):
+        first = asyncio.ensure_future(self.cache.get_or_load("q", self._loader("r", delay=0.05)))
+        second = asyncio.ensure_future(self.cache.get_or_load("q", self._loader("other")))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        self.assertEqual(await second, "r")
+
+    async def test_load_is_cancelled_when_every_waiter_leaves(self):
+        started = asyncio.Event()
+        cancelled = asyncio.Event()
+
+        async def load():
+            started.set()
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.set()
+                raise
+
+        waiters = [asyncio.ensure_future(self.cache.get_or_load("q", load)) for _ in range(2)]
+        await started.wait()
+        for waiter in waiters:
+            waiter.cancel()
+        await asyncio.wait_for(cancelled.wait(), 1)
+        self.assertEqual(self.cache.stats()["in_flight"], 0)
+
+    async def test_caller_after_cancellation_starts_a_fresh_load(self):
+        waiter = asyncio.ensure_future(self.cache.get_or_load("q", self._loader("stale", delay=10)))
+        await asyncio.sleep(0.01)
+        waiter.cancel()
+        await asyncio.sleep(0)  # the waiter has cancelled the load, which has not unwound yet
+        self.assertTrue(waiter.cancelled())
+        self.assertEqual(await self.cache.get_or_load("q", self._loader("fresh")), "fresh")
+        self.assertEqual(self.calls, 2)
+        await asyncio.sleep(0)
+        self.assertEqual(self.cache.stats()["in_flight"], 0)
+        self.assertEqual(await self.cache.get_or_load("q", self._loader("again")), "fresh")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,119 @@
+"""
+Tests for the deployment index and re-deploy deduplication; Graph and the
+blob upload are mocked out.
+"""
+
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import requests
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions import intune_win32_uploader as uploader
+from api.functions.deployments import DeploymentIndex
+
+PACKAGE = str(Path(__file__).resolve().parent.parent / "files" / "Winget-InstallPackage.intunewin")
+
+
+class TestDeploymentIndex(unittest.TestCase):
+    """DeploymentIndex"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.index = DeploymentIndex(str(Path(self.tmp.name) / "deployments.db"))
+
+    def test_keyed_by_digest_tenant_and_package(self):
+        self.index.record("digest", "tenant-a", "Vendor.App", "app-1", "1", "App")
+        self.assertEqual(self.index.lookup("digest", "tenant-a", "Vendor.App")["app_id"], "app-1")
+        self.assertIsNone(self.index.lookup("digest", "tenant-b", "Vendor.App"))
+        self.assertIsNone(self.index.lookup("digest", "tenant-a", "Vendor.Other"))
+        self.assertIsNone(self.index.lookup("other", "tenant-a", "Vendor.App"))
+
+    def test_forget(self):
+        self.index.record("digest", "tenant-a", "Vendor.App", "app-1", "1")
+        self.index.record("digest", "tenant-b", "Vendor.App", "app-2", "1")
+        self.assertEqual(self.index.forget("app-1"), 1)
+        self.assertEqual([r["app_id"] for r in self.index.list()], ["app-2"])
+
+
+class TestRedeploy(unittest.TestCase):
+    """upload_intunewin with reuse"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.index = DeploymentIndex(str(Path(tmp.name) / "deployments.db"))
+        patcher = mock.patch("api.functions.journal.UPLOAD_JOURNAL_DIR", str(Path(tmp.name) / "journal"))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.apps = {}
+        self.created = 0
+
+        def fake_prepare(*args, **kwargs):
+            self.created += 1
+            app_id = f"app-{self.created}"
+            self.apps[app_id] = {"id": app_id, "committedContentVersion": "1"}
+            return app_id, "1", {"id": "file", "azureStorageUri": "http://blob"}
+
+        def fake_graph(method, url, client=None, **kwargs):
+            app_id = url.rsplit("/", 1)[-1].split("?")[0]
+            if app_id not in self.apps:
+                resp = requests.Response()
+                resp.status_code = 404
+                raise requests.HTTPError("404 Not Found", response=resp)
+            return self.apps[app_id]
+
+        for name, value in {
+            "get_deployment_index": lambda: self.index,
+            "client_for": lambda tenant_id: None,
+            "_prepare_app": fake_prepare,
+            "_upload_to_blob": lambda *a, **kw: None,
+            "_finish_app": lambda *a, **kw: None,
+            "_graph_request": fake_graph,
+        }.items():
+            patcher = mock.patch.object(uploader, name, side_effect=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _deploy(self, **kwargs):
+        stages = []
+        app_id = uploader.upload_intunewin(PACKAGE, "App", "Vendor.App",
+                                           progress=lambda stage, **info: stages.append(stage), **kwargs)
+        return app_id, stages
+
+    def test_unchanged_package_is_not_uploaded_again(self):
+        first, _ = self._deploy()
+        second, stages = self._deploy()
+        self.assertEqual(first, second)
+        self.assertEqual(self.created, 1)
+        self.assertEqual(stages, ["already_deployed"])
+
+    def test_other_package_id_or_tenant_deploys(self):
+        self._deploy()
+        uploader.upload_intunewin(PACKAGE, "Other", "Vendor.Other")
+        self._deploy(tenant_id="tenant-b")
+        self.assertEqual(self.created, 3)
+
+    def test_deleted_app_is_deployed_again(self):
+        first, _ = self._deploy()
+        del self.apps[first]
+        second, stages = self._deploy()
+        self.assertNotEqual(first, second)
+        self.assertNotIn("already_deployed", stages)
+        self.assertEqual(self.index.lookup(uploader._parse_detection_xml(Path(PACKAGE))[0]["file_digest"],
+                                           None, "Vendor.App")["app_id"], second)
+
+    def test_force(self):
+        self._deploy()
+        self._deploy(reuse=False)
+        self.assertEqual(self.created, 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
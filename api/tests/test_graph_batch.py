@@ -0,0 +1,133 @@
+"""
+Tests for coalescing Graph requests into $batch calls, against a Graph stub.
+"""
+
+import sys
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions import graph_batch
+from api.functions.graph_batch import GraphBatcher
+from api.functions.graph_client import GraphClient
+from api.functions.throttle import TokenBucket
+from api.tests.stubs import GraphStubServer
+
+
+class FakeBatchEndpoint:
+    """Answers /$batch by passing each inner request to *handle(method, url, body)*."""
+
+    def __init__(self, handle):
+        self.handle = handle
+        self.batches = []
+        self.lock = threading.Lock()
+
+    def __call__(self, method, path, body):
+        assert method == "POST" and path.endswith("/$batch"), path
+        with self.lock:
+            self.batches.append(body["requests"])
+        responses = []
+        for item in body["requests"]:
+            status, data, headers = self.handle(item["method"], item["url"], item.get("body"), item)
+            responses.append({"id": item["id"], "status": status, "headers": headers or {}, "body": data})
+        return 200, {"responses": responses}, None
+
+
+class TestGraphBatcher(unittest.TestCase):
+    """GraphBatcher"""
+
+    def _batcher(self, handle, **kwargs):
+        self.endpoint = FakeBatchEndpoint(handle)
+        stub = GraphStubServer(self.endpoint).__enter__()
+        self.addCleanup(stub.__exit__)
+        client = GraphClient(auth_headers=lambda: {}, bucket=TokenBucket(rate=1000, capacity=1000))
+        self.addCleanup(client.close)
+        batcher = GraphBatcher(client, graph_base=stub.base_url, **kwargs)
+        self.addCleanup(batcher.close)
+        self.base = stub.base_url
+        return batcher
+
+    def test_concurrent_requests_share_batches(self):
+        batcher = self._batcher(lambda method, url, body, item: (200, {"url": url}, None), window=0.2)
+        urls = [f"{self.base}/deviceAppManagement/mobileApps/app-{n}" for n in range(30)]
+        with ThreadPoolExecutor(max_workers=30) as pool:
+            results = list(pool.map(lambda url: batcher.request("GET", url), urls))
+        self.assertEqual(results, [{"url": f"/deviceAppManagement/mobileApps/app-{n}"} for n in range(30)])
+        self.assertEqual(sorted(len(batch) for batch in self.endpoint.batches), [10, 20])
+
+    def test_item_errors_reach_only_their_caller(self):
+        def handle(method, url, body, item):
+            if url.endswith("missing"):
+                return 404, {"error": {"code": "ResourceNotFound"}}, {"Content-Type": "application/json"}
+            return 200, {"ok": True}, None
+
+        batcher = self._batcher(handle)
+        missing = batcher.submit("GET", f"{self.base}/deviceAppManagement/mobileApps/missing")
+        found = batcher.submit("GET", f"{self.base}/deviceAppManagement/mobileApps/found")
+        self.assertEqual(found.result(), {"ok": True})
+        with self.assertRaises(requests.HTTPError) as ctx:
+            missing.result()
+        self.assertEqual(ctx.exception.response.status_code, 404)
+        self.assertIn("ResourceNotFound", str(ctx.exception))
+
+    def test_throttled_dependency_is_retried_with_its_dependents(self):
+        calls = []
+
+        def handle(method, url, body, item):
+            calls.append((item["id"], item.get("dependsOn")))
+            if url.endswith("/assign") and len(calls) == 1:
+                return 429, {"error": {"code": "TooManyRequests"}}, {"Retry-After": "0"}
+            if item.get("dependsOn") and len(calls) == 2:
+                return 424, {"error": {"code": "FailedDependency"}}, None
+            return 200, {"url": url, "body": body}, None
+
+        batcher = self._batcher(handle)
+        assign, patch = batcher.submit_many([
+            {"method": "POST", "url": f"{self.base}/deviceAppManagement/mobileApps/a/assign", "json": {"x": 1}},
+            {"method": "PATCH", "url": f"{self.base}/deviceAppManagement/mobileApps/a", "json": {"y": 2},
+             "depends_on": [0]},
+        ])
+        self.assertEqual(assign.result(timeout=5)["body"], {"x": 1})
+        self.assertEqual(patch.result(timeout=5)["body"], {"y": 2})
+        self.assertEqual(len(self.endpoint.batches), 2)
+        self.assertEqual(self.endpoint.batches[0][1]["dependsOn"], ["1"])
+        self.assertEqual(self.endpoint.batches[0][0]["headers"]["Content-Type"], "application/json")
+
+    def test_requests_outside_the_base_are_rejected(self):
+        batcher = self._batcher(lambda *args: (200, None, None))
+        with self.assertRaises(ValueError):
+            batcher.submit("GET", "https://example.com/other")
+        with self.assertRaises(ValueError):
+            batcher.submit_many([{"method": "GET", "url": f"{self.base}/a", "depends_on": [0]}])
+
+
+class TestSharedBatchers(unittest.TestCase):
+    """batcher_for"""
+
+    def test_closing_the_client_releases_its_batcher(self):
+        client = GraphClient(auth_headers=lambda: {}, bucket=TokenBucket(rate=1000, capacity=1000))
+        batcher = graph_batch.batcher_for(client)
+        self.assertIs(graph_batch.batcher_for(client), batcher)
+        client.close()
+        self.assertNotIn(client, graph_batch._batchers)
+        with self.assertRaises(RuntimeError):
+            batcher.submit("GET", f"{graph_batch.GRAPH_BASE}/deviceAppManagement/mobileApps")
+
+    def test_closed_client_gets_no_batcher(self):
+        # e.g. an upload still holding the client of a tenant whose credentials were replaced
+        client = GraphClient(auth_headers=lambda: {}, bucket=TokenBucket(rate=1000, capacity=1000))
+        client.close()
+        with self.assertRaises(RuntimeError):
+            graph_batch.batcher_for(client)
+        self.assertNotIn(client, graph_batch._batchers)
+        self.assertEqual(client._on_close, [], "nothing waits for a close that already happened")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+"""
+Tests for the pooled Graph client, run against a local mock Graph server.
+"""
+
+import sys
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions.graph_client import GraphClient
+from api.functions.throttle import TokenBucket
+from api.tests.stubs import GraphStubServer
+
+# keep the client-side rate limit out of the way
+UNLIMITED = TokenBucket(rate=1e9, capacity=10 ** 9)
+
+
+def _headers():
+    return {"Authorization": "Bearer test-token", "Content-Type": "application/json"}
+
+
+class TestGraphClient(unittest.TestCase):
+    """GraphClient"""
+
+    def test_connections_are_reused(self):
+        with GraphStubServer() as stub:
+            client = GraphClient(auth_headers=_headers, bucket=UNLIMITED, pool_maxsize=4)
+            for _ in range(20):
+                client.get(f"{stub.base_url}/deviceAppManagement/mobileApps")
+            with ThreadPoolExecutor(max_workers=4) as pool:
+                list(pool.map(lambda _: client.get(f"{stub.base_url}/x"), range(40)))
+            client.close()
+        self.assertEqual(len(stub.requests), 60)
+        self.assertLessEqual(stub.connections, 4)
+        self.assertEqual(stub.requests[0][2]["Authorization"], "Bearer test-token")
+
+    def test_error_carries_graph_body_and_response(self):
+        def responder(method, path, body):
+            return 400, {"error": {"code": "BadRequest", "message": "nope"}}, None
+
+        with GraphStubServer(responder) as stub:
+            client = GraphClient(auth_headers=_headers, bucket=UNLIMITED)
+            with self.assertRaises(requests.HTTPError) as ctx:
+                client.post(f"{stub.base_url}/deviceAppManagement/mobileApps", json={"a": 1})
+            client.close()
+        self.assertIn("BadRequest", str(ctx.exception))
+        self.assertEqual(ctx.exception.response.status_code, 400)
+        self.assertEqual(stub.requests[0][3], {"a": 1})
+
+
+if __name__ == "__main__":
+    unittest.main()
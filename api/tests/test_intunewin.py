@@ -0,0 +1,100 @@
+"""
+Tests for the native .intunewin packager.
+"""
+
+import base64
+import io
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+import zlib
+from pathlib import Path
+from unittest import mock
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions import intunewin
+from api.functions import intune_win32_uploader as uploader
+
+
+class TestCrc32Combine(unittest.TestCase):
+    """crc32_combine"""
+
+    def test_matches_crc_of_concatenation(self):
+        for a, b in [(b"", b"x"), (b"hmac" * 8, os.urandom(1000)), (os.urandom(33), os.urandom(70001))]:
+            self.assertEqual(intunewin.crc32_combine(zlib.crc32(a), zlib.crc32(b), len(b)), zlib.crc32(a + b))
+
+
+class TestBuildIntunewin(unittest.TestCase):
+    """build_intunewin"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = Path(self.tmp.name) / "src"
+        (self.source / "config").mkdir(parents=True)
+        self.files = {
+            "Winget-InstallPackage.ps1": b"param($PackageID)\nwinget install --id $PackageID\n",
+            "config/settings.json": b'{"scope": "machine"}',
+            "payload.bin": os.urandom(300 * 1024),
+            "setup.msi": os.urandom(64 * 1024),
+        }
+        for name, data in self.files.items():
+            (self.source / name).write_bytes(data)
+        self.output = Path(self.tmp.name) / "App.intunewin"
+
+    def _decrypt(self, meta, encrypted):
+        key = base64.b64decode(meta["encryption_key"])
+        decryptor = Cipher(algorithms.AES(key), modes.CBC(encrypted[32:48])).decryptor()
+        plain = decryptor.update(encrypted[48:]) + decryptor.finalize()
+        return plain[:-plain[-1]]
+
+    def test_package_round_trips(self):
+        meta = intunewin.build_intunewin(self.source, "Winget-InstallPackage.ps1", self.output)
+        with zipfile.ZipFile(self.output) as zf:
+            self.assertIsNone(zf.testzip(), "CRCs must match the patched contents")
+            self.assertEqual(zf.namelist(), [intunewin.CONTENTS_MEMBER, intunewin.DETECTION_MEMBER])
+            encrypted = zf.read(intunewin.CONTENTS_MEMBER)
+        with zipfile.ZipFile(io.BytesIO(self._decrypt(meta, encrypted))) as inner:
+            self.assertEqual({name: inner.read(name) for name in inner.namelist()}, self.files)
+
+    def test_compressed_installers_are_stored(self):
+        meta = intunewin.build_intunewin(self.source, "Winget-InstallPackage.ps1", self.output)
+        with zipfile.ZipFile(self.output) as zf:
+            plain = self._decrypt(meta, zf.read(intunewin.CONTENTS_MEMBER))
+        with zipfile.ZipFile(io.BytesIO(plain)) as inner:
+            methods = {info.filename: info.compress_type for info in inner.infolist()}
+        self.assertEqual(methods["setup.msi"], zipfile.ZIP_STORED)
+        self.assertEqual(methods["payload.bin"], zipfile.ZIP_DEFLATED)
+
+    def test_uploader_reads_and_verifies_it(self):
+        built = intunewin.build_intunewin(self.source, "Winget-InstallPackage.ps1", self.output)
+        meta, payload = uploader._parse_detection_xml(self.output)
+        self.assertEqual(meta, built)
+        verifier = uploader._PayloadVerifier.for_package(meta, payload)
+        with payload.open() as fh:
+            for chunk in iter(lambda: fh.read(64 * 1024), b""):
+                verifier.update(chunk)
+        verifier.finish()
+
+    def test_zip64_contents(self):
+        with mock.patch.object(intunewin, "ZIP64_THRESHOLD", 0):
+            intunewin.build_intunewin(self.source, "Winget-InstallPackage.ps1", self.output)
+        with zipfile.ZipFile(self.output) as zf:
+            self.assertIsNone(zf.testzip())
+        meta, payload = uploader._parse_detection_xml(self.output)
+        with payload.open() as fh:
+            self.assertEqual(fh.read(32), base64.b64decode(meta["mac"]))
+
+    def test_missing_setup_file(self):
+        with self.assertRaises(FileNotFoundError):
+            intunewin.build_intunewin(self.source, "setup.exe", self.output)
+
+
+if __name__ == "__main__":
+    unittest.main()
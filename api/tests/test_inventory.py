@@ -0,0 +1,176 @@
+"""
+Tests for the local mirror of Intune's Win32 apps, synced from a Graph stub.
+"""
+
+import re
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from urllib.parse import parse_qs, urlencode, urlparse
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions.graph_client import GraphClient
+from api.functions.inventory import AppInventory, package_id_of
+from api.tests.stubs import GraphStubServer
+
+
+def _app(n, modified, assignments=()):
+    return {
+        "id": f"app-{n}",
+        "displayName": f"App {n}",
+        "publisher": "Contoso" if n % 2 else "Fabrikam",
+        "displayVersion": f"1.{n}",
+        "publishingState": "published",
+        "isAssigned": bool(assignments),
+        "createdDateTime": "2024-01-01T00:00:00Z",
+        "lastModifiedDateTime": modified,
+        "installCommandLine": f'powershell.exe -file Winget-InstallPackage.ps1 -mode install -PackageID "Vendor.App{n}"',
+        "description": "not selected",
+        "assignments": [
+            {"id": f"a-{n}-{group}", "intent": "required",
+             "target": {"@odata.type": "#microsoft.graph.groupAssignmentTarget", "groupId": group}}
+            for group in assignments
+        ],
+    }
+
+
+class FakeMobileApps:
+    """Answers mobileApps list queries: $top/$skiptoken paging, $select, $expand and the modified filter."""
+
+    def __init__(self, apps):
+        self.apps = {app["id"]: app for app in apps}
+        self.queries = []
+        self.origin = ""  # scheme and host for next links
+
+    def __call__(self, method, path, body):
+        url = urlparse(path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        self.queries.append(query)
+        apps = sorted(self.apps.values(), key=lambda app: app["id"])
+        since = re.search(r"lastModifiedDateTime ge (\S+)", query.get("$filter", ""))
+        if since:
+            apps = [app for app in apps if app["lastModifiedDateTime"] >= since.group(1)]
+        start = int(query.get("$skiptoken", 0))
+        top = int(query["$top"])
+        fields = query["$select"].split(",") + (["assignments"] if query.get("$expand") == "assignments" else [])
+        data = {"value": [{key: app[key] for key in fields if key in app} for app in apps[start:start + top]]}
+        if start + top < len(apps):
+            data["@odata.nextLink"] = f"{self.origin}{url.path}?" + urlencode(
+                {**query, "$skiptoken": start + top})
+        return 200, data, None
+
+
+class TestAppInventory(unittest.TestCase):
+    """AppInventory"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.graph = FakeMobileApps([_app(n, f"2024-02-0{n}T00:00:00.1234567Z", ["g1"] if n < 3 else [])
+                                     for n in range(1, 6)])
+        self.stub = GraphStubServer(self.graph).__enter__()
+        self.addCleanup(self.stub.__exit__)
+        self.graph.origin = self.stub.base_url[:-len("/beta")]
+        client = GraphClient(auth_headers=lambda: {}, tenant_id="inventory-test")
+        self.addCleanup(client.close)
+        self.inventory = AppInventory(str(Path(self.tmp.name) / "inventory.db"), graph_base=self.stub.base_url,
+                                      client_factory=lambda tenant_id: client, page_size=2)
+
+    def test_full_sync_mirrors_selected_fields_and_assignments(self):
+        result = self.inventory.sync()
+        self.assertEqual((result["full"], result["changed"], result["apps"]), (True, 5, 5))
+        self.assertEqual(len(self.graph.queries), 3, "5 apps in pages of 2")
+        self.assertIn("isof('microsoft.graph.win32LobApp')", self.graph.queries[0]["$filter"])
+
+        app = self.inventory.get("app-1")
+        self.assertEqual(app["package_id"], "Vendor.App1")
+        self.assertTrue(app["is_assigned"])
+        self.assertNotIn("description", app)
+        self.assertEqual(app["assignments"],
+                         [{"id": "a-1-g1", "intent": "required", "target_type": "groupAssignmentTarget",
+                           "group_id": "g1"}])
+        self.assertIsNone(self.inventory.get("app-9"))
+
+    def test_incremental_sync_fetches_changes_and_prunes_deletions(self):
+        self.inventory.sync()
+        self.graph.apps["app-2"]["displayName"] = "Renamed"
+        self.graph.apps["app-2"]["lastModifiedDateTime"] = "2024-03-01T00:00:00Z"
+        self.graph.apps["app-2"]["assignments"] = []
+        self.graph.apps["app-4"]["assignments"] = [{"id": "a-4", "intent": "available",
+                                                    "target": {"@odata.type": "#microsoft.graph.allDevicesAssignmentTarget"}}]
+        del self.graph.apps["app-5"]
+        self.graph.queries.clear()
+
+        result = self.inventory.sync()
+        self.assertFalse(result["full"])
+        self.assertEqual(result["removed"], 1)
+        self.assertEqual(result["apps"], 4)
+        changed = self.graph.queries[0]
+        self.assertIn("lastModifiedDateTime ge 2024-02-05T00:00:00.1234567Z", changed["$filter"])
+        self.assertEqual(changed["$expand"], "assignments")
+        self.assertEqual(result["changed"], 1)
+        self.assertEqual(self.inventory.get("app-2")["display_name"], "Renamed")
+        self.assertEqual(self.inventory.get("app-2")["assignments"], [])
+        self.assertIsNone(self.inventory.get("app-5"))
+        sweep = self.graph.queries[-1]
+        self.assertEqual(sweep["$select"], "id")
+        self.assertNotIn("$expand", sweep)
+        # unchanged apps keep their assignments until the next full sync
+        self.assertEqual(self.inventory.get("app-4")["assignments"], [])
+        self.assertTrue(self.inventory.sync(full=True)["full"])
+        self.assertEqual(self.inventory.get("app-4")["assignments"][0]["target_type"], "allDevicesAssignmentTarget")
+
+    def test_stale_mirror_gets_a_full_sync(self):
+        self.inventory.sync()
+        self.assertFalse(self.inventory.sync()["full"])
+        with self.inventory._connect() as conn:
+            conn.execute("UPDATE sync_state SET full_synced_at = full_synced_at - 3600")
+        self.inventory.full_sync_interval = 3600
+        self.assertTrue(self.inventory.sync()["full"])
+        self.assertIsNotNone(self.inventory.status()[0]["full_synced_at"])
+
+    def test_list_filters_and_pages(self):
+        self.inventory.sync()
+        page = self.inventory.list(limit=2, offset=2)
+        self.assertEqual(page["total"], 5)
+        self.assertEqual([app["id"] for app in page["items"]], ["app-3", "app-4"])
+        self.assertEqual({app["id"] for app in self.inventory.list(publisher="Contoso")["items"]},
+                         {"app-1", "app-3", "app-5"})
+        self.assertEqual([app["id"] for app in self.inventory.list(search="vendor.app4")["items"]], ["app-4"])
+        self.assertEqual(self.inventory.list(search="100%")["total"], 0)
+        self.assertEqual({app["id"] for app in self.inventory.list(group_id="g1")["items"]}, {"app-1", "app-2"})
+        self.assertEqual(self.inventory.list(assigned=False)["total"], 3)
+        self.assertEqual(self.inventory.list(order="modified")["items"][0]["id"], "app-5")
+        self.assertEqual(self.inventory.list(tenant_id="other-tenant")["total"], 0)
+        with self.assertRaises(ValueError):
+            self.inventory.list(order="size")
+
+    def test_packages_lists_versions_by_package_id(self):
+        self.inventory.sync()
+        packages = sorted(self.inventory.packages(), key=lambda app: app["id"])
+        self.assertEqual([(app["package_id"], app["display_version"]) for app in packages],
+                         [(f"Vendor.App{n}", f"1.{n}") for n in range(1, 6)])
+        self.assertEqual(self.inventory.packages("other-tenant"), [])
+
+    def test_failed_sync_keeps_mirror_and_reports_error(self):
+        self.inventory.sync()
+        self.stub.responder = lambda method, path, body: (400, {"error": {"code": "BadRequest"}}, None)
+        with self.assertRaises(Exception):
+            self.inventory.sync()
+        self.assertEqual(self.inventory.list()["total"], 5)
+        self.assertIn("400", self.inventory.status()[0]["last_error"])
+
+
+class TestPackageId(unittest.TestCase):
+    def test_from_install_command(self):
+        self.assertEqual(package_id_of('x -mode install -PackageID "Notepad++.Notepad++" -Log "a.log"'),
+                         "Notepad++.Notepad++")
+        self.assertIsNone(package_id_of("setup.exe /S"))
+        self.assertIsNone(package_id_of(None))
+
+
+if __name__ == "__main__":
+    unittest.main()
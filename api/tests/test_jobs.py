@@ -0,0 +1,64 @@
+"""
+Tests for the background job runner used by the upload endpoints.
+"""
+
+import sys
+import threading
+import unittest
+from pathlib import Path
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions.jobs import JobManager
+
+
+class TestJobManager(unittest.TestCase):
+    """JobManager"""
+
+    def setUp(self):
+        self.jobs = JobManager(max_workers=2)
+        self.addCleanup(self.jobs.shutdown)
+
+    def _wait(self, job):
+        self.jobs.shutdown(wait=True)
+        self.assertTrue(job.finished)
+
+    def test_progress_and_result(self):
+        release = threading.Event()
+
+        def work(name, progress):
+            progress("shell")
+            release.wait(5)
+            progress("upload", bytes_sent=10, total_bytes=20)
+            progress("upload", bytes_sent=20, total_bytes=20)
+            return f"app-{name}"
+
+        job = self.jobs.submit("upload", work, "x", params={"name": "x"})
+        self.assertIs(self.jobs.get(job.id), job)
+        release.set()
+        self._wait(job)
+
+        state = job.to_dict()
+        self.assertEqual(state["status"], "succeeded")
+        self.assertEqual(state["result"], "app-x")
+        self.assertEqual(state["params"], {"name": "x"})
+        stages = [e["stage"] for e in job.events_since(0)]
+        self.assertEqual(stages, [None, None, "shell", "upload", "upload", "done"])
+        self.assertEqual(job.events_since(0)[-1]["info"]["bytes_sent"], 20)
+        self.assertEqual(job.events_since(job.events_since(0)[-2]["seq"])[0]["stage"], "done")
+
+    def test_failure_is_recorded(self):
+        def work(progress):
+            progress("commit")
+            raise RuntimeError("commitFileFailed")
+
+        job = self.jobs.submit("upload", work)
+        self._wait(job)
+        self.assertEqual(job.status, "failed")
+        self.assertEqual(job.stage, "commit")
+        self.assertIn("commitFileFailed", job.error)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,179 @@
+"""
+Tests for deployment manifests: validation, planning against a Graph stub
+and applying the plan.
+"""
+
+import importlib.util
+import json
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions import manifest as manifests
+from api.functions.graph_batch import GraphBatcher
+from api.functions.detection import version_detection_rule
+from api.functions.graph_client import GraphClient
+from api.functions.manifest import DEFAULT_PACKAGE, ManifestError, apply_manifest, load_manifest, parse_manifest, \
+    plan_manifest
+from api.functions.winget_catalog import CatalogIndex, WingetCatalog
+from api.tests.stubs import GraphStubServer
+
+REGISTRY_RULE = {"@odata.type": "#microsoft.graph.win32LobAppRegistryRule", "ruleType": "detection",
+                 "keyPath": "HKEY_LOCAL_MACHINE\\SOFTWARE\\Vendor", "operationType": "exists"}
+
+
+def _live(app_id, package_id, **props):
+    return {"id": app_id, "lastModifiedDateTime": "2024-01-01T00:00:00Z",
+            "installCommandLine": f'powershell.exe -file Winget-InstallPackage.ps1 -mode install -PackageID "{package_id}"',
+            **props}
+
+
+class TestParseManifest(unittest.TestCase):
+    """parse_manifest / load_manifest"""
+
+    def test_normalises_entries(self):
+        manifest = parse_manifest({
+            "defaults": {"publisher": "Contoso", "overrides": {"notes": "managed"}},
+            "apps": [{"package_id": "Vendor.App", "display_name": "App", "detection": [REGISTRY_RULE],
+                      "overrides": {"minimum_supported_windows_release": "1809"}}],
+        })
+        app = manifest["apps"][0]
+        self.assertEqual(app["publisher"], "Contoso")
+        self.assertEqual(app["path"], str(DEFAULT_PACKAGE))
+        self.assertEqual(app["overrides"], {"notes": "managed", "minimum_supported_windows_release": "1809",
+                                            "rules": [REGISTRY_RULE]})
+
+    def test_rejects_invalid_manifests(self):
+        app = {"package_id": "Vendor.App", "display_name": "App"}
+        for bad in (
+            {"apps": [{**app, "colour": "red"}]},
+            {"apps": [app, {**app, "package_id": "vendor.app"}]},
+            {"apps": [{**app, "overrides": {"install_command_line": "x"}}]},
+            {"apps": [{**app, "overrides": {"applicable_architectures": "sparc"}}]},
+            {"apps": [{**app, "path": "missing.intunewin"}]},
+            {"apps": [{"display_name": "App"}]},
+            {"app": [app]},
+        ):
+            with self.subTest(bad=bad), self.assertRaises(ManifestError):
+                parse_manifest(bad)
+
+    @unittest.skipUnless(importlib.util.find_spec("yaml"), "PyYAML is not installed")
+    def test_loads_yaml_with_paths_relative_to_the_manifest(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            package = Path(tmp) / "custom.intunewin"
+            package.write_bytes(DEFAULT_PACKAGE.read_bytes())
+            path = Path(tmp) / "apps.yaml"
+            path.write_text("apps:\n  - package_id: Vendor.App\n    display_name: App\n    path: custom.intunewin\n")
+            self.assertEqual(load_manifest(path)["apps"][0]["path"], str(package))
+
+
+class TestPlanAndApply(unittest.TestCase):
+    """plan_manifest / apply_manifest"""
+
+    def setUp(self):
+        self.live = [
+            _live("app-same", "Vendor.Same", displayName="Same", publisher="Contoso",
+                  rules=[{**REGISTRY_RULE, "check32BitOn64System": False}]),
+            _live("app-old", "Vendor.Changed", displayName="Old name", publisher="Contoso",
+                  lastModifiedDateTime="2023-01-01T00:00:00Z"),
+            _live("app-changed", "Vendor.Changed", displayName="Old name", publisher="Contoso"),
+            _live("app-other", "Vendor.NotInManifest", displayName="Other"),
+        ]
+        self.patches = []
+        self.queries = []
+
+        def respond(method, path, body):
+            if method == "GET":
+                self.queries.append(path)
+                return 200, {"value": self.live}, None
+            if path.endswith("/$batch"):
+                responses = []
+                for item in body["requests"]:
+                    self.patches.append((item["method"], item["url"], item["body"]))
+                    responses.append({"id": item["id"], "status": 204, "body": None})
+                return 200, {"responses": responses}, None
+            return 404, {}, None
+
+        stub = GraphStubServer(respond).__enter__()
+        self.addCleanup(stub.__exit__)
+        self.base = stub.base_url
+        self.client = GraphClient(auth_headers=lambda: {})
+        self.addCleanup(self.client.close)
+        self.manifest = parse_manifest({"defaults": {"publisher": "Contoso"}, "apps": [
+            {"package_id": "Vendor.Same", "display_name": "Same", "detection": [REGISTRY_RULE]},
+            {"package_id": "Vendor.Changed", "display_name": "New name"},
+            {"package_id": "Vendor.New", "display_name": "New", "overrides": {"notes": "hi"}},
+        ]})
+
+    def test_plan_diffs_in_one_read(self):
+        plan = plan_manifest(self.manifest, client=self.client, graph_base=self.base)
+        self.assertEqual(len(self.queries), 1)
+        self.assertIn("isof", self.queries[0])
+        self.assertEqual(plan["counts"], {"create": 1, "update": 1, "skip": 1})
+        same, changed, new = plan["actions"]
+        self.assertEqual((same["action"], same["app_id"]), ("skip", "app-same"))
+        self.assertEqual((changed["action"], changed["app_id"]), ("update", "app-changed"))
+        self.assertEqual(changed["changes"], {"displayName": "New name"})
+        self.assertEqual((new["action"], new["app_id"]), ("create", None))
+
+    def test_apply_creates_and_patches(self):
+        batchers = []
+
+        def batcher(client):
+            batchers.append(GraphBatcher(client, graph_base=self.base))
+            return batchers[-1]
+
+        uploaded = [{"package_id": "Vendor.New", "status": "succeeded", "app_id": "app-new", "already_deployed": False}]
+        with mock.patch.object(manifests, "upload_intunewin_batch", return_value=uploaded) as upload:
+            outcome = apply_manifest(self.manifest, client=self.client, graph_base=self.base, max_workers=2,
+                                     batcher_factory=batcher)
+        for b in batchers:
+            b.close()
+
+        items, workers = upload.call_args.args
+        self.assertEqual(workers, 2)
+        self.assertEqual([item["package_id"] for item in items], ["Vendor.New"])
+        self.assertEqual(items[0]["overrides"], {"notes": "hi"})
+        self.assertEqual(self.patches, [("PATCH", "/deviceAppManagement/mobileApps/app-changed",
+                                         {"@odata.type": "#microsoft.graph.win32LobApp", "displayName": "New name"})])
+        self.assertEqual([(r["package_id"], r["action"], r["status"], r["app_id"]) for r in outcome["results"]], [
+            ("Vendor.Same", "skip", "succeeded", "app-same"),
+            ("Vendor.Changed", "update", "succeeded", "app-changed"),
+            ("Vendor.New", "create", "succeeded", "app-new"),
+        ])
+        self.assertEqual((outcome["succeeded"], outcome["failed"]), (3, 0))
+
+    def test_apply_records_the_catalog_version_of_created_apps(self):
+        catalog = WingetCatalog(local_path="unused")
+        catalog.index = CatalogIndex([{"Id": "Vendor.New", "Name": "New", "Version": "4.2", "Source": "winget"}])
+        uploaded = [{"package_id": "Vendor.New", "status": "succeeded", "app_id": "app-new", "already_deployed": False}]
+        with mock.patch.object(manifests, "upload_intunewin_batch", return_value=uploaded) as upload:
+            apply_manifest(self.manifest, client=self.client, graph_base=self.base, catalog=catalog,
+                           batcher_factory=lambda client: mock.Mock())
+
+        overrides = upload.call_args.args[0][0]["overrides"]
+        self.assertEqual(overrides["notes"], "hi")
+        self.assertEqual(overrides["display_version"], "4.2")
+        self.assertEqual(overrides["rules"], [version_detection_rule("Vendor.New", "4.2")])
+
+    def test_cli_plan_prints_actions(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "apps.json"
+            path.write_text(json.dumps({"apps": [{"package_id": "Vendor.New", "display_name": "New"}]}))
+            plan = lambda manifest, tenant_id=None: plan_manifest(manifest, tenant_id, self.client, self.base)
+            with mock.patch.object(manifests, "plan_manifest", side_effect=plan), \
+                    mock.patch("builtins.print") as printed:
+                code = manifests.main(["plan", str(path)])
+        self.assertEqual(code, 0)
+        lines = [call.args[0] for call in printed.call_args_list]
+        self.assertEqual(lines[0], "+ create Vendor.New")
+        self.assertIn("1 to create", lines[-1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,163 @@
+"""
+Tests for the metrics registry, its Prometheus exposition and the
+instrumentation of Graph requests and upload stages.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions import graph_client, metrics
+from api.functions.graph_client import GraphClient
+from api.functions.throttle import TokenBucket
+from api.tests.stubs import GraphStubServer
+
+
+class TestExposition(unittest.TestCase):
+    """Counter / Histogram / render"""
+
+    def setUp(self):
+        self.addCleanup(metrics.set_enabled, metrics.ENABLED)
+        metrics.set_enabled(True)
+
+    def test_counter_and_histogram_render(self):
+        requests_ = metrics.counter("test_render_total", "Requests", ("route",))
+        latency = metrics.histogram("test_render_seconds", "Latency", buckets=(0.1, 1))
+        self.addCleanup(requests_.clear)
+        self.addCleanup(latency.clear)
+        requests_.inc('/a"b')
+        requests_.inc('/a"b', amount=2)
+        for value in (0.05, 0.5, 5):
+            latency.observe(value)
+
+        text = metrics.render()
+        self.assertIn("# TYPE test_render_total counter\n", text)
+        self.assertIn('test_render_total{route="/a\\"b"} 3\n', text)
+        self.assertIn('test_render_seconds_bucket{le="0.1"} 1\n', text)
+        self.assertIn('test_render_seconds_bucket{le="1"} 2\n', text)
+        self.assertIn('test_render_seconds_bucket{le="+Inf"} 3\n', text)
+        self.assertIn("test_render_seconds_sum 5.55\n", text)
+        self.assertIn("test_render_seconds_count 3\n", text)
+
+    def test_same_name_returns_the_registered_metric(self):
+        first = metrics.counter("test_shared_total", "Shared", ("a",))
+        self.assertIs(metrics.counter("test_shared_total", "Shared", ("a",)), first)
+        with self.assertRaises(ValueError):
+            metrics.histogram("test_shared_total", "Shared")
+
+    def test_collectors_are_read_at_scrape_time(self):
+        state = {"hits": 1}
+        metrics.register_collector(lambda: [("test_collected_total", "counter", "Hits", [({}, state["hits"])])])
+        state["hits"] = 4
+        self.assertIn("test_collected_total 4\n", metrics.render())
+
+    def test_disabled_metrics_record_nothing(self):
+        counter = metrics.counter("test_disabled_total", "Disabled")
+        metrics.set_enabled(False)
+        counter.inc()
+        self.assertEqual(counter.value(), 0)
+
+    def test_route_templates(self):
+        self.assertEqual(
+            metrics.route_of("https://graph.microsoft.com/beta/deviceAppManagement/mobileApps/"
+                             "0f8fad5b-d9cb-469f-a165-70867728950e/microsoft.graph.win32LobApp/contentVersions/1"
+                             "?$select=id"),
+            "/deviceAppManagement/mobileApps/{id}/microsoft.graph.win32LobApp/contentVersions/{id}")
+        self.assertEqual(metrics.route_of("https://graph.microsoft.com/v1.0/$batch"), "/$batch")
+
+
+class TestTimedStages(unittest.TestCase):
+    """timed_stages"""
+
+    def setUp(self):
+        self.addCleanup(metrics.set_enabled, metrics.ENABLED)
+        metrics.set_enabled(True)
+        self.stages = metrics.histogram("test_stage_seconds", "Stages", ("stage",))
+        self.outcomes = metrics.counter("test_stage_outcomes_total", "Outcomes", ("outcome",))
+        self.addCleanup(self.stages.clear)
+        self.addCleanup(self.outcomes.clear)
+
+    def test_times_each_stage_and_forwards_progress(self):
+        @metrics.timed_stages(self.stages, self.outcomes)
+        def work(fail=False, progress=None):
+            progress("shell")
+            progress("upload", bytes_sent=1)
+            progress("upload", bytes_sent=2)
+            if fail:
+                raise RuntimeError("boom")
+            progress("publish")
+            return "app"
+
+        seen = []
+        self.assertEqual(work(progress=lambda stage, **info: seen.append((stage, info))), "app")
+        self.assertEqual(seen[1:3], [("upload", {"bytes_sent": 1}), ("upload", {"bytes_sent": 2})])
+        self.assertEqual([self.stages.count(stage) for stage in ("shell", "upload", "publish")], [1, 1, 1])
+        with self.assertRaises(RuntimeError):
+            work(fail=True)
+        self.assertEqual(self.stages.count("upload"), 2)
+        self.assertEqual((self.outcomes.value("succeeded"), self.outcomes.value("failed")), (1, 1))
+
+    def test_disabled_passes_the_callback_through(self):
+        metrics.set_enabled(False)
+        received = []
+        callback = lambda stage, **info: None  # noqa: E731
+
+        @metrics.timed_stages(self.stages, self.outcomes)
+        def work(progress=None):
+            received.append(progress)
+
+        work(progress=callback)
+        self.assertIs(received[0], callback)
+        self.assertEqual(self.outcomes.value("succeeded"), 0)
+
+    def test_stages_become_spans(self):
+        tracer, trace = mock.Mock(), mock.Mock()
+        with mock.patch.object(metrics, "_tracer", tracer), \
+                mock.patch.object(metrics, "otel_trace", trace, create=True):
+            @metrics.timed_stages(self.stages, self.outcomes)
+            def work(progress=None):
+                progress("shell")
+                progress("publish")
+
+            work()
+        names = [call.args[0] for call in tracer.start_span.call_args_list]
+        self.assertEqual(names, ["work", "work.shell", "work.publish"])
+        self.assertEqual(tracer.start_span.return_value.end.call_count, 3)
+
+
+class TestGraphRequestMetrics(unittest.TestCase):
+    """GraphClient.request instrumentation"""
+
+    def setUp(self):
+        self.addCleanup(metrics.set_enabled, metrics.ENABLED)
+        metrics.set_enabled(True)
+        self.throttled = 1
+
+        def respond(method, path, body):
+            if self.throttled:
+                self.throttled -= 1
+                return 429, {"error": {"code": "TooManyRequests"}}, {"Retry-After": "0"}
+            return 200, {"id": "x"}, None
+
+        stub = GraphStubServer(respond).__enter__()
+        self.addCleanup(stub.__exit__)
+        self.base = stub.base_url
+        self.client = GraphClient(auth_headers=lambda: {}, bucket=TokenBucket(rate=1000, capacity=1000))
+        self.addCleanup(self.client.close)
+
+    def test_counts_latency_and_retries_by_route(self):
+        route = "/deviceAppManagement/mobileApps/{id}"
+        before = (graph_client._REQUESTS.value("GET", route, "200"), graph_client._RETRIES.value("GET", route),
+                  graph_client._LATENCY.count("GET", route))
+        self.client.get(f"{self.base}/deviceAppManagement/mobileApps/0f8fad5b-d9cb-469f-a165-70867728950e")
+        after = (graph_client._REQUESTS.value("GET", route, "200"), graph_client._RETRIES.value("GET", route),
+                 graph_client._LATENCY.count("GET", route))
+        self.assertEqual([a - b for a, b in zip(after, before)], [1, 1, 1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""
+Tests for the shared backoff polling primitive.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+import requests
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions import polling
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def _throttled(status=429, retry_after="7"):
+    resp = requests.Response()
+    resp.status_code = status
+    resp.headers["Retry-After"] = retry_after
+    return requests.HTTPError("throttled", response=resp)
+
+
+class TestPollUntil(unittest.TestCase):
+    """poll_until"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def _poll(self, results, **kwargs):
+        it = iter(results)
+
+        def fetch():
+            value = next(it)
+            if isinstance(value, Exception):
+                raise value
+            return value
+
+        kwargs.setdefault("timeout", 100)
+        return polling.poll_until(fetch, bool, sleep=self.clock.sleep, clock=self.clock,
+                                  initial_delay=1, max_delay=8, backoff=2, jitter=0, **kwargs)
+
+    def test_backoff_grows_to_cap(self):
+        self.assertEqual(self._poll([0, 0, 0, 0, 0, 0, "ok"], stage="t-backoff"), "ok")
+        self.assertEqual(self.clock.sleeps, [1, 2, 4, 8, 8, 8])
+
+    def test_immediate_success_does_not_sleep(self):
+        self._poll(["ok"], stage="t-fast")
+        self.assertEqual(self.clock.sleeps, [])
+        self.assertEqual(polling.poll_stats()["t-fast"]["polls"], 1)
+
+    def test_retry_after_is_honoured(self):
+        self._poll([_throttled(), "ok"], stage="t-throttle")
+        self.assertEqual(self.clock.sleeps, [7.0])
+
+    def test_other_http_errors_propagate(self):
+        with self.assertRaises(requests.HTTPError):
+            self._poll([_throttled(status=404)], stage="t-404")
+
+    def test_deadline_is_monotonic_and_exact(self):
+        with self.assertRaises(TimeoutError) as ctx:
+            self._poll([0] * 100, stage="t-timeout", timeout=10, timeout_message="gave up")
+        self.assertEqual(str(ctx.exception), "gave up")
+        self.assertEqual(sum(self.clock.sleeps), 10)
+        stats = polling.poll_stats()["t-timeout"]
+        self.assertEqual(stats["timeouts"], 1)
+        self.assertEqual(stats["total_seconds"], 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+"""
+Tests for resuming an interrupted upload from its journal; Graph is mocked
+out and the blob goes to a local stub.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions import intune_win32_uploader as uploader
+from api.functions.deployments import DeploymentIndex
+from api.tests.stubs import BlobStubServer
+
+BLOCK = 4096
+
+
+class SimulatedCrash(Exception):
+    pass
+
+
+class TestResumableUpload(unittest.TestCase):
+    """upload_intunewin resume"""
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.journal_dir = Path(tmp.name) / "journal"
+        self.payload = os.urandom(20 * BLOCK + 99)
+        self.path = Path(tmp.name) / "payload.bin"
+        self.path.write_bytes(self.payload)
+        self.blob = BlobStubServer().__enter__()
+        self.addCleanup(self.blob.__exit__, None, None, None)
+
+        self.calls = []
+        self.sas_expired = False
+        meta = self.meta = {"file_name": "payload.bin", "unencrypted_size": 1, "file_digest": "digest"}
+        index = DeploymentIndex(str(Path(tmp.name) / "deployments.db"))
+
+        def record(name, result=None):
+            return lambda *args, **kwargs: self.calls.append(name) or result
+
+        def fake_graph(method, url, client=None, **kwargs):
+            self.calls.append(f"{method} {url.rsplit('/', 1)[-1]}")
+            if url.endswith("renewUpload"):
+                self.sas_expired = False
+                return None
+            if self.sas_expired:
+                return {"id": "file-1", "azureStorageUri": self.blob.sas_uri,
+                        "azureStorageUriExpirationDateTime": "2001-01-01T00:00:00.1234567Z"}
+            return {"id": "file-1", "azureStorageUri": self.blob.sas_uri + "&renewed=1",
+                    "azureStorageUriExpirationDateTime": "2999-01-01T00:00:00Z",
+                    "uploadState": "azureStorageUriRenewalSuccess"}
+
+        patches = {
+            "_parse_detection_xml": record("parse", (meta, uploader._FilePayload(self.path))),
+            "get_deployment_index": lambda: index,
+            "client_for": lambda tenant_id: None,
+            "_create_app_shell": record("shell", "app-1"),
+            "_create_content_version": record("content_version", "1"),
+            "_create_file_placeholder": record("file", {"id": "file-1"}),
+            "_wait_for_storage_uri": record("storage_uri", {"id": "file-1", "azureStorageUri": self.blob.sas_uri}),
+            "_graph_request": fake_graph,
+            "_commit_file": record("commit_file"),
+            "_wait_for_commit": record("wait_commit"),
+            "_commit_content_version": record("commit_version"),
+            "_wait_for_published": record("published"),
+        }
+        for name, value in patches.items():
+            patcher = mock.patch.object(uploader, name, side_effect=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        for target, value in {
+            "api.functions.journal.UPLOAD_JOURNAL_DIR": str(self.journal_dir),
+            "api.functions.intune_win32_uploader.BLOB_BLOCK_SIZE": BLOCK,
+            "api.functions.intune_win32_uploader.BLOB_UPLOAD_CONCURRENCY": 2,
+        }.items():
+            patcher = mock.patch(target, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def _upload(self):
+        return uploader.upload_intunewin(self.path, "App", "Vendor.App")
+
+    def _crash_after(self, blocks):
+        real_put = uploader._put_block
+        sent = []
+
+        def put(*args):
+            if len(sent) >= blocks:
+                raise SimulatedCrash()
+            sent.append(1)
+            return real_put(*args)
+
+        return mock.patch.object(uploader, "_put_block", side_effect=put)
+
+    def test_resume_skips_created_objects_and_staged_blocks(self):
+        with self._crash_after(8), self.assertRaises(SimulatedCrash):
+            self._upload()
+        staged = len(self.blob.blocks)
+        self.assertGreaterEqual(staged, 8)
+        self.assertEqual(len(list(self.journal_dir.iterdir())), 1)
+
+        self.blob.block_puts = 0
+        self.sas_expired = True
+        self.calls.clear()
+        self.assertEqual(self._upload(), "app-1")
+
+        self.assertNotIn("shell", self.calls)
+        self.assertNotIn("content_version", self.calls)
+        self.assertNotIn("file", self.calls)
+        self.assertIn("POST renewUpload", self.calls)
+        self.assertEqual(self.blob.block_puts, 21 - staged)
+        self.assertEqual(self.blob.blob, self.payload)
+        self.assertEqual(self.calls[-4:], ["commit_file", "wait_commit", "commit_version", "published"])
+        self.assertEqual(list(self.journal_dir.iterdir()), [], "journal is removed once published")
+
+    def test_resume_from_stored_zip_member(self):
+        # the payload sits inside the package, behind another member
+        package = self.path.with_suffix(".intunewin")
+        with zipfile.ZipFile(package, "w", zipfile.ZIP_STORED) as zf:
+            zf.writestr("IntuneWinPackage/Metadata/Detection.xml", "<ApplicationInfo/>" * 50)
+            zf.writestr("IntuneWinPackage/Contents/payload.bin", self.payload)
+        with zipfile.ZipFile(package) as zf:
+            payload = uploader._ZipPayload(package, zf.getinfo("IntuneWinPackage/Contents/payload.bin"))
+
+        with mock.patch.object(uploader, "_parse_detection_xml", return_value=(self.meta, payload)):
+            with self._crash_after(8), self.assertRaises(SimulatedCrash):
+                self._upload()
+            self.assertEqual(self._upload(), "app-1")
+        self.assertEqual(self.blob.blob, self.payload)
+
+    def test_identical_uploads_run_one_after_the_other(self):
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            results = list(pool.map(lambda _: self._upload(), range(2)))
+        self.assertEqual(results, ["app-1", "app-1"])
+        shells = [n for n, call in enumerate(self.calls) if call == "shell"]
+        self.assertEqual(len(shells), 2, "the stub never confirms the first app")
+        self.assertGreater(shells[1], self.calls.index("published"))
+        self.assertEqual(self.blob.blob, self.payload)
+        self.assertEqual(list(self.journal_dir.iterdir()), [])
+
+    def test_commit_is_not_sent_twice(self):
+        with mock.patch.object(uploader, "_wait_for_commit", side_effect=SimulatedCrash()), \
+                self.assertRaises(SimulatedCrash):
+            self._upload()
+        self.calls.clear()
+        self._upload()
+        self.assertNotIn("commit_file", self.calls)
+        self.assertIn("commit_version", self.calls)
+        self.assertEqual(self.blob.block_puts, 21, "blocks were only sent by the first attempt")
+
+    def test_fresh_upload_without_journal(self):
+        self._upload()
+        self.assertEqual(self.calls[:4], ["parse", "shell", "content_version", "file"])
+        self.assertEqual(self.blob.blob, self.payload)
+
+
+if __name__ == "__main__":
+    unittest.main()
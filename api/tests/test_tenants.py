@@ -0,0 +1,124 @@
+"""
+Tests for the tenant registry and multi-tenant fan-out uploads; Graph is
+mocked out and blobs go to local stubs.
+"""
+
+import os
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions import graph_batch, intune_win32_uploader as uploader
+from api.functions.tenants import TenantRegistry, UnknownTenantError
+from api.tests.stubs import BlobStubServer
+
+
+class TestTenantRegistry(unittest.TestCase):
+    """TenantRegistry"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.registry = TenantRegistry(Path(self.tmp.name) / "tenants.db")
+
+    def tearDown(self):
+        self.registry.close()
+        self.tmp.cleanup()
+
+    def test_add_list_remove(self):
+        self.registry.add("tenant-b", "client-b", "secret-b", name="Beta")
+        self.registry.add("tenant-a", "client-a", "secret-a", name="Alpha")
+        listed = self.registry.list()
+        self.assertEqual([t["tenant_id"] for t in listed], ["tenant-a", "tenant-b"])
+        self.assertNotIn("client_secret", listed[0])
+        self.assertTrue(self.registry.remove("tenant-a"))
+        self.assertFalse(self.registry.remove("tenant-a"))
+        self.assertIsNone(self.registry.get("tenant-a"))
+
+    def test_providers_and_clients_are_per_tenant_and_reused(self):
+        self.registry.add("tenant-a", "client-a", "secret-a")
+        self.registry.add("tenant-b", "client-b", "secret-b")
+        client_a = self.registry.client("tenant-a")
+        self.assertIs(self.registry.client("tenant-a"), client_a)
+        self.assertIsNot(self.registry.client("tenant-b"), client_a)
+        self.assertEqual(self.registry.provider("tenant-a").client_id, "client-a")
+        self.assertIsNot(client_a.bucket, self.registry.client("tenant-b").bucket)
+
+    def test_updating_credentials_drops_cached_provider(self):
+        self.registry.add("tenant-a", "client-a", "secret-a")
+        before = self.registry.provider("tenant-a")
+        self.registry.add("tenant-a", "client-a2", "secret-a2")
+        self.assertEqual(self.registry.provider("tenant-a").client_id, "client-a2")
+        self.assertIsNot(self.registry.provider("tenant-a"), before)
+
+    def test_unknown_tenant(self):
+        with self.assertRaises(UnknownTenantError):
+            self.registry.client("nope")
+
+    def test_client_held_across_a_credential_change_is_not_batched(self):
+        self.registry.add("tenant-a", "client-a", "secret-a")
+        held = self.registry.client("tenant-a")
+        self.registry.add("tenant-a", "client-a2", "secret-a2")
+        self.assertTrue(held.closed)
+        self.assertIsNot(self.registry.client("tenant-a"), held)
+        # a poll from an upload that started before the change goes out directly
+        with mock.patch.object(uploader, "GRAPH_BATCH_WINDOW", 0.01), \
+                mock.patch.object(held, "request", return_value={"uploadState": "commitFileSuccess"}) as request:
+            self.assertEqual(uploader._poll_get("https://graph/files/1", held), {"uploadState": "commitFileSuccess"})
+        request.assert_called_once_with("GET", "https://graph/files/1")
+        self.assertNotIn(held, graph_batch._batchers)
+
+
+class TestFanOutUpload(unittest.TestCase):
+    """upload_intunewin_to_tenants"""
+
+    def setUp(self):
+        fd, name = tempfile.mkstemp()
+        self.payload = os.urandom(40 * 1024 + 7)
+        with os.fdopen(fd, "wb") as fh:
+            fh.write(self.payload)
+        self.path = Path(name)
+        self.addCleanup(self.path.unlink)
+
+    def test_payload_read_once_and_sent_to_every_tenant(self):
+        meta = {"file_name": "x.intunewin", "unencrypted_size": 1}
+        payload = uploader._FilePayload(self.path)
+        reads = []
+        real_open = payload.open
+        payload.open = lambda: reads.append(1) or real_open()
+        finished = []
+
+        with BlobStubServer() as blob_a, BlobStubServer() as blob_b, BlobStubServer() as blob_d:
+            blob_d.faults = [403]
+            stubs = {"a": blob_a, "b": blob_b, "d": blob_d}
+
+            def fake_prepare(meta, payload, *args, client=None, progress=None, overrides=None):
+                assert overrides == {"display_version": "2.0"}
+                if client == "c":
+                    raise RuntimeError("no permission")
+                return f"app-{client}", "1", {"id": "file", "azureStorageUri": stubs[client].sas_uri}
+
+            with mock.patch.object(uploader, "_parse_detection_xml", return_value=(meta, payload)), \
+                    mock.patch.object(uploader, "client_for", side_effect=lambda tenant_id: tenant_id), \
+                    mock.patch.object(uploader, "_prepare_app", side_effect=fake_prepare), \
+                    mock.patch.object(uploader, "_finish_app",
+                                      side_effect=lambda app_id, *a, **kw: finished.append(app_id)), \
+                    mock.patch.object(uploader, "BLOB_BLOCK_SIZE", 4096):
+                results = uploader.upload_intunewin_to_tenants(
+                    self.path, "App", "Vendor.App", ["a", "b", "c", "d"], overrides={"display_version": "2.0"})
+
+        self.assertEqual([r["status"] for r in results], ["succeeded", "succeeded", "failed", "failed"])
+        self.assertEqual(results[0]["app_id"], "app-a")
+        self.assertIn("no permission", results[2]["error"])
+        self.assertEqual(blob_a.blob, self.payload)
+        self.assertEqual(blob_b.blob, self.payload)
+        self.assertEqual(len(reads), 1)
+        self.assertEqual(sorted(finished), ["app-a", "app-b"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,103 @@
+"""
+Tests for the retry / rate-limit layer, using local stubs that inject 429s.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+import requests
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions import intune_win32_uploader as uploader
+from api.functions import throttle
+from api.functions.graph_client import GraphClient
+from api.functions.throttle import TokenBucket
+from api.tests.stubs import BlobStubServer, GraphStubServer
+from api.tests.test_polling import FakeClock
+
+
+def _headers():
+    return {"Authorization": "Bearer test-token"}
+
+
+def _throttling_responder(failures, status=429):
+    remaining = {"n": failures}
+
+    def responder(method, path, body):
+        if remaining["n"]:
+            remaining["n"] -= 1
+            return status, {"error": {"code": "TooManyRequests"}}, {"Retry-After": "0"}
+        return 200, {"id": "app-1"}, None
+
+    return responder
+
+
+class TestTokenBucket(unittest.TestCase):
+    """TokenBucket"""
+
+    def test_burst_then_rate(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=2, capacity=3, clock=clock, sleep=clock.sleep)
+        for _ in range(3):
+            self.assertEqual(bucket.acquire(), 0)
+        bucket.acquire()
+        bucket.acquire()
+        self.assertEqual(clock.sleeps, [0.5, 0.5])
+
+    def test_hold_pauses_everyone(self):
+        clock = FakeClock()
+        bucket = TokenBucket(rate=100, capacity=100, clock=clock, sleep=clock.sleep)
+        bucket.hold(5)
+        self.assertEqual(bucket.acquire(), 5)
+
+    def test_buckets_are_per_tenant(self):
+        self.assertIs(throttle.bucket_for("tenant-a"), throttle.bucket_for("tenant-a"))
+        self.assertIsNot(throttle.bucket_for("tenant-a"), throttle.bucket_for("tenant-b"))
+
+
+class TestRetry(unittest.TestCase):
+    """Retries against stub servers"""
+
+    def setUp(self):
+        self.bucket = TokenBucket(rate=1e9, capacity=10 ** 9)
+
+    def test_graph_429_is_retried(self):
+        with GraphStubServer(_throttling_responder(2)) as stub:
+            client = GraphClient(auth_headers=_headers, bucket=self.bucket)
+            result = client.post(f"{stub.base_url}/deviceAppManagement/mobileApps", json={})
+            client.close()
+        self.assertEqual(result, {"id": "app-1"})
+        self.assertEqual(len(stub.requests), 3)
+
+    def test_post_is_not_retried_on_503(self):
+        with GraphStubServer(_throttling_responder(1, status=503)) as stub:
+            client = GraphClient(auth_headers=_headers, bucket=self.bucket)
+            with self.assertRaises(requests.HTTPError):
+                client.post(f"{stub.base_url}/deviceAppManagement/mobileApps", json={})
+            client.close()
+        self.assertEqual(len(stub.requests), 1)
+
+    def test_gives_up_after_max_attempts(self):
+        with GraphStubServer(_throttling_responder(100)) as stub:
+            with requests.Session() as session:
+                resp = throttle.send_with_retry(
+                    lambda: session.get(f"{stub.base_url}/deviceAppManagement/mobileApps"),
+                    "GET", max_attempts=3, sleep=lambda s: None,
+                )
+        self.assertEqual(resp.status_code, 429)
+        self.assertEqual(resp.attempts, 3)
+        self.assertEqual(len(stub.requests), 3)
+
+    def test_blob_blocks_are_retried(self):
+        path = Path(__file__).resolve().parent.parent / "files" / "Winget-InstallPackage.intunewin"
+        with BlobStubServer() as stub:
+            stub.faults = [503, 429, 500]
+            uploader._upload_to_blob(path, stub.sas_uri, block_size=256, concurrency=2)
+        self.assertEqual(stub.blob, path.read_bytes())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+"""
+Tests for TokenProvider, using a fake MSAL application instead of Entra ID.
+"""
+
+import sys
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions.auth import TokenProvider
+
+
+class FakeMsalApp:
+    """Counts token requests; each one returns a new token."""
+
+    instances = 0
+
+    def __init__(self, expires_in=3600, delay=0.0, fail=False, **kwargs):
+        FakeMsalApp.instances += 1
+        self.expires_in = expires_in
+        self.delay = delay
+        self.fail = fail
+        self.calls = []
+        self._lock = threading.Lock()
+
+    def acquire_token_for_client(self, scopes):
+        time.sleep(self.delay)
+        with self._lock:
+            self.calls.append(tuple(scopes))
+            n = len(self.calls)
+        if self.fail:
+            return {"error": "invalid_client", "error_description": "bad secret"}
+        return {"access_token": f"token-{n}", "expires_in": self.expires_in}
+
+
+def _provider(provider_kwargs=None, **app_kwargs):
+    apps = []
+
+    def factory(**kwargs):
+        apps.append(FakeMsalApp(**app_kwargs))
+        return apps[-1]
+
+    provider = TokenProvider("client", "secret", "tenant", app_factory=factory, **(provider_kwargs or {}))
+    return provider, apps
+
+
+class TestTokenProvider(unittest.TestCase):
+    """TokenProvider"""
+
+    def test_concurrent_callers_share_one_acquisition(self):
+        provider, apps = _provider(delay=0.2)
+        with ThreadPoolExecutor(max_workers=20) as pool:
+            tokens = list(pool.map(lambda _: provider.get_token(), range(20)))
+        provider.close()
+        self.assertEqual(set(tokens), {"token-1"})
+        self.assertEqual(len(apps), 1)
+        self.assertEqual(len(apps[0].calls), 1)
+
+    def test_tokens_are_cached_per_scope(self):
+        provider, apps = _provider()
+        graph = provider.get_token()
+        other = provider.get_token(["https://api.example/.default"])
+        self.assertNotEqual(graph, other)
+        self.assertEqual(provider.get_token(), graph)
+        self.assertEqual(provider.get_token(["https://api.example/.default"]), other)
+        provider.close()
+        self.assertEqual(len(apps[0].calls), 2)
+
+    def test_refreshes_ahead_of_expiry_in_background(self):
+        # 61s token, refreshed 60.8s before expiry: the timer fires after ~0.2s
+        provider, apps = _provider({"refresh_margin": 60.8, "retry_interval": 0.1}, expires_in=61)
+        self.assertEqual(provider.get_token(), "token-1")
+        deadline = time.monotonic() + 5
+        while len(apps[0].calls) < 2 and time.monotonic() < deadline:
+            time.sleep(0.05)
+        provider.close()
+        self.assertGreaterEqual(len(apps[0].calls), 2)
+        # callers pick up the refreshed token without acquiring themselves
+        self.assertNotEqual(provider.get_token(), "token-1")
+
+    def test_failure_returns_none(self):
+        provider, apps = _provider(fail=True)
+        self.assertIsNone(provider.get_token())
+        provider.close()
+        self.assertEqual(provider.acquisitions, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
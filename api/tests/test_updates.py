@@ -0,0 +1,156 @@
+"""
+Tests for the winget update pipeline and its version-aware detection rules.
+"""
+
+import base64
+import sys
+import threading
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions import updates as update_module
+from api.functions.detection import catalog_overrides, version_detection_rule, version_detection_script
+from api.functions.graph_batch import GraphBatcher
+from api.functions.graph_client import GraphClient
+from api.functions.updates import UpdatePipeline
+from api.functions.winget_catalog import CatalogIndex, WingetCatalog
+from api.tests.stubs import GraphStubServer
+
+CATALOG = [("Vendor.Old", "10.1"), ("Vendor.Current", "1.5"), ("Vendor.Unversioned", "3.0")]
+
+
+def _row(app_id, package_id, version, modified="2024-01-01T00:00:00Z"):
+    return {"id": app_id, "package_id": package_id, "display_name": package_id.split(".")[1],
+            "publisher": "Vendor", "display_version": version, "modified_at": modified}
+
+
+class TestVersionDetection(unittest.TestCase):
+    """version_detection_script / version_detection_rule"""
+
+    def test_script_embeds_quoted_id_and_version(self):
+        script = version_detection_script("Vendor.O'Brien", "1.2.3")
+        self.assertIn("$PackageId = 'Vendor.O''Brien'", script)
+        self.assertIn("$Wanted = '1.2.3'", script)
+        self.assertIn("list --id $PackageId --exact", script)
+        with self.assertRaises(ValueError):
+            version_detection_script("Vendor.App", "")
+
+    def test_rule_carries_the_script(self):
+        rule = version_detection_rule("Vendor.App", "2.0")
+        self.assertEqual(rule["@odata.type"], "#microsoft.graph.win32LobAppPowerShellScriptRule")
+        self.assertEqual(base64.b64decode(rule["scriptContent"]).decode(),
+                         version_detection_script("Vendor.App", "2.0"))
+
+    def test_first_deployment_takes_the_catalog_version(self):
+        catalog = WingetCatalog(local_path="unused")
+        self.assertIsNone(catalog_overrides(catalog, "Vendor.App"), "not loaded: unversioned")
+        catalog.index = CatalogIndex([{"Id": "Vendor.App", "Name": "App", "Version": "2.0", "Source": "winget"}])
+
+        overrides = catalog_overrides(catalog, "vendor.app")
+        self.assertEqual(overrides["display_version"], "2.0")
+        self.assertEqual(overrides["rules"], [version_detection_rule("Vendor.App", "2.0")])
+        self.assertEqual(catalog_overrides(catalog, "Vendor.App", {"rules": []})["rules"], [])
+        self.assertEqual(catalog_overrides(catalog, "Vendor.Gone", {"notes": "x"}), {"notes": "x"})
+
+
+class TestUpdatePipeline(unittest.TestCase):
+    """UpdatePipeline"""
+
+    def setUp(self):
+        self.catalog = WingetCatalog(local_path="unused")
+        self.catalog.index = CatalogIndex([{"Id": i, "Name": i, "Version": v, "Source": "winget"}
+                                           for i, v in CATALOG])
+        self.inventory = mock.Mock()
+        self.inventory.packages.return_value = [
+            _row("app-old-9", "Vendor.Old", "9.0", modified="2024-06-01T00:00:00Z"),
+            _row("app-old-10", "vendor.old", "10.0"),  # newest by version, not by date
+            _row("app-current", "Vendor.Current", "1.5"),
+            _row("app-unversioned", "Vendor.Unversioned", None),
+            _row("app-gone", "Vendor.Gone", "1.0"),
+        ]
+
+        self.requests = []
+        self.lock = threading.Lock()
+
+        def respond(method, path, body):
+            responses = []
+            for item in body["requests"]:
+                with self.lock:
+                    self.requests.append((item["method"], item["url"], item["body"]))
+                responses.append({"id": item["id"], "status": 204, "body": None})
+            return 200, {"responses": responses}, None
+
+        stub = GraphStubServer(respond).__enter__()
+        self.addCleanup(stub.__exit__)
+        self.client = GraphClient(auth_headers=lambda: {})
+        self.addCleanup(self.client.close)
+        batcher = GraphBatcher(self.client, graph_base=stub.base_url, window=0.05)
+        self.addCleanup(batcher.close)
+        self.assigner = mock.Mock()
+        self.assigner.copy.side_effect = lambda apps: dict.fromkeys(apps, {"status": "succeeded", "assignments": 2})
+        self.pipeline_args = dict(inventory=self.inventory, client_factory=lambda tenant_id: self.client,
+                                  graph_base=stub.base_url, batcher_factory=lambda client: batcher,
+                                  assigner_factory=lambda client: self.assigner)
+
+    def test_plan_compares_newest_version_with_catalog(self):
+        plan = UpdatePipeline(self.catalog, **self.pipeline_args).plan()
+        self.assertEqual(plan["updates"], [{
+            "package_id": "Vendor.Old", "app_id": "app-old-10", "display_name": "old", "publisher": "Vendor",
+            "installed_version": "10.0", "available_version": "10.1",
+        }])
+        self.assertEqual(plan["current"], ["Vendor.Current"])
+        self.assertEqual(plan["unversioned"], ["Vendor.Unversioned"])
+        self.assertEqual(plan["not_in_catalog"], ["Vendor.Gone"])
+
+        plan = UpdatePipeline(self.catalog, **self.pipeline_args).plan(include_unversioned=True)
+        self.assertEqual([u["app_id"] for u in plan["updates"]], ["app-old-10", "app-unversioned"])
+
+    def test_supersede_uploads_new_apps_and_links_them(self):
+        uploaded = [{"package_id": "Vendor.Old", "status": "succeeded", "app_id": "app-new", "already_deployed": False},
+                    {"package_id": "Vendor.Unversioned", "status": "failed", "error": "boom"}]
+        pipeline = UpdatePipeline(self.catalog, mode="supersede", **self.pipeline_args)
+        with mock.patch.object(update_module, "upload_intunewin_batch", return_value=uploaded) as upload:
+            outcome = pipeline.run(include_unversioned=True)
+
+        self.inventory.sync.assert_called_once_with(None)
+        items = upload.call_args.args[0]
+        self.assertFalse(items[0]["reuse"])
+        self.assertNotIn("app_id", items[0])
+        self.assertEqual(items[0]["overrides"]["display_version"], "10.1")
+        self.assertEqual(items[0]["overrides"]["rules"], [version_detection_rule("Vendor.Old", "10.1")])
+        self.assertEqual(self.requests, [("POST", "/deviceAppManagement/mobileApps/app-new/updateRelationships", {
+            "relationships": [{"@odata.type": "#microsoft.graph.mobileAppSupersedence",
+                               "targetId": "app-old-10", "supersedenceType": "update"}]})])
+        self.assigner.copy.assert_called_once_with({"app-new": "app-old-10"})
+        self.assertEqual([(r["app_id"], r.get("new_app_id"), r["status"]) for r in outcome["results"]],
+                         [("app-old-10", "app-new", "succeeded"), ("app-unversioned", None, "failed")])
+        self.assertEqual((outcome["succeeded"], outcome["failed"]), (1, 1))
+        self.assertEqual(pipeline.status()["last_runs"][update_module.tenant_key(None)]["succeeded"], 1)
+
+    def test_content_version_updates_the_existing_app(self):
+        uploaded = [{"package_id": "Vendor.Old", "status": "succeeded", "app_id": "app-old-10",
+                     "already_deployed": False}]
+        pipeline = UpdatePipeline(self.catalog, mode="content_version", **self.pipeline_args)
+        with mock.patch.object(update_module, "upload_intunewin_batch", return_value=uploaded) as upload:
+            outcome = pipeline.run(sync=False)
+
+        self.inventory.sync.assert_not_called()
+        item = upload.call_args.args[0][0]
+        self.assertEqual((item["app_id"], item["reuse"]), ("app-old-10", False))
+        self.assertEqual(self.requests, [("PATCH", "/deviceAppManagement/mobileApps/app-old-10", {
+            "@odata.type": "#microsoft.graph.win32LobApp", "displayVersion": "10.1",
+            "rules": [version_detection_rule("Vendor.Old", "10.1")]})])
+        self.assigner.copy.assert_not_called()
+        self.assertEqual(outcome["results"][0]["status"], "succeeded")
+
+    def test_rejects_unknown_mode(self):
+        with self.assertRaises(ValueError):
+            UpdatePipeline(self.catalog, mode="replace", **self.pipeline_args)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,104 @@
+"""
+Tests for the Win32LobApp model and the app shell the uploader creates from it.
+"""
+
+import json
+import sys
+import unittest
+from unittest import mock
+from pathlib import Path
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.classes.win32app import Win32LobApp
+from api.functions.graph_client import GraphClient
+from api.functions import intune_win32_uploader as uploader
+from api.tests.stubs import GraphStubServer
+
+
+def _app(**kwargs):
+    fields = dict(display_name="Notepad++", description="Text editor", publisher="Don Ho",
+                  install_command_line="install.cmd", uninstall_command_line="uninstall.cmd",
+                  setup_file_path="setup.exe")
+    fields.update(kwargs)
+    return Win32LobApp(**fields)
+
+
+class TestWin32LobApp(unittest.TestCase):
+    """Win32LobApp"""
+
+    def test_serializes_required_and_set_fields_only(self):
+        body = json.loads(_app(msi_information={"productCode": "{X}"}).to_json())
+        self.assertEqual(body["@odata.type"], "#microsoft.graph.win32LobApp")
+        self.assertEqual(body["setupFilePath"], "setup.exe")
+        self.assertEqual(body["applicableArchitectures"], "x64")
+        self.assertEqual(body["installExperience"]["@odata.type"], "#microsoft.graph.win32LobAppInstallExperience")
+        self.assertEqual(body["msiInformation"], {"@odata.type": "#microsoft.graph.win32LobAppMsiInformation",
+                                                  "productCode": "{X}"})
+        self.assertNotIn("publishingState", body)
+        self.assertNotIn("rules", body)
+
+    def test_json_is_cached_until_mutated(self):
+        app = _app()
+        first = app.to_json()
+        self.assertIs(app.to_json(), first)
+
+        app.display_name = "Notepad++ (x64)"
+        self.assertEqual(json.loads(app.to_json())["displayName"], "Notepad++ (x64)")
+
+        app.add_return_code({"returnCode": 3010, "type": "softReboot"})
+        self.assertEqual(json.loads(app.to_json())["returnCodes"][0]["returnCode"], 3010)
+
+        app.return_codes[0]["type"] = "hardReboot"
+        app.invalidate()
+        self.assertEqual(json.loads(app.to_json())["returnCodes"][0]["type"], "hardReboot")
+
+    def test_has_no_instance_dict(self):
+        app = _app()
+        self.assertFalse(hasattr(app, "__dict__"))
+        with self.assertRaises(AttributeError):
+            app.display_nme = "typo"
+
+    def test_invalid_apps_are_rejected(self):
+        with self.assertRaises(ValueError):
+            _app(setup_file_path="")
+        with self.assertRaises(ValueError):
+            _app(publisher=None)
+        with self.assertRaises(ValueError):
+            _app(applicable_architectures="x64,sparc")
+        with self.assertRaises(ValueError):
+            _app(rules={"ruleType": "detection"})
+        _app(description="", applicable_architectures="x86, x64")
+
+
+class TestCreateAppShell(unittest.TestCase):
+    """_create_app_shell"""
+
+    def test_posts_the_model_body(self):
+        bodies = []
+
+        def respond(method, path, body):
+            bodies.append(body)
+            return 201, {"id": "app-1"}, None
+
+        with GraphStubServer(respond) as stub:
+            client = GraphClient(auth_headers=lambda: {})
+            self.addCleanup(client.close)
+            with mock.patch.object(uploader, "GRAPH_BASE", stub.base_url):
+                app_id = uploader._create_app_shell("Notepad++", None, "Don Ho", "setup.exe",
+                                                    "Notepad++.Notepad++", client=client)
+        self.assertEqual(app_id, "app-1")
+        body = bodies[0]
+        self.assertEqual(body["description"], "Notepad++")
+        self.assertEqual(body["fileName"], "setup.exe")
+        self.assertIn('-mode install -PackageID "Notepad++.Notepad++"', body["installCommandLine"])
+        self.assertIn("-mode uninstall", body["uninstallCommandLine"])
+        self.assertEqual(body["installExperience"], {"@odata.type": "#microsoft.graph.win32LobAppInstallExperience",
+                                                     "runAsAccount": "system", "deviceRestartBehavior": "suppress"})
+        self.assertEqual(body["rules"][0]["ruleType"], "detection")
+        self.assertEqual(body["minimumSupportedWindowsRelease"], "1607")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,159 @@
+"""
+Tests for the winget search wrappers, using a fake `winget` on PATH.
+"""
+
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest import mock
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions import winget
+from api.tests.stubs import write_fake_winget
+
+
+RECORDED = (
+    "   - \r   \\ \r"
+    "Name                         Id                          Version     Match            Source\n"
+    "-------------------------------------------------------------------------------------------\n"
+    "Visual Studio Code           Microsoft.VisualStudioCode  1.95.3                       winget\n"
+    "微信                         Tencent.WeChat              3.9.12      Tag: chat        winget\n"
+    "Très Long Application Name…  Vendor.VeryLongIdentifie…   2.0                          winget\n"
+    "Another App                  Vendor.Another              1.0         Moniker: other   winget\n"
+)
+
+
+class TestWingetTableParser(unittest.TestCase):
+    """WingetTableParser / parse_winget_output"""
+
+    def test_recorded_output(self):
+        apps = winget.parse_winget_output(RECORDED)
+        self.assertEqual([a["Id"] for a in apps],
+                         ["Microsoft.VisualStudioCode", "Tencent.WeChat", "Vendor.Another"])
+        # wide characters in Name must not shift the following columns
+        self.assertEqual(apps[1], {"Name": "微信", "Id": "Tencent.WeChat", "Version": "3.9.12", "Source": "winget"})
+        # the Match column is not mistaken for part of the version
+        self.assertEqual(apps[2]["Version"], "1.0")
+
+    def test_rows_are_yielded_one_at_a_time(self):
+        parser = winget.WingetTableParser()
+        lines = RECORDED.split("\n")
+        self.assertIsNone(parser.feed(lines[0]))  # spinner, then the header
+        self.assertIsNotNone(parser.columns)
+        self.assertIsNone(parser.feed(lines[1]))
+        self.assertEqual(parser.feed(lines[2])["Id"], "Microsoft.VisualStudioCode")
+        parser.feed(lines[4])
+        self.assertEqual(parser.truncated, 1)
+
+    def test_structured_lines(self):
+        line = '{"Name":"Git","Id":"Git.Git","Version":"2.47.0","Source":"winget"}'
+        self.assertEqual(winget._parse_json_line(line)["Id"], "Git.Git")
+        self.assertIsNone(winget._parse_json_line("WARNING: something"))
+
+
+@unittest.skipIf(os.name == "nt", "fake winget script needs a POSIX shebang")
+class TestWingetSearch(unittest.IsolatedAsyncioTestCase):
+    """search_winget_packages / search_winget_packages_async"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        patcher = mock.patch.dict(os.environ, {"PATH": self.tmp.name + os.pathsep + os.environ["PATH"]})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    async def test_async_search_parses_results(self):
+        write_fake_winget(self.tmp.name, rows=2)
+        apps = await winget.search_winget_packages_async("notepad")
+        self.assertEqual([a["Id"] for a in apps], ["Fake.Echo", "Fake.App0", "Fake.App1"])
+        self.assertEqual(apps[1], {"Name": "Fake App 0", "Id": "Fake.App0", "Version": "1.0", "Source": "winget"})
+
+    async def test_search_term_is_not_shell_interpreted(self):
+        write_fake_winget(self.tmp.name, rows=0)
+        term = 'x"; touch pwned; echo "'
+        apps = await winget.search_winget_packages_async(term)
+        self.assertEqual(apps[0]["Name"], ("Echo " + term)[:40].strip())
+        self.assertFalse(Path("pwned").exists())
+        self.assertEqual(winget.search_winget_packages(term)[0]["Name"], apps[0]["Name"])
+
+    async def test_results_stream_before_winget_exits(self):
+        write_fake_winget(self.tmp.name, rows=3, row_delay=0.5)
+        started = time.monotonic()
+        stream = winget.iter_winget_search("x")
+        first = await stream.__anext__()
+        self.assertEqual(first["Id"], "Fake.Echo")
+        self.assertLess(time.monotonic() - started, 1.0)
+        await stream.aclose()  # abandoning the stream kills winget
+
+    async def test_timeout_kills_process(self):
+        write_fake_winget(self.tmp.name, delay=5)
+        started = time.monotonic()
+        with self.assertRaises(asyncio.TimeoutError):
+            await winget.search_winget_packages_async("slow", timeout=0.3)
+        self.assertLess(time.monotonic() - started, 2)
+
+    async def test_failed_search_raises(self):
+        fake = Path(self.tmp.name) / "winget"
+        fake.write_text("#!/bin/sh\necho 'source unavailable' >&2\nexit 3\n")
+        fake.chmod(0o755)
+        with self.assertRaises(subprocess.CalledProcessError) as caught:
+            await winget.search_winget_packages_async("notepad")
+        self.assertIn("source unavailable", caught.exception.stderr)
+
+    async def test_no_match_is_an_empty_result(self):
+        async def no_match(command, *args):
+            raise subprocess.CalledProcessError(winget.WINGET_NO_MATCH - 2 ** 32, command[0])
+            yield
+
+        with mock.patch.object(winget, "_stream_process", no_match), \
+                mock.patch.object(winget, "WINGET_SEARCH_MODE", "table"):
+            self.assertEqual(await winget.search_winget_packages_async("nothing"), [])
+
+    async def test_unavailable_structured_search_falls_back_to_the_cli(self):
+        write_fake_winget(self.tmp.name, rows=1)
+        with mock.patch.object(winget, "_structured_available", None), \
+                mock.patch.object(winget, "_use_structured", lambda: winget._structured_available is not False), \
+                mock.patch.object(winget, "_structured_search_command", lambda: [sys.executable, "-c", "exit(1)"]), \
+                self.assertLogs(winget.logger, "WARNING") as logs:
+            apps = await winget.search_winget_packages_async("x")
+            self.assertFalse(winget._structured_available)
+        self.assertEqual([a["Id"] for a in apps], ["Fake.Echo", "Fake.App0"])
+        self.assertIn("Structured winget search unavailable, using winget CLI", logs.output[0])
+
+    async def test_concurrency_is_bounded(self):
+        write_fake_winget(self.tmp.name, delay=0.3)
+        with mock.patch.object(winget, "WINGET_MAX_PROCESSES", 2):
+            started = time.monotonic()
+            await asyncio.gather(*(winget.search_winget_packages_async(f"q{i}") for i in range(4)))
+            elapsed = time.monotonic() - started
+        self.assertGreaterEqual(elapsed, 0.6)
+
+
+
+class TestWingetSearchLoops(unittest.TestCase):
+    """iter_winget_search across event loops"""
+
+    def test_each_event_loop_gets_its_own_process_slots(self):
+        with tempfile.TemporaryDirectory() as tmp, \
+                mock.patch.dict(os.environ, {"PATH": tmp + os.pathsep + os.environ["PATH"]}), \
+                mock.patch.object(winget, "WINGET_MAX_PROCESSES", 1):
+            write_fake_winget(tmp, delay=0.05, rows=0)
+
+            async def searches():
+                searches = (winget.search_winget_packages_async(f"q{i}") for i in range(5))
+                return await asyncio.wait_for(asyncio.gather(*searches), 10)
+
+            # the second loop waits for slots too, which a semaphore bound to the first would refuse
+            for _ in range(2):
+                self.assertEqual([len(apps) for apps in asyncio.run(searches())], [1] * 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,142 @@
+"""
+Tests for the in-memory winget catalog index.
+"""
+
+import sqlite3
+import sys
+import tempfile
+import time
+import unittest
+import zipfile
+from pathlib import Path
+
+# Add the parent directory to sys.path to ensure imports work correctly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent))
+
+from api.functions.winget_catalog import CatalogIndex, WingetCatalog, load_source, version_key
+
+PACKAGES = [
+    ("Microsoft.VisualStudioCode", "Microsoft Visual Studio Code", "vscode", "1.95.3"),
+    ("Notepad++.Notepad++", "Notepad++", "notepad++", "8.7.1"),
+    ("Mozilla.Firefox", "Mozilla Firefox", "firefox", "132.0.2"),
+    ("VideoLAN.VLC", "VLC media player", "vlc", "3.0.21"),
+    ("Git.Git", "Git", "git", "2.47.0"),
+]
+
+
+def write_v2_db(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE packages (rowid INTEGER PRIMARY KEY, id TEXT, name TEXT, moniker TEXT, "
+                 "latest_version TEXT, arp_min_version TEXT, arp_max_version TEXT, hash BLOB)")
+    conn.executemany("INSERT INTO packages (id, name, moniker, latest_version) VALUES (?, ?, ?, ?)", PACKAGES)
+    conn.commit()
+    conn.close()
+
+
+def write_v1_db(path):
+    conn = sqlite3.connect(path)
+    for table, column in (("ids", "id"), ("names", "name"), ("monikers", "moniker"), ("versions", "version")):
+        conn.execute(f"CREATE TABLE {table} (rowid INTEGER PRIMARY KEY, {column} TEXT)")
+    conn.execute("CREATE TABLE manifest (rowid INTEGER PRIMARY KEY, id INT64, name INT64, moniker INT64, "
+                 "version INT64, channel INT64, pathpart INT64)")
+    for n, (pkg_id, name, moniker, version) in enumerate(PACKAGES, start=1):
+        conn.execute("INSERT INTO ids VALUES (?, ?)", (n, pkg_id))
+        conn.execute("INSERT INTO names VALUES (?, ?)", (n, name))
+        conn.execute("INSERT INTO monikers VALUES (?, ?)", (n, moniker))
+        conn.execute("INSERT INTO versions VALUES (?, ?)", (n, version))
+        conn.execute("INSERT INTO versions VALUES (?, ?)", (100 + n, "0.9"))
+        conn.execute("INSERT INTO manifest (id, name, moniker, version) VALUES (?, ?, ?, ?)", (n, n, n, 100 + n))
+        conn.execute("INSERT INTO manifest (id, name, moniker, version) VALUES (?, ?, ?, ?)", (n, n, n, n))
+    conn.commit()
+    conn.close()
+
+
+class TestCatalogLoading(unittest.TestCase):
+    """Loading index.db in both schemas, bare or inside the source msix"""
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def _assert_loaded(self, entries):
+        by_id = {e["Id"]: e for e in entries}
+        self.assertEqual(len(by_id), len(PACKAGES))
+        self.assertEqual(by_id["Mozilla.Firefox"]["Version"], "132.0.2")
+
+    def test_v2_schema(self):
+        write_v2_db(self.dir / "index.db")
+        self._assert_loaded(load_source(self.dir / "index.db"))
+
+    def test_v1_schema_keeps_latest_version(self):
+        write_v1_db(self.dir / "index.db")
+        self._assert_loaded(load_source(self.dir / "index.db"))
+
+    def test_msix(self):
+        write_v2_db(self.dir / "index.db")
+        with zipfile.ZipFile(self.dir / "source.msix", "w") as zf:
+            zf.write(self.dir / "index.db", "Public/index.db")
+        catalog = WingetCatalog(local_path=str(self.dir / "source.msix"))
+        self.assertTrue(catalog.refresh())
+        self.assertEqual(catalog.status()["packages"], len(PACKAGES))
+
+    def test_failed_first_load_is_retried_soon(self):
+        # the index appears only after the first two attempts failed
+        catalog = WingetCatalog(local_path=str(self.dir / "index.db"))
+        attempts = []
+        refresh = catalog.refresh
+
+        def flaky():
+            attempts.append(time.monotonic())
+            if len(attempts) == 3:
+                write_v2_db(self.dir / "index.db")
+            return refresh()
+
+        catalog.refresh = flaky
+        catalog.start(interval=3600, retry=0.05)
+        self.addCleanup(catalog.stop)
+        deadline = time.monotonic() + 5
+        while not catalog.loaded and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(catalog.loaded)
+        self.assertEqual(len(attempts), 3)
+        self.assertGreaterEqual(attempts[2] - attempts[1], 0.1, "the backoff doubles")
+
+
+class TestCatalogIndex(unittest.TestCase):
+    """CatalogIndex search"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.index = CatalogIndex([
+            {"Id": i, "Name": n, "Moniker": m, "Version": v, "Source": "winget"} for i, n, m, v in PACKAGES
+        ])
+
+    def _ids(self, query):
+        return [r["Id"] for r in self.index.search(query)]
+
+    def test_substring_over_name_id_and_moniker(self):
+        self.assertEqual(self._ids("studio"), ["Microsoft.VisualStudioCode"])
+        self.assertEqual(self._ids("VSCODE"), ["Microsoft.VisualStudioCode"])
+        self.assertEqual(self._ids("media play"), ["VideoLAN.VLC"])
+        self.assertEqual(self._ids("zzz"), [])
+
+    def test_exact_id_ranks_first(self):
+        self.assertEqual(self._ids("git")[0], "Git.Git")
+
+    def test_short_queries_match_word_prefixes(self):
+        self.assertIn("VideoLAN.VLC", self._ids("vl"))
+
+    def test_result_shape(self):
+        self.assertEqual(self.index.search("firefox")[0],
+                         {"Name": "Mozilla Firefox", "Id": "Mozilla.Firefox", "Version": "132.0.2", "Source": "winget"})
+        self.assertEqual(self.index.get("mozilla.firefox")["Version"], "132.0.2")
+
+    def test_version_key(self):
+        self.assertGreater(version_key("1.10.0"), version_key("1.9.9"))
+
+
+if __name__ == "__main__":
+    unittest.main()